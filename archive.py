@@ -0,0 +1,290 @@
+"""
+DoubOS - Archives
+Streaming tar and tar.gz archives of VFS subtrees
+"""
+
+import codecs
+import gzip
+import io
+import os
+import posixpath
+import tarfile
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+from filesystem import _mode_to_permissions
+
+
+# Archive paths starting with this name a file on the host instead of the VFS
+HOST_PREFIX = "host:"
+
+# Compression level of created .tar.gz archives (gzip's own default)
+COMPRESS_LEVEL = 6
+
+
+# VFS files hold text. File contents go into archives as UTF-8; lone
+# surrogates (bytes that were not UTF-8 when extracted) turn back into
+# those bytes. Archives themselves are binary and are kept in the VFS one
+# character per byte (Latin-1), so their length is their size in bytes.
+
+def _encode(text: str) -> bytes:
+    try:
+        return text.encode("utf-8", "surrogateescape")
+    except UnicodeEncodeError:
+        return text.encode("utf-8", "surrogatepass")
+
+
+def _encoded_size(text: str) -> int:
+    return len(text) if text.isascii() else len(_encode(text))
+
+
+class _ChunkReader(io.RawIOBase):
+    """Read-only binary stream over an iterator of byte strings"""
+
+    def __init__(self, chunks: Iterable[bytes]):
+        super().__init__()
+        self._chunks = iter(chunks)
+        self._data = b""
+        self._offset = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        while self._offset >= len(self._data):
+            data = next(self._chunks, None)
+            if data is None:
+                return 0
+            self._data, self._offset = data, 0
+        count = min(len(buffer), len(self._data) - self._offset)
+        buffer[:count] = self._data[self._offset:self._offset + count]
+        self._offset += count
+        return count
+
+
+class _ArchiveReader(io.RawIOBase):
+    """Seekable binary stream over an archive kept in the VFS"""
+
+    def __init__(self, handle):
+        super().__init__()
+        self._handle = handle
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        try:
+            data = self._handle.read(len(buffer)).encode("latin-1")
+        except UnicodeEncodeError:
+            raise tarfile.ReadError("not an archive") from None
+        buffer[:len(data)] = data
+        return len(data)
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        return self._handle.seek(offset, whence)
+
+    def tell(self) -> int:
+        return self._handle.tell()
+
+    def close(self):
+        self._handle.close()
+        super().close()
+
+
+class _ArchiveWriter(io.RawIOBase):
+    """Binary stream appending to an archive in the VFS, one file chunk at a time"""
+
+    def __init__(self, filesystem, path: str, owner: str):
+        super().__init__()
+        self.filesystem = filesystem
+        self.path = path
+        self.owner = owner
+        self._buffer = bytearray()
+        self._block = filesystem.CHUNK_SIZE
+        if not filesystem.write_file(path, "", owner):
+            raise OSError("Cannot open")
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._buffer += data
+        while len(self._buffer) >= self._block:
+            self._append(self._buffer[:self._block])
+            del self._buffer[:self._block]
+        return len(data)
+
+    def _append(self, data):
+        if not self.filesystem.write_file(self.path, data.decode("latin-1"), self.owner, append=True):
+            raise OSError("Cannot write")
+
+    def close(self):
+        if not self.closed and self._buffer:
+            self._append(self._buffer)
+            self._buffer.clear()
+        super().close()
+
+
+def open_archive(filesystem, path: str, write: bool = False, owner: str = "root"):
+    """Binary file object for reading or writing the archive at path
+
+    path is a VFS path, or HOST_PREFIX and a host path. Archives in host
+    mounts are read from the host file itself, byte for byte. Returns None
+    if there is no archive to read.
+    """
+    if path.startswith(HOST_PREFIX):
+        return open(path[len(HOST_PREFIX):], "wb" if write else "rb")
+    if write:
+        return _ArchiveWriter(filesystem, path, owner)
+    node = filesystem._get_node(path)
+    if node is None or node.is_directory:
+        return None
+    if node.is_host:
+        return open(node.host_path, "rb")
+    return io.BufferedReader(_ArchiveReader(filesystem.open(path)))
+
+
+def walk(filesystem, path: str) -> Iterator[Tuple[str, object]]:
+    """Yield (path, node) for path and everything below it, parents first, by name
+
+    Host directories are entered once, so symlink loops in mounts end.
+    """
+    node = filesystem._get_node(path)
+    if node is None:
+        return
+    seen = set()
+    stack = [(path, node)]
+    while stack:
+        path, node = stack.pop()
+        yield path, node
+        if not node.is_directory:
+            continue
+        if node.is_host:
+            if node._ident in seen:
+                continue
+            seen.add(node._ident)
+        children = filesystem.list_directory(path) or []
+        base = path.rstrip("/")
+        stack.extend((base + "/" + child.name, child)
+                     for child in sorted(children, key=lambda child: child.name, reverse=True))
+
+
+def _member(name: str, node) -> tarfile.TarInfo:
+    info = tarfile.TarInfo(name)
+    info.mode = node.mode
+    info.mtime = int(node.modified_at.timestamp())
+    info.uname = info.gname = node.owner
+    if node.is_directory:
+        info.type = tarfile.DIRTYPE
+    return info
+
+
+def create(filesystem, output, sources: List[Tuple[str, str]], compress: bool = True,
+           skip: Optional[str] = None) -> Iterator[tarfile.TarInfo]:
+    """Write an archive of VFS subtrees to the binary file object output
+
+    sources are (VFS path, name in the archive) pairs. Entries are streamed
+    into the archive one file chunk at a time, so memory use does not grow
+    with the size of the tree; each is yielded once it is written. skip is
+    a path left out (the archive itself, when it is written inside the
+    tree). output is not closed.
+    """
+    stream = gzip.GzipFile(filename="", mode="wb", compresslevel=COMPRESS_LEVEL, fileobj=output) \
+        if compress else output
+    try:
+        with tarfile.open(fileobj=stream, mode="w|") as tar:
+            for source, name in sources:
+                prefix = source.rstrip("/")
+                for path, node in walk(filesystem, source):
+                    if path == skip:
+                        continue
+                    info = _member(posixpath.normpath(name + path[len(prefix):]), node)
+                    if node.is_directory:
+                        tar.addfile(info)
+                    elif node.is_host:
+                        with open(node.host_path, "rb") as data:
+                            info.size = os.fstat(data.fileno()).st_size
+                            tar.addfile(info, data)
+                    else:
+                        # One consistent version of the file, whatever is written meanwhile
+                        chunks = list(node.iter_chunks())
+                        info.size = sum(map(_encoded_size, chunks))
+                        tar.addfile(info, io.BufferedReader(_ChunkReader(map(_encode, chunks))))
+                    yield info
+    finally:
+        if compress:
+            stream.close()
+
+
+def members(archive) -> Iterator[tarfile.TarInfo]:
+    """The entries of a (possibly compressed) archive, reading only their headers
+
+    File data is skipped with seeks; a compressed archive still has to be
+    inflated to find the next header, but its data is never copied out.
+    """
+    with tarfile.open(fileobj=archive, mode="r:*") as tar:
+        info = tar.next()
+        while info is not None:
+            yield info
+            # Entries already listed are not kept
+            tar.members.clear()
+            info = tar.next()
+
+
+def _safe_name(name: str) -> Optional[str]:
+    """Archive name as a relative path, or None if it is absolute or would leave the target"""
+    if name.startswith("/"):
+        return None
+    parts = [part for part in name.split("/") if part and part != "."]
+    if not parts or ".." in parts:
+        return None
+    return "/".join(parts)
+
+
+def extract(filesystem, archive, target: str, owner: str = "root") -> Iterator[Tuple[tarfile.TarInfo, Optional[str]]]:
+    """Unpack a (possibly compressed) archive read as a stream into the VFS directory target
+
+    Yields (entry, problem) for every entry, problem being None once the
+    entry is written. File data goes into the VFS one chunk at a time.
+    Entries with absolute names or ".." components, and anything but
+    files and directories, are skipped.
+    """
+    block = filesystem.CHUNK_SIZE
+    base = target.rstrip("/")
+    with tarfile.open(fileobj=archive, mode="r|*") as tar:
+        for info in tar:
+            tar.members.clear()
+            name = _safe_name(info.name)
+            if name is None:
+                yield info, "unsafe path; skipped"
+                continue
+            path = base + "/" + name
+            if info.isdir():
+                if not filesystem.mkdir(path, recursive=True, owner=owner):
+                    yield info, "Cannot mkdir"
+                    continue
+            elif info.isfile():
+                parent = path.rpartition("/")[0] or "/"
+                if not filesystem.is_directory(parent) and not filesystem.mkdir(parent, recursive=True, owner=owner):
+                    yield info, "Cannot mkdir"
+                    continue
+                decoder = codecs.getincrementaldecoder("utf-8")("surrogateescape")
+                data = tar.extractfile(info)
+                text = decoder.decode(data.read(block), final=info.size <= block)
+                if not filesystem.write_file(path, text, owner):
+                    yield info, "Cannot open"
+                    continue
+                while True:
+                    chunk = data.read(block)
+                    text = decoder.decode(chunk, final=not chunk)
+                    if text:
+                        filesystem.write_file(path, text, owner, append=True)
+                    if not chunk:
+                        break
+            else:
+                yield info, "not a regular file or directory; skipped"
+                continue
+            filesystem.chmod(path, _mode_to_permissions(info.mode))
+            yield info, None
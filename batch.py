@@ -0,0 +1,106 @@
+"""
+DoubOS - Batch Mode
+Runs command scripts without prompts and reports throughput and latency
+"""
+
+import math
+import sys
+import time
+from typing import Callable, Dict, List, Optional, TextIO
+
+
+def parse_script(text: str) -> List[str]:
+    """Command lines of a script, skipping blank lines and # comments"""
+    commands = []
+    for line in text.splitlines():
+        line = line.strip()
+        if line and not line.startswith("#"):
+            commands.append(line)
+    return commands
+
+
+def percentile(ordered: List[float], fraction: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    if not ordered:
+        return 0.0
+    rank = max(math.ceil(fraction * len(ordered)) - 1, 0)
+    return ordered[min(rank, len(ordered) - 1)]
+
+
+class BatchReport:
+    """Timings of one batch run"""
+
+    # Commands listed in the per-command breakdown
+    TOP_COMMANDS = 10
+
+    def __init__(self):
+        self.elapsed = 0.0
+        # Seconds per executed command line, in order
+        self.latencies: List[float] = []
+        # Command name -> latencies of its lines
+        self.by_command: Dict[str, List[float]] = {}
+
+    @property
+    def count(self) -> int:
+        return len(self.latencies)
+
+    @property
+    def throughput(self) -> float:
+        """Commands per second"""
+        return self.count / self.elapsed if self.elapsed else 0.0
+
+    def record(self, command_line: str, seconds: float):
+        self.latencies.append(seconds)
+        self.by_command.setdefault(command_line.split()[0], []).append(seconds)
+
+    def format(self) -> str:
+        """Human-readable summary"""
+        ordered = sorted(self.latencies)
+        ms = [1000 * percentile(ordered, p) for p in (0.5, 0.9, 0.99)]
+        lines = [
+            f"Batch: {self.count} commands in {self.elapsed:.3f} s ({self.throughput:,.1f} commands/s)",
+            f"Latency (ms): p50 {ms[0]:.3f}  p90 {ms[1]:.3f}  p99 {ms[2]:.3f}  "
+            f"max {1000 * (ordered[-1] if ordered else 0):.3f}",
+        ]
+        if self.by_command:
+            lines.append(f"  {'COMMAND':12} {'COUNT':>7} {'TOTAL ms':>10} {'p50 ms':>8} {'p99 ms':>8}")
+            slowest = sorted(self.by_command.items(), key=lambda item: -sum(item[1]))
+            for name, times in slowest[:self.TOP_COMMANDS]:
+                times = sorted(times)
+                lines.append(f"  {name:12} {len(times):>7} {1000 * sum(times):>10.1f} "
+                             f"{1000 * percentile(times, 0.5):>8.3f} {1000 * percentile(times, 0.99):>8.3f}")
+        return "\n".join(lines)
+
+
+def run_script(processor, commands: List[str], output: Optional[TextIO] = None,
+               history: Optional[Callable[[str], None]] = None,
+               running: Optional[Callable[[], bool]] = None) -> BatchReport:
+    """Execute command lines one after another, timing each
+
+    Command output goes to output (discarded if None). history is called
+    with every line before it runs; the run stops early once running()
+    turns false (after exit or shutdown).
+    """
+    report = BatchReport()
+    clock = time.perf_counter
+    started = clock()
+    for command_line in commands:
+        if running is not None and not running():
+            break
+        if history is not None:
+            history(command_line)
+        before = clock()
+        result = processor.execute(command_line)
+        report.record(command_line, clock() - before)
+        if result and output is not None:
+            output.write(result + "\n")
+    report.elapsed = clock() - started
+    return report
+
+
+def read_script(path: str) -> str:
+    """Script text from a file, or from stdin for "-" """
+    if path == "-":
+        return sys.stdin.read()
+    with open(path, 'r', encoding='utf-8') as f:
+        return f.read()
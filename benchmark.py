@@ -0,0 +1,841 @@
+"""
+DoubOS Benchmark Suite
+Micro-benchmarks for the virtual file system and shell
+
+Run all benchmarks:      python benchmark.py
+Run a single benchmark:  python benchmark.py path_resolution
+"""
+
+import itertools
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from datetime import datetime
+from fnmatch import fnmatchcase
+
+from filesystem import FileNode, VirtualFileSystem
+from search_index import iter_nodes
+
+
+def _time_per_call(func, repeat: int) -> float:
+    """Average wall time of func() in microseconds"""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) / repeat * 1e6
+
+
+def bench_path_resolution():
+    """Path lookup cost as directory depth grows"""
+    print("Path resolution (µs per lookup)")
+    print(f"  {'depth':>6} {'cached':>10} {'uncached':>10}")
+
+    for depth in (4, 16, 64, 256):
+        path = "/home/bench" + "".join(f"/d{i}" for i in range(depth))
+        leaf = path + "/file.txt"
+
+        timings = []
+        for cache_size in (VirtualFileSystem.PATH_CACHE_SIZE, 0):
+            fs = VirtualFileSystem(path_cache_size=cache_size)
+            fs.mkdir(path, recursive=True)
+            fs.write_file(leaf, "data")
+            timings.append(_time_per_call(lambda: fs.exists(leaf), 20000))
+
+        print(f"  {depth:>6} {timings[0]:>10.3f} {timings[1]:>10.3f}")
+
+
+def _populate(fs: VirtualFileSystem, files: int, size: int = 256):
+    """Fill /home/bench with files spread over 100 directories"""
+    payload = "x" * size
+    for i in range(files):
+        directory = f"/home/bench/d{i % 100}"
+        if i < 100:
+            fs.mkdir(directory, recursive=True)
+        fs.write_file(f"{directory}/f{i}.txt", payload)
+
+
+def bench_journal_save():
+    """Cost of saving after a one-file change, full dump vs journal"""
+    print("Save after one small write (ms)")
+    print(f"  {'files':>8} {'full dump':>10} {'journal':>10}")
+
+    for files in (1000, 10000, 50000):
+        with tempfile.TemporaryDirectory() as tmp:
+            full_path = os.path.join(tmp, "full.json")
+            fs = VirtualFileSystem()
+            _populate(fs, files)
+
+            fs.write_file("/home/bench/changed.txt", "hello")
+            full = _time_per_call(lambda: fs.save_to_disk(full_path), 3) / 1000
+
+            snapshot_path = os.path.join(tmp, "journal.json")
+            fs.open_journal(snapshot_path, compact_threshold=10**9)
+
+            def journaled_save():
+                fs.write_file("/home/bench/changed.txt", "hello")
+                fs.save_to_disk(snapshot_path)
+
+            journaled = _time_per_call(journaled_save, 50) / 1000
+            fs.close_journal(compact=False)
+
+        print(f"  {files:>8} {full:>10.2f} {journaled:>10.3f}")
+
+
+def bench_deferred_hydration():
+    """Boot-time load of a saved JSON image, building every node vs deferring hydration
+    
+    Both parse the whole file, so both stay linear in its size; deferring
+    saves only the work of building nodes nobody reads.
+    """
+    print("Load saved JSON image and read /etc/motd (ms)")
+    print(f"  {'nodes':>8} {'json parse':>11} {'eager':>10} {'deferred':>10}")
+
+    for files in (10000, 100000):
+        with tempfile.TemporaryDirectory() as tmp:
+            image = os.path.join(tmp, "image.json")
+            fs = VirtualFileSystem()
+            _populate(fs, files, size=16)
+            fs.save_to_disk(image)
+
+            def parse():
+                with open(image) as f:
+                    json.load(f)
+
+            def boot(lazy):
+                booted = VirtualFileSystem()
+                booted.load_from_disk(image, lazy=lazy)
+                booted.read_file("/etc/motd")
+
+            timings = [
+                _time_per_call(parse, 3) / 1000,
+                _time_per_call(lambda: boot(False), 3) / 1000,
+                _time_per_call(lambda: boot(True), 3) / 1000,
+            ]
+
+        print(f"  {files:>8} {timings[0]:>11.1f} {timings[1]:>10.1f} {timings[2]:>10.1f}")
+
+
+def bench_append():
+    """Cost of appending to a growing log file"""
+    print("Append 10 KB to a growing file (µs per append)")
+    print(f"  {'file size':>10} {'append':>10}")
+
+    fs = VirtualFileSystem()
+    entry = "[WARNING] " * 1000 + "\n"
+    written = 0
+    for target in (1, 10, 50):
+        batch = []
+        while written < target * 1024 * 1024:
+            start = time.perf_counter()
+            fs.write_file("/var/log/system.log", entry, append=True)
+            batch.append(time.perf_counter() - start)
+            written += len(entry)
+        average = sum(batch[-100:]) / len(batch[-100:]) * 1e6
+        print(f"  {str(target) + ' MB':>10} {average:>10.1f}")
+
+
+class _LegacyFileNode:
+    """The original __dict__-based node layout, kept for comparison"""
+
+    def __init__(self, name, is_directory=False, owner="root", permissions="rwxr-xr-x"):
+        self.name = name
+        self.is_directory = is_directory
+        self.owner = owner
+        self.permissions = permissions
+        self.content = ""
+        self.created_at = datetime.now()
+        self.modified_at = datetime.now()
+        self.size = 0
+        self.children = {} if is_directory else None
+
+
+def _node_bytes(factory, count: int) -> float:
+    """Traced allocation per node when building count nodes"""
+    tracemalloc.start()
+    nodes = [factory(f"f{i}.txt", False, "".join(["ad", "min"]), "rw-r--r--") for i in range(count)]
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del nodes
+    return current / count
+
+
+def bench_node_memory():
+    """Resident size of file nodes, original layout vs compact layout"""
+    print("Memory per file node (bytes)")
+    print(f"  {'nodes':>9} {'legacy':>10} {'compact':>10}")
+
+    for count in (100000, 1000000):
+        legacy = _node_bytes(_LegacyFileNode, count)
+        compact = _node_bytes(FileNode, count)
+        print(f"  {count:>9} {legacy:>10.0f} {compact:>10.0f}")
+
+
+def bench_content_search():
+    """grep -r over a large tree, full scan vs content index"""
+    print("Recursive search for a rare phrase")
+    print(f"  {'logical':>8} {'files':>7} {'index build':>12} {'scan':>10} {'indexed':>10}")
+
+    rng = random.Random(7)
+    words = ["".join(rng.choice("abcdefghijklmnopqrstuvwxyz") for _ in range(rng.randint(3, 9)))
+             for _ in range(5000)]
+    # Distinct 64 KB documents; the simulated tree repeats them, as
+    # copied and duplicated files do, so only these are stored once
+    documents = []
+    for i in range(256):
+        lines = []
+        while sum(map(len, lines)) < 64 * 1024:
+            lines.append(" ".join(rng.choice(words) for _ in range(12)))
+        if i % 64 == 0:
+            lines[len(lines) // 2] += " kernel panic: unable to mount root"
+        documents.append("\n".join(lines)[:64 * 1024])
+
+    for total_mb in (64, 1024):
+        fs = VirtualFileSystem()
+        files = total_mb * 1024 // 64
+        for i in range(files):
+            directory = f"/home/bench/d{i % 100}"
+            if i < 100:
+                fs.mkdir(directory, recursive=True)
+            fs.write_file(f"{directory}/f{i}.txt", documents[i % len(documents)])
+
+        def scan():
+            hits = 0
+            for directory in fs.list_directory("/home/bench"):
+                for node in directory.children.values():
+                    hits += sum("kernel panic" in line.lower() for line in node.iter_lines())
+            return hits
+
+        scan_ms = _time_per_call(scan, 1) / 1000
+        build_ms = _time_per_call(lambda: fs.search_content("kernel panic", "/home/bench"), 1) / 1000
+        indexed_ms = _time_per_call(lambda: fs.search_content("unable to mount root", "/home/bench"), 5) / 1000
+        print(f"  {str(total_mb) + ' MB':>8} {files:>7} {str(round(build_ms)) + ' ms':>12} "
+              f"{str(round(scan_ms)) + ' ms':>10} {indexed_ms:>7.1f} ms")
+
+
+def bench_find_name():
+    """find -name with a glob, tree walk vs name index"""
+    print("find /home -name '*.log' -type f (ms)")
+    print(f"  {'files':>8} {'walk':>10} {'indexed':>10}")
+
+    for files in (100000, 500000):
+        fs = VirtualFileSystem()
+        for i in range(files):
+            directory = f"/home/bench/d{i % 1000}"
+            if i < 1000:
+                fs.mkdir(directory, recursive=True)
+            suffix = "log" if i % 100 == 0 else "txt"
+            fs.write_file(f"{directory}/f{i}.{suffix}", "")
+
+        def walk():
+            return sorted(path for path, node in iter_nodes("/home", fs._get_node("/home"))
+                          if not node.is_directory and fnmatchcase(node.name, "*.log"))
+
+        walked = _time_per_call(walk, 1) / 1000
+        fs.find("/")
+        indexed = _time_per_call(lambda: fs.find("/home", "*.log", "f"), 5) / 1000
+        assert fs.find("/home", "*.log", "f") == walk()
+        print(f"  {files:>8} {walked:>10.1f} {indexed:>10.1f}")
+
+
+def bench_snapshot():
+    """Snapshot cost vs a full save, and the copy-on-write cost it adds"""
+    print("Snapshot before a risky command")
+    print(f"  {'files':>8} {'full save':>10} {'snapshot':>10} {'write':>10} {'write+snap':>11} {'extra mem':>10}")
+
+    for files in (10000, 100000):
+        with tempfile.TemporaryDirectory() as tmp:
+            fs = VirtualFileSystem()
+            _populate(fs, files)
+            image = os.path.join(tmp, "image.json")
+            full_ms = _time_per_call(lambda: fs.save_to_disk(image), 1) / 1000
+
+        counter = itertools.count()
+        write = lambda: fs.write_file(f"/home/bench/d{next(counter) % 100}/f0.txt", "changed")
+        plain_us = _time_per_call(write, 1000)
+        snapshot_us = _time_per_call(fs.create_snapshot, 1000)
+
+        def write_after_snapshot():
+            fs.create_snapshot()
+            write()
+
+        tracemalloc.start()
+        cow_us = _time_per_call(write_after_snapshot, 1000)
+        extra, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(f"  {files:>8} {full_ms:>7.0f} ms {snapshot_us:>7.2f} µs {plain_us:>7.1f} µs "
+              f"{cow_us:>8.1f} µs {extra / 1000 / 1024:>7.1f} KB")
+
+
+def bench_concurrent_reads():
+    """Directory listings while another thread copies a large tree"""
+    print("Listing latency during a long copy")
+    print(f"  {'files':>8} {'copy':>9} {'list idle':>10} {'list busy':>10} {'lists':>7}")
+
+    for files in (10000, 50000):
+        fs = VirtualFileSystem()
+        _populate(fs, files)
+        idle_us = _time_per_call(lambda: fs.list_directory("/home"), 1000)
+
+        done = threading.Event()
+        def copy():
+            start = time.perf_counter()
+            fs.copy("/home/bench", "/tmp/bench")
+            copy_ms.append((time.perf_counter() - start) * 1000)
+            done.set()
+        copy_ms = []
+        thread = threading.Thread(target=copy)
+        thread.start()
+        lists = 0
+        start = time.perf_counter()
+        while not done.is_set():
+            fs.list_directory("/home")
+            fs.list_directory("/")
+            lists += 2
+        busy_us = (time.perf_counter() - start) / max(lists, 1) * 1e6
+        thread.join()
+        print(f"  {files:>8} {copy_ms[0]:>6.0f} ms {idle_us:>7.1f} µs {busy_us:>7.1f} µs {lists:>7}")
+
+
+def bench_image_format():
+    """Save/load time and size of JSON vs binary images"""
+    print("Whole-image save and load, JSON vs binary")
+    print(f"  {'nodes':>8} {'json save':>10} {'bin save':>10} {'json load':>10} "
+          f"{'bin load':>10} {'json size':>10} {'bin size':>10}")
+
+    for files in (10000, 100000, 1000000):
+        fs = VirtualFileSystem()
+        for i in range(files):
+            directory = f"/home/bench/d{i % 1000}"
+            if i < 1000:
+                fs.mkdir(directory, recursive=True)
+            fs.write_file(f"{directory}/f{i}.txt", f"line {i} of a synthetic file\n")
+        nodes = sum(1 for _ in iter_nodes("/", fs.root)) + 1
+
+        with tempfile.TemporaryDirectory() as tmp:
+            row = []
+            sizes = []
+            for suffix in (".json", ".dimg"):
+                image = os.path.join(tmp, "image" + suffix)
+                row.append(_time_per_call(lambda: fs.save_to_disk(image), 1) / 1000)
+                sizes.append(os.path.getsize(image) / 1024 / 1024)
+
+            def load(suffix):
+                booted = VirtualFileSystem()
+                booted.load_from_disk(os.path.join(tmp, "image" + suffix))
+                booted.read_file("/etc/motd")
+            loads = [_time_per_call(lambda: load(suffix), 1) / 1000 for suffix in (".json", ".dimg")]
+
+        print(f"  {nodes:>8} {row[0]:>7.0f} ms {row[1]:>7.0f} ms {loads[0]:>7.0f} ms "
+              f"{loads[1]:>7.0f} ms {sizes[0]:>7.1f} MB {sizes[1]:>7.1f} MB")
+        del fs
+
+
+def bench_host_mount():
+    """grep and wc on a large mounted host file: throughput and peak memory"""
+    print("Mounted host file, memory-mapped reads")
+    print(f"  {'size':>8} {'grep':>10} {'wc':>10} {'grep peak':>10} {'wc peak':>10}")
+
+    for megabytes in (16, 256):
+        with tempfile.TemporaryDirectory() as host:
+            line = b"2024-01-01 12:00:00 INFO request served in 12ms by worker 7\n"
+            with open(os.path.join(host, "big.log"), "wb") as f:
+                block = line * (1024 * 1024 // len(line))
+                for _ in range(megabytes):
+                    f.write(block)
+                f.write(b"2024-01-01 12:00:01 ERROR disk full\n")
+            fs = VirtualFileSystem()
+            fs.mkdir("/mnt/host", recursive=True)
+            fs.mount(host, "/mnt/host")
+
+            def grep():
+                assert fs.search_file("/mnt/host/big.log", "error") == ["2024-01-01 12:00:01 ERROR disk full"]
+
+            def wc():
+                lines = 0
+                for data in fs.read_chunks("/mnt/host/big.log"):
+                    lines += data.count("\n")
+
+            row = []
+            for func in (grep, wc):
+                tracemalloc.start()
+                elapsed = _time_per_call(func, 1) / 1e6
+                row.append((megabytes / elapsed, tracemalloc.get_traced_memory()[1] / 1024 / 1024))
+                tracemalloc.stop()
+        print(f"  {megabytes:>5} MB {row[0][0]:>5.0f} MB/s {row[1][0]:>5.0f} MB/s "
+              f"{row[0][1]:>7.1f} MB {row[1][1]:>7.1f} MB")
+
+
+def bench_head_tail():
+    """head and tail on a large log, whole-content split vs streaming handle"""
+    from collections import deque
+
+    print("head -n 10 / tail -n 10 on a large log file")
+    print(f"  {'size':>8} {'split head':>11} {'head':>10} {'split tail':>11} {'tail':>10}")
+
+    line = "2024-01-01 12:00:00 INFO request served in 12ms by worker 7\n"
+    for megabytes in (16, 128, 512):
+        fs = VirtualFileSystem()
+        fs.write_file("/var/log/big.log", line * (megabytes * 1024 * 1024 // len(line)))
+
+        def split_head():
+            return fs.read_file("/var/log/big.log").split("\n")[:10]
+
+        def head():
+            with fs.open("/var/log/big.log") as f:
+                return list(itertools.islice(f, 10))
+
+        def split_tail():
+            return deque(fs.read_lines("/var/log/big.log"), maxlen=10)
+
+        def tail():
+            return fs.tail_lines("/var/log/big.log", 10)
+
+        times = [_time_per_call(split_head, 1) / 1000, _time_per_call(head, 100),
+                 _time_per_call(split_tail, 1) / 1000, _time_per_call(tail, 100)]
+        print(f"  {megabytes:>5} MB {times[0]:>8.0f} ms {times[1]:>7.1f} µs "
+              f"{times[2]:>8.0f} ms {times[3]:>7.1f} µs")
+        del fs
+
+
+def bench_pipeline():
+    """cat | grep | head over a large log, eager strings vs lazy line streams"""
+    from commands import CommandContext, CommandProcessor
+    from users import UserManager
+    from utilities import register_utility_commands
+
+    print("cat big.log | grep ERROR | head -5")
+    print(f"  {'size':>8} {'eager':>10} {'pipeline':>10}")
+
+    line = "2024-01-01 12:00:00 INFO request served in 12ms by worker 7\n"
+    for megabytes in (16, 128):
+        fs = VirtualFileSystem()
+        lines = megabytes * 1024 * 1024 // len(line)
+        # Matches are spread out so the pipeline reads a tenth of the file
+        block = line * (lines // 50) + "2024-01-01 12:00:01 ERROR disk full\n"
+        fs.write_file("/var/log/big.log", block * 50)
+        users = UserManager()
+        context = CommandContext(None, fs, users, None, users.login("admin", "admin123"))
+        processor = CommandProcessor(context)
+        register_utility_commands(processor)
+
+        def eager():
+            # What one string-returning command after another amounts to
+            matches = [l for l in fs.read_file("/var/log/big.log").split("\n") if "error" in l.lower()]
+            return "\n".join(matches[:5])
+
+        def pipeline():
+            return processor.execute("cat /var/log/big.log | grep ERROR | head -5")
+
+        assert eager() == pipeline()
+        print(f"  {megabytes:>5} MB {_time_per_call(eager, 1) / 1000:>7.0f} ms "
+              f"{_time_per_call(pipeline, 1) / 1000:>7.0f} ms")
+        del fs
+
+
+def bench_batch():
+    """CommandProcessor throughput on a generated mixed script (batch mode)"""
+    from batch import percentile
+    from doubos import DoubOS
+
+    print("Batch mode: mixed script through CommandProcessor")
+    print(f"  {'commands':>8} {'commands/s':>11} {'p50':>9} {'p90':>9} {'p99':>9}")
+
+    templates = [
+        "mkdir -p /tmp/batch/d{n}",
+        "echo line {i} of the batch script > /tmp/batch/d{n}/f{i}.txt",
+        "cat /tmp/batch/d{n}/f{i}.txt",
+        "ls /tmp/batch/d{n}",
+        "cd /tmp/batch/d{n}",
+        "grep batch f{i}.txt",
+        "wc f{i}.txt",
+        "cat f{i}.txt | grep line | wc",
+        "pwd",
+        "find /tmp/batch -name f{i}.txt",
+    ]
+    for count in (1000, 10000):
+        doubos = DoubOS()
+        doubos.kernel.boot(verbose=False)
+        doubos.login("admin", "admin123")
+        script = [templates[i % len(templates)].format(i=i // len(templates), n=i // 100)
+                  for i in range(count)]
+        report = doubos.run_batch(script, quiet=True)
+        ordered = sorted(report.latencies)
+        p50, p90, p99 = (1e6 * percentile(ordered, p) for p in (0.5, 0.9, 0.99))
+        print(f"  {report.count:>8} {report.throughput:>11,.0f} {p50:>6.1f} µs {p90:>6.1f} µs {p99:>6.1f} µs")
+
+
+def bench_shell_server():
+    """Command round trips with many concurrent server sessions"""
+    import asyncio
+    from batch import percentile
+    from loadgen import run_local
+
+    print("Shell server: concurrent sessions over TCP (10 commands each)")
+    print(f"  {'sessions':>8} {'commands/s':>11} {'login p50':>10} {'p50':>9} {'p90':>9} {'p99':>9}")
+    for sessions in (50, 500):
+        report = asyncio.run(run_local(sessions))
+        ordered = sorted(report.latencies)
+        p50, p90, p99 = (1000 * percentile(ordered, p) for p in (0.5, 0.9, 0.99))
+        login = 1000 * percentile(sorted(report.logins), 0.5)
+        print(f"  {sessions:>8} {report.throughput:>11,.0f} {login:>7.1f} ms "
+              f"{p50:>6.1f} ms {p90:>6.1f} ms {p99:>6.1f} ms")
+
+
+def bench_history_search():
+    """Reverse search and grep over a 1M-entry command history"""
+    from history import CommandHistory
+
+    print("Command history: 1M entries, 50k distinct lines")
+    rng = random.Random(19)
+    templates = ["cd /home/admin/project{n}", "grep -r TODO src/module{n}.py", "vim notes{n}.txt",
+                 "cat /var/log/app{n}.log | grep ERROR", "ls -l /tmp/build{n}"]
+    distinct = [templates[i % len(templates)].format(n=i) for i in range(50000)]
+    history = CommandHistory(1_000_000)
+    start = time.perf_counter()
+    for _ in range(1_000_000):
+        history.add(rng.choice(distinct), 0.0)
+    print(f"  add: {1e6 / (time.perf_counter() - start):,.0f} entries/s")
+
+    held = [line for _, line in history.entries()]
+    print(f"  {'query':20} {'matches':>8} {'ctrl-r':>10} {'grep':>10} {'scan':>10}")
+    for query in ("module4241.py", "notes777", "build1234", "project4"):
+        ctrl_r = _time_per_call(lambda: history.search(query), 200)
+        grep = _time_per_call(lambda: history.matches(query), 20)
+        start = time.perf_counter()
+        count = sum(1 for line in held if query in line.lower())
+        scan = (time.perf_counter() - start) * 1e6
+        print(f"  {query:20} {count:>8} {ctrl_r:>7.1f} µs {grep:>7.1f} µs {scan / 1000:>7.1f} ms")
+
+
+def bench_completion():
+    """Tab completion latency in a directory of 100k entries"""
+    from kernel import DoubOSKernel, DoubOSShell
+    from users import UserManager
+    from commands import CommandProcessor, CommandContext
+    from completion import Completer
+
+    print("Tab completion: 100k files in one directory (µs per completion)")
+    kernel = DoubOSKernel()
+    fs = VirtualFileSystem()
+    um = UserManager()
+    session = um.login("admin", "admin123", kernel.environment_vars)
+    context = CommandContext(kernel, fs, um, DoubOSShell(kernel, session), session)
+    processor = CommandProcessor(context)
+    context.commands = processor.commands
+    completer = Completer(processor)
+    fs.mkdir("/big")
+    for i in range(100_000):
+        fs.write_file(f"/big/file{i:06d}.txt", "")
+    session.cwd = "/big"
+
+    start = time.perf_counter()
+    completer.complete("cat file0")
+    print(f"  first completion (builds the listing): {(time.perf_counter() - start) * 1000:.1f} ms")
+    relist = _time_per_call(lambda: sorted(node.name for node in fs.list_directory("/big")), 5)
+    print(f"  relisting and sorting the directory instead: {relist / 1000:.1f} ms")
+    print(f"  {'line':22} {'matches':>8} {'cached':>10}")
+    for line in ("cat ", "cat file0999", "cat file099999", "cat /big/file01", "l"):
+        matches = len(completer.complete(line))
+        cached = _time_per_call(lambda: completer.complete(line), 200)
+        print(f"  {line!r:22} {matches:>8} {cached:>7.1f} µs")
+
+    # A change patches the cached listing instead of dropping it
+    changed = _time_per_call(lambda: (fs.write_file("/big/new.txt", ""), fs.remove("/big/new.txt"),
+                                      completer.complete("cat new")), 200)
+    print(f"  create + delete + complete: {changed:.1f} µs")
+
+
+def bench_watch():
+    """Cost of change notification on writers, and delivery latency"""
+    print("File watches")
+    fs = VirtualFileSystem()
+    fs.mkdir("/app/logs", recursive=True)
+    fs.write_file("/app/logs/app.log", "")
+
+    def write():
+        fs.write_file("/app/logs/app.log", "line\n")
+
+    print(f"  write, no watches:                   {_time_per_call(write, 20000):6.1f} µs")
+    idle = [fs.watch(f"/idle/dir{i}", recursive=True, callback=lambda batch: None) for i in range(1000)]
+    print(f"  write, 1000 idle watches elsewhere:  {_time_per_call(write, 20000):6.1f} µs")
+    watch = fs.watch("/app", recursive=True)
+    print(f"  write, watched (coalesced):          {_time_per_call(write, 20000):6.1f} µs")
+    print(f"  queued after 20k writes: {len(watch.read(0))} change(s)")
+    cpu = time.process_time()
+    time.sleep(0.5)
+    print(f"  CPU used by 1000 idle watches in 0.5 s: {(time.process_time() - cpu) * 1000:.2f} ms")
+
+    # Writer to reader wake-up, through a blocked read() as tail -f uses
+    latencies = []
+    ready = threading.Event()
+
+    def reader():
+        for _ in range(200):
+            ready.set()
+            watch.read()
+            latencies.append(time.perf_counter() - written[0])
+
+    written = [0.0]
+    thread = threading.Thread(target=reader)
+    thread.start()
+    for _ in range(200):
+        ready.wait()
+        ready.clear()
+        time.sleep(0.0005)
+        written[0] = time.perf_counter()
+        write()
+    thread.join()
+    latencies.sort()
+    print(f"  write to blocked reader: p50 {latencies[100] * 1e6:.0f} µs, p99 {latencies[198] * 1e6:.0f} µs")
+    for item in idle + [watch]:
+        item.close()
+
+
+def bench_job_control():
+    """Interactive command latency while background jobs run"""
+    from batch import percentile
+    from doubos import DoubOS
+
+    print("Job control: interactive commands alongside background find jobs")
+    print(f"  {'jobs':>5} {'p50':>9} {'p99':>9} {'job wall':>9} {'job CPU':>9}")
+    doubos = DoubOS()
+    doubos.kernel.boot(verbose=False)
+    doubos.login("admin", "admin123")
+    processor = doubos.processor
+    fs = doubos.filesystem
+    for d in range(100):
+        fs.mkdir(f"/tmp/jobs/d{d}", recursive=True)
+        for f in range(100):
+            fs.write_file(f"/tmp/jobs/d{d}/f{f}.txt", "x")
+    session = processor.context.session
+    for jobs in (0, 2, 8):
+        session.jobs.clear()
+        for _ in range(jobs):
+            processor.execute("find /tmp/jobs -type f &")
+        latencies = []
+        for _ in range(200):
+            start = time.perf_counter()
+            processor.execute("ls /tmp/jobs/d0")
+            latencies.append(time.perf_counter() - start)
+        processes = list(session.jobs.values())
+        for process in processes:
+            process.wait()
+        latencies.sort()
+        p50, p99 = (1e6 * percentile(latencies, p) for p in (0.5, 0.99))
+        wall = sum(process.wall_time for process in processes) / jobs * 1000 if jobs else 0.0
+        cpu = sum(process.cpu_time for process in processes) / jobs * 1000 if jobs else 0.0
+        print(f"  {jobs:>5} {p50:>6.1f} µs {p99:>6.1f} µs {wall:>6.1f} ms {cpu:>6.1f} ms")
+
+
+def bench_tar():
+    """tar throughput in MB/s on a 1 GB synthetic tree"""
+    from doubos import DoubOS
+
+    print("tar: 1 GB tree of 64 directories x 64 files of 256 KB")
+    doubos = DoubOS()
+    doubos.kernel.boot(verbose=False)
+    doubos.login("admin", "admin123")
+    processor = doubos.processor
+    fs = doubos.filesystem
+    # Files are built from a pool of distinct log-like chunks; the blob
+    # store keeps each chunk once, so the tree costs little memory
+    rng = random.Random(7)
+    size = fs.CHUNK_SIZE
+    pool = []
+    for _ in range(64):
+        text = "".join(f"2026-10-17 12:{rng.randrange(60):02d}:{rng.randrange(60):02d} INFO "
+                       f"worker-{rng.randrange(32)} request {rng.randrange(10 ** 6)} "
+                       f"took {rng.randrange(1000)} ms\n" for _ in range(size // 40))
+        pool.append(text[:size])
+    for d in range(64):
+        fs.mkdir(f"/data/d{d}", recursive=True)
+        for f in range(64):
+            fs.write_file(f"/data/d{d}/f{f}.log", "".join(rng.sample(pool, 4)))
+    total = fs.get_size("/data") / 1e6
+
+    def run(command):
+        start = time.perf_counter()
+        output = processor.execute(command)
+        return output, time.perf_counter() - start
+
+    _, seconds = run(f"tar -cf host:{os.devnull} /data")
+    print(f"  create tar (to /dev/null):      {total / seconds:7.1f} MB/s")
+    _, seconds = run("tar -czf /tmp/data.tar.gz /data")
+    archive = fs.get_size("/tmp/data.tar.gz") / 1e6
+    print(f"  create tar.gz (in the VFS):     {total / seconds:7.1f} MB/s  ({archive:.0f} MB archive)")
+    _, seconds = run("tar -tzf /tmp/data.tar.gz")
+    print(f"  list tar.gz (headers only):     {total / seconds:7.1f} MB/s")
+    fs.mkdir("/restore")
+    _, seconds = run("tar -xzf /tmp/data.tar.gz -C /restore")
+    print(f"  extract tar.gz:                 {total / seconds:7.1f} MB/s")
+
+
+def bench_grep():
+    """grep: chunked scans of a large file and parallel scans of many files"""
+    import grep
+    from doubos import DoubOS
+
+    doubos = DoubOS()
+    doubos.kernel.boot(verbose=False)
+    doubos.login("admin", "admin123")
+    processor = doubos.processor
+    fs = doubos.filesystem
+    rng = random.Random(7)
+    lines = [f"2026-10-17 12:00:{i % 60:02d} {'ERROR' if i % 50000 == 0 else 'INFO'} "
+             f"worker-{rng.randrange(32)} request {rng.randrange(10 ** 6)} took {rng.randrange(1000)} ms"
+             for i in range(1000000)]
+    fs.write_file("/var/log/big.log", "\n".join(lines) + "\n")
+    megabytes = fs.get_size("/var/log/big.log") / 1e6
+
+    def timed(command):
+        start = time.perf_counter()
+        processor.execute(command)
+        return time.perf_counter() - start
+
+    print(f"grep on a {megabytes:.0f} MB log (1M lines, 20 matches)")
+    needle = "error"
+    start = time.perf_counter()
+    sum(1 for line in fs.read_lines("/var/log/big.log") if needle in line.lower())
+    print(f"  line by line (previous grep):   {megabytes / (time.perf_counter() - start):7.0f} MB/s")
+    print(f"  grep -c ERROR (blocks):         {megabytes / timed('grep -c ERROR /var/log/big.log'):7.0f} MB/s")
+    print(f"  grep -ci error:                 {megabytes / timed('grep -ci error /var/log/big.log'):7.0f} MB/s")
+    print(f"  grep -cE 'took 99[0-9] ms':     {megabytes / timed('grep -cE took.99[0-9].ms /var/log/big.log'):7.0f} MB/s")
+    print(f"  grep -l ERROR (first match):    {timed('grep -l ERROR /var/log/big.log') * 1000:7.2f} ms")
+    print(f"  grep -m 1 INFO:                 {timed('grep -m 1 INFO /var/log/big.log') * 1000:7.2f} ms")
+
+    # 2000 distinct files of 32 KB
+    for i in range(2000):
+        if i % 100 == 0:
+            fs.mkdir(f"/src/d{i // 100}", recursive=True)
+        fs.write_file(f"/src/d{i // 100}/f{i}.txt", "\n".join(rng.sample(lines, 400)) + "\n")
+    megabytes = fs.get_size("/src") / 1e6
+    print(f"grep -r over 2000 files ({megabytes:.0f} MB)")
+    print(f"  content index build (first indexed grep -r): {timed('grep -rl ERROR /src') * 1000:.0f} ms")
+    print(f"  {'workers':>8} {'regex':>10} {'indexed literal':>16}")
+    for workers in (1, 4):
+        grep.WORKERS, grep._pool = workers, None
+        regex = timed("grep -rcE took.99[0-9].ms /src")
+        literal = timed("grep -rl ERROR /src")
+        print(f"  {workers:>8} {megabytes / regex:>5.0f} MB/s {literal * 1000:>13.1f} ms")
+    grep.WORKERS, grep._pool = 4, None
+
+    def compile_uncached():
+        grep.compile_pattern.__wrapped__("took [0-9]+ ms", grep.EXTENDED)
+
+    print(f"pattern compile: cached {_time_per_call(lambda: grep.compile_pattern('took [0-9]+ ms', grep.EXTENDED), 100000):.2f} µs, "
+          f"uncached {_time_per_call(compile_uncached, 10000):.2f} µs")
+
+
+def bench_find():
+    """find: streamed walks with predicates, pruning and wide directories"""
+    import grep
+    from doubos import DoubOS
+
+    doubos = DoubOS()
+    doubos.kernel.boot(verbose=False)
+    doubos.login("admin", "admin123")
+    processor = doubos.processor
+    fs = doubos.filesystem
+    # 200k files: 100 project trees of 20 directories, plus a few wide ones
+    for i in range(200000):
+        directory = f"/srv/p{i % 100}/d{i // 100 % 20}" if i < 160000 else f"/srv/wide{i % 4}"
+        if i < 2000 or 160000 <= i < 160004:
+            fs.mkdir(directory, recursive=True)
+        fs.write_file(f"{directory}/f{i}.dat", "x" * (100 if i % 1000 else 50000))
+
+    def timed(command):
+        start = time.perf_counter()
+        output = processor.execute(command)
+        return (time.perf_counter() - start) * 1000, len(output.splitlines())
+
+    def materialised():
+        # The previous approach: every path first, then the filter
+        paths = list(iter_nodes("/srv", fs._get_node("/srv")))
+        return [path for path, node in paths if not node.is_directory and node.size > 10240]
+
+    start = time.perf_counter()
+    expected = len(materialised())
+    print("find over 200k files (ms)")
+    print(f"  materialise then filter (-size +10k):  {(time.perf_counter() - start) * 1000:8.1f}  ({expected} found)")
+    for command in ("find /srv -size +10k", "find /srv -user root -size +40k", "find /srv -mtime -1 -type d",
+                    "find /srv -perm -644 -type d", "find /srv -maxdepth 2 -size -2k"):
+        elapsed, found = timed(command)
+        print(f"  {command + ':':<38} {elapsed:8.1f}  ({found} lines)")
+    # Small trees are skipped wholesale once a large size is asked for
+    fs.write_file("/srv/p0/d0/huge.dat", "y" * (2 * 1024 * 1024))
+    elapsed, found = timed("find /srv -size +1M")
+    print(f"  {'find /srv -size +1M (pruned):':<38} {elapsed:8.1f}  ({found} lines)")
+
+    stream = processor.stream("find /srv -size -1k")
+    start = time.perf_counter()
+    next(iter(stream))
+    print(f"  first line of a streamed walk:         {(time.perf_counter() - start) * 1000:8.2f}")
+    stream.close()
+
+    print(f"  {'workers':>8} {'find /srv -size +1 (4 dirs of 10k files)':>42}")
+    for workers in (1, 4):
+        grep.WORKERS, grep._pool = workers, None
+        elapsed, _ = timed("find /srv -size +1")
+        print(f"  {workers:>8} {elapsed:>39.1f} ms")
+    grep.WORKERS, grep._pool = 4, None
+
+    deep = "/deep" + "/d" * 2000
+    fs.mkdir(deep, recursive=True)
+    fs.write_file(deep + "/leaf", "z")
+    elapsed, _ = timed("find /deep -type f -size 1c")
+    print(f"  2000 levels deep (recursive walk: RecursionError): {elapsed:.1f} ms")
+
+
+BENCHMARKS = {
+    "path_resolution": bench_path_resolution,
+    "journal_save": bench_journal_save,
+    "deferred_hydration": bench_deferred_hydration,
+    "append": bench_append,
+    "node_memory": bench_node_memory,
+    "content_search": bench_content_search,
+    "find_name": bench_find_name,
+    "snapshot": bench_snapshot,
+    "concurrent_reads": bench_concurrent_reads,
+    "image_format": bench_image_format,
+    "host_mount": bench_host_mount,
+    "head_tail": bench_head_tail,
+    "pipeline": bench_pipeline,
+    "batch": bench_batch,
+    "shell_server": bench_shell_server,
+    "history_search": bench_history_search,
+    "completion": bench_completion,
+    "watch": bench_watch,
+    "job_control": bench_job_control,
+    "tar": bench_tar,
+    "grep": bench_grep,
+    "find": bench_find,
+}
+
+
+def main():
+    """Run the selected benchmarks"""
+    selected = sys.argv[1:] or list(BENCHMARKS)
+    print("="*60)
+    print("DoubOS Benchmark Suite")
+    print("="*60)
+
+    for name in selected:
+        bench = BENCHMARKS.get(name)
+        if bench is None:
+            print(f"\nUnknown benchmark: {name}")
+            print(f"Available: {', '.join(BENCHMARKS)}")
+            return False
+        print()
+        bench()
+
+    return True
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
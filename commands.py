@@ -3,10 +3,17 @@ DoubOS - Command Processor
 Handles command parsing and execution
 """
 
-from typing import Dict, Callable, List, Optional
+from typing import Dict, Callable, Iterator, List, Optional, Tuple
 from datetime import datetime
+import copy
 import os
 import shutil
+import threading
+import time
+
+from grep import literal_text
+from session import Session
+from processes import Process, resident_memory
 
 
 class Command:
@@ -22,17 +29,75 @@ class Command:
     def execute(self, args: List[str], context: 'CommandContext') -> str:
         """Execute the command"""
         raise NotImplementedError
+        
+    def stream(self, args: List[str], context: 'CommandContext',
+               stdin: Optional[Iterator[str]] = None) -> Iterator[str]:
+        """Execute as a pipeline stage, yielding output lines
+        
+        stdin holds the previous stage's lines (None for the first stage).
+        The default runs execute() and splits what it returns, which suits
+        commands that do not read input; filters and commands with large
+        output override this to work line by line.
+        """
+        output = self.execute(args, context)
+        if output:
+            yield from output.split("\n")
+
+
+def file_lines(filesystem, path: str) -> Optional[Iterator[str]]:
+    """Stream a file's lines without their "\\n"; None if path is not a file"""
+    handle = filesystem.open(path)
+    if handle is None:
+        return None
+    return _stripped_lines(handle)
+    
+    
+def _stripped_lines(handle, block_size: int = 64 * 1024) -> Iterator[str]:
+    # Splitting whole blocks is much faster than readline() per line
+    with handle:
+        pending = []
+        for block in iter(lambda: handle.read(block_size), ""):
+            lines = block.split("\n")
+            if len(lines) == 1:
+                pending.append(block)
+                continue
+            pending.append(lines[0])
+            yield "".join(pending)
+            yield from lines[1:-1]
+            pending = [lines[-1]]
+        last = "".join(pending)
+        if last:
+            yield last
 
 
 class CommandContext:
-    """Context for command execution"""
+    """Context for command execution
+    
+    kernel, filesystem and user_manager are shared services; the user,
+    directory, environment and history commands act on belong to session
+    (the shell's session unless one is given).
+    """
     
-    def __init__(self, kernel, filesystem, user_manager, shell):
+    def __init__(self, kernel, filesystem, user_manager, shell, session: Optional[Session] = None):
         self.kernel = kernel
         self.filesystem = filesystem
         self.user_manager = user_manager
         self.shell = shell
-        self.current_dir = "/"
+        if session is None:
+            session = getattr(shell, "session", None) or Session(
+                environment=kernel.environment_vars if kernel else None)
+        self.session = session
+        # True while output is shown as it is produced (CommandProcessor.stream),
+        # so a command may go on producing it until interrupted (tail -f)
+        self.streaming = False
+        
+    @property
+    def current_dir(self) -> str:
+        return self.session.cwd
+        
+    @current_dir.setter
+    def current_dir(self, path: str):
+        self.session.cwd = path
 
 
 class CommandProcessor:
@@ -54,30 +119,61 @@ class CommandProcessor:
         """Register a command"""
         self.commands[command.name] = command
         
+    def fork(self, session: Session) -> 'CommandProcessor':
+        """A processor with the same commands and aliases acting on another session"""
+        context = self.context
+        forked = copy.copy(self)
+        forked.context = CommandContext(context.kernel, context.filesystem, context.user_manager,
+                                        context.shell, session)
+        forked.context.commands = self.commands
+        return forked
+        
+    @staticmethod
+    def _background(command_line: str) -> Optional[str]:
+        """The command of a line ending in "&" (None for a foreground line)"""
+        line = command_line.rstrip()
+        if line.endswith("&") and not line.endswith("&&"):
+            return line[:-1].strip()
+        return None
+        
+    def spawn(self, command_line: str) -> str:
+        """Start command_line as a background job of the session; return its "[job] pid" line
+        
+        The job runs on the kernel's process table with a copy of the
+        session, so a cd or su inside it stays there.
+        """
+        if not command_line:
+            return "syntax error near unexpected token `&'"
+        session = self.context.session
+        job_session = session.fork(history=False)
+        processor = self.fork(job_session)
+        process = self.context.kernel.processes.spawn(command_line, processor.stream,
+                                                      session.username or "guest", job_session)
+        return f"[{session.add_job(process)}] {process.pid}"
+        
     def execute(self, command_line: str) -> Optional[str]:
         """Execute a command line"""
         # Handle empty command
         if not command_line.strip():
             return None
+        background = self._background(command_line)
+        if background is not None:
+            return self.spawn(background)
+            
+        stages = self.parse_pipeline(command_line)
+        if isinstance(stages, str):
+            return stages
+        if len(stages) > 1 or stages[0][1] is not None:
+            return self.run_pipeline(stages)
             
-        # Expand aliases
-        for alias, expansion in self.aliases.items():
-            if command_line.startswith(alias + " ") or command_line == alias:
-                command_line = command_line.replace(alias, expansion, 1)
-                
         # Parse command and arguments
-        parts = command_line.split()
+        parts = self.expand_aliases(stages[0][0]).split()
         cmd_name = parts[0]
         args = parts[1:] if len(parts) > 1 else []
         
-        # Find command
-        command = self.commands.get(cmd_name)
-        if not command:
-            return f"⚠️  Command not found: {cmd_name}\nType 'help' for available commands."
-            
-        # Check admin privileges
-        if command.requires_admin and not self.context.user_manager.is_admin():
-            return f"❌ Permission denied: {cmd_name} requires administrator privileges"
+        command, error = self.resolve(cmd_name)
+        if error:
+            return error
             
         # Execute command
         try:
@@ -85,6 +181,182 @@ class CommandProcessor:
         except Exception as e:
             return f"❌ Error executing {cmd_name}: {str(e)}"
             
+    def stream(self, command_line: str) -> Iterator[str]:
+        """Execute a command line, yielding its output lines as they are produced
+        
+        The lines are those execute() would return joined; front ends that
+        print as they go use this, which also lets commands such as
+        tail -f keep producing output until the session is interrupted.
+        """
+        if not command_line.strip():
+            return
+        background = self._background(command_line)
+        if background is not None:
+            yield self.spawn(background)
+            return
+        stages = self.parse_pipeline(command_line)
+        if isinstance(stages, str):
+            yield from stages.split("\n")
+            return
+        self.context.streaming = True
+        try:
+            yield from self.pipeline_lines(stages)
+        finally:
+            self.context.streaming = False
+            
+    def expand_aliases(self, command_line: str) -> str:
+        """Replace a leading alias with its expansion"""
+        for alias, expansion in self.aliases.items():
+            if command_line.startswith(alias + " ") or command_line == alias:
+                command_line = command_line.replace(alias, expansion, 1)
+        return command_line
+        
+    def resolve(self, cmd_name: str) -> Tuple[Optional[Command], Optional[str]]:
+        """Look up a command the current user may run; (None, error message) otherwise"""
+        command = self.commands.get(cmd_name)
+        if not command:
+            return None, f"⚠️  Command not found: {cmd_name}\nType 'help' for available commands."
+            
+        # Check admin privileges
+        if command.requires_admin and not self.context.session.is_admin:
+            return None, f"❌ Permission denied: {cmd_name} requires administrator privileges"
+        return command, None
+        
+    # ============= PIPELINES =============
+    
+    # Characters written to a redirected file at a time
+    REDIRECT_BLOCK = 64 * 1024
+    
+    @staticmethod
+    def _split_unquoted(text: str, separator: str) -> Tuple[List[str], Optional[str]]:
+        """Split text at separator characters outside quotes; also return an unclosed quote
+        
+        A quote only opens a quoted run at the start of a word, so the
+        apostrophe in don't is an ordinary character.
+        """
+        parts = []
+        start = 0
+        quote = None
+        for i, char in enumerate(text):
+            if quote:
+                if char == quote:
+                    quote = None
+            elif char in "'\"" and (i == 0 or text[i - 1].isspace() or text[i - 1] in "|>"):
+                quote = char
+            elif char == separator:
+                parts.append(text[start:i])
+                start = i + 1
+        parts.append(text[start:])
+        return parts, quote
+        
+    def parse_pipeline(self, command_line: str):
+        """Split a command line into (command, redirect) stages
+        
+        Stages are separated by |; a stage may end in "> file" or
+        ">> file", giving redirect = (file, append). Operators inside
+        quotes are left alone. Returns an error message on bad syntax.
+        """
+        segments, quote = self._split_unquoted(command_line, "|")
+        if quote:
+            return "syntax error: unterminated quote"
+        stages = []
+        for segment in segments:
+            pieces, _ = self._split_unquoted(segment, ">")
+            command = pieces[0].strip()
+            if not command:
+                return "syntax error near unexpected token `|'"
+            redirect = None
+            if len(pieces) == 2:
+                redirect = (pieces[1], False)
+            elif len(pieces) == 3 and pieces[1] == "":
+                redirect = (pieces[2], True)
+            elif len(pieces) > 1:
+                return "syntax error near unexpected token `>'"
+            if redirect is not None:
+                words = redirect[0].split()
+                if len(words) != 1:
+                    return "syntax error near unexpected token `newline'"
+                redirect = (words[0], redirect[1])
+            stages.append((command, redirect))
+        return stages
+        
+    def run_pipeline(self, stages: List[Tuple[str, Optional[Tuple[str, bool]]]]) -> str:
+        """Run stages as chained line streams; return the last stage's output"""
+        return "\n".join(self.pipeline_lines(stages))
+        
+    def pipeline_lines(self, stages: List[Tuple[str, Optional[Tuple[str, bool]]]]) -> Iterator[str]:
+        """Chain stages as line streams, yielding the last stage's lines
+        
+        Every stage is a generator pulled by the next one, so a stage only
+        runs as far as its consumer reads: in `cat big.log | grep ERROR |
+        head -5` the file stops being read after the fifth match.
+        Redirected output is written to the file in blocks as it arrives.
+        A command with a stream_matching method may take over a plain
+        `| grep PATTERN` that follows it, answering from an index.
+        """
+        lines = None
+        stages = list(stages)
+        while stages:
+            command_line, redirect = stages.pop(0)
+            parts = self.expand_aliases(command_line).split()
+            command, error = self.resolve(parts[0])
+            if error:
+                yield from error.split("\n")
+                return
+            stream = None
+            needle = self._grep_needle(stages[0][0]) if stages and redirect is None else None
+            if needle is not None and hasattr(command, "stream_matching"):
+                # The command can filter for the following grep itself
+                stream = command.stream_matching(parts[1:], self.context, needle)
+                if stream is not None:
+                    redirect = stages.pop(0)[1]
+            if stream is None:
+                stream = command.stream(parts[1:], self.context, lines)
+            lines = self._guard(parts[0], stream)
+            if redirect is not None:
+                lines = self._redirect(lines, *redirect)
+        yield from lines
+        
+    def _grep_needle(self, command_line: str) -> Optional[str]:
+        """The text a plain `grep TEXT` stage looks for (None for anything else)"""
+        parts = self.expand_aliases(command_line).split()
+        if len(parts) != 2 or parts[0] != "grep" or parts[1][0] in "-'\"":
+            return None
+        if self.resolve("grep")[1]:
+            return None
+        return literal_text(parts[1])
+        
+    @staticmethod
+    def _guard(cmd_name: str, lines: Iterator[str]) -> Iterator[str]:
+        """Turn a failing stage into an error line, as execute() does"""
+        try:
+            yield from lines
+        except Exception as e:
+            yield f"❌ Error executing {cmd_name}: {str(e)}"
+            
+    def _redirect(self, lines: Iterator[str], target: str, append: bool) -> Iterator[str]:
+        """Write a stage's lines to a file (> replaces it, >> appends)"""
+        context = self.context
+        if not target.startswith("/"):
+            target = context.current_dir.rstrip("/") + "/" + target
+        owner = context.session.username or "guest"
+        if not append and not context.filesystem.write_file(target, "", owner):
+            yield f"{target}: cannot create file"
+            return
+        block = []
+        size = 0
+        for line in lines:
+            block.append(line + "\n")
+            size += len(line) + 1
+            if size >= self.REDIRECT_BLOCK:
+                if not context.filesystem.write_file(target, "".join(block), owner, append=True):
+                    yield f"{target}: cannot write file"
+                    return
+                block = []
+                size = 0
+        if block and not context.filesystem.write_file(target, "".join(block), owner, append=True):
+            yield f"{target}: cannot write file"
+            
     def register_builtin_commands(self):
         """Register all built-in commands"""
         # Navigation commands
@@ -117,9 +389,18 @@ class CommandProcessor:
         
         # System info
         self.register_command(DfCommand())
+        self.register_command(DuCommand())
+        self.register_command(SnapshotCommand())
         self.register_command(PsCommand())
         self.register_command(TopCommand())
         
+        # Job control
+        self.register_command(JobsCommand())
+        self.register_command(FgCommand())
+        self.register_command(BgCommand())
+        self.register_command(KillCommand())
+        self.register_command(SleepCommand())
+        
         # Utility commands
         self.register_command(HelpCommand())
         self.register_command(ManCommand())
@@ -140,7 +421,7 @@ class CdCommand(Command):
     def execute(self, args: List[str], context: CommandContext) -> str:
         if not args:
             # Go to home directory
-            user = context.user_manager.get_current_user()
+            user = context.session.user
             target = user.home_dir if user else "/home"
         elif args[0] == "..":
             # Go to parent directory
@@ -158,7 +439,6 @@ class CdCommand(Command):
         
         if context.filesystem.is_directory(target):
             context.current_dir = target
-            context.shell.change_directory(target)
             return None
         else:
             return f"cd: {args[0]}: No such directory"
@@ -174,11 +454,12 @@ class PwdCommand(Command):
 
 class LsCommand(Command):
     def __init__(self):
-        super().__init__("ls", "List directory contents", "ls [-l] [-a] [directory]")
+        super().__init__("ls", "List directory contents", "ls [-l] [-a] [-i] [directory]")
         
     def execute(self, args: List[str], context: CommandContext) -> str:
         long_format = "-l" in args
         show_hidden = "-a" in args
+        show_inode = "-i" in args
         
         # Remove flags from args
         args = [a for a in args if not a.startswith("-")]
@@ -209,16 +490,18 @@ class LsCommand(Command):
                 date = item.modified_at.strftime("%b %d %H:%M")
                 color = "\033[94m" if item.is_directory else "\033[0m"
                 reset = "\033[0m"
-                lines.append(f"{item_type}{item.permissions} {item.owner:8} {size:8} {date} {color}{item.name}{reset}")
+                inode = f"{item.inode:8} " if show_inode else ""
+                lines.append(f"{inode}{item_type}{item.permissions} {item.owner:8} {size:8} {date} {color}{item.name}{reset}")
             return "\n".join(lines)
         else:
             # Simple format with colors
             result = []
             for item in sorted(items, key=lambda x: x.name):
+                inode = f"{item.inode} " if show_inode else ""
                 if item.is_directory:
-                    result.append(f"\033[94m{item.name}/\033[0m")
+                    result.append(f"{inode}\033[94m{item.name}/\033[0m")
                 else:
-                    result.append(item.name)
+                    result.append(f"{inode}{item.name}")
             return "  ".join(result)
 
 
@@ -240,6 +523,23 @@ class CatCommand(Command):
         if content is None:
             return f"cat: {args[0]}: No such file or directory"
         return content.rstrip()
+        
+    def stream(self, args: List[str], context: CommandContext,
+               stdin: Optional[Iterator[str]] = None) -> Iterator[str]:
+        if not args and stdin is not None:
+            yield from stdin
+            return
+        if not args:
+            yield "cat: missing file operand"
+            return
+        target = args[0]
+        if not target.startswith("/"):
+            target = context.current_dir.rstrip("/") + "/" + target
+        lines = file_lines(context.filesystem, target)
+        if lines is None:
+            yield f"cat: {args[0]}: No such file or directory"
+            return
+        yield from lines
 
 
 class TouchCommand(Command):
@@ -254,7 +554,7 @@ class TouchCommand(Command):
         if not target.startswith("/"):
             target = context.current_dir.rstrip("/") + "/" + target
             
-        user = context.user_manager.get_current_user()
+        user = context.session.user
         owner = user.username if user else "guest"
         
         if context.filesystem.write_file(target, "", owner):
@@ -281,7 +581,7 @@ class MkdirCommand(Command):
         if not target.startswith("/"):
             target = context.current_dir.rstrip("/") + "/" + target
             
-        user = context.user_manager.get_current_user()
+        user = context.session.user
         owner = user.username if user else "guest"
         
         if context.filesystem.mkdir(target, recursive, owner):
@@ -402,7 +702,7 @@ class WhoamiCommand(Command):
         super().__init__("whoami", "Display current user", "whoami")
         
     def execute(self, args: List[str], context: CommandContext) -> str:
-        user = context.user_manager.get_current_user()
+        user = context.session.user
         return user.username if user else "guest"
 
 
@@ -418,16 +718,50 @@ class UnameCommand(Command):
 
 class HistoryCommand(Command):
     def __init__(self):
-        super().__init__("history", "Display command history", "history")
+        super().__init__("history", "Display command history",
+                         "history [N] | history -s <text> | history -c")
         
     def execute(self, args: List[str], context: CommandContext) -> str:
-        history = context.kernel.command_history
-        if not history:
-            return ""
-        lines = []
-        for i, entry in enumerate(history[-50:], 1):  # Last 50 commands
-            lines.append(f"{i:4d}  {entry['command']}")
-        return "\n".join(lines)
+        return "\n".join(self.stream(args, context))
+        
+    @staticmethod
+    def format(number: int, line: str) -> str:
+        return f"{number:5d}  {line}"
+        
+    def stream(self, args: List[str], context: CommandContext,
+               stdin: Optional[Iterator[str]] = None) -> Iterator[str]:
+        history = context.session.history
+        if not args:
+            entries = history.entries()
+        elif args[0] == "-c":
+            history.clear()
+            return
+        elif args[0] == "-s":
+            # Reverse search, as Ctrl-R does
+            if len(args) < 2:
+                yield f"history: -s requires text to search for\nUsage: {self.usage}"
+                return
+            found = history.search(" ".join(args[1:]))
+            if found:
+                yield self.format(*found)
+            return
+        elif args[0].isdigit():
+            entries = history.tail(int(args[0]))
+        else:
+            yield f"history: {args[0]}: numeric argument required"
+            return
+        for number, line in entries:
+            yield self.format(number, line)
+            
+    def stream_matching(self, args: List[str], context: CommandContext,
+                        needle: str) -> Optional[Iterator[str]]:
+        """The lines `history | grep needle` prints, found through the history's index"""
+        if args or needle[:1].isdigit():
+            # Numbers are part of each line; leave those matches to grep
+            return None
+        # The index ignores case; grep does not
+        return (self.format(number, line) for number, line in context.session.history.matches(needle)
+                if needle in line)
 
 
 class EnvCommand(Command):
@@ -436,7 +770,7 @@ class EnvCommand(Command):
         
     def execute(self, args: List[str], context: CommandContext) -> str:
         lines = []
-        for key, value in context.kernel.environment_vars.items():
+        for key, value in context.session.environment.items():
             lines.append(f"{key}={value}")
         return "\n".join(lines)
 
@@ -456,7 +790,25 @@ class SuCommand(Command):
         super().__init__("su", "Switch user", "su [username]")
         
     def execute(self, args: List[str], context: CommandContext) -> str:
-        return "User switching requires interactive mode (not available in simulation)"
+        if len(args) > 1:
+            # A password on the command line would end up in the history file
+            return f"Usage: {self.usage}"
+        username = args[0] if args else "admin"
+        if context.session.is_admin:
+            # Administrators switch without a password
+            user = context.user_manager.get_user(username)
+            if user is None:
+                return f"su: user {username} does not exist"
+        else:
+            ask = context.session.ask_password
+            if ask is None:
+                return "su: no terminal to read a password from"
+            password = ask("Password: ")
+            user = context.user_manager.authenticate(username, password) if password else None
+            if user is None:
+                return "su: Authentication failure"
+        context.session.switch_user(user)
+        return None
 
 
 class UsersCommand(Command):
@@ -479,18 +831,148 @@ class DfCommand(Command):
         super().__init__("df", "Display disk space usage", "df")
         
     def execute(self, args: List[str], context: CommandContext) -> str:
-        total_size = context.filesystem.get_size("/")
-        return f"Filesystem     Size    Used\n/             Virtual  {total_size}B"
+        logical, physical = context.filesystem.get_usage("/")
+        return (f"Filesystem     Size    Used      Physical\n"
+                f"/             Virtual  {str(logical) + 'B':9} {physical}B")
+
+
+class DuCommand(Command):
+    def __init__(self):
+        super().__init__("du", "Estimate file space usage", "du [-s] [-h] [-d N] [path]")
+        
+    @staticmethod
+    def human_size(size: int) -> str:
+        """Format a byte count as 512B, 1.5K, 3.0M, ..."""
+        for unit in ("B", "K", "M", "G"):
+            if size < 1024 or unit == "G":
+                return f"{size}{unit}" if unit == "B" else f"{size:.1f}{unit}"
+            size /= 1024
+            
+    def execute(self, args: List[str], context: CommandContext) -> str:
+        summarize = "-s" in args
+        human = "-h" in args
+        max_depth = 0 if summarize else None
+        
+        if "-d" in args:
+            try:
+                idx = args.index("-d")
+                max_depth = int(args[idx + 1])
+                args = args[:idx] + args[idx + 2:]
+            except (IndexError, ValueError):
+                return "du: option -d requires a numeric depth"
+                
+        args = [a for a in args if not a.startswith("-")]
+        display = args[0] if args else "."
+        target = args[0] if args else context.current_dir
+        if not target.startswith("/"):
+            target = context.current_dir.rstrip("/") + "/" + target
+            
+        node = context.filesystem._get_node(target)
+        if node is None:
+            return f"du: cannot access '{display}': No such file or directory"
+            
+        # Directory sizes are kept up to date by the filesystem, so each
+        # line costs O(1); only the listing itself walks the tree
+        lines = []
+        stack = [(node, display, 0, False)]
+        while stack:
+            item, item_path, depth, expanded = stack.pop()
+            if item.is_directory and not expanded:
+                stack.append((item, item_path, depth, True))
+                if max_depth is None or depth < max_depth:
+                    subdirs = sorted((c for c in item.children.values() if c.is_directory),
+                                     key=lambda c: c.name, reverse=True)
+                    for child in subdirs:
+                        stack.append((child, item_path.rstrip("/") + "/" + child.name, depth + 1, False))
+                continue
+            size = item.tree_size if item.is_directory else item.size
+            size_text = self.human_size(size) if human else str(size)
+            lines.append(f"{size_text}\t{item_path}")
+                
+        return "\n".join(lines)
 
 
+class SnapshotCommand(Command):
+    def __init__(self):
+        super().__init__("snapshot", "Save and restore file system snapshots",
+                         "snapshot create [name] | list | restore <name> | rm <name>")
+        
+    def execute(self, args: List[str], context: CommandContext) -> str:
+        fs = context.filesystem
+        action = args[0] if args else "list"
+        
+        if action == "create":
+            name = fs.create_snapshot(args[1] if len(args) > 1 else None)
+            if name is None:
+                return f"snapshot: '{args[1]}' already exists"
+            return f"📸 Snapshot '{name}' created"
+            
+        if action == "list":
+            snapshots = fs.list_snapshots()
+            if not snapshots:
+                return "No snapshots"
+            lines = [f"{'NAME':16} {'CREATED':19} {'FILES':>7} {'SIZE':>8}  NOTE"]
+            for snap in snapshots:
+                created = snap.created_at.strftime("%Y-%m-%d %H:%M:%S")
+                size = DuCommand.human_size(snap.root.tree_size)
+                lines.append(f"{snap.name:16} {created} {snap.root.file_count:>7} {size:>8}  {snap.note}")
+            return "\n".join(lines)
+            
+        if action == "restore":
+            if len(args) < 2:
+                return "snapshot: restore requires a snapshot name"
+            if not context.session.is_admin:
+                return "❌ Permission denied: snapshot restore requires administrator privileges"
+            if not fs.restore_snapshot(args[1]):
+                return f"snapshot: no such snapshot: {args[1]}"
+            context.current_dir = "/"
+            return f"⏪ Restored snapshot '{args[1]}'"
+            
+        if action == "rm":
+            if len(args) < 2:
+                return "snapshot: rm requires a snapshot name"
+            if not context.session.is_admin:
+                return "❌ Permission denied: snapshot rm requires administrator privileges"
+            if not fs.delete_snapshot(args[1]):
+                return f"snapshot: no such snapshot: {args[1]}"
+            return f"🗑️ Removed snapshot '{args[1]}'"
+            
+        return f"snapshot: unknown action '{action}'\nUsage: {self.usage}"
+
+
+def _seconds(value: float) -> str:
+    """Duration for process listings: 0.42s, 3m05s, 2h07m"""
+    if value < 60:
+        return f"{value:.2f}s"
+    minutes, seconds = divmod(int(value), 60)
+    if minutes < 60:
+        return f"{minutes}m{seconds:02d}s"
+    return f"{minutes // 60}h{minutes % 60:02d}m"
+    
+    
+def _megabytes(value: int, signed: bool = False) -> str:
+    return f"{value / 2 ** 20:{'+' if signed else ''}.1f}M"
+    
+    
+def _process_rows(processes: List[Process], context: CommandContext) -> List[str]:
+    """ps/top table: the kernel as pid 1 (whole-system totals), then each process"""
+    kernel = context.kernel
+    uptime = (datetime.now() - kernel.boot_time).total_seconds() if kernel.boot_time else 0.0
+    rows = [f"{'PID':>5}  {'USER':8} {'STAT':8} {'CPU':>8} {'WALL':>8} {'MEM':>8}  COMMAND",
+            f"{1:>5}  {'root':8} {'running':8} {_seconds(time.process_time()):>8} "
+            f"{_seconds(uptime):>8} {_megabytes(resident_memory()):>8}  init"]
+    for process in processes:
+        rows.append(f"{process.pid:>5}  {process.user:8} {process.state:8} {_seconds(process.cpu_time):>8} "
+                    f"{_seconds(process.wall_time):>8} {_megabytes(process.memory, True):>8}  {process.command}")
+    return rows
+    
+    
 class PsCommand(Command):
     def __init__(self):
         super().__init__("ps", "List running processes", "ps")
         
     def execute(self, args: List[str], context: CommandContext) -> str:
-        user = context.user_manager.get_current_user()
-        username = user.username if user else "guest"
-        return f"PID  USER      COMMAND\n  1  root      init\n  2  {username:8}  shell"
+        return "\n".join(_process_rows(context.kernel.processes.list(), context))
 
 
 class TopCommand(Command):
@@ -499,13 +981,185 @@ class TopCommand(Command):
         
     def execute(self, args: List[str], context: CommandContext) -> str:
         uptime = context.kernel.get_uptime()
-        user = context.user_manager.get_current_user()
+        user = context.session.user
         username = user.username if user else "guest"
-        return f"""DoubOS System Monitor
-Uptime: {uptime}
-User: {username}
-Processes: 2 total
-Memory: Virtual (unlimited)"""
+        processes = context.kernel.processes.list()
+        states = {}
+        for process in processes:
+            states[process.state] = states.get(process.state, 0) + 1
+        counts = ", ".join(f"{count} {state}" for state, count in sorted(states.items()))
+        # Busiest first
+        processes.sort(key=lambda process: process.cpu_time, reverse=True)
+        return "\n".join([
+            "DoubOS System Monitor",
+            f"Uptime: {uptime}",
+            f"User: {username}",
+            f"Processes: {len(processes) + 1} total" + (f" ({counts})" if counts else ""),
+            f"CPU: {_seconds(time.process_time())} used since start",
+            f"Memory: {_megabytes(resident_memory())} resident",
+            "",
+        ] + _process_rows(processes, context))
+
+
+# ============= JOB CONTROL =============
+
+def _find_job(args: List[str], context: CommandContext) -> Tuple[Optional[int], Optional[Process], Optional[str]]:
+    """(job number, process, error) for "%N", a pid, or the newest job when args is empty"""
+    jobs = context.session.jobs
+    if not args:
+        if not jobs:
+            return None, None, "no current job"
+        number = max(jobs)
+        return number, jobs[number], None
+    spec = args[0]
+    if spec.startswith("%"):
+        try:
+            number = int(spec[1:])
+        except ValueError:
+            number = None
+        if number not in jobs:
+            return None, None, f"{spec}: no such job"
+        return number, jobs[number], None
+    try:
+        pid = int(spec)
+    except ValueError:
+        return None, None, f"{spec}: arguments must be process or job IDs"
+    for number, process in jobs.items():
+        if process.pid == pid:
+            return number, process, None
+    process = context.kernel.processes.get(pid)
+    if process is None:
+        return None, None, f"({pid}) - No such process"
+    return None, process, None
+
+
+class _Alarm:
+    """A sleep that Session.interrupt() cuts short"""
+    
+    def __init__(self):
+        self._woken = threading.Event()
+        
+    def sleep(self, seconds: float) -> bool:
+        """Sleep; False if interrupted"""
+        return not self._woken.wait(seconds)
+        
+    def close(self):
+        self._woken.set()
+
+
+class JobsCommand(Command):
+    def __init__(self):
+        super().__init__("jobs", "List background jobs", "jobs [-l]")
+        
+    def execute(self, args: List[str], context: CommandContext) -> str:
+        lines = []
+        long = "-l" in args
+        for number, process in sorted(context.session.jobs.items()):
+            if long:
+                lines.append(f"[{number}]  {process.pid:>5} {process.state.capitalize():<10} "
+                             f"cpu {_seconds(process.cpu_time):>7}  wall {_seconds(process.wall_time):>7}  "
+                             f"{process.command}")
+            else:
+                lines.append(f"[{number}]  {process.state.capitalize():<10} {process.command}")
+        # Finished jobs are listed once
+        context.session.job_notices()
+        return "\n".join(lines)
+
+
+class FgCommand(Command):
+    def __init__(self):
+        super().__init__("fg", "Bring a job to the foreground", "fg [%job]")
+        
+    def execute(self, args: List[str], context: CommandContext) -> str:
+        return "\n".join(self.stream(args, context))
+        
+    def stream(self, args: List[str], context: CommandContext,
+               stdin: Optional[Iterator[str]] = None) -> Iterator[str]:
+        number, process, error = _find_job(args, context)
+        if error:
+            yield f"fg: {error}"
+            return
+        if number is None:
+            yield f"fg: {process.pid}: not a job of this shell"
+            return
+        yield process.command
+        process.resume()
+        # Interrupting the foreground job kills it
+        session = context.session
+        session.wait_on(process)
+        finished = False
+        try:
+            yield from process.follow()
+            finished = True
+        finally:
+            session.done_waiting(process)
+            if not finished:
+                process.kill()
+        session.jobs.pop(number, None)
+
+
+class BgCommand(Command):
+    def __init__(self):
+        super().__init__("bg", "Resume a stopped job in the background", "bg [%job]")
+        
+    def execute(self, args: List[str], context: CommandContext) -> str:
+        number, process, error = _find_job(args, context)
+        if error:
+            return f"bg: {error}"
+        if number is None:
+            return f"bg: {process.pid}: not a job of this shell"
+        if not process.resume():
+            return f"bg: job {number} has finished"
+        return f"[{number}] {process.command} &"
+
+
+class KillCommand(Command):
+    # Signals by name and number, as what they do here
+    SIGNALS = {"TERM": "kill", "KILL": "kill", "INT": "kill", "STOP": "stop", "TSTP": "stop",
+               "CONT": "resume", "15": "kill", "9": "kill", "2": "kill", "19": "stop", "18": "resume"}
+    
+    def __init__(self):
+        super().__init__("kill", "Stop, resume or end a process", "kill [-STOP|-CONT|-KILL] <pid|%job>...")
+        
+    def execute(self, args: List[str], context: CommandContext) -> str:
+        action = "kill"
+        if args and args[0].startswith("-") and len(args[0]) > 1:
+            name = args[0][1:].upper()
+            action = self.SIGNALS.get(name[3:] if name.startswith("SIG") else name)
+            if action is None:
+                return f"kill: {args[0]}: invalid signal specification"
+            args = args[1:]
+        if not args:
+            return f"Usage: {self.usage}"
+        errors = []
+        user = context.session.username or "guest"
+        for spec in args:
+            _, process, error = _find_job([spec], context)
+            if error:
+                errors.append(f"kill: {error}")
+            elif process.user != user and not context.session.is_admin:
+                errors.append(f"kill: ({process.pid}) - Operation not permitted")
+            else:
+                getattr(process, action)()
+        return "\n".join(errors) or None
+
+
+class SleepCommand(Command):
+    def __init__(self):
+        super().__init__("sleep", "Wait for a number of seconds", "sleep <seconds>")
+        
+    def execute(self, args: List[str], context: CommandContext) -> str:
+        try:
+            seconds = float(args[0])
+        except (IndexError, ValueError):
+            return f"Usage: {self.usage}"
+        alarm = _Alarm()
+        context.session.wait_on(alarm)
+        try:
+            alarm.sleep(max(seconds, 0.0))
+        finally:
+            context.session.done_waiting(alarm)
+        return None
 
 
 # ============= UTILITY COMMANDS =============
@@ -531,7 +1185,8 @@ class HelpCommand(Command):
             "File Operations": ["cat", "touch", "mkdir", "rm", "cp", "mv", "echo"],
             "System": ["clear", "date", "uptime", "whoami", "uname", "history", "env"],
             "Users": ["passwd", "su", "users"],
-            "Info": ["df", "ps", "top"],
+            "Info": ["df", "du", "snapshot", "ps", "top"],
+            "Jobs": ["jobs", "fg", "bg", "kill", "sleep"],
             "Power": ["shutdown", "reboot", "exit"],
             "Dangerous": ["format", "nuke"],
             "Help": ["help", "man"]
@@ -547,6 +1202,7 @@ class HelpCommand(Command):
                     output.append(f"  {admin_flag} {cmd.name:12} - {cmd.description}")
         
         output.append("\n\nType 'help <command>' for detailed information")
+        output.append("Chain commands with | and save output with > file or >> file")
         output.append("🔒 = Requires admin privileges")
         return "\n".join(output)
 
@@ -594,5 +1250,5 @@ class ExitCommand(Command):
         super().__init__("exit", "Exit the shell", "exit")
         
     def execute(self, args: List[str], context: CommandContext) -> str:
-        context.kernel.shutdown()
+        context.session.end()
         return None
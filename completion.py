@@ -0,0 +1,265 @@
+"""
+DoubOS - Tab Completion
+Completes command names and VFS paths for the shell and the GUI terminal
+"""
+
+import posixpath
+import threading
+import weakref
+from bisect import bisect_left, insort
+from collections import OrderedDict
+from os.path import commonprefix
+from typing import Dict, List, Optional
+
+from filesystem import CREATE, DELETE, MOVE, RESET, Change
+
+
+# Characters that end a word when completing (as the shell splits lines)
+DELIMITERS = " \t\n|<>"
+
+
+class CommandTrie:
+    """Prefix tree over command names and aliases"""
+
+    def __init__(self, words=()):
+        # Nested dicts keyed by character; the "" key marks a whole word
+        self._root: Dict[str, dict] = {}
+        for word in words:
+            self.insert(word)
+
+    def insert(self, word: str):
+        node = self._root
+        for char in word:
+            node = node.setdefault(char, {})
+        node[""] = word
+
+    def words(self, prefix: str = "") -> List[str]:
+        """Every word starting with prefix, sorted"""
+        node = self._root
+        for char in prefix:
+            node = node.get(char)
+            if node is None:
+                return []
+        found = []
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            for key, child in node.items():
+                if key:
+                    stack.append(child)
+                else:
+                    found.append(child)
+        found.sort()
+        return found
+
+
+class DirectoryListings:
+    """Sorted child names of recently completed directories
+
+    Names of subdirectories end in "/". A listing is built from
+    list_directory the first time a directory is completed in; after that
+    the file system's change notifications keep it current (a create or
+    delete is one insertion into or removal from the sorted list), so a
+    completion costs two binary searches however large the directory is.
+    Directories in host mounts change behind the VFS's back and are listed
+    afresh every time.
+    """
+
+    # Directories whose listings are kept, least recently used dropped first
+    MAX_DIRECTORIES = 256
+
+    def __init__(self, filesystem):
+        self._filesystem = weakref.ref(filesystem)
+        self._lock = threading.Lock()
+        self._listings: "OrderedDict[str, List[str]]" = OrderedDict()
+        # Bumped by every change, so a listing built while the tree was
+        # changing underneath is not kept
+        self._changes = 0
+        filesystem.add_listener(self.changed)
+
+    def names(self, path: str) -> Optional[List[str]]:
+        """Sorted child names of the directory at a normalized path (None if there is none)
+
+        The list returned is shared; do not modify it.
+        """
+        with self._lock:
+            names = self._listings.get(path)
+            if names is not None:
+                self._listings.move_to_end(path)
+                return names
+            changes = self._changes
+        filesystem = self._filesystem()
+        if filesystem is None:
+            return None
+        items = filesystem.list_directory(path)
+        if items is None:
+            return None
+        names = sorted(item.name + "/" if item.is_directory else item.name for item in items)
+        if filesystem.mounts and filesystem._in_mount(path):
+            return names
+        with self._lock:
+            if changes == self._changes:
+                self._listings[path] = names
+                if len(self._listings) > self.MAX_DIRECTORIES:
+                    self._listings.popitem(last=False)
+        return names
+
+    def changed(self, change: Change):
+        """File system listener: patch or drop the listings a change affects"""
+        with self._lock:
+            self._changes += 1
+            if change.event == RESET:
+                self._forget(change.path)
+            elif change.event in (CREATE, DELETE):
+                self._forget(change.path)
+                self._unlist(change.path)
+                if change.event == CREATE:
+                    self._list(change.path, change.is_directory)
+            elif change.event == MOVE:
+                self._forget(change.path)
+                self._unlist(change.path)
+                self._forget(change.dest)
+                self._unlist(change.dest)
+                self._list(change.dest, change.is_directory)
+
+    def _forget(self, path: str):
+        """Drop the listings of path and every directory below it"""
+        if path == "/":
+            self._listings.clear()
+            return
+        prefix = path + "/"
+        for key in [key for key in self._listings if key == path or key.startswith(prefix)]:
+            del self._listings[key]
+
+    def _unlist(self, path: str):
+        parent, _, name = path.rpartition("/")
+        names = self._listings.get(parent or "/")
+        if names is not None:
+            for entry in (name, name + "/"):
+                index = bisect_left(names, entry)
+                if index < len(names) and names[index] == entry:
+                    del names[index]
+
+    def _list(self, path: str, is_directory: bool):
+        parent, _, name = path.rpartition("/")
+        names = self._listings.get(parent or "/")
+        if names is not None:
+            insort(names, name + "/" if is_directory else name)
+
+
+# One set of listings per file system, shared by all of its sessions
+_listings: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+_listings_lock = threading.Lock()
+
+
+def listings_for(filesystem) -> DirectoryListings:
+    """The DirectoryListings kept for filesystem"""
+    with _listings_lock:
+        listings = _listings.get(filesystem)
+        if listings is None:
+            listings = _listings[filesystem] = DirectoryListings(filesystem)
+        return listings
+
+
+def _cut(names: List[str], limit: int, start: int = 0, end: Optional[int] = None) -> List[str]:
+    """names[start:end] (sorted) cut to at most limit entries, keeping the last
+
+    The common prefix of a sorted list is that of its first and last
+    entries, so what a completion inserts is unchanged by the cut.
+    """
+    end = len(names) if end is None else end
+    if end - start <= limit:
+        return names[start:end]
+    return names[start:start + limit - 1] + names[end - 1:end]
+
+
+def _prefixed(names: List[str], prefix: str, limit: int) -> List[str]:
+    """Sorted names starting with prefix, cut to limit; names starting with "." only if prefix does"""
+    if prefix:
+        start = bisect_left(names, prefix)
+        end = bisect_left(names, prefix[:-1] + chr(ord(prefix[-1]) + 1), start)
+        return _cut(names, limit, start, end)
+    # Hidden names sort together, between "." and "/"
+    start = bisect_left(names, ".")
+    end = bisect_left(names, "/", start)
+    if start == end:
+        return _cut(names, limit)
+    return _cut(_cut(names, limit, 0, start) + _cut(names, limit, end), limit)
+
+
+class Completer:
+    """Tab completion for one CommandProcessor's session
+
+    The first word of a command (or of a pipeline stage) completes to
+    command names and aliases the session's user may run; every other word
+    completes to a path, relative to the session's directory. Command
+    names come from a trie rebuilt only when commands or aliases change;
+    paths come from the file system's shared DirectoryListings.
+    """
+
+    # Candidates returned for one completion; readline and the GUI only
+    # show them, and a larger list would cost more than the lookup
+    MAX_CANDIDATES = 1000
+
+    def __init__(self, processor):
+        self.processor = processor
+        self.context = processor.context
+        self.listings = listings_for(self.context.filesystem)
+        self._trie = CommandTrie()
+        self._known = frozenset()
+
+    @staticmethod
+    def word_start(line: str) -> int:
+        """Index where the last word of line starts"""
+        start = len(line)
+        while start and line[start - 1] not in DELIMITERS:
+            start -= 1
+        return start
+
+    def complete(self, line: str) -> List[str]:
+        """Candidates to replace the last word of line with, sorted"""
+        start = self.word_start(line)
+        word = line[start:]
+        before = line[:start].rstrip()
+        if not before or before.endswith("|"):
+            return self.complete_command(word)
+        return self.complete_path(word)
+
+    def complete_command(self, prefix: str) -> List[str]:
+        """Command names and aliases starting with prefix"""
+        processor = self.processor
+        known = processor.commands.keys() | processor.aliases.keys()
+        if known != self._known:
+            self._trie = CommandTrie(known)
+            self._known = frozenset(known)
+        is_admin = self.context.session.is_admin
+        candidates = []
+        for name in self._trie.words(prefix):
+            command = processor.commands.get(name)
+            if command is None or is_admin or not command.requires_admin:
+                candidates.append(name)
+        return _cut(candidates, self.MAX_CANDIDATES)
+
+    def complete_path(self, word: str) -> List[str]:
+        """Paths starting with word; directories end in "/" """
+        head, _, base = word.rpartition("/")
+        if word.startswith("/"):
+            directory = head or "/"
+        else:
+            directory = self.context.current_dir.rstrip("/") + "/" + head
+        directory = posixpath.normpath("/" + directory.lstrip("/"))
+        names = self.listings.names(directory)
+        if not names:
+            return []
+        matches = _prefixed(names, base, self.MAX_CANDIDATES)
+        if not head and not word.startswith("/"):
+            return matches
+        prefix = word[:len(word) - len(base)]
+        return [prefix + name for name in matches]
+
+    @staticmethod
+    def common_prefix(candidates: List[str]) -> str:
+        """Longest text every candidate starts with"""
+        if not candidates:
+            return ""
+        return commonprefix([min(candidates), max(candidates)])
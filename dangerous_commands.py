@@ -50,6 +50,9 @@ Think carefully before doing this!"""
         for stage in stages:
             result += f"\n   [{stage}] ✓"
             
+        # Keep the old tree around; snapshots are O(1)
+        snapshot = context.filesystem.create_snapshot(note="before format", auto=True)
+        
         # Actually format the file system
         context.filesystem.format()
         
@@ -60,7 +63,8 @@ Think carefully before doing this!"""
         # Reinitialize basic structure
         context.filesystem.initialize_default_structure()
         
-        result += f"\n✓  Basic structure restored\n"
+        result += f"\n✓  Basic structure restored"
+        result += f"\n📸 Previous contents saved: snapshot restore {snapshot}\n"
         return result
 
 
@@ -112,6 +116,7 @@ To proceed with total annihilation, run:
         # Nuke sequence
         output.append("🔥 NUKING ALL SYSTEMS:")
         output.append("   [Wiping file system...] ☢️")
+        snapshot = context.filesystem.create_snapshot(note="before nuke", auto=True)
         context.filesystem.format()
         
         output.append("   [Removing user accounts...] ☢️")
@@ -121,10 +126,10 @@ To proceed with total annihilation, run:
             context.user_manager.remove_user(username)
             
         output.append("   [Clearing command history...] ☢️")
-        context.kernel.command_history.clear()
+        context.session.history.clear()
         
         output.append("   [Resetting environment...] ☢️")
-        context.kernel.environment_vars.clear()
+        context.session.environment.clear()
         
         output.append("   [Destroying logs...] ☢️")
         output.append("   [Obliterating metadata...] ☢️")
@@ -136,13 +141,14 @@ To proceed with total annihilation, run:
         # Reinitialize bare minimum
         context.filesystem.initialize_default_structure()
         context.user_manager.initialize_default_users()
-        context.kernel.environment_vars = {
+        context.session.environment.update({
             "OS_NAME": "DoubOS",
             "OS_VERSION": "1.0.0"
-        }
+        })
         
         output.append("✓  Minimal system restored")
         output.append("\n⚠️  All previous data has been permanently destroyed!")
+        output.append(f"📸 ...except the file system: snapshot restore {snapshot}")
         
         return "\n".join(output)
 
@@ -228,14 +234,15 @@ To proceed, run: wipe {args[0]} --confirm"""
         count = len(items)
         
         # Wipe the directory
+        snapshot = context.filesystem.create_snapshot(note=f"before wipe {target}", auto=True)
         if context.filesystem.remove(target, recursive=True):
-            return f"✓  Wiped {args[0]} ({count} items deleted)"
+            return f"✓  Wiped {args[0]} ({count} items deleted)\n📸 Undo with: snapshot restore {snapshot}"
         else:
             return f"wipe: failed to wipe {args[0]}"
 
 
 class KillallCommand(Command):
-    """Terminate all processes (simulated)"""
+    """Terminate every background process"""
     
     def __init__(self):
         super().__init__(
@@ -251,13 +258,13 @@ class KillallCommand(Command):
 
 To proceed, run: killall --confirm"""
         
-        return """🔪 Terminating all processes...
-   [Killing user processes...] ✓
-   [Killing system daemons...] ✓
-   [Stopping services...] ✓
+        count = context.kernel.processes.kill_all()
+        if not count:
+            return "killall: no processes to terminate"
+        return f"""🔪 Terminating all processes...
+   [Killing {count} process(es)...] ✓
 
-✓  All processes terminated!
-⚠️  System may be unstable"""
+✓  All processes terminated!"""
 
 
 class CorruptCommand(Command):
@@ -288,7 +295,7 @@ class CorruptCommand(Command):
         corrupted = ''.join(random.choice('!@#$%^&*()~`{}[]|\\:;"<>,.?/') 
                            for _ in range(len(content)))
         
-        user = context.user_manager.get_current_user()
+        user = context.session.user
         owner = user.username if user else "guest"
         context.filesystem.write_file(target, corrupted, owner)
         
@@ -335,7 +342,7 @@ class LogbombCommand(Command):
         # Generate massive log entry
         log_entry = "[WARNING] " * 1000 + "\n"
         
-        user = context.user_manager.get_current_user()
+        user = context.session.user
         owner = user.username if user else "guest"
         
         context.filesystem.write_file("/var/log/system.log", log_entry, owner, append=True)
@@ -5,33 +5,59 @@ Fully Fledged Operating System Simulator
 Run this file to start DoubOS!
 """
 
+import argparse
+import contextlib
 import sys
 import os
 from kernel import DoubOSKernel, DoubOSShell
 from filesystem import VirtualFileSystem
 from users import UserManager
+from session import Session
 from commands import CommandProcessor, CommandContext
 from dangerous_commands import register_dangerous_commands
 from utilities import register_utility_commands
 from fun_commands import register_fun_commands
+from completion import Completer
+import image_format
+from batch import parse_script, read_script, run_script
+
+
+FILESYSTEM_FILE = "doubos_filesystem.json"
+JOURNAL_FILE = "doubos_filesystem.journal"
+USERS_FILE = "doubos_users.json"
+
+# Binary images (see image_format.py), used with --binary
+BINARY_FILESYSTEM_FILE = "doubos_filesystem.dimg"
+BINARY_USERS_FILE = "doubos_users.dimg"
 
 
 class DoubOS:
     """Main DoubOS orchestrator"""
     
-    def __init__(self):
+    def __init__(self, journaled: bool = False, binary: bool = False):
+        # Journaled sessions persist every filesystem change as it happens
+        self.journaled = journaled
+        # Binary sessions save compact images instead of JSON, reading the
+        # JSON files once if no image exists yet
+        self.filesystem_file = BINARY_FILESYSTEM_FILE if binary else FILESYSTEM_FILE
+        self.users_file = BINARY_USERS_FILE if binary else USERS_FILE
+        
         # Initialize core components
         self.kernel = DoubOSKernel()
         self.filesystem = VirtualFileSystem()
         self.user_manager = UserManager()
-        self.shell = DoubOSShell(self.kernel)
+        
+        # The console's login: user, directory, environment and history
+        self.session = Session(environment=self.kernel.environment_vars)
+        self.shell = DoubOSShell(self.kernel, self.session)
         
         # Create command context
         self.context = CommandContext(
             self.kernel,
             self.filesystem,
             self.user_manager,
-            self.shell
+            self.shell,
+            self.session
         )
         
         # Initialize command processor
@@ -45,6 +71,17 @@ class DoubOS:
         # Store processor reference in context
         self.context.commands = self.processor.commands
         
+        # Tab completion in the interactive shell
+        self.shell.completer = Completer(self.processor)
+        
+    def login(self, username: str, password: str) -> bool:
+        """Authenticate and start the session in the user's home directory"""
+        user = self.user_manager.authenticate(username, password)
+        if not user:
+            return False
+        self.session.switch_user(user)
+        return True
+        
     def login_screen(self):
         """Display login screen and handle authentication"""
         print("\n" + "="*60)
@@ -68,12 +105,8 @@ class DoubOS:
                     
                 password = input("Password: ").strip()
                 
-                if self.user_manager.login(username, password):
-                    user = self.user_manager.get_current_user()
-                    self.kernel.current_user = username
-                    self.context.current_dir = user.home_dir
-                    self.shell.current_dir = user.home_dir
-                    
+                if self.login(username, password):
+                    self.session.open_history(self.filesystem)
                     print(f"\n✓ Login successful! Welcome, {username}!")
                     
                     # Show message of the day
@@ -116,39 +149,116 @@ class DoubOS:
         # Main shell loop
         for command in self.shell.run():
             if command:
-                output = self.processor.execute(command)
-                if output:
-                    print(output)
+                # Print output as it is produced; Ctrl-C stops a command
+                # that keeps producing it (tail -f)
+                try:
+                    for line in self.processor.stream(command):
+                        print(line, flush=True)
+                except KeyboardInterrupt:
+                    print("^C")
                     
-                # Check if kernel was shutdown
-                if not self.kernel.running:
+                # Check for exit or shutdown
+                if not (self.session.running and self.kernel.running):
                     break
                     
+    def run_batch(self, commands, quiet: bool = False):
+        """Execute script commands without prompts; return the timing report"""
+        return run_script(self.processor, commands,
+                          output=None if quiet else sys.stdout,
+                          history=self.session.add_to_history,
+                          running=lambda: self.session.running and self.kernel.running)
+                    
     def save_state(self):
         """Save system state to disk"""
         try:
-            self.filesystem.save_to_disk("doubos_filesystem.json")
-            self.user_manager.save_to_disk("doubos_users.json")
+            self.session.history.flush()
+            self.filesystem.save_to_disk(self.filesystem_file)
+            self.user_manager.save_to_disk(self.users_file)
             print("✓ System state saved")
         except Exception as e:
             print(f"⚠️  Error saving state: {e}")
             
+    @staticmethod
+    def _existing(path: str, fallback: str) -> str:
+        """path, or fallback if only that one has been saved so far"""
+        if not os.path.exists(path) and os.path.exists(fallback):
+            return fallback
+        return path
+        
     def load_state(self):
         """Load system state from disk"""
         try:
-            if os.path.exists("doubos_filesystem.json"):
-                self.filesystem.load_from_disk("doubos_filesystem.json")
+            filesystem_file = self._existing(self.filesystem_file, FILESYSTEM_FILE)
+            if self.journaled:
+                if filesystem_file != self.filesystem_file:
+                    # Carry the journal snapshot (and its sequence) over
+                    image_format.convert(filesystem_file, self.filesystem_file)
+                replayed = self.filesystem.open_journal(self.filesystem_file, JOURNAL_FILE)
+                print(f"✓ Filesystem restored from journal ({replayed} change(s) replayed)")
+            elif os.path.exists(filesystem_file):
+                self.filesystem.load_from_disk(filesystem_file, lazy=True)
                 print("✓ Filesystem loaded from disk")
                 
-            if os.path.exists("doubos_users.json"):
-                self.user_manager.load_from_disk("doubos_users.json")
+            users_file = self._existing(self.users_file, USERS_FILE)
+            if os.path.exists(users_file):
+                self.user_manager.load_from_disk(users_file)
                 print("✓ Users loaded from disk")
         except Exception as e:
             print(f"⚠️  Error loading state: {e}")
 
 
+def parse_args(argv=None):
+    """Command-line options"""
+    parser = argparse.ArgumentParser(description="DoubOS operating system simulator")
+    parser.add_argument("--journal", action="store_true",
+                        help="persist every filesystem change as it happens")
+    parser.add_argument("--binary", action="store_true",
+                        help="save compact binary images instead of JSON")
+    batch = parser.add_argument_group("batch mode")
+    batch.add_argument("--script", metavar="FILE",
+                       help="run the commands in FILE ('-' for stdin) without prompts, "
+                            "then report throughput and latency")
+    batch.add_argument("--user", default="guest", help="user to run the script as (default: guest)")
+    batch.add_argument("--password", default=os.environ.get("DOUBOS_PASSWORD", "guest"),
+                       help="password for --user (default: $DOUBOS_PASSWORD, or 'guest')")
+    batch.add_argument("--load", action="store_true", help="load the saved session first")
+    batch.add_argument("--save", action="store_true", help="save the session afterwards")
+    batch.add_argument("--quiet", action="store_true", help="discard command output")
+    return parser.parse_args(argv)
+
+
+def batch_main(args) -> int:
+    """Run a script non-interactively; the report goes to stderr, output to stdout"""
+    os_instance = DoubOS(journaled=args.journal, binary=args.binary)
+    # Status messages stay out of the command output
+    with contextlib.redirect_stdout(sys.stderr):
+        if args.journal or args.load:
+            os_instance.load_state()
+    os_instance.kernel.boot(verbose=False)
+    
+    if not os_instance.login(args.user, args.password):
+        print(f"❌ Login failed for '{args.user}'", file=sys.stderr)
+        return 2
+        
+    commands = parse_script(read_script(args.script))
+    try:
+        report = os_instance.run_batch(commands, quiet=args.quiet)
+    finally:
+        with contextlib.redirect_stdout(sys.stderr):
+            if args.journal or args.save:
+                os_instance.save_state()
+            if args.journal:
+                os_instance.filesystem.close_journal()
+    print(report.format(), file=sys.stderr)
+    return 0
+
+
 def main():
     """Main entry point"""
+    args = parse_args()
+    if args.script:
+        sys.exit(batch_main(args))
+        
     print("\033[92m")  # Green color
     print("""
     ╔═══════════════════════════════════════════════════════╗
@@ -168,12 +278,16 @@ def main():
     print("\033[0m")  # Reset color
     
     # Create and run DoubOS
-    os_instance = DoubOS()
+    journaled = args.journal
+    os_instance = DoubOS(journaled=journaled, binary=args.binary)
     
-    # Optionally load previous state
-    load_previous = input("Load previous session? (y/n): ").strip().lower()
-    if load_previous == 'y':
+    # Journaled sessions always resume; otherwise loading is optional
+    if journaled:
         os_instance.load_state()
+    else:
+        load_previous = input("Load previous session? (y/n): ").strip().lower()
+        if load_previous == 'y':
+            os_instance.load_state()
     
     try:
         os_instance.run()
@@ -185,9 +299,13 @@ def main():
         traceback.print_exc()
     finally:
         # Save state on exit
-        save = input("\nSave session for next time? (y/n): ").strip().lower()
-        if save == 'y':
+        if journaled:
             os_instance.save_state()
+            os_instance.filesystem.close_journal()
+        else:
+            save = input("\nSave session for next time? (y/n): ").strip().lower()
+            if save == 'y':
+                os_instance.save_state()
             
         print("\n💾 DoubOS shutdown complete.\n")
 
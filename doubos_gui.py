@@ -7,6 +7,8 @@ import sys
 from kernel import DoubOSKernel
 from filesystem import VirtualFileSystem
 from users import UserManager
+from session import Session
+from history import flush_all
 from gui_login import LoginScreen
 from gui_desktop import DoubOSDesktop
 
@@ -50,12 +52,13 @@ def main():
         return
         
     # Login successful
-    kernel.current_user = user.username
     print(f"\n✓ Logged in as: {user.username}")
     
     # Launch desktop
     print("🖥️ Loading desktop environment...")
-    desktop = DoubOSDesktop(kernel, filesystem, user_manager)
+    session = Session(user, kernel.environment_vars)
+    session.open_history(filesystem)
+    desktop = DoubOSDesktop(kernel, filesystem, user_manager, session)
     
     print("\n🎉 DoubOS Desktop ready!\n")
     
@@ -72,6 +75,7 @@ def main():
         # Save state
         print("\n💾 Saving system state...")
         try:
+            flush_all()
             filesystem.save_to_disk("doubos_filesystem.json")
             user_manager.save_to_disk("doubos_users.json")
             print("✓ State saved")
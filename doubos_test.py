@@ -7,6 +7,7 @@ import sys
 from kernel import DoubOSKernel
 from filesystem import VirtualFileSystem
 from users import UserManager
+from session import Session
 from gui_desktop import DoubOSDesktop
 
 
@@ -54,12 +55,12 @@ def main():
         return
         
     # Login successful
-    kernel.current_user = user.username
     print(f"✓ Logged in as: {user.username}")
     
     # Launch desktop
     print("🖥️ Loading desktop environment...")
-    desktop = DoubOSDesktop(kernel, filesystem, user_manager)
+    desktop = DoubOSDesktop(kernel, filesystem, user_manager,
+                            Session(user, kernel.environment_vars))
     
     print("\n🎉 DoubOS Desktop ready!\n")
     print("💡 Try clicking the desktop icons or START menu to open apps\n")
@@ -0,0 +1,130 @@
+"""
+DoubOS - File Handles
+Streaming, seekable read access to virtual files
+"""
+
+import io
+from typing import Iterator, Optional
+
+
+class VirtualFile(io.TextIOBase):
+    """Read-only text file object over a file node
+
+    The content is streamed chunk by chunk: read(n), readline() and line
+    iteration only touch the chunks they return, and positions (tell and
+    seek) are character offsets. The handle keeps reading the version of
+    the file that existed when it was opened, so later writes never tear
+    what it returns. Lines keep their "\\n", as with built-in files.
+    """
+
+    def __init__(self, node, name: str):
+        super().__init__()
+        self.name = name
+        # A private version shares the chunks but not later replacements
+        self._node = node.version(node.gen)
+        self._chunks: Optional[Iterator[str]] = None
+        self._buffer = ""       # chunk being read
+        self._offset = 0        # read position within _buffer
+        self._position = 0      # character offset of _buffer[_offset]
+        self._length = None     # total characters, once known
+        self._restart(0)
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def _check_open(self):
+        if self.closed:
+            raise ValueError("I/O operation on closed file.")
+
+    def _restart(self, position: int):
+        """Continue reading from character position"""
+        if self._chunks is not None:
+            self._chunks.close()
+        self._chunks = self._node.iter_chunks(position)
+        self._buffer, self._offset, self._position = "", 0, position
+
+    def _fill(self) -> bool:
+        """Load the next chunk once the buffer is used up; False at the end"""
+        while self._offset >= len(self._buffer):
+            data = next(self._chunks, None)
+            if data is None:
+                return False
+            self._buffer, self._offset = data, 0
+        return True
+
+    def read(self, size: Optional[int] = -1) -> str:
+        """Read up to size characters (everything left if size is negative)"""
+        self._check_open()
+        parts = []
+        remaining = -1 if size is None or size < 0 else size
+        while remaining and self._fill():
+            end = len(self._buffer) if remaining < 0 else self._offset + remaining
+            piece = self._buffer[self._offset:end]
+            self._offset += len(piece)
+            if remaining > 0:
+                remaining -= len(piece)
+            parts.append(piece)
+        text = "".join(parts)
+        self._position += len(text)
+        return text
+
+    def readline(self, size: Optional[int] = -1) -> str:
+        """Read through the next "\\n" (or up to size characters)"""
+        self._check_open()
+        parts = []
+        remaining = -1 if size is None or size < 0 else size
+        while remaining and self._fill():
+            newline = self._buffer.find("\n", self._offset)
+            end = len(self._buffer) if newline < 0 else newline + 1
+            if remaining > 0:
+                end = min(end, self._offset + remaining)
+                remaining -= end - self._offset
+            parts.append(self._buffer[self._offset:end])
+            self._offset = end
+            if newline >= 0 and end == newline + 1:
+                break
+        text = "".join(parts)
+        self._position += len(text)
+        return text
+
+    def tell(self) -> int:
+        self._check_open()
+        return self._position
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        """Move to a character offset from the start, current position or end
+
+        Seeking from the end of a mounted host file counts its characters
+        first, which reads it once.
+        """
+        self._check_open()
+        if whence == io.SEEK_SET:
+            target = offset
+        elif whence == io.SEEK_CUR:
+            target = self._position + offset
+        elif whence == io.SEEK_END:
+            if self._length is None:
+                node = self._node
+                self._length = sum(map(len, node.iter_chunks())) if node.is_host else node.size
+            target = self._length + offset
+        else:
+            raise ValueError(f"invalid whence ({whence})")
+        target = max(target, 0)
+        # Within the current chunk the buffer is reused as is
+        start = self._position - self._offset
+        if start <= target <= start + len(self._buffer):
+            self._offset = target - start
+            self._position = target
+        else:
+            self._restart(target)
+        return target
+
+    def close(self):
+        if self._chunks is not None:
+            self._chunks.close()
+            self._chunks = None
+            self._buffer = ""
+        super().close()
@@ -3,26 +3,352 @@ DoubOS - Virtual File System
 Simulates a complete file system with files, directories, and permissions
 """
 
+import functools
+import hashlib
+import itertools
 import json
 import os
+import sys
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from contextlib import contextmanager
 from datetime import datetime
-from typing import Dict, List, Optional, Any
+from fnmatch import fnmatchcase
+from typing import Callable, Dict, Iterator, List, NamedTuple, Optional, Any, Tuple, Union
+
+from filehandle import VirtualFile
+from locking import LockManager
+from search_index import ContentIndex, NameIndex, iter_nodes
+
+
+# Inode numbers are handed out from a single counter so they stay unique for
+# the lifetime of the process, including nodes built by from_dict()
+_inode_numbers = itertools.count(1)
+
+# Serializes hydration of lazily loaded directories
+_hydrate_lock = threading.Lock()
+
+# Kinds of Change
+CREATE = "create"
+MODIFY = "modify"
+DELETE = "delete"
+MOVE = "move"
+RESET = "reset"
+
+
+class Change(NamedTuple):
+    """One change to the tree, as passed to VirtualFileSystem listeners
+    
+    RESET means anything at or below path may have changed (the tree was
+    replaced, or a mount was attached or detached there).
+    """
+    event: str
+    path: str
+    is_directory: bool
+    dest: Optional[str] = None      # where a MOVE went
+
+
+class _Replayed(NamedTuple):
+    """Result of a journaled method whose effect is logged as other records
+    
+    Returned when replaying the call itself would not redo it, such as a
+    copy out of a host mount, which is not there after a restart.
+    """
+    result: bool
+    records: List[Tuple[str, tuple, Dict[str, Any]]]
+
+
+def _journaled(method):
+    """Record successful calls of a mutating VFS method in the journal
+    
+    The method runs in its own lock scope and its record is appended
+    before that scope releases the locks, so the log orders conflicting
+    operations the same way they were applied. Inside a transaction the
+    records are held back until it commits. A method returning _Replayed
+    has its records logged in place of the call.
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.locks.scope():
+            result = method(self, *args, **kwargs)
+            records = [(method.__name__, args, kwargs)]
+            if isinstance(result, _Replayed):
+                result, records = result
+            journal = self.journal
+            if result is not False and journal is not None and not journal.replaying:
+                if self._txn is not None:
+                    self._txn.records.extend(records)
+                else:
+                    with journal.lock:
+                        for record in records:
+                            journal.append(*record)
+        return result
+    wrapper.journaled = True
+    return wrapper
+
+
+class Blob:
+    """Immutable file content shared by every file that holds the same bytes"""
+    
+    def __init__(self, data: str, digest: Optional[str] = None, refs: int = 0):
+        self.data = data
+        self._digest = digest
+        self.refs = refs
+        
+    @property
+    def digest(self) -> str:
+        if self._digest is None:
+            self._digest = BlobStore.hash(self.data)
+        return self._digest
+        
+    @property
+    def size(self) -> int:
+        return len(self.data)
+
+
+class BlobStore:
+    """Content-addressed, reference-counted storage for file contents"""
+    
+    def __init__(self):
+        self._blobs: Dict[str, Blob] = {}
+        self.physical_bytes = 0
+        self._lock = threading.Lock()
+        
+    @staticmethod
+    def hash(data: str) -> str:
+        """Content address of a string"""
+        return hashlib.blake2b(data.encode("utf-8", "surrogatepass"), digest_size=16).hexdigest()
+        
+    def __len__(self) -> int:
+        return len(self._blobs)
+        
+    def get(self, digest: str) -> Optional[Blob]:
+        """Look up a blob without taking a reference"""
+        return self._blobs.get(digest)
+        
+    def put(self, data: str) -> Optional[Blob]:
+        """Store data and take a reference to it (None for empty content)"""
+        if not data:
+            return None
+        digest = self.hash(data)
+        with self._lock:
+            blob = self._blobs.get(digest)
+            if blob is None:
+                blob = Blob(data, digest)
+                self._blobs[digest] = blob
+                self.physical_bytes += blob.size
+            blob.refs += 1
+        return blob
+        
+    def retain(self, ref: Union[Blob, str]):
+        """Take another reference to a stored blob (or its digest)"""
+        with self._lock:
+            if isinstance(ref, str):
+                ref = self._blobs[ref]
+            elif ref.digest not in self._blobs:
+                # Blob created outside the store; adopt it
+                self._blobs[ref.digest] = ref
+                self.physical_bytes += ref.size
+            ref.refs += 1
+        
+    def release(self, ref: Union[Blob, str]):
+        """Drop a reference; the blob is freed when none remain"""
+        with self._lock:
+            blob = self._blobs.get(ref if isinstance(ref, str) else ref.digest)
+            if blob is None:
+                return
+            blob.refs -= 1
+            if blob.refs <= 0:
+                del self._blobs[blob.digest]
+                self.physical_bytes -= blob.size
+            
+    def to_dict(self) -> Dict:
+        """Serialize every unique blob once, with its reference count"""
+        return {digest: [blob.data, blob.refs] for digest, blob in self._blobs.items()}
+        
+    @staticmethod
+    def from_dict(data: Dict) -> 'BlobStore':
+        """Create BlobStore from dictionary"""
+        store = BlobStore()
+        for digest, (content, refs) in data.items():
+            store._blobs[digest] = Blob(content, digest, refs)
+            store.physical_bytes += len(content)
+        return store
+
+
+def _mode_to_permissions(mode: int) -> str:
+    """Render the low 9 permission bits as an rwxrwxrwx string"""
+    return "".join(flag if mode & (1 << (8 - i)) else "-" for i, flag in enumerate("rwxrwxrwx"))
+
+
+# Every permission string a node can have, shared by all nodes, and the
+# reverse mapping used when a string is assigned
+_PERMISSION_STRINGS = tuple(_mode_to_permissions(mode) for mode in range(0o1000))
+_PERMISSION_MODES = {permissions: mode for mode, permissions in enumerate(_PERMISSION_STRINGS)}
 
 
 class FileNode:
-    """Represents a file or directory in the file system"""
+    """Represents a file or directory in the file system
+    
+    Nodes use __slots__ and keep timestamps as epoch floats and permissions
+    as an integer mode so that very large trees stay small in memory; the
+    public attributes (permissions, created_at, ...) are exposed as
+    properties in their original form.
+    """
+    
+    __slots__ = (
+        "name", "is_directory", "owner", "_mode", "_chunks", "_ctime", "_mtime",
+        "size", "tree_size", "file_count", "_children", "_raw", "inode", "gen", "__weakref__",
+    )
+    
+    # True for host files seen through a mount (see mount.py)
+    is_host = False
     
     def __init__(self, name: str, is_directory: bool = False, owner: str = "root", 
                  permissions: str = "rwxr-xr-x", content: str = ""):
+        now = time.time()
         self.name = name
         self.is_directory = is_directory
-        self.owner = owner
+        self.owner = sys.intern(owner)
         self.permissions = permissions
-        self.content = content
-        self.created_at = datetime.now()
-        self.modified_at = datetime.now()
+        # File content is a list of (possibly shared) Blob chunks read in
+        # order; None means empty
+        self._chunks = [Blob(content)] if content else None
+        # Epoch seconds, or the raw ISO string of an old image until first read
+        self._ctime = now
+        self._mtime = now
         self.size = len(content) if not is_directory else 0
-        self.children = {} if is_directory else None
+        # Running totals over a directory's whole subtree
+        self.tree_size = 0
+        self.file_count = 0
+        # Children dict, created on first use for directories
+        self._children = None
+        # (serialized children, BlobStore) of a lazily loaded directory that
+        # has not been hydrated yet
+        self._raw = None
+        self.inode = next(_inode_numbers)
+        # Snapshot generation this version of the node belongs to (see
+        # VirtualFileSystem.create_snapshot)
+        self.gen = 0
+        
+    @property
+    def permissions(self) -> str:
+        return _PERMISSION_STRINGS[self._mode]
+        
+    @permissions.setter
+    def permissions(self, value: str):
+        try:
+            self._mode = _PERMISSION_MODES[value]
+        except KeyError:
+            raise ValueError(f"invalid permission string: {value!r}") from None
+            
+    @property
+    def mode(self) -> int:
+        """Permission bits as an integer (0o755 for rwxr-xr-x)"""
+        return self._mode
+        
+    @mode.setter
+    def mode(self, value: int):
+        self._mode = value & 0o777
+        
+    @property
+    def content(self) -> str:
+        if not self._chunks:
+            return ""
+        if len(self._chunks) == 1:
+            return self._chunks[0].data
+        return "".join(chunk.data for chunk in self._chunks)
+        
+    @content.setter
+    def content(self, value: str):
+        # Detached from any BlobStore; VirtualFileSystem writes go through
+        # the store instead
+        self._chunks = [Blob(value)] if value else None
+        
+    def iter_chunks(self, start: int = 0) -> Iterator[str]:
+        """Yield the content piece by piece without joining it, from character start on"""
+        for chunk in self._chunks or ():
+            if start >= chunk.size:
+                # Skipped chunks are only measured, never sliced
+                start -= chunk.size
+                continue
+            yield chunk.data[start:] if start else chunk.data
+            start = 0
+            
+    def iter_chunks_reversed(self) -> Iterator[str]:
+        """Yield the content piece by piece, last piece first"""
+        for chunk in reversed(self._chunks or ()):
+            yield chunk.data
+            
+    def iter_lines(self) -> Iterator[str]:
+        """Yield the same lines as content.split("\\n"), chunk by chunk"""
+        pending = []
+        for data in self.iter_chunks():
+            parts = data.split("\n")
+            if len(parts) == 1:
+                pending.append(data)
+                continue
+            pending.append(parts[0])
+            yield "".join(pending)
+            yield from parts[1:-1]
+            pending = [parts[-1]]
+        yield "".join(pending)
+        
+    @property
+    def children(self) -> Optional[Dict[str, 'FileNode']]:
+        """Child nodes by name, hydrated on first access for lazy directories"""
+        if self._children is None and self.is_directory:
+            with _hydrate_lock:
+                if self._children is None and self._raw is not None:
+                    raw, store = self._raw
+                    children = {k: FileNode.from_dict(v, lazy=True, store=store) for k, v in raw.items()}
+                    # Hydrated children are shared exactly when this node is
+                    for child in children.values():
+                        child.gen = self.gen
+                    self._children = children
+                    self._raw = None
+                elif self._children is None:
+                    self._children = {}
+        return self._children
+        
+    @children.setter
+    def children(self, value: Optional[Dict[str, 'FileNode']]):
+        self._children = value
+        self._raw = None
+        
+    @property
+    def is_hydrated(self) -> bool:
+        """False while a lazy directory still holds serialized children"""
+        return self._raw is None
+        
+    @staticmethod
+    def _epoch(value) -> float:
+        return datetime.fromisoformat(value).timestamp() if isinstance(value, str) else value
+        
+    @property
+    def created_at(self) -> datetime:
+        self._ctime = self._epoch(self._ctime)
+        return datetime.fromtimestamp(self._ctime)
+        
+    @created_at.setter
+    def created_at(self, value: datetime):
+        self._ctime = value.timestamp()
+        
+    @property
+    def modified_at(self) -> datetime:
+        return datetime.fromtimestamp(self.mtime)
+        
+    @modified_at.setter
+    def modified_at(self, value: datetime):
+        self._mtime = value.timestamp()
+        
+    @property
+    def mtime(self) -> float:
+        """Modification time in epoch seconds"""
+        self._mtime = self._epoch(self._mtime)
+        return self._mtime
         
     def to_dict(self) -> Dict:
         """Convert to dictionary for serialization"""
@@ -31,41 +357,296 @@ class FileNode:
             "is_directory": self.is_directory,
             "owner": self.owner,
             "permissions": self.permissions,
-            "created_at": self.created_at.isoformat(),
-            "modified_at": self.modified_at.isoformat(),
+            "created_at": self._ctime,
+            "modified_at": self._mtime,
             "size": self.size
         }
         if self.is_directory:
-            data["children"] = {k: v.to_dict() for k, v in self.children.items()}
-        else:
-            data["content"] = self.content
+            data["tree_size"] = self.tree_size
+            data["file_count"] = self.file_count
+            if self._raw is not None:
+                # Never hydrated, so the serialized form is still current
+                data["children"] = self._raw[0]
+            else:
+                data["children"] = {k: v.to_dict() for k, v in (self._children or {}).items()}
+        elif self._chunks:
+            if len(self._chunks) == 1:
+                data["blob"] = self._chunks[0].digest
+            else:
+                data["chunks"] = [chunk.digest for chunk in self._chunks]
         return data
         
     @staticmethod
-    def from_dict(data: Dict) -> 'FileNode':
-        """Create FileNode from dictionary"""
+    def from_dict(data: Dict, lazy: bool = False, store: Optional[BlobStore] = None) -> 'FileNode':
+        """Create FileNode from dictionary
+        
+        Files reference their content by "blob" digest (or a list of
+        "chunks" digests) in store, whose reference counts already include
+        them. Older images carry inline "content", which is added to store
+        as nodes are built. Timestamps are epoch seconds, or ISO strings in
+        older images.
+        
+        With lazy=True, children and ISO timestamps stay in their parsed
+        JSON form until they are first accessed. The data itself is already
+        in memory; only building nodes from it is deferred.
+        """
         node = FileNode(
             data["name"],
             data["is_directory"],
             data["owner"],
-            data["permissions"],
-            data.get("content", "")
+            data["permissions"]
         )
-        node.created_at = datetime.fromisoformat(data["created_at"])
-        node.modified_at = datetime.fromisoformat(data["modified_at"])
         node.size = data["size"]
+        if "blob" in data:
+            node._chunks = [store.get(data["blob"])]
+        elif "chunks" in data:
+            node._chunks = [store.get(digest) for digest in data["chunks"]]
+        elif data.get("content"):
+            node._chunks = [store.put(data["content"]) if store is not None else Blob(data["content"])]
+        if lazy:
+            node._ctime = data["created_at"]
+            node._mtime = data["modified_at"]
+            if data["is_directory"]:
+                node._raw = (data["children"], store)
+                if "tree_size" in data:
+                    node.tree_size, node.file_count = data["tree_size"], data["file_count"]
+                else:
+                    node.tree_size, node.file_count = FileNode._raw_totals(data["children"])
+            return node
+        node._ctime = FileNode._epoch(data["created_at"])
+        node._mtime = FileNode._epoch(data["modified_at"])
         if data["is_directory"]:
-            node.children = {k: FileNode.from_dict(v) for k, v in data["children"].items()}
+            node.children = {k: FileNode.from_dict(v, store=store) for k, v in data["children"].items()}
+            for child in node.children.values():
+                size, count = child.totals()
+                node.tree_size += size
+                node.file_count += count
+        return node
+        
+    @staticmethod
+    def _raw_totals(raw_children: Dict) -> Tuple[int, int]:
+        """Sum sizes and file counts of serialized children"""
+        size = count = 0
+        stack = [raw_children]
+        while stack:
+            for child in stack.pop().values():
+                if not child["is_directory"]:
+                    size += child["size"]
+                    count += 1
+                elif "tree_size" in child:
+                    size += child["tree_size"]
+                    count += child["file_count"]
+                else:
+                    stack.append(child["children"])
+        return size, count
+        
+    def totals(self) -> Tuple[int, int]:
+        """(bytes, files) this node contributes to its ancestors"""
+        if self.is_directory:
+            return self.tree_size, self.file_count
+        return self.size, 1
+        
+    def clone(self, name: Optional[str] = None, gen: int = 0) -> 'FileNode':
+        """Copy this node (and its subtree) with fresh inode numbers
+        
+        Content blobs are shared, not duplicated; the caller is responsible
+        for taking the extra references (see iter_blob_refs).
+        """
+        node = FileNode(name or self.name, self.is_directory, self.owner)
+        node.gen = gen
+        node._mode = self._mode
+        node._chunks = list(self._chunks) if self._chunks else None
+        node._ctime = self._ctime
+        node._mtime = self._mtime
+        node.size = self.size
+        node.tree_size = self.tree_size
+        node.file_count = self.file_count
+        if self.is_directory:
+            if self._raw is not None:
+                # Serialized children are never mutated, so they can be shared
+                node._raw = self._raw
+            elif self._children:
+                node.children = {k: v.clone(gen=gen) for k, v in self._children.items()}
+        return node
+        
+    def version(self, gen: int) -> 'FileNode':
+        """Shallow copy of this node for generation gen, keeping its inode
+        
+        Used for path copying: a directory copy shares its children with
+        the original, and a file copy shares its content blobs (the caller
+        takes the extra references).
+        """
+        node = FileNode.__new__(FileNode)
+        for slot in FileNode.__slots__[:-1]:  # all but __weakref__
+            setattr(node, slot, getattr(self, slot))
+        node.gen = gen
+        if self.is_directory:
+            node._children = dict(self.children)
+            node._raw = None
+        # Chunk lists are replaced on write, never edited, so files share theirs
         return node
+        
+    def iter_blob_refs(self, min_gen: int = 0, max_gen: Optional[int] = None) -> Iterator[Union[Blob, str]]:
+        """Yield the content blob of every file in this subtree
+        
+        Unhydrated subtrees are scanned in serialized form and yield blob
+        digests instead, so nothing is built just to be counted. Nodes
+        older than min_gen (shared with a snapshot) are skipped together
+        with everything below them; nodes from max_gen on are skipped but
+        their children are still visited.
+        """
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            if not isinstance(node, dict):
+                if node.gen < min_gen:
+                    continue
+                if max_gen is not None and node.gen >= max_gen:
+                    if node.is_directory and node._children:
+                        stack.extend(node._children.values())
+                    continue
+            if isinstance(node, dict):
+                if node["is_directory"]:
+                    stack.extend(node["children"].values())
+                elif "blob" in node:
+                    yield node["blob"]
+                elif "chunks" in node:
+                    yield from node["chunks"]
+            elif node.is_directory:
+                if node._raw is not None:
+                    stack.extend(node._raw[0].values())
+                elif node._children:
+                    stack.extend(node._children.values())
+            elif node._chunks:
+                yield from node._chunks
+
+
+class Snapshot:
+    """A saved root of the file system tree"""
+    
+    def __init__(self, name: str, root: FileNode, blobs: BlobStore, note: str = "", auto: bool = False):
+        self.name = name
+        self.root = root
+        self.blobs = blobs
+        self.note = note
+        # Taken by the system rather than asked for; see AUTO_SNAPSHOTS
+        self.auto = auto
+        self.created_at = datetime.now()
+
+
+class _Transaction:
+    """State of an open VirtualFileSystem.transaction()"""
+    
+    def __init__(self, root: FileNode, blobs: BlobStore, generation: int):
+        # Tree to return to on rollback
+        self.root = root
+        self.blobs = blobs
+        self.base_gen = generation
+        # Journal records, written on commit
+        self.records: List[Tuple[str, tuple, Dict[str, Any]]] = []
+        # (node, whole subtree?) replaced or removed while the transaction
+        # could still roll back; their blob references are dropped on commit
+        self.garbage: List[Tuple[FileNode, bool]] = []
 
 
 class VirtualFileSystem:
     """Complete virtual file system implementation"""
     
-    def __init__(self):
+    # Maximum number of path -> inode entries kept in the lookup cache
+    PATH_CACHE_SIZE = 4096
+    
+    # File contents are stored in chunks of at most this many characters
+    CHUNK_SIZE = 64 * 1024
+    
+    # Automatic snapshots (taken before destructive commands) kept; older ones are dropped
+    AUTO_SNAPSHOTS = 3
+    
+    def __init__(self, path_cache_size: int = PATH_CACHE_SIZE):
         self.root = FileNode("/", is_directory=True)
+        self.blobs = BlobStore()
+        self.path_cache_size = path_cache_size
+        self.journal = None
+        # Saved roots by name; see create_snapshot
+        self.snapshots: Dict[str, Snapshot] = {}
+        # Nodes with an older generation are shared with a snapshot or an
+        # open transaction and must be copied before being modified
+        self.generation = 0
+        self._generations = itertools.count(1)
+        self._txn: Optional[_Transaction] = None
+        # Path locks taken by every operation (see locking.py), plus short
+        # internal mutexes for state shared across directories
+        self.locks = LockManager()
+        self._tree_mutex = threading.RLock()    # path copying, running totals
+        self._cache_lock = threading.Lock()     # path cache
+        self._index_lock = threading.RLock()    # content and name indexes
+        # Host directories by mount point; replaced, never edited in place,
+        # so lookups can read it without a lock
+        self.mounts: Dict[str, 'HostMount'] = {}
+        # Called with every Change; replaced, never edited in place
+        self._listeners: Tuple[Callable[[Change], None], ...] = ()
+        # Watches on paths (see watch.py), made on first use
+        self._watch_manager = None
+        self._reset_caches()
         self.initialize_default_structure()
         
+    def _reset_caches(self):
+        """Drop the inode table and path cache (used when the root is replaced)"""
+        # Inode table: inode number -> live node. Weak so removed subtrees
+        # disappear from it without an explicit walk.
+        self.inodes: "weakref.WeakValueDictionary[int, FileNode]" = weakref.WeakValueDictionary()
+        self.inodes[self.root.inode] = self.root
+        # Bounded LRU cache of normalized path -> inode number
+        self._path_cache: "OrderedDict[str, int]" = OrderedDict()
+        # Full-text index for recursive grep and path index for find, each
+        # built on first use
+        self.content_index: Optional[ContentIndex] = None
+        self.name_index: Optional[NameIndex] = None
+        self._notify(RESET, "/", True)
+        
+    def add_listener(self, listener: Callable[[Change], None]):
+        """Call listener with a Change after every change to the tree
+        
+        Listeners run on the thread making the change while it still holds
+        the operation's locks, so they must be quick and must not call back
+        into the file system.
+        """
+        with self._tree_mutex:
+            self._listeners = self._listeners + (listener,)
+            
+    def remove_listener(self, listener: Callable[[Change], None]):
+        """Stop calling a listener added with add_listener"""
+        with self._tree_mutex:
+            self._listeners = tuple(item for item in self._listeners if item != listener)
+            
+    def watch(self, path: str, recursive: bool = False,
+              callback: Optional[Callable[[List[Change]], None]] = None,
+              max_events: Optional[int] = None) -> 'Watch':
+        """Watch path for changes to it and its entries (its whole subtree if recursive)
+        
+        Returns a Watch to read batches of changes from, or that calls
+        callback with each batch from a dispatcher thread; see watch.py.
+        Close it when done.
+        """
+        from watch import Watch, WatchManager
+        
+        with self._tree_mutex:
+            if self._watch_manager is None:
+                self._watch_manager = WatchManager(self)
+        return self._watch_manager.add(Watch(self._watch_manager, self._normalize(path),
+                                             recursive, callback, max_events))
+            
+    def _notify(self, event: str, path: str, is_directory: bool, dest: Optional[str] = None):
+        """Tell the listeners about a change (paths are normalized here)"""
+        if not self._listeners:
+            return
+        change = Change(event, self._normalize(path), is_directory,
+                        None if dest is None else self._normalize(dest))
+        for listener in self._listeners:
+            try:
+                listener(change)
+            except Exception:
+                pass  # a failing listener must not fail the operation
+        
     def initialize_default_structure(self):
         """Create default directory structure"""
         # Create standard Unix-like directories
@@ -95,30 +676,206 @@ class VirtualFileSystem:
         self.write_file("/home/admin/.profile", "# Admin profile\nexport PATH=/bin:/usr/bin:/sbin\n")
         self.write_file("/var/log/system.log", f"[{datetime.now()}] DoubOS initialized\n")
         
+    @staticmethod
+    def _normalize(path: str) -> str:
+        """Collapse duplicate and trailing slashes"""
+        return "/" + "/".join(p for p in path.split("/") if p)
+        
+    def _cache_lookup(self, path: str) -> Optional[FileNode]:
+        """Return the cached node for a normalized path, if still live"""
+        with self._cache_lock:
+            ino = self._path_cache.get(path)
+            if ino is None:
+                return None
+            node = self.inodes.get(ino)
+            if node is None:
+                del self._path_cache[path]
+                return None
+            self._path_cache.move_to_end(path)
+            return node
+        
+    def _cache_store(self, path: str, node: FileNode):
+        """Remember the node for a normalized path"""
+        if self.path_cache_size <= 0:
+            return
+        self.inodes[node.inode] = node
+        with self._cache_lock:
+            self._path_cache[path] = node.inode
+            if len(self._path_cache) > self.path_cache_size:
+                self._path_cache.popitem(last=False)
+            
+    def _invalidate(self, path: str):
+        """Forget cached lookups for path and everything below it"""
+        path = self._normalize(path)
+        with self._cache_lock:
+            if path == "/":
+                self._path_cache.clear()
+                return
+            prefix = path + "/"
+            stale = [key for key in self._path_cache if key == path or key.startswith(prefix)]
+            for key in stale:
+                del self._path_cache[key]
+            
+    def _register(self, node: FileNode) -> FileNode:
+        """Add a newly created node to the inode table"""
+        node.gen = self.generation
+        self.inodes[node.inode] = node
+        return node
+        
+    def _has_shared_nodes(self) -> bool:
+        """Whether any node may be shared with a snapshot or open transaction"""
+        return bool(self.snapshots) or self._txn is not None
+        
+    def _own(self, node: FileNode) -> FileNode:
+        """Private copy of a node shared with a snapshot, replacing it in the inode table"""
+        copy = node.version(self.generation)
+        for chunk in copy._chunks or ():
+            self.blobs.retain(chunk)
+        self.inodes[copy.inode] = copy
+        if self._txn is not None:
+            self._txn.garbage.append((node, False))
+        return copy
+        
+    def _own_child(self, parent: FileNode, name: str) -> Optional[FileNode]:
+        """Child of a writable directory, itself made writable"""
+        child = parent.children.get(name)
+        if child is not None and child.gen < self.generation and self._has_shared_nodes():
+            child = parent.children[name] = self._own(child)
+        return child
+        
+    def _writable(self, path: str) -> Optional[FileNode]:
+        """Node at path, made safe to modify in place
+        
+        Once a snapshot exists, nodes it shares with the live tree are
+        path-copied: the node and every ancestor up to the root are replaced
+        by private versions (with the same inode numbers, so the path cache
+        stays valid). Paths in a mount are never writable.
+        """
+        if self._in_mount(path):
+            return None
+        if not self._has_shared_nodes():
+            return self._get_node(path)
+        with self._tree_mutex:
+            if self.root.gen < self.generation:
+                self.root = self._own(self.root)
+            node = self.root
+            for part in [p for p in path.split("/") if p]:
+                if not node.is_directory:
+                    return None
+                node = self._own_child(node, part)
+                if node is None:
+                    return None
+            return node
+            
+    def _mount_of(self, path: str) -> Tuple[Optional['HostMount'], str]:
+        """Mount holding a normalized path and the rest of the path below it"""
+        for mount_path, mount in self.mounts.items():
+            if path == mount_path or path.startswith(mount_path + "/"):
+                return mount, path[len(mount_path):]
+        return None, ""
+        
+    def _mounts_below(self, path: str) -> List['HostMount']:
+        """Mounts at or below a normalized path"""
+        prefix = "/" if path == "/" else path + "/"
+        return [mount for mount_path, mount in self.mounts.items()
+                if mount_path == path or mount_path.startswith(prefix)]
+        
+    def _in_mount(self, path: str) -> bool:
+        """Whether path lies in a mount, which is read-only"""
+        return bool(self.mounts) and self._mount_of(self._normalize(path))[0] is not None
+        
+    def _lock(self, reads=(), writes=(), lists=()) -> list:
+        """Lock paths until the current operation ends
+        
+        reads are subtrees that must stay unchanged; writes are directories
+        whose entries (or entries' attributes) will change; lists are
+        directories whose entries are read.
+        """
+        plan = LockManager.plan([self._normalize(p) for p in reads],
+                                [self._normalize(p) for p in writes],
+                                [self._normalize(p) for p in lists])
+        return self.locks.acquire(plan)
+        
+    @contextmanager
+    def _locked(self, reads=(), writes=(), lists=()):
+        """Run a block as one operation holding the given locks"""
+        with self.locks.scope():
+            self._lock(reads, writes, lists)
+            yield
+            
+    def _parent_path(self, path: str) -> str:
+        return self._normalize(path).rpartition("/")[0] or "/"
+        
     def _get_node(self, path: str) -> Optional[FileNode]:
         """Get node at given path"""
         if path == "/":
             return self.root
             
-        parts = [p for p in path.split("/") if p]
-        current = self.root
-        
-        for part in parts:
-            if not current.is_directory or part not in current.children:
+        node = self._cache_lookup(path)
+        if node is not None:
+            return node
+            
+        path = self._normalize(path)
+        if path == "/":
+            return self.root
+        node = self._cache_lookup(path)
+        if node is not None:
+            return node
+            
+        # Host nodes are looked up through their mount and never cached
+        if self.mounts:
+            mount, rest = self._mount_of(path)
+            if mount is not None:
+                return mount.resolve(rest)
+            
+        # Start from the deepest ancestor that is already cached
+        end = len(path)
+        current = None
+        while current is None:
+            end = path.rfind("/", 0, end)
+            if end <= 0:
+                end = 0
+                current = self.root
+            else:
+                current = self._cache_lookup(path[:end])
+                
+        # Walk the remaining components, caching every prefix on the way
+        current_path = path[:end]
+        for part in path[end + 1:].split("/"):
+            if not current.is_directory:
                 return None
-            current = current.children[part]
+            current = current.children.get(part)
+            if current is None:
+                return None
+            current_path += "/" + part
+            self._cache_store(current_path, current)
             
         return current
         
-    def _get_parent_and_name(self, path: str) -> tuple[Optional[FileNode], str]:
-        """Get parent node and filename from path"""
+    def _get_parent_and_name(self, path: str, writable: bool = False) -> tuple[Optional[FileNode], str]:
+        """Get parent node and filename from path
+        
+        With writable=True the parent (and its ancestors) may be modified.
+        """
         if path == "/":
             return None, "/"
             
-        parts = [p for p in path.split("/") if p]
-        parent_path = "/" + "/".join(parts[:-1]) if len(parts) > 1 else "/"
-        parent = self._get_node(parent_path)
-        return parent, parts[-1]
+        parent_path, _, name = path.rstrip("/").rpartition("/")
+        if not name:
+            return None, "/"
+        if writable:
+            return self._writable(parent_path or "/"), name
+        parent = self._get_node(parent_path or "/")
+        return parent, name
+        
+    def get_inode(self, path: str) -> Optional[int]:
+        """Get inode number of the node at path"""
+        node = self._get_node(path)
+        return node.inode if node else None
+        
+    def get_node_by_inode(self, inode: int) -> Optional[FileNode]:
+        """Look up a live node by inode number"""
+        return self.inodes.get(inode)
         
     def exists(self, path: str) -> bool:
         """Check if path exists"""
@@ -134,57 +891,158 @@ class VirtualFileSystem:
         node = self._get_node(path)
         return node is not None and not node.is_directory
         
+    @_journaled
     def mkdir(self, path: str, recursive: bool = False, owner: str = "root") -> bool:
         """Create directory"""
-        if self.exists(path):
+        if self._in_mount(path):
+            return False
+        parent_path = self._parent_path(path)
+        if not recursive:
+            self._lock(writes=[parent_path])
+        else:
+            # Lock the deepest directory that already exists, which covers
+            # everything created below it; retry if it vanishes meanwhile
+            while True:
+                anchor = parent_path
+                while anchor != "/" and not self.exists(anchor):
+                    anchor = self._parent_path(anchor)
+                taken = self._lock(writes=[anchor])
+                if anchor == "/" or self.exists(anchor):
+                    break
+                self.locks.release(taken)
+                
+        parent, name = self._get_parent_and_name(path, writable=True)
+        if name == "/":
             return False
             
-        parent, name = self._get_parent_and_name(path)
-        
         if parent is None:
-            if recursive and path != "/":
+            if recursive:
                 # Create parent directories
-                parts = [p for p in path.split("/") if p]
-                current_path = ""
-                for part in parts:
-                    current_path += "/" + part
-                    if not self.exists(current_path):
-                        parent_node, dir_name = self._get_parent_and_name(current_path)
-                        if parent_node and parent_node.is_directory:
-                            parent_node.children[dir_name] = FileNode(dir_name, True, owner)
+                current = self._writable("/")
+                created = ""
+                for part in [p for p in path.split("/") if p]:
+                    if not current.is_directory:
+                        break
+                    created += "/" + part
+                    child = self._own_child(current, part)
+                    if child is None:
+                        child = self._register(FileNode(part, True, owner))
+                        current.children[part] = child
+                        if self.name_index is not None:
+                            with self._index_lock:
+                                self.name_index.add(created, True)
+                        self._notify(CREATE, created, True)
+                    current = child
                 return True
             return False
             
-        if not parent.is_directory:
+        if not parent.is_directory or name in parent.children:
             return False
             
-        parent.children[name] = FileNode(name, is_directory=True, owner=owner)
+        parent.children[name] = self._register(FileNode(name, is_directory=True, owner=owner))
+        if self.name_index is not None:
+            with self._index_lock:
+                self.name_index.add(self._normalize(path), True)
+        self._notify(CREATE, path, True)
         return True
         
+    @_journaled
     def write_file(self, path: str, content: str, owner: str = "root", append: bool = False) -> bool:
         """Write content to file"""
-        parent, name = self._get_parent_and_name(path)
+        self._lock(writes=[self._parent_path(path)])
+        parent, name = self._get_parent_and_name(path, writable=True)
         
         if parent is None or not parent.is_directory:
             return False
             
         if name in parent.children:
             # File exists, update it
-            node = parent.children[name]
+            node = self._own_child(parent, name)
             if node.is_directory:
                 return False
+            old_size = node.size
             if append:
-                node.content += content
+                self._append_content(node, content)
             else:
-                node.content = content
-            node.size = len(node.content)
+                self._set_content(node, content)
             node.modified_at = datetime.now()
+            self._update_totals(path, node.size - old_size, 0)
+            event = MODIFY
         else:
             # Create new file
-            parent.children[name] = FileNode(name, is_directory=False, owner=owner, content=content)
+            node = self._register(FileNode(name, is_directory=False, owner=owner))
+            self._set_content(node, content)
+            parent.children[name] = node
+            self._update_totals(path, node.size, 1)
+            if self.name_index is not None:
+                with self._index_lock:
+                    self.name_index.add(self._normalize(path), False)
+            event = CREATE
             
+        if self.content_index is not None:
+            with self._index_lock:
+                if append:
+                    self.content_index.append(self._normalize(path), node, content)
+                else:
+                    self.content_index.add(self._normalize(path), node)
+        self._notify(event, path, False)
         return True
         
+    def _update_totals(self, path: str, size_delta: int, count_delta: int):
+        """Apply a change at path to the running totals of every ancestor"""
+        if not size_delta and not count_delta:
+            return
+        with self._tree_mutex:
+            node = self.root
+            node.tree_size += size_delta
+            node.file_count += count_delta
+            for part in [p for p in path.split("/") if p][:-1]:
+                node = node.children[part]
+                node.tree_size += size_delta
+                node.file_count += count_delta
+        
+    def _set_content(self, node: FileNode, content: str):
+        """Replace a file's content with stored chunks of at most CHUNK_SIZE"""
+        old = node._chunks
+        size = self.CHUNK_SIZE
+        node._chunks = [self.blobs.put(content[i:i + size])
+                        for i in range(0, len(content), size)] or None
+        node.size = len(content)
+        for chunk in old or ():
+            self.blobs.release(chunk)
+            
+    def _append_content(self, node: FileNode, content: str):
+        """Add content to the end of a file without rewriting what is there
+        
+        A short last chunk is merged with the new data (bounded by
+        CHUNK_SIZE); everything else is stored as new chunks. The chunk
+        list is replaced, not edited, so lock-free readers iterating the
+        old one still see a consistent file.
+        """
+        if not content:
+            return
+        chunks = list(node._chunks or ())
+        size = self.CHUNK_SIZE
+        if chunks and chunks[-1].size + len(content) <= size:
+            last = chunks.pop()
+            chunks.append(self.blobs.put(last.data + content))
+            self.blobs.release(last)
+        else:
+            chunks.extend(self.blobs.put(content[i:i + size])
+                          for i in range(0, len(content), size))
+        node._chunks = chunks
+        node.size += len(content)
+            
+    def _release(self, node: FileNode):
+        """Drop the blob references held by a detached subtree
+        
+        Parts still shared with a snapshot keep their references.
+        """
+        for ref in node.iter_blob_refs(self.generation):
+            self.blobs.release(ref)
+        if self._txn is not None:
+            self._txn.garbage.append((node, True))
+        
     def read_file(self, path: str) -> Optional[str]:
         """Read file content"""
         node = self._get_node(path)
@@ -192,19 +1050,188 @@ class VirtualFileSystem:
             return node.content
         return None
         
+    def read_chunks(self, path: str) -> Optional[Iterator[str]]:
+        """Iterate over a file's content chunks without joining them"""
+        node = self._get_node(path)
+        if node and not node.is_directory:
+            return node.iter_chunks()
+        return None
+        
+    def read_lines(self, path: str) -> Optional[Iterator[str]]:
+        """Iterate over a file's lines (as content.split("\\n") would)"""
+        node = self._get_node(path)
+        if node and not node.is_directory:
+            return node.iter_lines()
+        return None
+        
+    def open(self, path: str) -> Optional[VirtualFile]:
+        """Open a file for streaming reads (see filehandle.py); None if it is not a file"""
+        node = self._get_node(path)
+        if node and not node.is_directory:
+            return VirtualFile(node, self._normalize(path))
+        return None
+        
+    def tail_lines(self, path: str, count: int) -> Optional[List[str]]:
+        """Last count lines of a file (as content.split("\n")[-count:])
+        
+        The file is read backwards from its end, one chunk at a time, until
+        enough lines have been seen.
+        """
+        node = self._get_node(path)
+        if node is None or node.is_directory:
+            return None
+        if count <= 0:
+            return []
+        pieces = []
+        newlines = 0
+        for data in node.iter_chunks_reversed():
+            pieces.append(data)
+            newlines += data.count("\n")
+            if newlines >= count:
+                break
+        pieces.reverse()
+        return "".join(pieces).split("\n")[-count:]
+        
+    def search_file(self, path: str, needle: str) -> Optional[List[str]]:
+        """Lines of a file containing needle, case-insensitively (as grep -i)"""
+        node = self._get_node(path)
+        if node is None or node.is_directory:
+            return None
+        if node.is_host:
+            return node.search(needle)
+        needle = needle.lower()
+        return [line for line in node.iter_lines() if needle in line.lower()]
+        
+    def _content_index(self) -> ContentIndex:
+        """The content index, built over the whole tree on first use"""
+        if self.content_index is None:
+            with self._locked(reads=["/"]), self._index_lock:
+                if self.content_index is None:
+                    index = ContentIndex(self)
+                    index.add_tree("/", self.root)
+                    self.content_index = index
+        return self.content_index
+        
+    def search_content(self, needle: str, path: str = "/") -> Optional[List[Tuple[str, List[str]]]]:
+        """Find files below path containing needle, as (path, matching lines)
+        
+        Uses the content index, which is built over the whole tree on the
+        first call and kept current by every later mutation. Mounted host
+        files are not indexed and are scanned in place.
+        """
+        node = self._get_node(path)
+        if node is None:
+            return None
+        path = self._normalize(path)
+        if node.is_host:
+            return self._search_host(needle, path, node)
+        index = self._content_index()
+        with self._index_lock:
+            results = index.search(needle, path)
+        mounts = self._mounts_below(path)
+        for mount in mounts:
+            results += self._search_host(needle, mount.path, mount.root)
+        return sorted(results) if mounts else results
+        
+    def content_candidates(self, needle: str, path: str = "/") -> Optional[List[str]]:
+        """Sorted paths of the files below path that may contain needle (in any case)
+        
+        Narrowed by the content index without reading any file; every file
+        in a mount is a candidate. None if path does not exist.
+        """
+        node = self._get_node(path)
+        if node is None:
+            return None
+        path = self._normalize(path)
+        if node.is_host:
+            return self._find_host(path, node, file_type="f") if node.is_directory else [path]
+        index = self._content_index()
+        with self._index_lock:
+            results = index.candidates(needle, path)
+        mounts = self._mounts_below(path)
+        for mount in mounts:
+            results += self._find_host(mount.path, mount.root, file_type="f")
+        return sorted(results) if mounts else results
+        
+    @staticmethod
+    def _search_host(needle: str, path: str, node: 'HostNode') -> List[Tuple[str, List[str]]]:
+        """search_content below a host node"""
+        files = [(path, node)] if not node.is_directory else node.walk(path)
+        results = []
+        for file_path, file_node in files:
+            if not file_node.is_directory:
+                lines = file_node.search(needle)
+                if lines:
+                    results.append((file_path, lines))
+        results.sort()
+        return results
+        
+    def find(self, path: str = "/", pattern: Optional[str] = None,
+             file_type: Optional[str] = None) -> Optional[List[str]]:
+        """Paths below path whose name matches a glob, optionally only "f"iles or "d"irs
+        
+        Answered from the name index, which is built over the whole tree on
+        the first call and kept current by every later mutation. Mounted
+        host directories are walked instead.
+        """
+        node = self._get_node(path)
+        if node is None:
+            return None
+        path = self._normalize(path)
+        if node.is_host:
+            return self._find_host(path, node, pattern, file_type)
+        if self.name_index is None:
+            with self._locked(reads=["/"]), self._index_lock:
+                if self.name_index is None:
+                    index = NameIndex()
+                    index.add_tree("/", self.root)
+                    self.name_index = index
+        with self._index_lock:
+            results = self.name_index.find(path, pattern, file_type)
+        mounts = self._mounts_below(path)
+        for mount in mounts:
+            results = results + self._find_host(mount.path, mount.root, pattern, file_type)
+        return sorted(results) if mounts else results
+        
+    @staticmethod
+    def _find_host(path: str, node: 'HostNode', pattern: Optional[str] = None,
+                   file_type: Optional[str] = None) -> List[str]:
+        """find below a host directory"""
+        if not node.is_directory:
+            return []
+        want_dir = {"f": False, "d": True}.get(file_type)
+        return sorted(child_path for child_path, child in node.walk(path)
+                      if (pattern is None or fnmatchcase(child.name, pattern))
+                      and (want_dir is None or child.is_directory == want_dir))
+        
     def list_directory(self, path: str) -> Optional[List[FileNode]]:
         """List directory contents"""
-        node = self._get_node(path)
-        if node and node.is_directory:
-            return list(node.children.values())
+        with self._locked(lists=[path]):
+            node = self._get_node(path)
+            if node and node.is_directory:
+                items = list(node.children.values())
+                if node.is_host:
+                    for item in items:
+                        item.refresh()
+                elif self.mounts:
+                    # A mount point shows the host directory, not the one it covers
+                    path = self._normalize(path)
+                    mounted = {mount.root.name: mount.root.refresh() for mount_path, mount in self.mounts.items()
+                               if self._parent_path(mount_path) == path}
+                    items = [mounted.get(item.name, item) for item in items]
+                return items
         return None
         
+    @_journaled
     def remove(self, path: str, recursive: bool = False) -> bool:
         """Remove file or directory"""
         if path == "/":
             return False  # Can't remove root
+        if self._mounts_below(self._normalize(path)):
+            return False  # Busy: unmount first
             
-        parent, name = self._get_parent_and_name(path)
+        self._lock(writes=[self._parent_path(path)])
+        parent, name = self._get_parent_and_name(path, writable=True)
         
         if parent is None or name not in parent.children:
             return False
@@ -215,73 +1242,523 @@ class VirtualFileSystem:
             return False  # Directory not empty
             
         del parent.children[name]
+        size, count = node.totals()
+        self._update_totals(path, -size, -count)
+        self._release(node)
+        with self._index_lock:
+            if self.content_index is not None:
+                self.content_index.discard_tree(node)
+            if self.name_index is not None:
+                self.name_index.remove_tree(self._normalize(path))
+        self._invalidate(path)
+        self._notify(DELETE, path, node.is_directory)
         return True
         
+    @_journaled
     def move(self, src: str, dst: str) -> bool:
         """Move/rename file or directory"""
-        src_parent, src_name = self._get_parent_and_name(src)
-        dst_parent, dst_name = self._get_parent_and_name(dst)
+        if self._mounts_below(self._normalize(src)) or self._mounts_below(self._normalize(dst)):
+            return False  # Busy: unmount first
+        self._lock(writes=[self._parent_path(src), self._parent_path(dst)])
+        src_parent, src_name = self._get_parent_and_name(src, writable=True)
+        dst_parent, dst_name = self._get_parent_and_name(dst, writable=True)
         
         if not src_parent or src_name not in src_parent.children:
             return False
             
         if not dst_parent or not dst_parent.is_directory:
             return False
-            
-        node = src_parent.children[src_name]
+
+        if self._normalize(dst).startswith(self._normalize(src) + "/"):
+            return False  # Can't move a directory inside itself
+
+        node = self._own_child(src_parent, src_name)
+        del src_parent.children[src_name]
+        size, count = node.totals()
+        self._update_totals(src, -size, -count)
+        replaced = dst_parent.children.get(dst_name)
+        if replaced is not None and replaced is not node:
+            old_size, old_count = replaced.totals()
+            self._update_totals(dst, -old_size, -old_count)
+            self._release(replaced)
+            with self._index_lock:
+                if self.content_index is not None:
+                    self.content_index.discard_tree(replaced)
+                if self.name_index is not None:
+                    self.name_index.remove_tree(self._normalize(dst))
         node.name = dst_name
         dst_parent.children[dst_name] = node
-        del src_parent.children[src_name]
+        self._update_totals(dst, size, count)
+        with self._index_lock:
+            if self.content_index is not None:
+                self.content_index.rename_tree(self._normalize(dst), node)
+            if self.name_index is not None:
+                self.name_index.move_tree(self._normalize(src), self._normalize(dst))
+        self._invalidate(src)
+        self._invalidate(dst)
+        self._notify(MOVE, src, node.is_directory, dst)
         return True
         
+    @_journaled
     def copy(self, src: str, dst: str) -> bool:
         """Copy file or directory"""
+        if self._mounts_below(self._normalize(dst)):
+            return False
+        # The source subtree stays readable (but unchanged) while it is cloned
+        self._lock(reads=[src], writes=[self._parent_path(dst)])
         src_node = self._get_node(src)
         if not src_node:
             return False
             
-        dst_parent, dst_name = self._get_parent_and_name(dst)
+        dst_parent, dst_name = self._get_parent_and_name(dst, writable=True)
         if not dst_parent or not dst_parent.is_directory:
             return False
             
-        # Deep copy the node
-        import copy
-        new_node = copy.deepcopy(src_node)
-        new_node.name = dst_name
-        dst_parent.children[dst_name] = new_node
+        if src_node.is_host:
+            # Copying out of a mount reads the host files into the store
+            clone = self._register(src_node.materialize(dst_name, self.blobs, self.CHUNK_SIZE,
+                                                        self.generation))
+        else:
+            # Copy the subtree; the clone gets its own inode numbers but shares
+            # content blobs with the source until either side is rewritten
+            clone = self._register(src_node.clone(dst_name, self.generation))
+            for ref in clone.iter_blob_refs():
+                self.blobs.retain(ref)
+        replaced = dst_parent.children.get(dst_name)
+        dst_parent.children[dst_name] = clone
+        size, count = clone.totals()
+        if replaced is not None:
+            old_size, old_count = replaced.totals()
+            size -= old_size
+            count -= old_count
+            self._release(replaced)
+        self._update_totals(dst, size, count)
+        with self._index_lock:
+            if self.content_index is not None:
+                if replaced is not None:
+                    self.content_index.discard_tree(replaced)
+                self.content_index.add_tree(self._normalize(dst), clone)
+            if self.name_index is not None:
+                self.name_index.remove_tree(self._normalize(dst))
+                self.name_index.add_tree(self._normalize(dst), clone)
+        self._invalidate(dst)
+        self._notify(CREATE, dst, clone.is_directory)
+        if src_node.is_host:
+            return _Replayed(True, self._creation_records(self._normalize(dst), clone, replaced is not None))
         return True
         
-    def get_size(self, path: str) -> int:
-        """Get size of file or directory"""
+    @staticmethod
+    def _creation_records(path: str, node: FileNode, replace: bool = False) -> List[Tuple[str, tuple, Dict]]:
+        """Journal records that build the subtree node at path from scratch"""
+        records = [("remove", (path,), {"recursive": True})] if replace else []
+        modes = []
+        for node_path, item in itertools.chain([(path, node)], iter_nodes(path, node)):
+            if item.is_directory:
+                records.append(("mkdir", (node_path,), {"owner": item.owner}))
+            else:
+                records.append(("write_file", (node_path, item.content), {"owner": item.owner}))
+            modes.append(("chmod", (node_path, item.permissions), {}))
+        # Permissions last, so a read-only directory is filled first
+        return records + modes
+        
+    @_journaled
+    def chmod(self, path: str, permissions: str) -> bool:
+        """Change permission string of a file or directory"""
+        self._lock(writes=[self._parent_path(path)])
+        node = self._writable(path)
+        if not node:
+            return False
+        node.permissions = permissions
+        self._notify(MODIFY, path, node.is_directory)
+        return True
+        
+    @_journaled
+    def chown(self, path: str, owner: str) -> bool:
+        """Change owner of a file or directory"""
+        self._lock(writes=[self._parent_path(path)])
+        node = self._writable(path)
+        if not node:
+            return False
+        node.owner = sys.intern(owner)
+        self._notify(MODIFY, path, node.is_directory)
+        return True
+        
+    def get_size(self, path: str, physical: bool = False) -> int:
+        """Get size of file or directory
+        
+        Logical size counts every file; physical=True counts each stored
+        blob once, however many files share it.
+        """
+        if physical:
+            return self.get_usage(path)[1]
         node = self._get_node(path)
         if not node:
             return 0
+        return node.tree_size if node.is_directory else node.size
+        
+    def get_usage(self, path: str) -> Tuple[int, int]:
+        """Get (logical, physical) bytes used by a file or directory
+        
+        The logical size of a directory is its running total; physical
+        usage below the root needs a scan for the distinct blobs.
+        """
+        with self._locked(reads=[path]):
+            return self._usage(self._get_node(path))
+            
+    def _usage(self, node: Optional[FileNode]) -> Tuple[int, int]:
+        """get_usage for a node whose subtree is locked"""
+        if not node:
+            return 0, 0
             
         if not node.is_directory:
-            return node.size
-            
-        # Recursively calculate directory size
-        total = 0
-        for child in node.children.values():
-            if child.is_directory:
-                child_path = path.rstrip("/") + "/" + child.name
-                total += self.get_size(child_path)
-            else:
-                total += child.size
-        return total
+            unique = {chunk.digest: chunk.size for chunk in node._chunks or ()}
+            return node.size, sum(unique.values())
+            
+        logical = node.tree_size
+        if node is self.root:
+            return logical, self.blobs.physical_bytes
+        unique = {}
+        for ref in node.iter_blob_refs():
+            blob = self.blobs.get(ref) if isinstance(ref, str) else ref
+            if blob is not None:
+                unique[blob.digest] = blob.size
+        return logical, sum(unique.values())
         
+    @_journaled
     def format(self):
         """Format (clear) the entire file system - DANGEROUS!"""
+        self._lock(writes=["/"])
+        if self._has_shared_nodes():
+            # The old store lives on in the snapshots; drop what only we held
+            self._release(self.root)
         self.root = FileNode("/", is_directory=True)
+        self.root.gen = self.generation
+        self.blobs = BlobStore()
+        self.mounts = {}
+        self._reset_caches()
         
-    def save_to_disk(self, filepath: str):
-        """Save file system to disk"""
-        with open(filepath, 'w') as f:
-            json.dump(self.root.to_dict(), f, indent=2)
+    # ============= MOUNTS =============
+    
+    def mount(self, host_path: str, path: str) -> bool:
+        """Attach a host directory read-only at path, an empty directory
+        
+        The host tree is not copied: it is listed and read on demand (see
+        mount.py). Mounts belong to the running system and are not
+        journaled or saved in images. Returns False if host_path is not a
+        directory or path is not an empty directory outside other mounts.
+        """
+        from mount import HostMount
+        
+        host_path = os.path.abspath(host_path)
+        if not os.path.isdir(host_path):
+            return False
+        path = self._normalize(path)
+        with self._locked(writes=[self._parent_path(path)]):
+            if path == "/" or self._in_mount(path) or self._mounts_below(path):
+                return False
+            node = self._get_node(path)
+            if node is None or not node.is_directory or node.children:
+                return False
+            self.mounts = {**self.mounts, path: HostMount(host_path, path)}
+            self._invalidate(path)
+            self._notify(RESET, path, True)
+            return True
+            
+    def umount(self, path: str) -> bool:
+        """Detach the mount at path, uncovering the directory below it"""
+        path = self._normalize(path)
+        with self._locked(writes=[self._parent_path(path)]):
+            if path not in self.mounts:
+                return False
+            self.mounts = {key: mount for key, mount in self.mounts.items() if key != path}
+            self._invalidate(path)
+            self._notify(RESET, path, True)
+            return True
             
-    def load_from_disk(self, filepath: str):
-        """Load file system from disk"""
+    def list_mounts(self) -> List['HostMount']:
+        """Active mounts, ordered by mount point"""
+        return [self.mounts[path] for path in sorted(self.mounts)]
+        
+    # ============= SNAPSHOTS =============
+    
+    def create_snapshot(self, name: Optional[str] = None, note: str = "",
+                        auto: bool = False) -> Optional[str]:
+        """Save the current tree under name in constant time
+        
+        The snapshot keeps the current root. Bumping the generation makes
+        every existing node read-only for the live tree, so later mutations
+        path-copy what they touch and the snapshot costs memory only in
+        proportion to those changes. Returns the snapshot name, or None if
+        it is already taken. Of the auto snapshots, only the newest
+        AUTO_SNAPSHOTS are kept.
+        """
+        with self._locked(writes=["/"]):
+            if self._txn is not None:
+                raise RuntimeError("snapshots cannot be taken inside a transaction")
+            if name is None:
+                number = len(self.snapshots) + 1
+                while f"snap{number}" in self.snapshots:
+                    number += 1
+                name = f"snap{number}"
+            if name in self.snapshots:
+                return None
+            self.snapshots[name] = Snapshot(name, self.root, self.blobs, note, auto)
+            self.generation = next(self._generations)
+            if auto:
+                autos = [snap.name for snap in self.snapshots.values() if snap.auto]
+                for old in autos[:-self.AUTO_SNAPSHOTS]:
+                    self._drop_snapshot(old)
+            return name
+        
+    def list_snapshots(self) -> List['Snapshot']:
+        """Snapshots in creation order"""
+        return list(self.snapshots.values())
+        
+    def restore_snapshot(self, name: str) -> bool:
+        """Make a snapshot's tree the live tree again (the snapshot is kept)"""
+        with self._locked(writes=["/"]):
+            if self._txn is not None:
+                raise RuntimeError("snapshots cannot be restored inside a transaction")
+            snapshot = self.snapshots.get(name)
+            if snapshot is None:
+                return False
+            # Only nodes created since the last snapshot belong to no snapshot
+            self._release(self.root)
+            self.root = snapshot.root
+            self.blobs = snapshot.blobs
+            self.generation = next(self._generations)
+            self._reset_caches()
+            if self.journal is not None:
+                # The log cannot express this change; fold it into a new image
+                self.journal.compact()
+            return True
+            
+    def delete_snapshot(self, name: str) -> bool:
+        """Drop a snapshot, releasing the blobs only it held"""
+        with self._locked(writes=["/"]):
+            if self._txn is not None:
+                raise RuntimeError("snapshots cannot be deleted inside a transaction")
+            return self._drop_snapshot(name)
+            
+    def _drop_snapshot(self, name: str) -> bool:
+        """Forget a snapshot (the caller holds the whole tree)
+        
+        Nodes it shared with the live tree and with no other snapshot
+        become the live tree's own again, writable in place and released
+        when removed; nodes nothing else holds give up their blobs. Telling
+        them apart walks the remaining trees, so unlike taking a snapshot
+        this is linear in their size.
+        """
+        snapshot = self.snapshots.pop(name, None)
+        if snapshot is None:
+            return False
+        held = set()
+        for other in self.snapshots.values():
+            self._mark_nodes(other.root, held)
+        # Claim what only the live tree holds now
+        live = set()
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            if id(node) in held:
+                continue
+            live.add(id(node))
+            if node.gen < self.generation:
+                node.gen = self.generation
+            if node.is_directory and node._raw is None and node._children:
+                stack.extend(node._children.values())
+        if snapshot.blobs is not self.blobs and all(other.blobs is not snapshot.blobs
+                                                    for other in self.snapshots.values()):
+            # Nothing else uses its store; it goes with the snapshot
+            return True
+        stack = [snapshot.root]
+        while stack:
+            node = stack.pop()
+            if id(node) in held or id(node) in live:
+                continue
+            if node.is_directory and node._raw is None:
+                stack.extend((node._children or {}).values())
+            else:
+                for ref in node.iter_blob_refs():
+                    snapshot.blobs.release(ref)
+        return True
+        
+    @staticmethod
+    def _mark_nodes(root: FileNode, seen: set):
+        """Add the ids of the nodes of a tree to seen, skipping subtrees already there"""
+        stack = [root]
+        while stack:
+            node = stack.pop()
+            if id(node) in seen:
+                continue
+            seen.add(id(node))
+            if node.is_directory and node._raw is None and node._children:
+                stack.extend(node._children.values())
+            
+    # ============= TRANSACTIONS =============
+    
+    @contextmanager
+    def transaction(self):
+        """Apply a block of operations atomically
+        
+        The block holds the whole tree exclusively, so other threads see
+        none or all of its changes. If it raises, the tree is rolled back to
+        where it started in constant time (the same way a snapshot is
+        restored) and journal records are only written once it commits.
+        A nested transaction joins the outer one.
+        """
+        with self.locks.scope():
+            self._lock(writes=["/"])
+            if self._txn is not None:
+                yield
+                return
+            txn = self._txn = _Transaction(self.root, self.blobs, self.generation)
+            self.generation = next(self._generations)
+            try:
+                yield
+            except BaseException:
+                self._txn = None
+                self._rollback(txn)
+                raise
+            self._txn = None
+            self._commit(txn)
+            
+    def _commit(self, txn: _Transaction):
+        """Make a transaction's changes permanent"""
+        txn_gen = self.generation
+        for node, subtree in txn.garbage:
+            if subtree:
+                refs = node.iter_blob_refs(txn.base_gen, txn_gen)
+            elif node.gen >= txn.base_gen:
+                refs = node._chunks or ()
+            else:
+                continue
+            for ref in refs:
+                txn.blobs.release(ref)
+        # Nothing outside the transaction holds the nodes it copied, so
+        # they become writable in place again
+        self.generation = txn.base_gen
+        if self.journal is not None and txn.records:
+            with self.journal.lock:
+                for op, args, kwargs in txn.records:
+                    self.journal.append(op, args, kwargs)
+                    
+    def _rollback(self, txn: _Transaction):
+        """Return to the tree a transaction started from"""
+        for ref in self.root.iter_blob_refs(self.generation):
+            self.blobs.release(ref)
+        self.root = txn.root
+        self.blobs = txn.blobs
+        self.generation = txn.base_gen
+        self._reset_caches()
+        
+    # On-disk image version: 2 stores each unique blob once next to the tree
+    IMAGE_FORMAT = 2
+    
+    def _dump_tree(self) -> Dict:
+        """Serialize the whole tree"""
+        with self._locked(reads=["/"]):
+            return {
+                "format": self.IMAGE_FORMAT,
+                "blobs": self.blobs.to_dict(),
+                "root": self.root.to_dict()
+            }
+        
+    def _load_tree(self, data: Dict, lazy: bool = False):
+        """Replace the tree with a deserialized one"""
+        if "format" in data:
+            blobs = BlobStore.from_dict(data["blobs"])
+            root = FileNode.from_dict(data["root"], lazy=lazy, store=blobs)
+        else:
+            # Version 1 image with inline contents. Loaded eagerly so every
+            # file's content is interned (and counted) in the blob store.
+            blobs = BlobStore()
+            root = FileNode.from_dict(data, store=blobs)
+        self._install_tree(root, blobs)
+        
+    def _install_tree(self, root: FileNode, blobs: BlobStore):
+        """Make a freshly built tree the live tree"""
+        with self._locked(writes=["/"]):
+            self.blobs = blobs
+            self.root = root
+            # Snapshots are kept in memory only and do not survive a reload
+            self.snapshots = {}
+            self.generation = 0
+            self._reset_caches()
+            
+    def _load_image(self, filepath: str, lazy: bool = False) -> Dict[str, Any]:
+        """Load a JSON or binary image file; return its top-level metadata"""
+        import image_format
+        
+        if image_format.is_binary_file(filepath):
+            with open(filepath, 'rb') as f:
+                root, blobs, meta = image_format.decode_tree(f.read())
+            # The flat node table builds faster than lazy JSON, so binary
+            # images are always loaded in full
+            self._install_tree(root, blobs)
+            return meta
+        with open(filepath, 'r') as f:
+            data = json.load(f)
+        self._load_tree(data, lazy=lazy)
+        if "format" not in data:
+            # A version 1 image is the root node itself, with no metadata
+            return {}
+        return {key: value for key, value in data.items() if key not in ("root", "blobs")}
+        
+    def _write_image(self, filepath: str, data: Dict[str, Any], binary: Optional[bool] = None):
+        """Write a serialized tree as JSON or as a binary image"""
+        import image_format
+        
+        if binary is None:
+            binary = image_format.is_binary_path(filepath)
+        if binary:
+            with open(filepath, 'wb') as f:
+                f.write(image_format.encode_tree(data))
+        else:
+            with open(filepath, 'w') as f:
+                json.dump(data, f, indent=2)
+        
+    def save_to_disk(self, filepath: str, binary: Optional[bool] = None):
+        """Save file system to disk
+        
+        Paths ending in .dimg (or binary=True) get the compact binary image
+        format from image_format.py; anything else is saved as JSON.
+        """
+        if self.journal is not None and filepath == self.journal.snapshot_path:
+            # Mutations are already in the log; just make them durable
+            self.journal.sync()
+            return
+        self._write_image(filepath, self._dump_tree(), binary)
+            
+    def load_from_disk(self, filepath: str, lazy: bool = False):
+        """Load file system from disk (JSON or binary, detected from the file)
+        
+        lazy=True defers building directory contents and parsing
+        timestamps of JSON images until they are first used. The file is
+        still read and parsed in full, so loading stays linear in its size.
+        """
         if os.path.exists(filepath):
-            with open(filepath, 'r') as f:
-                data = json.load(f)
-                self.root = FileNode.from_dict(data)
+            self._load_image(filepath, lazy=lazy)
+                
+    def open_journal(self, snapshot_path: str, log_path: Optional[str] = None,
+                     compact_threshold: Optional[int] = None) -> int:
+        """Switch to journaled persistence, restoring snapshot + log tail
+        
+        Returns the number of log records replayed.
+        """
+        from journal import FilesystemJournal
+        
+        self.close_journal()
+        kwargs = {}
+        if compact_threshold is not None:
+            kwargs["compact_threshold"] = compact_threshold
+        journal = FilesystemJournal(snapshot_path, log_path, **kwargs)
+        replayed = journal.attach(self)
+        self.journal = journal
+        return replayed
+        
+    def close_journal(self, compact: bool = True):
+        """Stop journaling (folding the log into the snapshot by default)"""
+        if self.journal is not None:
+            self.journal.close(compact)
+            self.journal = None
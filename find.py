@@ -0,0 +1,223 @@
+"""
+DoubOS - Find
+Predicates and the streaming tree walk behind find
+"""
+
+import re
+import threading
+import time
+from fnmatch import translate
+from typing import Callable, Iterator, List, Optional, Tuple
+
+from grep import ordered_map
+
+
+# Directories with more entries than this have their subtrees walked on
+# the worker pool, BATCH entries to a task
+FANOUT = 256
+BATCH = 32
+
+# -size units; a bare number counts 512-byte blocks
+_SIZE_UNITS = {"c": 1, "w": 2, "b": 512, "k": 1024, "M": 1024 ** 2, "G": 1024 ** 3}
+
+DAY = 86400
+
+
+def _number(spec: str) -> Tuple[str, int]:
+    """(sign, n) of a numeric argument: +n (more than n), -n (less than n) or n"""
+    sign = spec[:1] if spec[:1] in ("+", "-") else ""
+    digits = spec[len(sign):]
+    if not digits.isdigit():
+        raise ValueError(spec)
+    return sign, int(digits)
+
+
+def _compare(sign: str, n: int) -> Callable[[int], bool]:
+    if sign == "+":
+        return lambda value: value > n
+    if sign == "-":
+        return lambda value: value < n
+    return lambda value: value == n
+
+
+class Query:
+    """The tests of one find command line, applied to each node as the tree is walked
+
+    Tests are added in command-line order and all have to pass. Besides
+    the tests, a query knows how deep a walk may go (maxdepth) and the
+    size a file must exceed to pass its -size tests (larger_than), below
+    which a whole subtree can be skipped using its directory's running
+    total.
+    """
+
+    def __init__(self, now: Optional[float] = None):
+        self.now = time.time() if now is None else now
+        self.tests: List[Callable] = []
+        self.pattern: Optional[str] = None
+        self.file_type: Optional[str] = None
+        self.maxdepth: Optional[int] = None
+        self.larger_than: Optional[int] = None
+        # Only -name and -type so far, which the name index answers
+        self.indexed = True
+
+    def name(self, pattern: str):
+        match = re.compile(translate(pattern)).match
+        self.tests.append(lambda node: match(node.name) is not None)
+        if self.pattern is not None:
+            self.indexed = False
+        self.pattern = pattern
+
+    def type(self, kind: str):
+        if kind not in ("f", "d"):
+            raise ValueError(kind)
+        want_dir = kind == "d"
+        self.tests.append(lambda node: node.is_directory == want_dir)
+        if self.file_type is not None:
+            self.indexed = False
+        self.file_type = kind
+
+    def size(self, spec: str):
+        """-size [+-]n[cwbkMG]: size in units, rounded up"""
+        unit = _SIZE_UNITS.get(spec[-1:])
+        if unit is None:
+            unit = 512
+        else:
+            spec = spec[:-1]
+        sign, n = _number(spec)
+        compare = _compare(sign, n)
+        self.tests.append(lambda node: compare(-(-node.size // unit)))
+        # Bytes a file must be larger than to pass; directories (size 0) never do
+        bound = n * unit if sign == "+" else (n - 1) * unit if not sign and n else None
+        if bound is not None and (self.larger_than is None or bound > self.larger_than):
+            self.larger_than = bound
+        self.indexed = False
+
+    def mtime(self, spec: str):
+        """-mtime [+-]n: whole days since the last modification"""
+        compare = _compare(*_number(spec))
+        now = self.now
+        self.tests.append(lambda node: compare(int((now - node.mtime) // DAY)))
+        self.indexed = False
+
+    def newer(self, reference: float):
+        """-newer: modified after the reference time"""
+        self.tests.append(lambda node: node.mtime > reference)
+        self.indexed = False
+
+    def user(self, owner: str):
+        self.tests.append(lambda node: node.owner == owner)
+        self.indexed = False
+
+    def perm(self, spec: str):
+        """-perm mode (exactly), -mode (all of its bits) or /mode (any of them), in octal"""
+        prefix = spec[:1] if spec[:1] in ("-", "/") else ""
+        digits = spec[len(prefix):]
+        if not digits or len(digits) > 4 or any(c not in "01234567" for c in digits):
+            raise ValueError(spec)
+        bits = int(digits, 8) & 0o777
+        if prefix == "-":
+            self.tests.append(lambda node: node.mode & bits == bits)
+        elif prefix == "/":
+            self.tests.append(lambda node: not bits or node.mode & bits != 0)
+        else:
+            self.tests.append(lambda node: node.mode == bits)
+        self.indexed = False
+
+    def depth(self, spec: str):
+        """-maxdepth n: entries at most n levels below the starting directory"""
+        if not spec.isdigit():
+            raise ValueError(spec)
+        self.maxdepth = int(spec)
+
+    def matches(self, node) -> bool:
+        for test in self.tests:
+            if not test(node):
+                return False
+        return True
+
+    def prunes(self, node) -> bool:
+        """True if nothing below the directory node can pass"""
+        # Host directories keep no running totals
+        return self.larger_than is not None and not node.is_host and node.tree_size <= self.larger_than
+
+
+# ============= WALK =============
+
+def walk(filesystem, path: str, query: Query, stop: Optional[threading.Event] = None) -> Iterator[str]:
+    """Paths below path that pass query, as they are found
+
+    The walk is iterative, so the depth of the tree does not matter, and
+    subtrees the query rules out are never entered. Directories come
+    before their contents and siblings go by name. The entries of a
+    directory with more than FANOUT of them are walked by the worker pool
+    and their results are passed on in the same order. Setting stop ends
+    the walk.
+    """
+    node = filesystem._get_node(path)
+    if node is None:
+        return
+    path = filesystem._normalize(path)
+    if node.is_directory and query.maxdepth != 0 and not _pruned(filesystem, query, path, node):
+        seen = {node._ident} if node.is_host else set()
+        yield from _walk(filesystem, _entries(filesystem, path, node, 1), query, stop, seen, True)
+
+
+def _pruned(filesystem, query: Query, path: str, node) -> bool:
+    # Running totals leave out the host trees mounted below a directory
+    return query.prunes(node) and not filesystem._mounts_below(path)
+
+
+def _entries(filesystem, path: str, node, depth: int) -> List[Tuple[str, object, int]]:
+    """(path, node, depth) of each entry of a directory, by name"""
+    if node.is_host or any((mount.rpartition("/")[0] or "/") == path for mount in filesystem.mounts):
+        children = filesystem.list_directory(path) or []
+    else:
+        # A copy of the children dict, taken without the path locks: their
+        # cost grows with depth, and a directory listed a moment early or
+        # late is all a concurrent change can cause
+        children = list(dict(node.children).values())
+    children.sort(key=lambda child: child.name)
+    base = path.rstrip("/")
+    return [(base + "/" + child.name, child, depth) for child in children]
+
+
+def _walk(filesystem, entries: List[Tuple[str, object, int]], query: Query,
+          stop: Optional[threading.Event], seen: set, split: bool) -> Iterator[str]:
+    """Walk entries and their subtrees depth first; split fans large directories out"""
+    stack = entries[::-1]
+    maxdepth = query.maxdepth
+    while stack:
+        if stop is not None and stop.is_set():
+            return
+        path, node, depth = stack.pop()
+        if query.matches(node):
+            yield path
+        if not node.is_directory or depth == maxdepth or _pruned(filesystem, query, path, node):
+            continue
+        if node.is_host:
+            # Each host directory is entered once, so symlink loops end
+            if node._ident in seen:
+                continue
+            seen.add(node._ident)
+        below = _entries(filesystem, path, node, depth + 1)
+        if split and len(below) > FANOUT:
+            yield from _fan_out(filesystem, below, query, stop, seen)
+        else:
+            stack.extend(reversed(below))
+
+
+def _fan_out(filesystem, entries: List[Tuple[str, object, int]], query: Query,
+             stop: Optional[threading.Event], seen: set) -> Iterator[str]:
+    """Walk the subtrees of entries on the worker pool, BATCH entries to a task"""
+    # Tasks do not split again: a task waiting on tasks queued behind it
+    # could take every worker
+    done = threading.Event()
+
+    def task(batch):
+        return list(_walk(filesystem, batch, query, done, set(seen), False))
+
+    batches = (entries[i:i + BATCH] for i in range(0, len(entries), BATCH))
+    for found in ordered_map(task, batches, done):
+        if stop is not None and stop.is_set():
+            return
+        yield from found
@@ -0,0 +1,227 @@
+"""
+DoubOS - Grep
+Regular-expression search over VFS files and line streams
+"""
+
+import itertools
+import re
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import Callable, Iterable, Iterator, Optional, Tuple
+
+
+# Pattern syntaxes: basic (grep), extended (grep -E) and fixed strings (grep -F)
+BASIC = "basic"
+EXTENDED = "extended"
+FIXED = "fixed"
+
+# Characters with a meaning in each syntax; a pattern without any is plain text
+_SPECIAL = {
+    BASIC: frozenset(".[]*^$\\"),
+    EXTENDED: frozenset(".[]*^$\\+?(){}|"),
+}
+
+# Literal in a basic expression, special once backslashed (the reverse of Python)
+_BASIC_SWAPPED = frozenset("+?|(){}")
+
+
+def _basic_to_python(pattern: str) -> str:
+    out = []
+    i = 0
+    while i < len(pattern):
+        char = pattern[i]
+        if char == "\\" and i + 1 < len(pattern):
+            following = pattern[i + 1]
+            out.append(following if following in _BASIC_SWAPPED else char + following)
+            i += 2
+            continue
+        out.append("\\" + char if char in _BASIC_SWAPPED else char)
+        i += 1
+    return "".join(out)
+
+
+@lru_cache(maxsize=256)
+def compile_pattern(pattern: str, syntax: str = BASIC, ignore_case: bool = False) -> 're.Pattern':
+    """Compiled form of a grep pattern, kept in an LRU cache
+
+    Patterns are compiled in MULTILINE mode, so ^ and $ match at the line
+    boundaries inside a block of lines. Raises re.error for a bad pattern.
+    """
+    if syntax == FIXED:
+        source = re.escape(pattern)
+    elif syntax == BASIC:
+        source = _basic_to_python(pattern)
+    else:
+        source = pattern
+    return re.compile(source, re.MULTILINE | (re.IGNORECASE if ignore_case else 0))
+
+
+def literal_text(pattern: str, syntax: str = BASIC) -> Optional[str]:
+    """The text a pattern matches if it is plain text (None for a real expression)"""
+    if syntax == FIXED or not _SPECIAL[syntax].intersection(pattern):
+        return pattern
+    return None
+
+
+# ============= SCANNING =============
+
+def _blocks(chunks: Iterable[str]) -> Iterator[str]:
+    """Regroup text chunks into blocks of whole lines (only the last may lack its "\\n")"""
+    pending = []
+    for chunk in chunks:
+        cut = chunk.rfind("\n") + 1
+        if not cut:
+            pending.append(chunk)
+            continue
+        if pending:
+            pending.append(chunk[:cut])
+            yield "".join(pending)
+            pending = []
+        else:
+            yield chunk[:cut] if cut < len(chunk) else chunk
+        if cut < len(chunk):
+            pending.append(chunk[cut:])
+    if pending:
+        yield "".join(pending)
+
+
+def _matching_spans(pattern, block: str) -> Iterator[Tuple[int, int]]:
+    """(start, end) of each line of block containing a match
+
+    The whole block is searched at once; a match found running into the
+    next line only counts if its line matches on its own.
+    """
+    search = pattern.search
+    pos = 0
+    size = len(block)
+    while pos < size:
+        found = search(block, pos)
+        if found is None:
+            return
+        start = block.rfind("\n", 0, found.start()) + 1
+        end = block.find("\n", found.start())
+        if end < 0:
+            end = size
+        if found.end() <= end or search(block[start:end]) is not None:
+            yield start, end
+        pos = end + 1
+
+
+def folded(pattern: str, syntax: str = BASIC) -> Optional['re.Pattern']:
+    """Case-sensitive pattern for lowercased ASCII text, standing in for an -i search
+
+    Only plain-text ASCII patterns have one (None otherwise): matching a
+    lowercased block with it is many times faster than IGNORECASE.
+    """
+    text = literal_text(pattern, syntax)
+    if text is None or not text.isascii():
+        return None
+    return compile_pattern(text.lower(), FIXED)
+
+
+def scan(chunks: Iterable[str], pattern, invert: bool = False, limit: Optional[int] = None,
+         numbers: bool = False, stop: Optional[threading.Event] = None,
+         lowered: Optional['re.Pattern'] = None) -> Iterator[Tuple[int, str]]:
+    """Yield (line number, line) for each selected line of text read as chunks
+
+    Lines are selected if they match (or with invert, if they do not),
+    up to limit of them. Line numbers are counted only when asked for (0
+    otherwise). Setting stop ends the scan at the next block. lowered is
+    pattern's folded() form, used on the blocks that are ASCII.
+    """
+    if limit is not None and limit <= 0:
+        return
+    found = 0
+    base = 0    # lines in earlier blocks
+    for block in _blocks(chunks):
+        if stop is not None and stop.is_set():
+            return
+        fold = lowered is not None and block.isascii()
+        if invert:
+            search = (lowered if fold else pattern).search
+            lines = block.split("\n")
+            if block.endswith("\n"):
+                lines.pop()
+            for number, line in enumerate(lines, base + 1):
+                if search(line.lower() if fold else line) is None:
+                    yield number, line
+                    found += 1
+                    if found == limit:
+                        return
+            base += len(lines)
+            continue
+        counted = 0
+        counted_to = 0
+        # Lowercasing keeps ASCII text's offsets, so lines are cut from block
+        spans = _matching_spans(lowered, block.lower()) if fold else _matching_spans(pattern, block)
+        for start, end in spans:
+            if numbers:
+                counted += block.count("\n", counted_to, start)
+                counted_to = start
+            yield (base + counted + 1 if numbers else 0), block[start:end]
+            found += 1
+            if found == limit:
+                return
+        if numbers:
+            base += block.count("\n")
+
+
+def scan_lines(lines: Iterable[str], pattern, invert: bool = False,
+               limit: Optional[int] = None) -> Iterator[Tuple[int, str]]:
+    """Yield (line number, line) for each selected line of a line stream, as scan()"""
+    if limit is not None and limit <= 0:
+        return
+    found = 0
+    search = pattern.search
+    for number, line in enumerate(lines, 1):
+        if (search(line) is None) == invert:
+            yield number, line
+            found += 1
+            if found == limit:
+                return
+
+
+# ============= PARALLEL FILES =============
+
+# Threads scanning files; shared by every grep
+WORKERS = 4
+
+# Files queued ahead of the one whose results are being returned
+WINDOW = 4 * WORKERS
+
+_pool: Optional[ThreadPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def _workers() -> ThreadPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=WORKERS, thread_name_prefix="doubos-grep")
+        return _pool
+
+
+def ordered_map(func: Callable, items: Iterable, stop: Optional[threading.Event] = None) -> Iterator:
+    """func(item) for every item, run on the worker pool, yielded in the order of items
+
+    At most WINDOW items are queued ahead of the one being waited for, so
+    results start arriving at once and memory stays bounded. Closing the
+    iterator early cancels what is queued and sets stop, which func may
+    watch to end a long scan.
+    """
+    pool = _workers()
+    items = iter(items)
+    pending = deque(pool.submit(func, item) for item in itertools.islice(items, WINDOW))
+    try:
+        while pending:
+            result = pending.popleft().result()
+            for item in itertools.islice(items, 1):
+                pending.append(pool.submit(func, item))
+            yield result
+    finally:
+        if stop is not None:
+            stop.set()
+        for future in pending:
+            future.cancel()
@@ -7,7 +7,13 @@ import tkinter as tk
 from tkinter import ttk, scrolledtext, messagebox, filedialog, simpledialog
 from datetime import datetime
 import os
+import bisect
+import queue
 import random
+import threading
+
+from filesystem import CREATE, MODIFY, MOVE, RESET
+from watch import OVERFLOW
 
 
 class BaseWindow:
@@ -64,29 +70,41 @@ class BaseWindow:
 
 
 class TerminalApp(BaseWindow):
-    """Terminal application"""
+    """Terminal application
+    
+    Every window has its own session forked from the desktop's, so its
+    directory, environment and history are its own. Commands run on a
+    worker thread and their output is handed back to Tk through a queue,
+    so a slow command in one terminal never freezes the others.
+    """
     
     def __init__(self, desktop, kernel, filesystem, user_manager):
         super().__init__(desktop, "Terminal", 900, 600, "💻")
         self.kernel = kernel
         self.filesystem = filesystem
         self.user_manager = user_manager
-        self.current_dir = "/"
+        self.session = desktop.session.fork()
+        self.results = queue.Queue()
+        # Ctrl-R state: what was searched for and the entry last shown
+        self.search_query = None
+        self.search_hit = None
         
         # Import command processor
         from commands import CommandProcessor, CommandContext
         from dangerous_commands import register_dangerous_commands
         from utilities import register_utility_commands
         from fun_commands import register_fun_commands
+        from kernel import DoubOSShell
+        from completion import Completer
         
-        shell_mock = type('obj', (object,), {'current_dir': '/', 'change_directory': lambda x: None})()
-        context = CommandContext(kernel, filesystem, user_manager, shell_mock)
+        shell = DoubOSShell(kernel, self.session)
+        context = CommandContext(kernel, filesystem, user_manager, shell, self.session)
         self.processor = CommandProcessor(context)
         register_dangerous_commands(self.processor)
         register_utility_commands(self.processor)
         register_fun_commands(self.processor)
         context.commands = self.processor.commands
-        context.current_dir = "/"
+        self.completer = Completer(self.processor)
         
         self.setup_ui()
         self.print_welcome()
@@ -111,8 +129,7 @@ class TerminalApp(BaseWindow):
         input_frame.pack(fill=tk.X, padx=5, pady=5)
         
         # Prompt label
-        user = self.user_manager.get_current_user()
-        username = user.username if user else "guest"
+        username = self.session.username or "guest"
         self.prompt_text = f"{username}@DoubOS:~$ "
         
         self.prompt_label = tk.Label(input_frame, text=self.prompt_text,
@@ -129,6 +146,9 @@ class TerminalApp(BaseWindow):
                              relief=tk.FLAT)
         self.input.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=5)
         self.input.bind("<Return>", self.execute_command)
+        self.input.bind("<Control-r>", self.reverse_search)
+        self.input.bind("<Tab>", self.complete)
+        self.window.bind("<Control-c>", self.interrupt)
         self.input.focus()
         
     def print_welcome(self):
@@ -148,32 +168,121 @@ Type 'help' for available commands.
         # Echo command
         self.output.insert(tk.END, f"{self.prompt_text}{command}\n", "input")
         self.output.tag_config("input", foreground="#a6e3a1")
+        self.input.delete(0, tk.END)
         
-        # Execute
-        result = self.processor.execute(command)
-        if result:
-            self.output.insert(tk.END, result + "\n\n")
+        # Execute off the Tk thread; input waits until the command is done
+        self.input.configure(state=tk.DISABLED)
+        self.session.add_to_history(command)
+        threading.Thread(target=self.run_command, args=(command,), daemon=True).start()
+        self.window.after(20, self.show_result)
+        
+    def reverse_search(self, event=None):
+        """Ctrl-R: replace the input with the newest command containing it; repeat for older ones"""
+        current = self.input.get()
+        if self.search_hit is not None and current == self.search_hit[1]:
+            query, before = self.search_query, self.search_hit[0]
         else:
-            self.output.insert(tk.END, "\n")
-            
+            query, before = current, None
+        found = self.session.history.search(query, before) if query else None
+        if found:
+            self.search_query, self.search_hit = query, found
+            self.input.delete(0, tk.END)
+            self.input.insert(0, found[1])
+        else:
+            self.window.bell()
+        return "break"
+        
+    def complete(self, event=None):
+        """Tab: complete the word before the cursor, or list the choices"""
+        cursor = self.input.index(tk.INSERT)
+        line = self.input.get()[:cursor]
+        candidates = self.completer.complete(line)
+        if not candidates:
+            self.window.bell()
+            return "break"
+        start = self.completer.word_start(line)
+        common = self.completer.common_prefix(candidates)
+        if len(candidates) == 1 and not common.endswith("/"):
+            common += " "
+        if len(common) > cursor - start:
+            self.input.delete(start, cursor)
+            self.input.insert(start, common)
+        else:
+            shown = [candidate.rstrip("/").rpartition("/")[2] + ("/" if candidate.endswith("/") else "")
+                     for candidate in candidates]
+            self.output.insert(tk.END, f"{self.prompt_text}{self.input.get()}\n{'  '.join(shown)}\n\n")
+            self.output.see(tk.END)
+        return "break"
+        
+    def interrupt(self, event=None):
+        """Ctrl-C: stop a command waiting for more output (tail -f)"""
+        self.session.interrupt()
+        
+    def run_command(self, command):
+        """Worker thread: queue the output lines as they are produced, then None"""
+        try:
+            for line in self.processor.stream(command):
+                self.results.put(line)
+        finally:
+            self.results.put(None)
+        
+    def show_result(self):
+        """Tk thread: print the lines the worker has queued until it is done"""
+        if not self.window.winfo_exists():
+            self.session.interrupt()
+            return
+        done = False
+        while not done:
+            try:
+                line = self.results.get_nowait()
+            except queue.Empty:
+                break
+            if line is None:
+                done = True
+            else:
+                self.output.insert(tk.END, line + "\n")
         self.output.see(tk.END)
-        self.input.delete(0, tk.END)
+        if not done:
+            self.window.after(20, self.show_result)
+            return
+        for notice in self.session.job_notices():
+            self.output.insert(tk.END, notice + "\n")
+        self.output.insert(tk.END, "\n")
+        self.output.see(tk.END)
+        self.input.configure(state=tk.NORMAL)
+        self.input.focus()
         
-        # Check if shutdown
-        if not self.kernel.running:
+        # Check for exit or shutdown
+        if not (self.session.running and self.kernel.running):
             self.window.destroy()
 
 
 class FileExplorerApp(BaseWindow):
-    """File explorer application"""
+    """File explorer application
+    
+    The shown directory is watched, so the list follows changes made from
+    anywhere (terminals, other windows, the shell server) by adding and
+    removing single rows. The watch's dispatcher thread only queues each
+    batch; the Tk thread picks the batches up every POLL_MS.
+    """
+    
+    # Milliseconds between checks for queued changes
+    POLL_MS = 100
     
     def __init__(self, desktop, filesystem, user_manager):
         super().__init__(desktop, "File Explorer", 900, 650, "📁")
         self.filesystem = filesystem
         self.user_manager = user_manager
         self.current_path = "/"
+        # Shown rows as sorted (0 for directories or 1 for files, name)
+        self.entries = []
+        self.watch = None
+        # Change batches from the dispatcher thread, for the Tk thread
+        self.changes = queue.Queue()
         self.setup_ui()
         self.refresh()
+        self.window.bind("<Destroy>", self.on_destroy)
+        self.window.after(self.POLL_MS, self.poll_changes)
         
     def setup_ui(self):
         """Setup file explorer UI"""
@@ -237,20 +346,83 @@ class FileExplorerApp(BaseWindow):
         self.file_list.delete(0, tk.END)
         self.address_bar.delete(0, tk.END)
         self.address_bar.insert(0, self.current_path)
+        if self.watch is None or self.watch.path != self.filesystem._normalize(self.current_path):
+            if self.watch is not None:
+                self.watch.close()
+            self.watch = self.filesystem.watch(self.current_path, callback=self.on_changes)
         
         items = self.filesystem.list_directory(self.current_path)
-        if items:
-            # Sort: directories first, then files
-            dirs = sorted([i for i in items if i.is_directory], key=lambda x: x.name)
-            files = sorted([i for i in items if not i.is_directory], key=lambda x: x.name)
+        # Sort: directories first, then files
+        self.entries = sorted((0 if item.is_directory else 1, item.name) for item in items or ())
+        for entry in self.entries:
+            self.file_list.insert(tk.END, self.entry_label(entry))
             
-            for item in dirs:
-                self.file_list.insert(tk.END, f"📁 {item.name}/")
+    def entry_label(self, entry):
+        """List row for a (kind, name) entry"""
+        kind, name = entry
+        if kind == 0:
+            return f"📁 {name}/"
+        return f"{self.get_file_icon(name)} {name}"
+        
+    def on_changes(self, changes):
+        """Watch callback (dispatcher thread): queue the batch for the Tk thread"""
+        self.changes.put(changes)
+        
+    def poll_changes(self):
+        """Tk thread: apply the batches queued since the last poll"""
+        if not self.window.winfo_exists():
+            return
+        while True:
+            try:
+                changes = self.changes.get_nowait()
+            except queue.Empty:
+                break
+            self.apply_changes(changes)
+        self.window.after(self.POLL_MS, self.poll_changes)
+        
+    def apply_changes(self, changes):
+        """Add and remove the rows a batch of changes affects
+        
+        Changes outside the shown directory (queued by a watch the
+        explorer has since left) touch no rows.
+        """
+        for change in changes:
+            if change.event in (RESET, OVERFLOW) or change.path == self.watch.path:
+                self.refresh()
+                return
+            if change.event == MODIFY:
+                continue
+            self.remove_entry(change.path)
+            if change.event == CREATE:
+                self.add_entry(change.path, change.is_directory)
+            elif change.event == MOVE:
+                self.add_entry(change.dest, change.is_directory)
                 
-            for item in files:
-                icon = self.get_file_icon(item.name)
-                self.file_list.insert(tk.END, f"{icon} {item.name}")
+    def add_entry(self, path, is_directory):
+        parent, _, name = path.rpartition("/")
+        if (parent or "/") != self.watch.path:
+            return
+        entry = (0 if is_directory else 1, name)
+        index = bisect.bisect_left(self.entries, entry)
+        if index < len(self.entries) and self.entries[index] == entry:
+            return
+        self.entries.insert(index, entry)
+        self.file_list.insert(index, self.entry_label(entry))
+        
+    def remove_entry(self, path):
+        parent, _, name = path.rpartition("/")
+        if (parent or "/") != self.watch.path:
+            return
+        for entry in ((0, name), (1, name)):
+            index = bisect.bisect_left(self.entries, entry)
+            if index < len(self.entries) and self.entries[index] == entry:
+                del self.entries[index]
+                self.file_list.delete(index)
                 
+    def on_destroy(self, event):
+        if event.widget is self.window and self.watch is not None:
+            self.watch.close()
+            
     def get_file_icon(self, filename):
         """Get icon for file type"""
         ext = os.path.splitext(filename)[1].lower()
@@ -315,7 +487,7 @@ class FileExplorerApp(BaseWindow):
         
     def go_home(self):
         """Go to home directory"""
-        user = self.user_manager.get_current_user()
+        user = self.desktop.session.user
         self.current_path = user.home_dir if user else "/home"
         self.refresh()
         
@@ -327,7 +499,7 @@ class FileExplorerApp(BaseWindow):
             return
             
         path = self.current_path.rstrip('/') + '/' + name
-        user = self.user_manager.get_current_user()
+        user = self.desktop.session.user
         owner = user.username if user else "guest"
         
         if choice == 'yes':
@@ -419,10 +591,13 @@ class TextEditorApp(BaseWindow):
         if not path:
             return
             
-        content = self.filesystem.read_file(path)
-        if content is not None:
+        handle = self.filesystem.open(path)
+        if handle is not None:
             self.text.delete(1.0, tk.END)
-            self.text.insert(1.0, content)
+            # Insert block by block instead of building the whole string
+            with handle:
+                for block in iter(lambda: handle.read(64 * 1024), ""):
+                    self.text.insert(tk.END, block)
             self.current_file = path
         else:
             messagebox.showerror("Error", f"Could not open '{path}'")
@@ -566,7 +741,7 @@ class SettingsApp(BaseWindow):
                 font=("Segoe UI", 16, "bold"),
                 bg=self.desktop.colors["bg"], fg=self.desktop.colors["text"]).pack(anchor=tk.W, pady=(0, 20))
                 
-        user = self.user_manager.get_current_user()
+        user = self.desktop.session.user
         if user:
             info = f"""Username: {user.username}
 UID: {user.uid}
@@ -819,8 +994,8 @@ Processes: 2 running
 Memory: Virtual (unlimited)
 CPU: Simulated
 
-Command History: {len(self.kernel.command_history)} commands
-Environment Variables: {len(self.kernel.environment_vars)}
+Command History: {len(self.desktop.session.history)} commands
+Environment Variables: {len(self.desktop.session.environment)}
 
 Status: ✅ All systems operational
 """
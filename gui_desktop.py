@@ -9,17 +9,21 @@ from datetime import datetime
 import subprocess
 import os
 from window_manager import WindowManager
-from windowed_apps import TerminalApp, FileExplorerApp, TextEditorApp, CalculatorApp, SettingsApp
+from session import Session
+from windowed_apps import TextEditorApp, CalculatorApp, SettingsApp
+from gui_apps import TerminalApp, FileExplorerApp
 from games_menu import GamesMenuApp
 
 
 class DoubOSDesktop:
     """Main desktop environment"""
     
-    def __init__(self, kernel, filesystem, user_manager):
+    def __init__(self, kernel, filesystem, user_manager, session=None):
         self.kernel = kernel
         self.filesystem = filesystem
         self.user_manager = user_manager
+        # The desktop's login; terminals fork their own sessions from it
+        self.session = session or Session(environment=kernel.environment_vars)
         
         # Create main window
         self.root = tk.Tk()
@@ -194,7 +198,7 @@ class DoubOSDesktop:
         self.clock_label.pack(side=tk.RIGHT, padx=10)
         
         # User info
-        user = self.user_manager.get_current_user()
+        user = self.session.user
         user_text = f"👤 {user.username if user else 'Guest'}"
         user_label = tk.Label(self.tray, text=user_text, 
                              font=("Segoe UI", 9),
@@ -260,7 +264,7 @@ class DoubOSDesktop:
         header.pack(fill=tk.X)
         header.pack_propagate(False)
         
-        user = self.user_manager.get_current_user()
+        user = self.session.user
         user_name = user.username if user else "Guest"
         
         tk.Label(header, text=f"👤 {user_name}", 
@@ -355,18 +359,14 @@ class DoubOSDesktop:
         
     # Application launchers - opens inside simulation windows
     def open_terminal(self):
-        """Open terminal"""
+        """Open terminal (a window of its own, with a session forked from the desktop's)"""
         print("Opening Terminal...")
-        self.window_manager.open_window("Terminal 💻", 900, 450, 
-                                       TerminalApp,
-                                       self.kernel, self.filesystem, self.user_manager)
+        return TerminalApp(self, self.kernel, self.filesystem, self.user_manager)
         
     def open_file_explorer(self):
-        """Open file explorer"""
+        """Open file explorer (a window of its own, which follows changes to the shown directory)"""
         print("Opening File Explorer...")
-        self.window_manager.open_window("File Explorer 📁", 700, 400,
-                                       FileExplorerApp,
-                                       self.filesystem)
+        return FileExplorerApp(self, self.filesystem, self.user_manager)
         
     def open_text_editor(self):
         """Open text editor"""
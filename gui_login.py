@@ -181,8 +181,9 @@ class LoginScreen:
             messagebox.showerror("Error", "Please enter both username and password")
             return
             
-        if self.user_manager.login(username, password):
-            self.logged_in_user = self.user_manager.get_current_user()
+        user = self.user_manager.authenticate(username, password)
+        if user:
+            self.logged_in_user = user
             messagebox.showinfo("Success", f"Welcome back, {username}!")
             self.root.destroy()  # Destroy window to prevent it showing again
         else:
@@ -0,0 +1,302 @@
+"""
+DoubOS - Command History
+Bounded command history with a substring index and per-user history files
+"""
+
+import threading
+import time
+import weakref
+from array import array
+from typing import Dict, Iterator, List, Optional, Tuple
+
+
+# File in a user's home directory that their history is appended to
+HISTORY_FILE = ".doubos_history"
+
+
+class CommandHistory:
+    """Ring buffer of the most recent command lines
+
+    Entries are numbered from 1 for the life of the history; once capacity
+    entries are held, each new one evicts the oldest. Every distinct line
+    is stored (and indexed) once: a trigram index over the lowercased
+    distinct lines answers substring queries by checking only the lines
+    that contain the query's rarest trigram, and each entry links to the
+    previous entry with the same line, so all occurrences of a match are
+    found without scanning the buffer. Queries ignore case, as grep does.
+
+    attach() ties the history to an append-only file in the VFS: the newest
+    lines are loaded from it, and new entries are appended to it in the
+    background every FLUSH_INTERVAL seconds (and by flush()).
+    """
+
+    # Entries kept unless another capacity is given
+    CAPACITY = 1000
+
+    # Seconds between background writes of new entries
+    FLUSH_INTERVAL = 2.0
+
+    # Length of the indexed substrings; shorter queries scan the distinct lines
+    GRAM = 3
+
+    def __init__(self, capacity: Optional[int] = None):
+        self.capacity = capacity or self.CAPACITY
+        self._lock = threading.RLock()
+        # Where new entries are written (set by attach)
+        self.filesystem = None
+        self.path: Optional[str] = None
+        self.owner = "root"
+        # File lines not written yet
+        self._pending: List[str] = []
+        self._reset()
+
+    def _reset(self):
+        capacity = self.capacity
+        # Per ring slot (entry number % capacity): line id, time, and the
+        # number of the previous entry with the same line (0 for none)
+        self._ids = array('q', bytes(8 * capacity))
+        self._times = array('d', bytes(8 * capacity))
+        self._prev = array('q', bytes(8 * capacity))
+        self._first = 1     # oldest entry held
+        self._next = 1      # number of the next entry
+        # Distinct lines by id
+        self._id_of: Dict[str, int] = {}
+        self._lines: List[Optional[str]] = []
+        self._lowered: List[Optional[str]] = []
+        self._last = array('q')     # newest entry per line
+        self._count = array('q')    # entries held per line
+        self._free: List[int] = []
+        # Trigram -> ids of the lines containing it; ids of evicted lines
+        # stay until the next rebuild and are skipped when checked
+        self._postings: Dict[str, array] = {}
+        self._indexed = 0
+        self._stale = 0
+
+    def __len__(self) -> int:
+        return self._next - self._first
+
+    @property
+    def first(self) -> int:
+        """Number of the oldest entry held"""
+        return self._first
+
+    @property
+    def last(self) -> int:
+        """Number of the newest entry (0 if none yet)"""
+        return self._next - 1
+
+    # ============= ENTRIES =============
+
+    def add(self, command: str, timestamp: Optional[float] = None):
+        """Append a command line, evicting the oldest entry when full"""
+        timestamp = time.time() if timestamp is None else timestamp
+        with self._lock:
+            self._append(command, timestamp)
+            if self.path is not None:
+                self._pending.append(f"{timestamp:.0f}\t{command}")
+
+    def _append(self, command: str, timestamp: float):
+        number = self._next
+        if number - self._first >= self.capacity:
+            self._evict()
+        line_id = self._intern(command)
+        slot = number % self.capacity
+        self._ids[slot] = line_id
+        self._times[slot] = timestamp
+        self._prev[slot] = self._last[line_id]
+        self._last[line_id] = number
+        self._count[line_id] += 1
+        self._next = number + 1
+
+    def _evict(self):
+        line_id = self._ids[self._first % self.capacity]
+        self._first += 1
+        self._count[line_id] -= 1
+        if not self._count[line_id]:
+            self._stale += len(self._grams(self._lowered[line_id]))
+            del self._id_of[self._lines[line_id]]
+            self._lines[line_id] = self._lowered[line_id] = None
+            self._free.append(line_id)
+            if self._stale > self._indexed // 2:
+                self._rebuild()
+
+    def _intern(self, command: str) -> int:
+        line_id = self._id_of.get(command)
+        if line_id is not None:
+            return line_id
+        lowered = command.lower()
+        if lowered == command:
+            lowered = command
+        if self._free:
+            line_id = self._free.pop()
+            self._lines[line_id], self._lowered[line_id] = command, lowered
+            self._last[line_id] = self._count[line_id] = 0
+        else:
+            line_id = len(self._lines)
+            self._lines.append(command)
+            self._lowered.append(lowered)
+            self._last.append(0)
+            self._count.append(0)
+        self._id_of[command] = line_id
+        self._index(line_id, lowered)
+        return line_id
+
+    def _grams(self, lowered: str):
+        size = self.GRAM
+        return {lowered[i:i + size] for i in range(len(lowered) - size + 1)}
+
+    def _index(self, line_id: int, lowered: str):
+        postings = self._postings
+        for gram in self._grams(lowered):
+            posting = postings.get(gram)
+            if posting is None:
+                posting = postings[gram] = array('q')
+            posting.append(line_id)
+            self._indexed += 1
+
+    def _rebuild(self):
+        """Re-index the lines still held, dropping evicted ids"""
+        self._postings = {}
+        self._indexed = self._stale = 0
+        for line_id, lowered in enumerate(self._lowered):
+            if lowered is not None:
+                self._index(line_id, lowered)
+
+    def get(self, number: int) -> Optional[str]:
+        """Line of entry number (None once evicted)"""
+        if not self._first <= number < self._next:
+            return None
+        return self._lines[self._ids[number % self.capacity]]
+
+    def entries(self, start: Optional[int] = None) -> Iterator[Tuple[int, str]]:
+        """Yield (number, line) from entry start (the oldest held by default) on"""
+        number = self._first if start is None else max(start, self._first)
+        while number < self._next:
+            line = self.get(number)
+            if line is not None:
+                yield number, line
+            number += 1
+
+    def tail(self, count: int) -> List[Tuple[int, str]]:
+        """The newest count entries as (number, line)"""
+        return list(self.entries(self._next - count)) if count > 0 else []
+
+    def clear(self):
+        """Forget every entry (the history file is left alone)"""
+        with self._lock:
+            self._reset()
+
+    # ============= SEARCH =============
+
+    def _matching_ids(self, needle: str) -> List[int]:
+        """Ids of the held lines containing needle (lowercased)"""
+        lowered = self._lowered
+        if len(needle) < self.GRAM:
+            candidates = range(len(lowered))
+        else:
+            postings = [self._postings.get(gram) for gram in self._grams(needle)]
+            if not all(postings):
+                return []
+            candidates = min(postings, key=len)
+        ids = []
+        seen = set()
+        for line_id in candidates:
+            line = lowered[line_id]
+            if line is not None and needle in line and line_id not in seen:
+                seen.add(line_id)
+                ids.append(line_id)
+        return ids
+
+    def search(self, text: str, before: Optional[int] = None) -> Optional[Tuple[int, str]]:
+        """Newest entry before number before whose line contains text (Ctrl-R)"""
+        limit = self._next if before is None else before
+        best = 0
+        with self._lock:
+            for line_id in self._matching_ids(text.lower()):
+                number = self._last[line_id]
+                while number >= limit and number >= self._first:
+                    number = self._prev[number % self.capacity]
+                if number >= self._first and number > best:
+                    best = number
+            return (best, self.get(best)) if best else None
+
+    def matches(self, text: str) -> List[Tuple[int, str]]:
+        """Every held entry whose line contains text, oldest first"""
+        found = []
+        with self._lock:
+            first = self._first
+            for line_id in self._matching_ids(text.lower()):
+                line = self._lines[line_id]
+                number = self._last[line_id]
+                while number >= first:
+                    found.append((number, line))
+                    number = self._prev[number % self.capacity]
+        found.sort()
+        return found
+
+    # ============= PERSISTENCE =============
+
+    def attach(self, filesystem, path: str, owner: str = "root"):
+        """Load the newest lines of the history file at path and append new entries to it"""
+        lines = filesystem.tail_lines(path, self.capacity + 1) or []
+        with self._lock:
+            self.filesystem, self.path, self.owner = filesystem, path, owner
+            for line in lines:
+                stamp, tab, command = line.partition("\t")
+                if tab and command:
+                    try:
+                        self._append(command, float(stamp))
+                    except ValueError:
+                        continue
+        _flusher.watch(self)
+
+    def flush(self):
+        """Append the entries added since the last flush to the history file"""
+        with self._lock:
+            pending, self._pending = self._pending, []
+        if not pending or self.path is None:
+            return
+        try:
+            self.filesystem.write_file(self.path, "\n".join(pending) + "\n", self.owner, append=True)
+        except Exception:
+            with self._lock:
+                self._pending[:0] = pending
+            raise
+
+
+class _Flusher:
+    """Daemon thread flushing every attached history periodically"""
+
+    def __init__(self):
+        self._histories = weakref.WeakSet()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def watch(self, history: CommandHistory):
+        with self._lock:
+            self._histories.add(history)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="doubos-history", daemon=True)
+                self._thread.start()
+
+    def flush_all(self):
+        with self._lock:
+            histories = list(self._histories)
+        for history in histories:
+            try:
+                history.flush()
+            except Exception:
+                pass  # kept pending; retried next time
+
+    def _run(self):
+        while True:
+            time.sleep(CommandHistory.FLUSH_INTERVAL)
+            self.flush_all()
+
+
+_flusher = _Flusher()
+
+
+def flush_all():
+    """Write out the new entries of every attached history now"""
+    _flusher.flush_all()
@@ -0,0 +1,331 @@
+"""
+DoubOS - Binary Images
+Compact binary container for saved filesystem and user state
+
+Convert saved state between formats:  python image_format.py SRC DST
+(the target format follows DST's suffix: .dimg is binary, anything else JSON)
+"""
+
+import gc
+import json
+import os
+import sys
+import struct
+import zlib
+from array import array
+from typing import Any, Dict, List, Tuple
+
+from filesystem import Blob, BlobStore, FileNode, VirtualFileSystem, _PERMISSION_MODES
+
+
+# Paths ending in this suffix are saved as binary images
+BINARY_SUFFIX = ".dimg"
+
+# Layout (little-endian):
+#   header    MAGIC, format version u16, kind u16
+#   sections  tag (4 bytes), payload length u64, payload
+#
+# Filesystem images hold META (JSON object with the image format and any
+# extra keys such as journal_seq), STRS (string table), NODE (one _NODE
+# record per node in pre-order, root first), CHNK (u32 blob index of every
+# file chunk), BLOB (one _BLOB record per unique blob) and DATA (the blob
+# contents in BLOB order, zlib-compressed). User images hold STRS and USER.
+MAGIC = b"DOUBOSIM"
+VERSION = 1
+KIND_FILESYSTEM = 1
+KIND_USERS = 2
+
+_HEADER = struct.Struct("<8sHH")
+_SECTION = struct.Struct("<4sQ")
+# parent, name, owner, mode, is_directory, created, modified, size,
+# tree_size, file_count, first chunk, chunk count
+_NODE = struct.Struct("<IIIHBddQQIII")
+# digest (raw BLAKE2b bytes), refs, encoded length
+_BLOB = struct.Struct("<16sIQ")
+# username, password hash, uid, home, is_admin, created, last login, logins
+_USER = struct.Struct("<IIIIBIII")
+# No parent (the root) / no string (None)
+_NONE = 0xFFFFFFFF
+
+
+class _StringTable:
+    """Deduplicated strings, referenced by index"""
+
+    def __init__(self):
+        self.index: Dict[str, int] = {}
+        self.strings: List[str] = []
+
+    def add(self, value: str) -> int:
+        position = self.index.get(value)
+        if position is None:
+            if "\0" in value:
+                raise ValueError(f"cannot store {value!r} in a binary image")
+            position = self.index[value] = len(self.strings)
+            self.strings.append(value)
+        return position
+
+    def encode(self) -> bytes:
+        # add() keeps NUL out of the table, so it can separate entries
+        return "\0".join(self.strings).encode("utf-8", "surrogatepass")
+
+    @staticmethod
+    def decode(payload) -> List[str]:
+        return bytes(payload).decode("utf-8", "surrogatepass").split("\0")
+
+
+def _u32_array(values: List[int]) -> bytes:
+    packed = array("I", values)
+    if sys.byteorder == "big":
+        packed.byteswap()
+    return packed.tobytes()
+
+
+def _u32_values(payload) -> array:
+    values = array("I")
+    values.frombytes(payload)
+    if sys.byteorder == "big":
+        values.byteswap()
+    return values
+
+
+def _container(kind: int, sections: List[Tuple[bytes, bytes]]) -> bytes:
+    parts = [_HEADER.pack(MAGIC, VERSION, kind)]
+    for tag, payload in sections:
+        parts.append(_SECTION.pack(tag, len(payload)))
+        parts.append(payload)
+    return b"".join(parts)
+
+
+def _sections(buf: bytes, kind: int) -> Dict[bytes, memoryview]:
+    """Split an image into its sections, checking the header"""
+    if len(buf) < _HEADER.size:
+        raise ValueError("not a DoubOS image")
+    magic, version, found = _HEADER.unpack_from(buf)
+    if magic != MAGIC:
+        raise ValueError("not a DoubOS image")
+    if version > VERSION:
+        raise ValueError(f"unsupported image version {version}")
+    if found != kind:
+        raise ValueError(f"expected image kind {kind}, found {found}")
+    view = memoryview(buf)
+    sections = {}
+    offset = _HEADER.size
+    while offset < len(buf):
+        tag, length = _SECTION.unpack_from(buf, offset)
+        offset += _SECTION.size
+        if offset + length > len(buf):
+            raise ValueError("truncated image")
+        sections[tag] = view[offset:offset + length]
+        offset += length
+    return sections
+
+
+def is_binary_path(path: str) -> bool:
+    """Whether saving to path should produce a binary image"""
+    return path.endswith(BINARY_SUFFIX)
+
+
+def is_binary_file(path: str) -> bool:
+    """Whether the file at path is a binary image (by its header)"""
+    with open(path, 'rb') as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+# ============= FILESYSTEM =============
+
+def encode_tree(data: Dict[str, Any], level: int = 6) -> bytes:
+    """Encode a tree serialized by VirtualFileSystem._dump_tree"""
+    strings = _StringTable()
+    add = strings.add
+
+    blob_index = {}
+    blob_records = bytearray()
+    contents = []
+    for digest, (content, refs) in data["blobs"].items():
+        blob_index[digest] = len(blob_index)
+        encoded = content.encode("utf-8", "surrogatepass")
+        blob_records += _BLOB.pack(bytes.fromhex(digest), refs, len(encoded))
+        contents.append(encoded)
+
+    nodes = bytearray()
+    chunk_refs = []
+    pack = _NODE.pack
+    epoch = FileNode._epoch
+    count = 0
+    stack = [(data["root"], _NONE)]
+    while stack:
+        node, parent = stack.pop()
+        index = count
+        count += 1
+        first = len(chunk_refs)
+        if node["is_directory"]:
+            children = node["children"]
+            if "tree_size" in node:
+                tree_size, file_count = node["tree_size"], node["file_count"]
+            else:
+                tree_size, file_count = FileNode._raw_totals(children)
+            # Reversed so children pop off the stack in their original order
+            stack.extend((child, index) for child in reversed(children.values()))
+        else:
+            tree_size = file_count = 0
+            if "blob" in node:
+                chunk_refs.append(blob_index[node["blob"]])
+            elif "chunks" in node:
+                chunk_refs.extend(blob_index[digest] for digest in node["chunks"])
+        nodes += pack(parent, add(node["name"]), add(node["owner"]),
+                      _PERMISSION_MODES[node["permissions"]], node["is_directory"],
+                      epoch(node["created_at"]), epoch(node["modified_at"]),
+                      node["size"], tree_size, file_count, first, len(chunk_refs) - first)
+
+    meta = {key: value for key, value in data.items() if key not in ("root", "blobs")}
+    return _container(KIND_FILESYSTEM, [
+        (b"META", json.dumps(meta).encode()),
+        (b"STRS", strings.encode()),
+        (b"NODE", bytes(nodes)),
+        (b"CHNK", _u32_array(chunk_refs)),
+        (b"BLOB", bytes(blob_records)),
+        (b"DATA", zlib.compress(b"".join(contents), level)),
+    ])
+
+
+def decode_tree(buf: bytes) -> Tuple[FileNode, BlobStore, Dict[str, Any]]:
+    """Build (root, blob store, metadata) from a binary filesystem image"""
+    # Everything built here stays alive, so the collections that so many new
+    # objects would trigger cannot free anything; pause them meanwhile
+    collecting = gc.isenabled()
+    gc.disable()
+    try:
+        return _decode_tree(buf)
+    finally:
+        if collecting:
+            gc.enable()
+
+
+def _decode_tree(buf: bytes) -> Tuple[FileNode, BlobStore, Dict[str, Any]]:
+    sections = _sections(buf, KIND_FILESYSTEM)
+    meta = json.loads(bytes(sections[b"META"]))
+    strings = _StringTable.decode(sections[b"STRS"])
+
+    store = BlobStore()
+    blobs = []
+    data = zlib.decompress(sections[b"DATA"])
+    offset = 0
+    for digest, refs, length in _BLOB.iter_unpack(sections[b"BLOB"]):
+        content = data[offset:offset + length].decode("utf-8", "surrogatepass")
+        offset += length
+        blob = Blob(content, digest.hex(), refs)
+        store._blobs[blob.digest] = blob
+        store.physical_bytes += len(content)
+        blobs.append(blob)
+
+    chunk_refs = _u32_values(sections[b"CHNK"])
+    nodes = []
+    for (parent, name, owner, mode, is_directory, created, modified, size,
+         tree_size, file_count, first, chunks) in _NODE.iter_unpack(sections[b"NODE"]):
+        node = FileNode(strings[name], bool(is_directory), strings[owner])
+        node._mode = mode
+        node._ctime = created
+        node._mtime = modified
+        node.size = size
+        if is_directory:
+            node.tree_size = tree_size
+            node.file_count = file_count
+        elif chunks:
+            node._chunks = [blobs[i] for i in chunk_refs[first:first + chunks]]
+        if parent != _NONE:
+            siblings = nodes[parent]._children
+            if siblings is None:
+                siblings = nodes[parent]._children = {}
+            siblings[node.name] = node
+        nodes.append(node)
+    if not nodes:
+        raise ValueError("image has no root node")
+    return nodes[0], store, meta
+
+
+# ============= USERS =============
+
+def encode_users(data: Dict[str, Dict[str, Any]]) -> bytes:
+    """Encode users serialized by UserManager (username -> User.to_dict())"""
+    strings = _StringTable()
+    add = strings.add
+    records = bytearray()
+    for user in data.values():
+        last_login = user["last_login"]
+        records += _USER.pack(add(user["username"]), add(user["password_hash"]), user["uid"],
+                              add(user["home_dir"]), user["is_admin"], add(user["created_at"]),
+                              _NONE if last_login is None else add(last_login), user["login_count"])
+    return _container(KIND_USERS, [(b"STRS", strings.encode()), (b"USER", bytes(records))])
+
+
+def decode_users(buf: bytes) -> Dict[str, Dict[str, Any]]:
+    """Inverse of encode_users"""
+    sections = _sections(buf, KIND_USERS)
+    strings = _StringTable.decode(sections[b"STRS"])
+    users = {}
+    for (username, password_hash, uid, home_dir, is_admin, created_at,
+         last_login, login_count) in _USER.iter_unpack(sections[b"USER"]):
+        users[strings[username]] = {
+            "username": strings[username],
+            "password_hash": strings[password_hash],
+            "uid": uid,
+            "home_dir": strings[home_dir],
+            "is_admin": bool(is_admin),
+            "created_at": strings[created_at],
+            "last_login": None if last_login == _NONE else strings[last_login],
+            "login_count": login_count
+        }
+    return users
+
+
+# ============= CONVERSION =============
+
+def _is_users_image(path: str) -> bool:
+    if is_binary_file(path):
+        with open(path, 'rb') as f:
+            header = f.read(_HEADER.size)
+        return len(header) == _HEADER.size and _HEADER.unpack(header)[2] == KIND_USERS
+    with open(path, 'r') as f:
+        data = json.load(f)
+    # Filesystem images are a node (version 1) or carry a format number
+    return "format" not in data and "is_directory" not in data
+
+
+def convert(src: str, dst: str) -> str:
+    """Convert saved state between JSON and binary
+
+    The source format is detected from its content and the target format
+    from dst's suffix. Returns what was converted ("filesystem" or "users").
+    """
+    if _is_users_image(src):
+        from users import UserManager
+
+        manager = UserManager()
+        manager.load_from_disk(src)
+        manager.save_to_disk(dst)
+        return "users"
+    fs = VirtualFileSystem()
+    meta = fs._load_image(src, lazy=True)
+    data = fs._dump_tree()
+    # Keep extra metadata such as a journal snapshot's sequence number
+    for key, value in meta.items():
+        data.setdefault(key, value)
+    fs._write_image(dst, data)
+    return "filesystem"
+
+
+def main():
+    """Command-line converter"""
+    if len(sys.argv) != 3:
+        print(f"Usage: python {os.path.basename(sys.argv[0])} SRC DST")
+        print(f"  DST ending in {BINARY_SUFFIX} is written as a binary image, anything else as JSON")
+        return False
+    kind = convert(sys.argv[1], sys.argv[2])
+    before, after = os.path.getsize(sys.argv[1]), os.path.getsize(sys.argv[2])
+    print(f"Converted {kind} image: {before:,} -> {after:,} bytes")
+    return True
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
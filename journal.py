@@ -0,0 +1,204 @@
+"""
+DoubOS - Filesystem Journal
+Write-ahead log of file system mutations with background compaction
+"""
+
+import json
+import os
+import threading
+from typing import Any, Dict, List, Optional
+
+import image_format
+
+
+class FilesystemJournal:
+    """Append-only log of VFS mutations folded periodically into a snapshot
+
+    Every journaled VirtualFileSystem method appends one compact JSON line
+    holding a sequence number, the method name and its arguments. The
+    snapshot is a regular filesystem image that also records the last
+    sequence number it contains, so startup loads the snapshot and replays
+    only the records after it.
+    """
+
+    # Records appended before the background compactor is woken up
+    COMPACT_THRESHOLD = 1000
+
+    def __init__(self, snapshot_path: str, log_path: Optional[str] = None,
+                 compact_threshold: int = COMPACT_THRESHOLD):
+        self.snapshot_path = snapshot_path
+        self.log_path = log_path or snapshot_path + ".journal"
+        self.rotated_path = self.log_path + ".1"
+        self.compact_threshold = compact_threshold
+        self.filesystem = None
+        self.seq = 0
+        self.pending = 0
+        self.replaying = False
+        self.lock = threading.RLock()
+        self._compact_lock = threading.Lock()
+        self._log = None
+        self._wakeup = threading.Event()
+        self._stopping = False
+        self._compactor = None
+
+    # ============= STARTUP =============
+
+    def attach(self, filesystem):
+        """Restore filesystem from snapshot + log and start journaling it"""
+        self.filesystem = filesystem
+        snapshot_seq = 0
+
+        if os.path.exists(self.snapshot_path):
+            meta = filesystem._load_image(self.snapshot_path, lazy=True)
+            snapshot_seq = meta.get("journal_seq", 0)
+        self.seq = snapshot_seq
+
+        # A leftover rotated log means we stopped mid-compaction
+        replayed = 0
+        for path in (self.rotated_path, self.log_path):
+            replayed += self._replay(path, snapshot_seq)
+
+        if not os.path.exists(self.snapshot_path):
+            self._write_snapshot(self._capture())
+
+        self._log = open(self.log_path, 'a', encoding='utf-8')
+        self.pending = replayed
+        self._compactor = threading.Thread(target=self._compact_loop,
+                                           name="vfs-compactor", daemon=True)
+        self._compactor.start()
+        if self.pending >= self.compact_threshold:
+            self._wakeup.set()
+        return replayed
+
+    def _read_records(self, path: str) -> List[Dict[str, Any]]:
+        """Read log records, stopping at a torn trailing line"""
+        records = []
+        if not os.path.exists(path):
+            return records
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    break
+        return records
+
+    def _replay(self, path: str, after_seq: int) -> int:
+        """Re-apply records newer than after_seq"""
+        count = 0
+        self.replaying = True
+        try:
+            for record in self._read_records(path):
+                if record["s"] <= after_seq:
+                    continue
+                method = getattr(self.filesystem, record["op"], None)
+                if method is None or not getattr(method, "journaled", False):
+                    continue
+                method(*record.get("a", []), **record.get("k", {}))
+                self.seq = max(self.seq, record["s"])
+                count += 1
+        finally:
+            self.replaying = False
+        return count
+
+    # ============= LOGGING =============
+
+    def append(self, op: str, args: tuple, kwargs: Dict[str, Any]):
+        """Append one mutation record (caller holds self.lock)"""
+        self.seq += 1
+        record = {"s": self.seq, "op": op}
+        if args:
+            record["a"] = args
+        if kwargs:
+            record["k"] = kwargs
+        self._log.write(json.dumps(record, separators=(",", ":")) + "\n")
+        self._log.flush()
+        self.pending += 1
+        if self.pending >= self.compact_threshold:
+            self._wakeup.set()
+
+    def sync(self):
+        """Force appended records to stable storage"""
+        with self.lock:
+            if self._log:
+                self._log.flush()
+                os.fsync(self._log.fileno())
+
+    # ============= COMPACTION =============
+
+    def _capture(self) -> Dict[str, Any]:
+        """Serialize the tree together with the sequence number it reflects"""
+        data = self.filesystem._dump_tree()
+        data["journal_seq"] = self.seq
+        return data
+
+    def _write_snapshot(self, data: Dict[str, Any]):
+        """Atomically replace the snapshot file"""
+        tmp_path = self.snapshot_path + ".tmp"
+        binary = image_format.is_binary_path(self.snapshot_path)
+        with open(tmp_path, 'wb' if binary else 'w') as f:
+            if binary:
+                f.write(image_format.encode_tree(data))
+            else:
+                json.dump(data, f, separators=(",", ":"))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.snapshot_path)
+
+    def compact(self):
+        """Fold the current log into a fresh snapshot"""
+        # Lock order: filesystem tree, then compaction, then the log
+        with self.filesystem.locks.scope():
+            self.filesystem._lock(reads=["/"])
+            self._compact_lock.acquire()
+            try:
+                data = self._rotate()
+            except BaseException:
+                self._compact_lock.release()
+                raise
+
+        # Encoding and writing happen without blocking mutations
+        try:
+            if data is not None:
+                self._write_snapshot(data)
+                os.remove(self.rotated_path)
+        finally:
+            self._compact_lock.release()
+
+    def _rotate(self) -> Optional[Dict[str, Any]]:
+        """Capture the tree and start a new log; None once closed"""
+        with self.lock:
+            if self._log is None:
+                return None
+            data = self._capture()
+            self._log.close()
+            os.replace(self.log_path, self.rotated_path)
+            self._log = open(self.log_path, 'a', encoding='utf-8')
+            self.pending = 0
+            return data
+
+    def _compact_loop(self):
+        """Background compactor thread"""
+        while True:
+            self._wakeup.wait()
+            self._wakeup.clear()
+            if self._stopping:
+                return
+            try:
+                self.compact()
+            except OSError:
+                # Keep the log; the next wakeup retries
+                pass
+
+    def close(self, compact: bool = True):
+        """Stop the compactor and close the log"""
+        self._stopping = True
+        self._wakeup.set()
+        if self._compactor:
+            self._compactor.join()
+        if compact and self.pending:
+            self.compact()
+        with self.lock:
+            if self._log:
+                self._log.close()
+                self._log = None
@@ -3,6 +3,7 @@ DoubOS - A Fully Fledged Operating System Simulator
 Main Kernel and Shell
 """
 
+import getpass
 import os
 import sys
 import json
@@ -11,6 +12,9 @@ import platform
 from datetime import datetime
 from typing import Dict, List, Optional, Callable
 
+from session import Session
+from processes import ProcessTable
+
 
 class DoubOSKernel:
     """Main kernel for DoubOS"""
@@ -18,20 +22,23 @@ class DoubOSKernel:
     def __init__(self):
         self.version = "1.0.0"
         self.running = False
-        self.current_user = None
         self.boot_time = None
-        self.command_history = []
+        # Defaults every new session's environment starts from
         self.environment_vars = {
             "OS_NAME": "DoubOS",
             "OS_VERSION": "1.0.0",
             "PATH": "/bin:/usr/bin:/sbin",
             "HOME": "/home"
         }
+        # Background commands of every session
+        self.processes = ProcessTable()
         
-    def boot(self):
+    def boot(self, verbose: bool = True):
         """Boot the operating system"""
         self.boot_time = datetime.now()
         self.running = True
+        if not verbose:
+            return True
         print(f"""
 ╔══════════════════════════════════════════════════════════╗
 ║                    DoubOS v{self.version}                    ║
@@ -71,33 +78,36 @@ System ready!
         return f"{hours}h {minutes}m {seconds}s"
         
     def get_env(self, var: str) -> Optional[str]:
-        """Get environment variable"""
+        """Get default environment variable"""
         return self.environment_vars.get(var)
         
     def set_env(self, var: str, value: str):
-        """Set environment variable"""
+        """Set default environment variable (for sessions started later)"""
         self.environment_vars[var] = value
-        
-    def add_to_history(self, command: str):
-        """Add command to history"""
-        self.command_history.append({
-            "command": command,
-            "timestamp": datetime.now(),
-            "user": self.current_user
-        })
 
 
 class DoubOSShell:
     """Command-line shell for DoubOS"""
     
-    def __init__(self, kernel: DoubOSKernel):
+    def __init__(self, kernel: DoubOSKernel, session: Optional[Session] = None):
         self.kernel = kernel
+        self.session = session or Session(environment=kernel.environment_vars)
         self.prompt_symbol = "$"
-        self.current_dir = "/"
+        # Tab completion (a completion.Completer), set by whoever owns the processor
+        self.completer = None
+        self._completions = []
+        
+    @property
+    def current_dir(self) -> str:
+        return self.session.cwd
+        
+    @current_dir.setter
+    def current_dir(self, path: str):
+        self.session.cwd = path
         
     def get_prompt(self) -> str:
         """Generate command prompt"""
-        user = self.kernel.current_user or "guest"
+        user = self.session.username or "guest"
         color_user = "\033[92m"  # Green
         color_dir = "\033[94m"   # Blue
         color_reset = "\033[0m"
@@ -105,11 +115,16 @@ class DoubOSShell:
         
     def run(self):
         """Main shell loop"""
-        while self.kernel.running:
+        self._load_readline_history()
+        self._install_completer()
+        self.session.ask_password = getpass.getpass
+        while self.kernel.running and self.session.running:
             try:
+                for notice in self.session.job_notices():
+                    print(notice)
                 command = input(self.get_prompt()).strip()
                 if command:
-                    self.kernel.add_to_history(command)
+                    self.session.add_to_history(command)
                     yield command
             except KeyboardInterrupt:
                 print("\n^C")
@@ -118,6 +133,41 @@ class DoubOSShell:
                 print()
                 break
                 
+    def _load_readline_history(self):
+        """Give readline (when available) the session's history, for arrow keys and Ctrl-R"""
+        try:
+            import readline
+        except ImportError:
+            return
+        readline.clear_history()
+        for _, line in self.session.history.entries():
+            readline.add_history(line)
+            
+    def _install_completer(self):
+        """Bind Tab to the completer (when there is one and readline is available)"""
+        if self.completer is None:
+            return
+        try:
+            import readline
+        except ImportError:
+            return
+        from completion import DELIMITERS
+        
+        readline.set_completer_delims(DELIMITERS)
+        readline.set_completer(self._readline_complete)
+        if "libedit" in (readline.__doc__ or ""):
+            readline.parse_and_bind("bind ^I rl_complete")
+        else:
+            readline.parse_and_bind("tab: complete")
+            
+    def _readline_complete(self, text: str, state: int) -> Optional[str]:
+        """readline completer: the state-th candidate for the word being typed"""
+        if state == 0:
+            import readline
+            line = readline.get_line_buffer()[:readline.get_endidx()]
+            self._completions = self.completer.complete(line)
+        return self._completions[state] if state < len(self._completions) else None
+            
     def change_directory(self, path: str):
         """Change current directory"""
-        self.current_dir = path
+        self.session.cwd = path
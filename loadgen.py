@@ -0,0 +1,165 @@
+"""
+DoubOS - Load Generator
+Opens many concurrent sessions against the shell server and reports latency
+
+Against a running server:  python loadgen.py --port 8023 [--sessions 500]
+Self-contained run:        python loadgen.py --local
+"""
+
+import argparse
+import asyncio
+import sys
+import time
+from typing import List, Optional
+
+from batch import percentile
+from server import DEFAULT_HOST, DEFAULT_PORT, END, ShellServer, decode_reply
+
+
+# Command mix each session runs; {n} is the session number
+COMMANDS = [
+    "mkdir -p /tmp/load/s{n}",
+    "cd /tmp/load/s{n}",
+    "echo session {n} says hello > note.txt",
+    "cat note.txt",
+    "ls",
+    "grep hello note.txt",
+    "cat note.txt | grep session | wc",
+    "pwd",
+    "whoami",
+    "find /tmp/load/s{n} -name note.txt",
+]
+
+
+class LoadReport:
+    """Latencies collected by a load run"""
+
+    def __init__(self, sessions: int):
+        self.sessions = sessions
+        self.elapsed = 0.0
+        # Seconds from connecting to a successful login, per session
+        self.logins: List[float] = []
+        # Seconds per command round trip, over all sessions
+        self.latencies: List[float] = []
+        self.errors: List[str] = []
+
+    @property
+    def throughput(self) -> float:
+        """Commands per second over the whole run"""
+        return len(self.latencies) / self.elapsed if self.elapsed else 0.0
+
+    @staticmethod
+    def _row(label: str, samples: List[float]) -> str:
+        ordered = sorted(samples)
+        ms = [1000 * percentile(ordered, p) for p in (0.5, 0.9, 0.99)]
+        return (f"  {label:8} {len(ordered):>8} {ms[0]:>9.2f} {ms[1]:>9.2f} {ms[2]:>9.2f} "
+                f"{1000 * (ordered[-1] if ordered else 0):>9.2f}")
+
+    def format(self) -> str:
+        """Human-readable summary"""
+        lines = [
+            f"Load: {self.sessions} sessions, {len(self.latencies)} commands in "
+            f"{self.elapsed:.3f} s ({self.throughput:,.1f} commands/s)",
+            f"  {'':8} {'COUNT':>8} {'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9} {'max ms':>9}",
+            self._row("login", self.logins),
+            self._row("command", self.latencies),
+        ]
+        if self.errors:
+            lines.append(f"  {len(self.errors)} session(s) failed, first: {self.errors[0]}")
+        return "\n".join(lines)
+
+
+async def _read_reply(reader: asyncio.StreamReader) -> str:
+    lines = []
+    while True:
+        line = await reader.readline()
+        if not line:
+            raise ConnectionError("server closed the connection")
+        line = line.decode("utf-8").rstrip("\n")
+        if line == END:
+            return decode_reply(lines)
+        lines.append(line)
+
+
+async def _session(number: int, report: LoadReport, commands: List[str], user: str,
+                   password: str, host: str, port: int, path: Optional[str]):
+    clock = time.perf_counter
+    started = clock()
+    if path is not None:
+        reader, writer = await asyncio.open_unix_connection(path)
+    else:
+        reader, writer = await asyncio.open_connection(host, port)
+    try:
+        await _read_reply(reader)
+        writer.write(f"login {user} {password}\n".encode())
+        reply = await _read_reply(reader)
+        if not reply.startswith("✓"):
+            raise RuntimeError(reply)
+        report.logins.append(clock() - started)
+        for template in commands:
+            before = clock()
+            writer.write((template.format(n=number) + "\n").encode())
+            await _read_reply(reader)
+            report.latencies.append(clock() - before)
+        writer.write(b"exit\n")
+        await _read_reply(reader)
+    finally:
+        writer.close()
+
+
+async def run_load(sessions: int = 500, commands: Optional[List[str]] = None,
+                   user: str = "admin", password: str = "admin123",
+                   host: str = DEFAULT_HOST, port: int = DEFAULT_PORT,
+                   path: Optional[str] = None) -> LoadReport:
+    """Open sessions concurrent connections, each running commands once"""
+    report = LoadReport(sessions)
+    commands = COMMANDS if commands is None else commands
+    started = time.perf_counter()
+    results = await asyncio.gather(
+        *(_session(n, report, commands, user, password, host, port, path) for n in range(sessions)),
+        return_exceptions=True)
+    report.elapsed = time.perf_counter() - started
+    report.errors = [repr(result) for result in results if isinstance(result, BaseException)]
+    return report
+
+
+async def run_local(sessions: int = 500, commands: Optional[List[str]] = None,
+                    workers: Optional[int] = None) -> LoadReport:
+    """Start a server on an ephemeral port in this process and load it"""
+    server = ShellServer(workers=workers)
+    await server.start(DEFAULT_HOST, 0)
+    try:
+        return await run_load(sessions, commands, port=server.address[1])
+    finally:
+        await server.close()
+
+
+def parse_args(argv=None):
+    """Command-line options"""
+    parser = argparse.ArgumentParser(description="DoubOS shell server load generator")
+    parser.add_argument("--sessions", type=int, default=500, help="concurrent sessions (default: 500)")
+    parser.add_argument("--host", default=DEFAULT_HOST, help=f"server address (default: {DEFAULT_HOST})")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help=f"server port (default: {DEFAULT_PORT})")
+    parser.add_argument("--unix", metavar="PATH", help="connect to a Unix socket instead of TCP")
+    parser.add_argument("--user", default="admin", help="user every session logs in as (default: admin)")
+    parser.add_argument("--password", default="admin123", help="password for --user")
+    parser.add_argument("--local", action="store_true",
+                        help="start a server in this process instead of connecting to one")
+    return parser.parse_args(argv)
+
+
+def main():
+    """Command-line entry point"""
+    args = parse_args()
+    if args.local:
+        report = asyncio.run(run_local(args.sessions))
+    else:
+        report = asyncio.run(run_load(args.sessions, user=args.user, password=args.password,
+                                      host=args.host, port=args.port, path=args.unix))
+    print(report.format())
+    return not report.errors
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
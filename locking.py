@@ -0,0 +1,198 @@
+"""
+DoubOS - Locking
+Hierarchical reader-writer locks for the virtual file system
+"""
+
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Tuple
+
+# Lock modes: intention-shared, intention-exclusive, shared, exclusive
+IS, IX, S, X = "IS", "IX", "S", "X"
+
+# Modes that may be held on the same path at the same time as each mode
+_COMPATIBLE = {
+    IS: {IS, IX, S},
+    IX: {IS, IX},
+    S: {IS, S},
+    X: set(),
+}
+
+# Modes whose holder already has everything each mode grants
+_COVERS = {
+    IS: {IS, IX, S, X},
+    IX: {IX, X},
+    S: {S, X},
+    X: {X},
+}
+
+
+def _join(a: str, b: str) -> str:
+    """Weakest mode granting both a and b (S together with IX needs X)"""
+    if a in _COVERS[b]:
+        return a
+    if b in _COVERS[a]:
+        return b
+    return X
+
+
+def _depth(path: str) -> int:
+    return 0 if path == "/" else path.count("/")
+
+
+def _ancestors(path: str) -> List[str]:
+    """Proper ancestors of a normalized path, root first"""
+    if path == "/":
+        return []
+    parts = path.split("/")[1:-1]
+    return ["/"] + ["/" + "/".join(parts[:i]) for i in range(1, len(parts) + 1)]
+
+
+class _Request:
+    """A queued lock request (compared by identity)"""
+
+    __slots__ = ("mode",)
+
+    def __init__(self, mode: str):
+        self.mode = mode
+
+
+class _Entry:
+    """Lock state of one path"""
+
+    __slots__ = ("granted", "waiting")
+
+    def __init__(self):
+        self.granted = {IS: 0, IX: 0, S: 0, X: 0}
+        # Queued requests, oldest first
+        self.waiting: List[_Request] = []
+
+
+class LockManager:
+    """Multi-granularity reader-writer locks keyed by normalized path
+
+    To read or modify something, an operation locks the directory it
+    touches in S (read) or X (write) and every ancestor of it in the
+    matching intention mode (IS or IX). A lock on a directory therefore
+    covers its whole subtree: S on /home keeps everything below it stable
+    while readers anywhere proceed, and X on / excludes everyone.
+
+    All locks an operation needs are requested together and taken in
+    (depth, path) order, so operations cannot deadlock. Waiting requests
+    are served in arrival order, so writers are not starved by a stream
+    of readers. Locks belong to the calling thread's current scope and
+    are only released when the outermost scope ends (two-phase locking),
+    which is what keeps multi-operation transactions atomic.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._entries: Dict[str, _Entry] = {}
+        self._local = threading.local()
+
+    @staticmethod
+    def plan(reads: Iterable[str] = (), writes: Iterable[str] = (),
+             lists: Iterable[str] = ()) -> Dict[str, str]:
+        """Lock modes needed to read the subtrees at reads, modify the
+        directories at writes and read just the entries of those at lists
+
+        Listing only conflicts with changes to the directory's own
+        entries, not with writers further down.
+        """
+        plan: Dict[str, str] = {}
+        for paths, mode, intent in ((reads, S, IS), (writes, X, IX), (lists, IS, IS)):
+            for path in paths:
+                for ancestor in _ancestors(path):
+                    plan[ancestor] = _join(plan[ancestor], intent) if ancestor in plan else intent
+                plan[path] = _join(plan[path], mode) if path in plan else mode
+        return plan
+
+    @contextmanager
+    def scope(self):
+        """Hold every lock acquired inside until the outermost scope exits"""
+        local = self._local
+        if getattr(local, "held", None) is not None:
+            yield
+            return
+        local.held = {}
+        try:
+            yield
+        finally:
+            held, local.held = local.held, None
+            self._release(held.items())
+
+    def holds(self, path: str, mode: str) -> bool:
+        """Whether the current thread already has mode on path"""
+        held = getattr(self._local, "held", None)
+        return bool(held) and self._covered(held, path, mode)
+
+    @staticmethod
+    def _covered(held: Dict[str, str], path: str, mode: str) -> bool:
+        if held.get(path) in _COVERS[mode]:
+            return True
+        for other, other_mode in held.items():
+            if other_mode in (S, X) and (other == "/" or path.startswith(other + "/")):
+                if other_mode == X or mode in (S, IS):
+                    return True
+        return False
+
+    def acquire(self, plan: Dict[str, str]) -> List[Tuple[str, str]]:
+        """Take the locks in plan within the current scope; return the ones newly taken"""
+        held = getattr(self._local, "held", None)
+        if held is None:
+            raise RuntimeError("locks must be acquired inside a scope")
+        needed = []
+        for path, mode in sorted(plan.items(), key=lambda item: (_depth(item[0]), item[0])):
+            if self._covered(held, path, mode):
+                continue
+            if path in held:
+                raise RuntimeError(f"cannot upgrade the {held[path]} lock on {path} to {mode}")
+            needed.append((path, mode))
+
+        with self._cond:
+            for path, mode in needed:
+                entry = self._entries.get(path)
+                if entry is None:
+                    entry = self._entries[path] = _Entry()
+                request = _Request(mode)
+                entry.waiting.append(request)
+                while not self._grantable(entry, request):
+                    self._cond.wait()
+                entry.waiting.remove(request)
+                entry.granted[mode] += 1
+                held[path] = mode
+                # Requests queued behind this one may now be grantable
+                self._cond.notify_all()
+        return needed
+
+    def release(self, taken: List[Tuple[str, str]]):
+        """Give back locks returned by acquire before the scope ends
+
+        Only safe while nothing has been modified under them yet.
+        """
+        held = self._local.held
+        for path, _ in taken:
+            del held[path]
+        self._release(taken)
+
+    @staticmethod
+    def _grantable(entry: _Entry, request: _Request) -> bool:
+        compatible = _COMPATIBLE[request.mode]
+        for mode, count in entry.granted.items():
+            if count and mode not in compatible:
+                return False
+        for other in entry.waiting:
+            if other is request:
+                return True
+            if other.mode not in compatible:
+                return False
+        return True
+
+    def _release(self, taken: Iterable[Tuple[str, str]]):
+        with self._cond:
+            for path, mode in taken:
+                entry = self._entries[path]
+                entry.granted[mode] -= 1
+                if not entry.waiting and not any(entry.granted.values()):
+                    del self._entries[path]
+            self._cond.notify_all()
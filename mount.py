@@ -0,0 +1,295 @@
+"""
+DoubOS - Host Mounts
+Read-only views of host directories inside the virtual file system
+"""
+
+import codecs
+import mmap
+import os
+import stat
+import threading
+import time
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+from filesystem import BlobStore, FileNode
+
+try:
+    import pwd
+except ImportError:  # Windows
+    pwd = None
+
+
+# Serializes directory rescans
+_scan_lock = threading.Lock()
+
+
+@lru_cache(maxsize=None)
+def _owner_name(uid: int) -> str:
+    """User name for a host uid (the number itself if unknown)"""
+    if pwd is not None:
+        try:
+            return pwd.getpwuid(uid).pw_name
+        except KeyError:
+            pass
+    return str(uid)
+
+
+class HostNode(FileNode):
+    """A host file or directory seen through a mount
+
+    Metadata comes from os.stat and is trusted for STAT_TTL seconds. A
+    directory's listing is built with os.scandir and kept until the
+    directory's mtime changes; child nodes survive rescans, so their
+    inode numbers stay stable. File contents are never stored: every read
+    memory-maps the host file and decodes it CHUNK_SIZE bytes at a time.
+    """
+
+    __slots__ = ("host_path", "_checked", "_mtime_ns", "_listed", "_regular", "_ident")
+
+    is_host = True
+
+    # Seconds a stat result is trusted before the host is asked again
+    STAT_TTL = 1.0
+
+    # Bytes decoded per chunk when reading a file
+    CHUNK_SIZE = 1024 * 1024
+
+    def __init__(self, name: str, host_path: str, st: Optional[os.stat_result] = None):
+        super().__init__(name)
+        self.host_path = host_path
+        # mtime of the directory when its listing was built
+        self._listed = None
+        self._apply(st if st is not None else os.stat(host_path))
+
+    def _apply(self, st: os.stat_result):
+        """Take metadata from a stat result"""
+        self.is_directory = stat.S_ISDIR(st.st_mode)
+        self._regular = stat.S_ISREG(st.st_mode)
+        self._ident = (st.st_dev, st.st_ino)
+        self._mode = st.st_mode & 0o777
+        self.owner = _owner_name(st.st_uid)
+        self._ctime = st.st_ctime
+        self._mtime = st.st_mtime
+        self._mtime_ns = st.st_mtime_ns
+        self.size = st.st_size if self._regular else 0
+        self._checked = time.monotonic()
+
+    def refresh(self) -> 'HostNode':
+        """Re-stat the host entry once its cached metadata has expired"""
+        if time.monotonic() - self._checked >= self.STAT_TTL:
+            try:
+                self._apply(os.stat(self.host_path))
+            except OSError:
+                # Gone from the host; the parent drops it on its next rescan
+                pass
+        return self
+
+    @property
+    def children(self) -> Optional[Dict[str, 'HostNode']]:
+        """Child nodes by name, rescanned when the directory's mtime changes"""
+        if not self.is_directory:
+            return None
+        self.refresh()
+        children = self._children
+        if children is None or self._listed != self._mtime_ns:
+            with _scan_lock:
+                if self._children is None or self._listed != self._mtime_ns:
+                    listed = self._mtime_ns
+                    self._children = self._scan(self._children or {})
+                    self._listed = listed
+                children = self._children
+        return children
+
+    def _scan(self, previous: Dict[str, 'HostNode']) -> Dict[str, 'HostNode']:
+        """Fresh listing of the host directory, reusing previous child nodes"""
+        children = {}
+        try:
+            with os.scandir(self.host_path) as entries:
+                for entry in entries:
+                    try:
+                        st = entry.stat()
+                    except OSError:
+                        continue  # dangling symlink, or removed meanwhile
+                    child = previous.get(entry.name)
+                    if child is None:
+                        child = HostNode(entry.name, entry.path, st)
+                    else:
+                        child._apply(st)
+                    children[entry.name] = child
+        except OSError:
+            pass  # unreadable: list as empty
+        return children
+
+    def version(self, gen: int) -> 'HostNode':
+        # Host nodes are never path-copied
+        return self
+
+    # ============= CONTENT =============
+
+    @contextmanager
+    def _map(self):
+        """The file's bytes as a read-only memory map (b"" if there is nothing to map)"""
+        self.refresh()
+        if not self._regular or not self.size:
+            yield b""
+            return
+        with open(self.host_path, 'rb') as f:
+            try:
+                data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                # Truncated to zero since the last stat
+                data = None
+            if data is None:
+                yield b""
+                return
+            with data:
+                yield data
+
+    @property
+    def content(self) -> str:
+        return "".join(self.iter_chunks())
+
+    def iter_chunks(self, start: int = 0) -> Iterator[str]:
+        """Yield the file as text from character start on, decoding CHUNK_SIZE bytes of the map at a time"""
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        with self._map() as data:
+            step = self.CHUNK_SIZE
+            for offset in range(0, len(data), step):
+                text = decoder.decode(data[offset:offset + step])
+                if start >= len(text):
+                    start -= len(text)
+                    continue
+                yield text[start:] if start else text
+                start = 0
+        tail = decoder.decode(b"", final=True)
+        if len(tail) > start:
+            yield tail[start:]
+
+    def iter_chunks_reversed(self) -> Iterator[str]:
+        """Yield the file as text, last CHUNK_SIZE bytes first
+
+        Slices start on a UTF-8 lead byte so that each decodes on its own.
+        """
+        with self._map() as data:
+            step = self.CHUNK_SIZE
+            end = len(data)
+            while end > 0:
+                start = max(end - step, 0)
+                for _ in range(3):
+                    if start == 0 or data[start] & 0xC0 != 0x80:
+                        break
+                    start -= 1
+                yield data[start:end].decode("utf-8", "replace")
+                end = start
+
+    def search(self, needle: str) -> List[str]:
+        """Lines containing needle, case-insensitively (as the content index matches)
+
+        ASCII needles are looked for in lowercased CHUNK_SIZE windows of the
+        memory map; only the matching lines are decoded into strings.
+        """
+        if not needle or not needle.isascii() or "\n" in needle:
+            needle = needle.lower()
+            return [line for line in self.iter_lines() if needle in line.lower()]
+        target = needle.lower().encode("ascii")
+        lines = []
+        with self._map() as data:
+            size = len(data)
+            step = self.CHUNK_SIZE
+            # Windows overlap so a match across their boundary is seen whole
+            overlap = len(target) - 1
+            pos = 0  # where the next matching line may start
+            for base in range(0, size, step):
+                window = data[base:base + step + overlap].lower()
+                found = window.find(target, max(pos - base, 0))
+                while found >= 0:
+                    start = data.rfind(b"\n", 0, base + found) + 1
+                    end = data.find(b"\n", base + found + len(target))
+                    if end < 0:
+                        end = size
+                    lines.append(data[start:end].decode("utf-8", "replace"))
+                    pos = end + 1
+                    found = window.find(target, pos - base)
+        return lines
+
+    # ============= TREE =============
+
+    def walk(self, path: str) -> Iterator[Tuple[str, 'HostNode']]:
+        """Yield (path, node) for everything below this directory
+
+        Each host directory is entered once, so symlink loops end.
+        """
+        seen: Set[Tuple[int, int]] = {self._ident}
+        stack = [(path, self)]
+        while stack:
+            path, node = stack.pop()
+            base = path.rstrip("/")
+            for name, child in (node.children or {}).items():
+                child_path = base + "/" + name
+                yield child_path, child
+                if child.is_directory and child._ident not in seen:
+                    seen.add(child._ident)
+                    stack.append((child_path, child))
+
+    def materialize(self, name: str, store: BlobStore, chunk_size: int, gen: int = 0,
+                    seen: Optional[Set[Tuple[int, int]]] = None) -> FileNode:
+        """Ordinary copy of this subtree with its contents put into store
+
+        Used to copy out of a mount; put() takes the blob references.
+        """
+        node = FileNode(name, self.is_directory, self.owner)
+        node.gen = gen
+        node._mode = self._mode
+        node._ctime = self._ctime
+        node._mtime = self._mtime
+        if self.is_directory:
+            seen = seen if seen is not None else set()
+            seen.add(self._ident)
+            node.children = {}
+            for child_name, child in self.children.items():
+                if child.is_directory and child._ident in seen:
+                    continue
+                copy = child.materialize(child_name, store, chunk_size, gen, seen)
+                node.children[child_name] = copy
+                size, count = copy.totals()
+                node.tree_size += size
+                node.file_count += count
+            return node
+        chunks = []
+        pending = ""
+        for data in self.iter_chunks():
+            data = pending + data
+            whole = len(data) - len(data) % chunk_size
+            chunks.extend(store.put(data[i:i + chunk_size]) for i in range(0, whole, chunk_size))
+            pending = data[whole:]
+            node.size += whole
+        if pending:
+            chunks.append(store.put(pending))
+            node.size += len(pending)
+        node._chunks = chunks or None
+        return node
+
+
+class HostMount:
+    """A host directory attached at a VFS path"""
+
+    def __init__(self, host_path: str, path: str):
+        self.host_path = host_path
+        self.path = path
+        self.root = HostNode(path.rpartition("/")[2], host_path)
+
+    def resolve(self, rest: str) -> Optional[HostNode]:
+        """Node at rest ("" or "/a/b") below the mount point"""
+        node = self.root
+        for part in rest.split("/"):
+            if not part:
+                continue
+            children = node.children
+            if children is None:
+                return None
+            node = children.get(part)
+            if node is None:
+                return None
+        return node.refresh()
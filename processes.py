@@ -0,0 +1,266 @@
+"""
+DoubOS - Processes
+The kernel's process table: background jobs on a worker pool, with real
+wall time, CPU time and memory accounting
+"""
+
+import itertools
+import os
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterator, List, Optional
+
+
+def resident_memory() -> int:
+    """Resident size of the whole DoubOS process in bytes (0 if unknown)"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError, AttributeError):
+        pass
+    try:
+        import resource
+    except ImportError:
+        return 0
+    # Peak rather than current size: kilobytes on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _thread_clock(ident: int) -> Optional[int]:
+    """CPU-time clock of another thread, where the platform has one"""
+    try:
+        return time.pthread_getcpuclockid(ident)
+    except (AttributeError, OSError):
+        return None
+
+
+class Process:
+    """One command running under the kernel
+
+    The command's output lines are kept (the newest MAX_OUTPUT of them) for
+    fg to show. Stopping, resuming and killing take effect between output
+    lines; a command waiting on the file system (tail -f) or sleeping is
+    woken by a kill through its session's hang_up().
+    """
+
+    # Output lines kept per process
+    MAX_OUTPUT = 10000
+
+    WAITING = "waiting"     # queued for a worker
+    RUNNING = "running"
+    STOPPED = "stopped"
+    DONE = "done"
+    KILLED = "killed"
+
+    def __init__(self, pid: int, command: str, user: str = "root", session=None):
+        self.pid = pid
+        self.command = command
+        self.user = user
+        self.session = session
+        self.state = self.WAITING
+        self.started_at = time.time()
+        self.output: deque = deque(maxlen=self.MAX_OUTPUT)
+        # Lines dropped from the front of output
+        self.dropped = 0
+        self._changed = threading.Condition()
+        self._resume = threading.Event()
+        self._resume.set()
+        self._killed = False
+        self._began: Optional[float] = None
+        self._ended: Optional[float] = None
+        self._cpu_start = 0.0
+        self._cpu = 0.0
+        self._clock: Optional[int] = None
+        self._memory_start = 0
+        self._memory = 0
+
+    @property
+    def finished(self) -> bool:
+        return self.state in (self.DONE, self.KILLED)
+
+    @property
+    def wall_time(self) -> float:
+        """Seconds since the command started running (until it finished)"""
+        if self._began is None:
+            return 0.0
+        return (self._ended or time.perf_counter()) - self._began
+
+    @property
+    def cpu_time(self) -> float:
+        """CPU seconds used by the command's thread (live while it runs, where supported)"""
+        clock = self._clock
+        if clock is not None and self.state in (self.RUNNING, self.STOPPED):
+            try:
+                return time.clock_gettime(clock) - self._cpu_start
+            except OSError:
+                pass
+        return self._cpu
+
+    @property
+    def memory(self) -> int:
+        """Change in resident memory while the command ran, in bytes
+
+        Measured for the whole DoubOS process, so it also counts whatever
+        ran alongside.
+        """
+        if self.state in (self.RUNNING, self.STOPPED):
+            return resident_memory() - self._memory_start
+        return self._memory
+
+    # ============= CONTROL =============
+
+    def stop(self) -> bool:
+        if self.finished:
+            return False
+        self._resume.clear()
+        self._set_state(self.STOPPED)
+        return True
+
+    def resume(self) -> bool:
+        if self.finished:
+            return False
+        self._resume.set()
+        if self.state == self.STOPPED:
+            self._set_state(self.RUNNING if self._began is not None else self.WAITING)
+        return True
+
+    def kill(self) -> bool:
+        if self.finished:
+            return False
+        self._killed = True
+        self._resume.set()
+        if self.session is not None:
+            self.session.hang_up()
+        return True
+
+    def close(self):
+        """Kill, so that Session.interrupt() ends a wait on this process (fg)"""
+        self.kill()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Wait for the command to finish; False on timeout"""
+        with self._changed:
+            return self._changed.wait_for(lambda: self.finished, timeout)
+
+    def follow(self) -> Iterator[str]:
+        """The output so far, then each new line until the command finishes"""
+        index = self.dropped
+        while True:
+            with self._changed:
+                self._changed.wait_for(lambda: self.dropped + len(self.output) > index or self.finished)
+                start = max(index, self.dropped)
+                lines = list(itertools.islice(self.output, start - self.dropped, None))
+                finished = self.finished
+            yield from lines
+            index = start + len(lines)
+            if finished and not lines:
+                return
+
+    # ============= RUNNING (worker thread) =============
+
+    def _set_state(self, state: str):
+        with self._changed:
+            self.state = state
+            self._changed.notify_all()
+
+    def _begin(self) -> bool:
+        # Stopped while it waited for a worker
+        self._resume.wait()
+        if self._killed:
+            self._finish()
+            return False
+        self._began = time.perf_counter()
+        # thread_time() reads the same clock other threads read through _clock
+        self._cpu_start = time.thread_time()
+        self._clock = _thread_clock(threading.get_ident())
+        self._memory_start = resident_memory()
+        self._set_state(self.RUNNING if self._resume.is_set() else self.STOPPED)
+        return True
+
+    def _emit(self, line: str) -> bool:
+        """Keep an output line; wait while stopped; False once killed"""
+        with self._changed:
+            if len(self.output) == self.output.maxlen:
+                self.dropped += 1
+            self.output.append(line)
+            self._changed.notify_all()
+        if not self._resume.is_set():
+            self._resume.wait()
+        return not self._killed
+
+    def _finish(self):
+        if self._began is not None:
+            self._ended = time.perf_counter()
+            self._cpu = time.thread_time() - self._cpu_start
+            self._clock = None
+            self._memory = resident_memory() - self._memory_start
+        self._set_state(self.KILLED if self._killed else self.DONE)
+
+
+class ProcessTable:
+    """Every command the kernel is running in the background
+
+    spawn() queues a command on a pool of WORKERS threads; while more are
+    running, the rest wait their turn. Finished processes leave the table
+    (their Process objects stay with whoever holds them, such as a shell's
+    job list).
+    """
+
+    # Threads running background commands
+    WORKERS = 8
+
+    def __init__(self, workers: Optional[int] = None):
+        self.workers = workers or self.WORKERS
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._pids = itertools.count(100)
+        self._processes: Dict[int, Process] = {}
+
+    def spawn(self, command: str, run: Callable[[str], Iterator[str]],
+              user: str = "root", session=None) -> Process:
+        """Run run(command), a generator of output lines, on a worker"""
+        with self._lock:
+            process = Process(next(self._pids), command, user, session)
+            self._processes[process.pid] = process
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.workers,
+                                                thread_name_prefix="doubos-job")
+        self._pool.submit(self._run, process, run)
+        return process
+
+    def _run(self, process: Process, run: Callable[[str], Iterator[str]]):
+        try:
+            if not process._begin():
+                return
+            lines = run(process.command)
+            try:
+                for line in lines:
+                    if not process._emit(line):
+                        break
+            except Exception as e:
+                process._emit(f"❌ Error executing {process.command}: {e}")
+            finally:
+                lines.close()
+            process._finish()
+        finally:
+            with self._lock:
+                self._processes.pop(process.pid, None)
+
+    def get(self, pid: int) -> Optional[Process]:
+        return self._processes.get(pid)
+
+    def list(self) -> List[Process]:
+        """Processes waiting, running or stopped, by pid"""
+        with self._lock:
+            return sorted(self._processes.values(), key=lambda process: process.pid)
+
+    def kill_all(self) -> int:
+        """Kill every process; return how many there were"""
+        processes = self.list()
+        for process in processes:
+            process.kill()
+        return len(processes)
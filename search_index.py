@@ -0,0 +1,365 @@
+"""
+DoubOS - Search Indexes
+Inverted indexes over the virtual file system used by grep and find
+"""
+
+import bisect
+from fnmatch import fnmatchcase
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+
+def iter_files(path: str, node) -> Iterator[Tuple[str, object]]:
+    """Yield (path, node) for every file in the subtree rooted at node"""
+    stack = [(path, node)]
+    while stack:
+        path, node = stack.pop()
+        if not node.is_directory:
+            yield path, node
+            continue
+        base = path.rstrip("/")
+        for name, child in node.children.items():
+            stack.append((base + "/" + name, child))
+
+
+def iter_nodes(path: str, node) -> Iterator[Tuple[str, object]]:
+    """Yield (path, node) for every node below node, excluding node itself"""
+    stack = [(path, node)]
+    while stack:
+        path, node = stack.pop()
+        if not node.is_directory:
+            continue
+        base = path.rstrip("/")
+        for name, child in node.children.items():
+            child_path = base + "/" + name
+            yield child_path, child
+            stack.append((child_path, child))
+
+
+def _trigrams(text: str) -> Set[str]:
+    """All three-character substrings of text"""
+    return set(map("".join, zip(text, text[1:], text[2:])))
+
+
+class _ContentGroup:
+    """Files with identical content, indexed and verified as one unit"""
+
+    __slots__ = ("key", "grams", "inodes", "tail")
+
+    def __init__(self, key: Optional[tuple]):
+        # Chunk digests the grams were built from; None once appended to
+        self.key = key
+        self.grams: Set[str] = set()
+        self.inodes: Set[int] = set()
+        # Last two lowercased characters, for trigrams spanning an append
+        self.tail = ""
+
+
+class ContentIndex:
+    """Trigram inverted index over file contents for recursive grep
+
+    Every trigram of a file's lowercased content maps to the groups of
+    files containing it. Files whose chunks have the same digests share a
+    group, so duplicated content is indexed and scanned only once. A search
+    intersects the postings of the needle's trigrams and only reads files
+    in the groups that survive.
+    """
+
+    def __init__(self, filesystem):
+        self.filesystem = filesystem
+        self.postings: Dict[str, Set[_ContentGroup]] = {}
+        self.groups_by_key: Dict[tuple, _ContentGroup] = {}
+        self.group_of: Dict[int, _ContentGroup] = {}
+        self.paths: Dict[int, str] = {}
+
+    # ============= MAINTENANCE =============
+
+    def add(self, path: str, node):
+        """Index a file whose content was created or replaced"""
+        self.discard(node.inode)
+        key = tuple(chunk.digest for chunk in node._chunks or ())
+        group = self.groups_by_key.get(key)
+        if group is None:
+            group = _ContentGroup(key)
+            tail = ""
+            for data in node.iter_chunks():
+                text = tail + data.lower()
+                group.grams |= _trigrams(text)
+                tail = text[-2:]
+            group.tail = tail
+            self._post(group, group.grams)
+            self.groups_by_key[key] = group
+        group.inodes.add(node.inode)
+        self.group_of[node.inode] = group
+        self.paths[node.inode] = path
+        self.filesystem.inodes[node.inode] = node
+
+    def append(self, path: str, node, data: str):
+        """Index data appended to the end of a file"""
+        group = self.group_of.get(node.inode)
+        if group is None:
+            self.add(path, node)
+            return
+        if len(group.inodes) > 1:
+            # Other files still hold the old content; split this one off
+            group.inodes.discard(node.inode)
+            own = _ContentGroup(None)
+            own.grams = set(group.grams)
+            own.tail = group.tail
+            own.inodes.add(node.inode)
+            self._post(own, own.grams)
+            self.group_of[node.inode] = group = own
+        elif group.key is not None:
+            # The content no longer matches the digests it was indexed under
+            del self.groups_by_key[group.key]
+            group.key = None
+        text = group.tail + data.lower()
+        new = _trigrams(text) - group.grams
+        group.grams |= new
+        self._post(group, new)
+        group.tail = text[-2:]
+
+    def discard(self, inode: int):
+        """Stop indexing a file"""
+        self.paths.pop(inode, None)
+        group = self.group_of.pop(inode, None)
+        if group is None:
+            return
+        group.inodes.discard(inode)
+        if group.inodes:
+            return
+        for gram in group.grams:
+            holders = self.postings[gram]
+            holders.discard(group)
+            if not holders:
+                del self.postings[gram]
+        if group.key is not None:
+            del self.groups_by_key[group.key]
+
+    def _post(self, group: _ContentGroup, grams: Set[str]):
+        for gram in grams:
+            holders = self.postings.get(gram)
+            if holders is None:
+                self.postings[gram] = {group}
+            else:
+                holders.add(group)
+
+    def add_tree(self, path: str, node):
+        """Index every file below a new subtree"""
+        for file_path, file_node in iter_files(path, node):
+            self.add(file_path, file_node)
+
+    def discard_tree(self, node):
+        """Stop indexing every file below a detached subtree"""
+        for _, file_node in iter_files("/", node):
+            self.discard(file_node.inode)
+
+    def rename_tree(self, path: str, node):
+        """Record the new paths of a moved subtree"""
+        for file_path, file_node in iter_files(path, node):
+            if file_node.inode in self.paths:
+                self.paths[file_node.inode] = file_path
+
+    # ============= QUERIES =============
+
+    def _groups(self, needle: str) -> Set[_ContentGroup]:
+        """Groups holding every trigram of the lowercased needle (all groups for short needles)"""
+        grams = _trigrams(needle)
+        if not grams:
+            return set(self.group_of.values())
+        postings = sorted((self.postings.get(gram, ()) for gram in grams), key=len)
+        return set(postings[0]).intersection(*postings[1:])
+
+    def _paths_below(self, group: _ContentGroup, path: str) -> List[str]:
+        prefix = path.rstrip("/") + "/"
+        return [self.paths[inode] for inode in group.inodes
+                if self.paths[inode].startswith(prefix) or self.paths[inode] == path]
+
+    def search(self, needle: str, path: str = "/") -> List[Tuple[str, List[str]]]:
+        """Return (path, matching lines) for files under path containing needle
+
+        Matching is case-insensitive, like grep -i. Needles shorter than
+        three characters cannot be narrowed and check every indexed file.
+        """
+        needle = needle.lower()
+        results = []
+        for group in self._groups(needle):
+            paths = self._paths_below(group, path)
+            if not paths:
+                continue
+            node = self.filesystem.get_node_by_inode(next(iter(group.inodes)))
+            lines = [line for line in node.iter_lines() if needle in line.lower()]
+            if lines:
+                results.extend((file_path, lines) for file_path in paths)
+        results.sort()
+        return results
+
+    def candidates(self, needle: str, path: str = "/") -> List[str]:
+        """Sorted paths of the files under path that may contain needle, in any case
+
+        Nothing is read: the files are those holding every trigram of the
+        needle, which a caller still has to scan.
+        """
+        paths = []
+        for group in self._groups(needle.lower()):
+            paths.extend(self._paths_below(group, path))
+        paths.sort()
+        return paths
+
+
+# Marks the start and end of a basename so that anchored glob literals
+# ("log*", "*.log") narrow by position as well as content
+_NAME_START = "\x02"
+_NAME_END = "\x03"
+
+
+def _bracket_end(pattern: str, i: int) -> int:
+    """Index just past the [...] set starting at pattern[i], or -1 (as fnmatch)"""
+    j = i + 1
+    if j < len(pattern) and pattern[j] == "!":
+        j += 1
+    if j < len(pattern) and pattern[j] == "]":
+        j += 1
+    end = pattern.find("]", j)
+    return end + 1 if end >= 0 else -1
+
+
+def _glob_literals(pattern: str) -> List[str]:
+    """Literal runs a name matching pattern must contain, with anchors"""
+    runs = []
+    run = _NAME_START
+    i = 0
+    while i < len(pattern):
+        c = pattern[i]
+        end = _bracket_end(pattern, i) if c == "[" else -1
+        if c in "*?" or end > 0:
+            runs.append(run)
+            run = ""
+            i = end if end > 0 else i + 1
+            continue
+        run += c
+        i += 1
+    runs.append(run + _NAME_END)
+    return runs
+
+
+class NameIndex:
+    """Index of every path in the tree for find
+
+    Paths are kept in one sorted list, so everything below a directory is
+    a contiguous range found by bisection. Basenames are indexed by their
+    trigrams (with start/end anchors), so a glob only checks the names
+    that contain its literal parts.
+    """
+
+    def __init__(self):
+        self.paths: List[str] = []
+        self.is_directory: Dict[str, bool] = {}
+        self.by_name: Dict[str, Set[str]] = {}
+        self.grams: Dict[str, Set[str]] = {}
+
+    # ============= MAINTENANCE =============
+
+    def add(self, path: str, is_directory: bool):
+        """Index a newly created file or directory"""
+        if path in self.is_directory:
+            return
+        bisect.insort(self.paths, path)
+        self._add_entry(path, is_directory)
+
+    def _add_entry(self, path: str, is_directory: bool):
+        self.is_directory[path] = is_directory
+        name = path.rpartition("/")[2]
+        holders = self.by_name.get(name)
+        if holders is None:
+            self.by_name[name] = {path}
+            for gram in _trigrams(_NAME_START + name + _NAME_END):
+                self.grams.setdefault(gram, set()).add(name)
+        else:
+            holders.add(path)
+
+    def _remove_entry(self, path: str):
+        del self.is_directory[path]
+        name = path.rpartition("/")[2]
+        holders = self.by_name[name]
+        holders.discard(path)
+        if holders:
+            return
+        del self.by_name[name]
+        for gram in _trigrams(_NAME_START + name + _NAME_END):
+            names = self.grams[gram]
+            names.discard(name)
+            if not names:
+                del self.grams[gram]
+
+    def _range(self, path: str) -> Tuple[int, int]:
+        """Slice of self.paths holding the descendants of path"""
+        if path == "/":
+            return 0, len(self.paths)
+        # "0" sorts right after "/", closing the range of path + "/..."
+        return (bisect.bisect_left(self.paths, path + "/"),
+                bisect.bisect_left(self.paths, path + "0"))
+
+    def add_tree(self, path: str, node):
+        """Index a new subtree (path itself and everything below it)"""
+        entries = sorted(iter_nodes(path, node), key=lambda entry: entry[0])
+        if path != "/":
+            self.add(path, node.is_directory)
+        lo, hi = self._range(path)
+        self.paths[lo:hi] = [child_path for child_path, _ in entries]
+        for child_path, child in entries:
+            self._add_entry(child_path, child.is_directory)
+
+    def remove_tree(self, path: str) -> List[Tuple[str, bool]]:
+        """Drop path and everything below it; return the removed entries"""
+        lo, hi = self._range(path)
+        removed = [(p, self.is_directory[p]) for p in self.paths[lo:hi]]
+        del self.paths[lo:hi]
+        if path in self.is_directory:
+            removed.insert(0, (path, self.is_directory[path]))
+            del self.paths[bisect.bisect_left(self.paths, path)]
+        for entry_path, _ in removed:
+            self._remove_entry(entry_path)
+        return removed
+
+    def move_tree(self, src: str, dst: str):
+        """Re-index a subtree moved from src to dst"""
+        removed = self.remove_tree(src)
+        if not removed:
+            return
+        self.add(dst, removed[0][1])
+        moved = [(dst + p[len(src):], is_dir) for p, is_dir in removed[1:]]
+        lo, hi = self._range(dst)
+        self.paths[lo:hi] = [p for p, _ in moved]
+        for p, is_dir in moved:
+            self._add_entry(p, is_dir)
+
+    # ============= QUERIES =============
+
+    def find(self, path: str = "/", pattern: Optional[str] = None,
+             file_type: Optional[str] = None) -> List[str]:
+        """Sorted paths below path whose basename matches the glob pattern
+
+        file_type "f" keeps only files and "d" only directories.
+        """
+        want_dir = {"f": False, "d": True}.get(file_type)
+        grams = set()
+        if pattern is not None:
+            for literal in _glob_literals(pattern):
+                grams |= _trigrams(literal)
+
+        if grams:
+            # Narrow by name first, then by location
+            postings = sorted((self.grams.get(gram, ()) for gram in grams), key=len)
+            names = set(postings[0]).intersection(*postings[1:])
+            prefix = "/" if path == "/" else path + "/"
+            candidates = sorted(p for name in names if fnmatchcase(name, pattern)
+                                for p in self.by_name[name] if p.startswith(prefix))
+        else:
+            lo, hi = self._range(path)
+            candidates = self.paths[lo:hi]
+            if pattern is not None:
+                candidates = [p for p in candidates if fnmatchcase(p.rpartition("/")[2], pattern)]
+
+        if want_dir is not None:
+            candidates = [p for p in candidates if self.is_directory[p] == want_dir]
+        return candidates
@@ -0,0 +1,255 @@
+"""
+DoubOS - Shell Server
+Serves many concurrent shell sessions over TCP or a Unix socket
+
+Start a server:   python server.py [--host HOST] [--port PORT] [--unix PATH]
+Connect with:     nc localhost 8023
+
+Protocol: UTF-8 lines in both directions. Every reply is a block of
+lines ended by a line holding a single "."; output lines that start with
+"." get a second one in front (as in SMTP and NNTP). A connection starts
+with a greeting reply, then "login USER PASSWORD"; after that each line is
+a command line. "exit", "logout" and "shutdown" end the session.
+"""
+
+import argparse
+import asyncio
+import contextlib
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Set
+
+from kernel import DoubOSKernel, DoubOSShell
+from filesystem import VirtualFileSystem
+from users import UserManager
+from session import Session
+from commands import CommandProcessor, CommandContext
+from dangerous_commands import register_dangerous_commands
+from utilities import register_utility_commands
+from fun_commands import register_fun_commands
+
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8023
+
+# Reply terminator line
+END = "."
+
+
+def encode_reply(text: Optional[str]) -> bytes:
+    """Frame command output as a reply block"""
+    lines = text.split("\n") if text else []
+    stuffed = ["." + line if line.startswith(".") else line for line in lines]
+    stuffed.append(END)
+    return ("\n".join(stuffed) + "\n").encode("utf-8")
+
+
+def decode_reply(lines) -> str:
+    """Inverse of encode_reply for the reply lines before the terminator"""
+    return "\n".join(line[1:] if line.startswith("..") else line for line in lines)
+
+
+# ============= SESSIONS =============
+
+class ShellSession:
+    """One connected client: its own session and processor over the shared system"""
+
+    def __init__(self, kernel: DoubOSKernel, filesystem: VirtualFileSystem,
+                 user_manager: UserManager, peer: str = ""):
+        self.peer = peer
+        self.kernel = kernel
+        self.session = Session(environment=kernel.environment_vars)
+        self.shell = DoubOSShell(kernel, self.session)
+        self.context = CommandContext(kernel, filesystem, user_manager, self.shell, self.session)
+        self.processor = CommandProcessor(self.context)
+        register_dangerous_commands(self.processor)
+        register_utility_commands(self.processor)
+        register_fun_commands(self.processor)
+        self.context.commands = self.processor.commands
+        # One client must not stop the server for everybody else
+        self.processor.aliases["shutdown"] = "exit"
+
+    @property
+    def running(self) -> bool:
+        return self.session.running and self.kernel.running
+
+    @property
+    def logged_in(self) -> bool:
+        return self.session.user is not None
+
+    def login(self, username: str, password: str) -> bool:
+        """Authenticate and start in the user's home directory"""
+        user = self.context.user_manager.authenticate(username, password)
+        if not user:
+            return False
+        self.session.switch_user(user)
+        self.session.open_history(self.context.filesystem)
+        return True
+
+    def end(self):
+        self.session.end()
+
+    def execute(self, command_line: str) -> Optional[str]:
+        """Run one command line (called on a worker thread), then report finished jobs"""
+        self.session.add_to_history(command_line)
+        reply = self.processor.execute(command_line)
+        notices = self.session.job_notices()
+        if notices:
+            reply = "\n".join(([reply] if reply else []) + notices)
+        return reply
+
+
+# ============= SERVER =============
+
+class ShellServer:
+    """asyncio server multiplexing shell sessions onto one kernel, VFS and UserManager
+
+    Each connection gets its own Session (user, directory, environment and
+    history). Connections are handled on the event loop; every command runs
+    on a worker thread, so a slow find or sleep in one session never holds up
+    the replies of others. A session runs its commands one at a time, in
+    the order they arrive.
+    """
+
+    # Worker threads shared by all sessions
+    WORKERS = 32
+
+    # Pending connections the listening socket queues
+    BACKLOG = 1024
+
+    # Failed logins before a connection is dropped
+    MAX_LOGIN_ATTEMPTS = 3
+
+    def __init__(self, kernel: Optional[DoubOSKernel] = None,
+                 filesystem: Optional[VirtualFileSystem] = None,
+                 user_manager: Optional[UserManager] = None,
+                 workers: Optional[int] = None):
+        self.kernel = kernel or DoubOSKernel()
+        self.filesystem = filesystem or VirtualFileSystem()
+        self.user_manager = user_manager or UserManager()
+        self.pool = ThreadPoolExecutor(max_workers=workers or self.WORKERS,
+                                       thread_name_prefix="doubos-session")
+        self.sessions: Set[ShellSession] = set()
+        self.server: Optional[asyncio.AbstractServer] = None
+        if not self.kernel.running:
+            self.kernel.boot(verbose=False)
+
+    async def start(self, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT,
+                    path: Optional[str] = None) -> asyncio.AbstractServer:
+        """Listen on host:port, or on the Unix socket path if given"""
+        if path is not None:
+            self.server = await asyncio.start_unix_server(self._handle, path=path,
+                                                          backlog=self.BACKLOG)
+        else:
+            self.server = await asyncio.start_server(self._handle, host, port,
+                                                     backlog=self.BACKLOG)
+        return self.server
+
+    @property
+    def address(self):
+        """Bound address of the first listening socket"""
+        return self.server.sockets[0].getsockname()
+
+    async def close(self):
+        """Stop listening and release the worker threads"""
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+        self.pool.shutdown(wait=False)
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        peer = writer.get_extra_info("peername")
+        session = ShellSession(self.kernel, self.filesystem, self.user_manager, str(peer or ""))
+        self.sessions.add(session)
+        loop = asyncio.get_running_loop()
+        try:
+            writer.write(encode_reply(f"DoubOS {self.kernel.version} shell server\n"
+                                      "Log in with: login USER PASSWORD"))
+            await writer.drain()
+            failures = 0
+            while session.running:
+                line = await reader.readline()
+                if not line:
+                    break
+                command_line = line.decode("utf-8", "replace").strip()
+                if not command_line:
+                    reply = None
+                elif not session.logged_in:
+                    reply = self._login(session, command_line)
+                    if not session.logged_in and reply.startswith("❌"):
+                        failures += 1
+                        if failures >= self.MAX_LOGIN_ATTEMPTS:
+                            session.end()
+                elif command_line == "logout":
+                    session.end()
+                    reply = None
+                else:
+                    reply = await loop.run_in_executor(self.pool, session.execute, command_line)
+                writer.write(encode_reply(reply))
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self.sessions.discard(session)
+            writer.close()
+            with contextlib.suppress(ConnectionError):
+                await writer.wait_closed()
+
+    @staticmethod
+    def _login(session: ShellSession, command_line: str) -> str:
+        words = command_line.split()
+        if words[0] in ("exit", "logout", "quit"):
+            session.end()
+            return "Goodbye!"
+        if words[0] != "login" or len(words) != 3:
+            return "⚠️  Not logged in. Usage: login USER PASSWORD"
+        if not session.login(words[1], words[2]):
+            return f"❌ Login failed for '{words[1]}'"
+        return f"✓ Welcome, {words[1]}! Current directory: {session.context.current_dir}"
+
+
+def parse_args(argv=None):
+    """Command-line options"""
+    parser = argparse.ArgumentParser(description="DoubOS multi-session shell server")
+    parser.add_argument("--host", default=DEFAULT_HOST, help=f"address to listen on (default: {DEFAULT_HOST})")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help=f"TCP port (default: {DEFAULT_PORT})")
+    parser.add_argument("--unix", metavar="PATH", help="listen on a Unix socket instead of TCP")
+    parser.add_argument("--workers", type=int, default=ShellServer.WORKERS,
+                        help=f"worker threads running commands (default: {ShellServer.WORKERS})")
+    parser.add_argument("--load", action="store_true", help="load the saved session first")
+    return parser.parse_args(argv)
+
+
+async def serve(args):
+    """Run the server until interrupted"""
+    from doubos import DoubOS
+
+    system = DoubOS()
+    if args.load:
+        system.load_state()
+    server = ShellServer(system.kernel, system.filesystem, system.user_manager, args.workers)
+    await server.start(args.host, args.port, args.unix)
+    where = args.unix or "%s:%d" % server.address[:2]
+    print(f"DoubOS shell server listening on {where} ({args.workers} workers)")
+    try:
+        await server.server.serve_forever()
+    finally:
+        await server.close()
+        if args.unix:
+            with contextlib.suppress(OSError):
+                os.unlink(args.unix)
+
+
+def main():
+    """Command-line entry point"""
+    try:
+        asyncio.run(serve(parse_args()))
+    except KeyboardInterrupt:
+        print("\nServer stopped")
+    return True
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,140 @@
+"""
+DoubOS - Sessions
+Per-login state: user, working directory, environment and history
+"""
+
+import threading
+from typing import Callable, Dict, List, Optional
+
+from history import HISTORY_FILE, CommandHistory
+
+
+class Session:
+    """One login's view of the system
+
+    Everything that belongs to a single user at a terminal lives here; the
+    kernel, file system and user manager underneath are shared by every
+    session and hold no per-login state. Give each terminal, batch run or
+    server connection its own session and they can run commands on
+    separate threads side by side.
+    """
+
+    def __init__(self, user=None, environment: Optional[Dict[str, str]] = None,
+                 cwd: Optional[str] = None):
+        self.user = None
+        self.cwd = "/"
+        # Copied, so changes stay within this session
+        self.environment: Dict[str, str] = dict(environment or {})
+        self.history = CommandHistory()
+        # Cleared by exit
+        self.running = True
+        # What commands are waiting on (tail -f watches, sleeps); see interrupt()
+        self.waits = set()
+        self._waits_lock = threading.Lock()
+        # Set by hang_up: every wait ends at once
+        self.hung_up = False
+        # Background jobs by job number (processes.Process)
+        self.jobs: Dict[int, object] = {}
+        # Reads a password without echoing it (su); set by front ends with a terminal
+        self.ask_password: Optional[Callable[[str], Optional[str]]] = None
+        if user is not None:
+            self.switch_user(user)
+        if cwd is not None:
+            self.cwd = cwd
+
+    @property
+    def username(self) -> Optional[str]:
+        return self.user.username if self.user else None
+
+    @property
+    def is_admin(self) -> bool:
+        return bool(self.user and self.user.is_admin)
+
+    def switch_user(self, user):
+        """Become user, starting in their home directory (login and su)"""
+        self.user = user
+        self.cwd = user.home_dir
+        self.environment["USER"] = user.username
+        self.environment["HOME"] = user.home_dir
+
+    def fork(self, history: bool = True) -> 'Session':
+        """A new session for the same user, directory and environment, with its own history
+
+        With history False the new session's history is not tied to the
+        user's history file (background jobs, which record none).
+        """
+        session = Session(environment=self.environment, cwd=self.cwd)
+        session.user = self.user
+        if history and self.history.path is not None:
+            session.history.attach(self.history.filesystem, self.history.path, self.history.owner)
+        return session
+
+    def open_history(self, filesystem):
+        """Load the user's history file and keep appending to it (interactive logins)"""
+        if self.user is not None:
+            path = self.user.home_dir.rstrip("/") + "/" + HISTORY_FILE
+            self.history.attach(filesystem, path, self.user.username)
+
+    def end(self):
+        """Mark the session finished (exit), writing out its history"""
+        self.running = False
+        self.history.flush()
+
+    def wait_on(self, wait):
+        """Register something a running command blocks on (anything with close()),
+        so interrupt() can end the wait"""
+        with self._waits_lock:
+            if not self.hung_up:
+                self.waits.add(wait)
+                return
+        wait.close()
+
+    def done_waiting(self, wait):
+        with self._waits_lock:
+            self.waits.discard(wait)
+
+    def interrupt(self):
+        """Stop the session's commands that are waiting for changes (Ctrl-C)"""
+        with self._waits_lock:
+            waits, self.waits = self.waits, set()
+        for wait in waits:
+            wait.close()
+
+    def hang_up(self):
+        """Interrupt, and end every later wait as soon as it starts
+
+        For the private session of a killed job, whose command may not
+        have reached its first wait yet.
+        """
+        with self._waits_lock:
+            self.hung_up = True
+        self.interrupt()
+
+    def add_job(self, process) -> int:
+        """Give a background process the next free job number"""
+        number = 1
+        while number in self.jobs:
+            number += 1
+        self.jobs[number] = process
+        return number
+
+    def job_notices(self) -> List[str]:
+        """Report (once) and forget the jobs that have finished"""
+        notices = []
+        for number, process in sorted(self.jobs.items()):
+            if process.finished:
+                del self.jobs[number]
+                notices.append(f"[{number}]  {process.state.capitalize():<10} {process.command}")
+        return notices
+
+    def get_env(self, var: str) -> Optional[str]:
+        """Get environment variable"""
+        return self.environment.get(var)
+
+    def set_env(self, var: str, value: str):
+        """Set environment variable"""
+        self.environment[var] = value
+
+    def add_to_history(self, command: str):
+        """Add command to history"""
+        self.history.add(command)
@@ -73,6 +73,923 @@ def test_filesystem():
         return False
 
 
+def test_path_cache():
+    """Test inode table and path cache invalidation"""
+    print("\nTesting path cache...")
+    try:
+        from filesystem import VirtualFileSystem
+        fs = VirtualFileSystem()
+        
+        fs.mkdir("/home/admin/a/b", recursive=True)
+        fs.write_file("/home/admin/a/b/notes.txt", "cached")
+        inode = fs.get_inode("/home/admin/a")
+        assert fs.get_node_by_inode(inode) is fs._get_node("/home/admin/a")
+        
+        # Move keeps the inode but invalidates the old paths
+        assert fs.move("/home/admin/a", "/tmp/a")
+        assert not fs.exists("/home/admin/a/b/notes.txt")
+        assert fs.read_file("/tmp/a/b/notes.txt") == "cached"
+        assert fs.get_inode("/tmp/a") == inode
+        
+        # Copy over a cached path gets fresh inodes
+        fs.mkdir("/home/admin/a")
+        assert fs.get_inode("/home/admin/a") is not None
+        assert fs.copy("/tmp/a", "/home/admin/a")
+        assert fs.read_file("/home/admin/a/b/notes.txt") == "cached"
+        assert fs.get_inode("/home/admin/a") not in (None, inode)
+        
+        # Remove and format drop cached entries
+        assert fs.remove("/tmp/a", recursive=True)
+        assert not fs.exists("/tmp/a/b")
+        fs.format()
+        assert not fs.exists("/home/admin/a")
+        
+        print("✓ Path cache works")
+        return True
+    except Exception as e:
+        print(f"✗ Path cache failed: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+
+def test_journal():
+    """Test journaled persistence and replay"""
+    print("\nTesting filesystem journal...")
+    try:
+        import os
+        import tempfile
+        from filesystem import VirtualFileSystem
+        
+        with tempfile.TemporaryDirectory() as tmp:
+            snapshot = os.path.join(tmp, "fs.json")
+            log = os.path.join(tmp, "fs.journal")
+            
+            fs = VirtualFileSystem()
+            fs.open_journal(snapshot, log)
+            fs.mkdir("/home/admin/docs")
+            fs.write_file("/home/admin/docs/a.txt", "one\n")
+            fs.write_file("/home/admin/docs/a.txt", "two\n", append=True)
+            fs.copy("/home/admin/docs", "/tmp/docs")
+            fs.chmod("/tmp/docs/a.txt", "rw-r--r--")
+            fs.move("/tmp/docs/a.txt", "/tmp/b.txt")
+            fs.save_to_disk(snapshot)
+            
+            # Simulate a crash: reopen without compacting
+            fs.journal.close(compact=False)
+            fs.journal = None
+            
+            restored = VirtualFileSystem()
+            assert restored.open_journal(snapshot, log) == 6
+            assert restored.read_file("/home/admin/docs/a.txt") == "one\ntwo\n"
+            assert restored.read_file("/tmp/b.txt") == "one\ntwo\n"
+            assert restored._get_node("/tmp/b.txt").permissions == "rw-r--r--"
+            
+            # After compaction the snapshot alone holds everything
+            restored.journal.compact()
+            restored.remove("/tmp/b.txt")
+            restored.close_journal()
+            again = VirtualFileSystem()
+            assert again.open_journal(snapshot, log) == 0
+            assert not again.exists("/tmp/b.txt")
+            assert again.exists("/tmp/docs")
+            again.close_journal()
+            
+            # A copy out of a host mount is logged as the files it made,
+            # since the mount is gone when the log is replayed
+            host = os.path.join(tmp, "host")
+            os.makedirs(os.path.join(host, "sub"))
+            with open(os.path.join(host, "sub", "a.txt"), "w") as f:
+                f.write("from the host\n")
+            fs = VirtualFileSystem()
+            fs.open_journal(snapshot, log)
+            fs.mkdir("/mnt/h", recursive=True)
+            assert fs.mount(host, "/mnt/h")
+            assert fs.copy("/mnt/h/sub/a.txt", "/home/a.txt")
+            assert fs.copy("/mnt/h", "/tmp/h")
+            fs.umount("/mnt/h")
+            fs.journal.close(compact=False)
+            fs.journal = None
+            restored = VirtualFileSystem()
+            restored.open_journal(snapshot, log)
+            assert restored.read_file("/home/a.txt") == "from the host\n"
+            assert restored.read_file("/tmp/h/sub/a.txt") == "from the host\n"
+            restored.close_journal()
+        
+        print("✓ Filesystem journal works")
+        return True
+    except Exception as e:
+        print(f"✗ Filesystem journal failed: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+
+def test_deferred_hydration():
+    """Test deferred hydration of a saved filesystem"""
+    print("\nTesting deferred hydration...")
+    try:
+        import os
+        import tempfile
+        from filesystem import VirtualFileSystem
+        
+        fs = VirtualFileSystem()
+        fs.mkdir("/home/admin/projects/doubos", recursive=True)
+        fs.write_file("/home/admin/projects/doubos/readme.txt", "lazy")
+        
+        with tempfile.TemporaryDirectory() as tmp:
+            image = os.path.join(tmp, "fs.json")
+            fs.save_to_disk(image)
+            
+            lazy = VirtualFileSystem()
+            lazy.load_from_disk(image, lazy=True)
+            assert not lazy.root.is_hydrated
+            
+            # Only the directories on the walked path are hydrated
+            assert lazy.read_file("/home/admin/projects/doubos/readme.txt") == "lazy"
+            assert lazy._get_node("/home").is_hydrated
+            assert not lazy._get_node("/etc").is_hydrated
+            
+            # Timestamps load as stored epoch seconds, no parsing needed
+            node = lazy._get_node("/home/admin/projects/doubos/readme.txt")
+            assert isinstance(node._mtime, float)
+            assert node.modified_at == fs._get_node("/home/admin/projects/doubos/readme.txt").modified_at
+            
+            # Unhydrated subtrees serialize back unchanged
+            assert lazy.root.to_dict() == fs.root.to_dict()
+        
+        print("✓ Deferred hydration works")
+        return True
+    except Exception as e:
+        print(f"✗ Deferred hydration failed: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+
+def test_blob_store():
+    """Test copy-on-write content sharing"""
+    print("\nTesting blob store...")
+    try:
+        import json
+        import os
+        import tempfile
+        from filesystem import VirtualFileSystem
+        
+        fs = VirtualFileSystem()
+        fs.mkdir("/home/admin/big")
+        for i in range(10):
+            fs.write_file(f"/home/admin/big/f{i}.txt", "x" * 1000)
+        logical, physical = fs.get_usage("/home/admin/big")
+        assert (logical, physical) == (10000, 1000)
+        
+        # Copies share blobs until they diverge
+        before = fs.get_size("/", physical=True)
+        fs.copy("/home/admin/big", "/tmp/big")
+        assert fs.get_size("/", physical=True) == before
+        assert fs.get_size("/tmp/big") == 10000
+        fs.write_file("/tmp/big/f0.txt", "changed")
+        assert fs.read_file("/home/admin/big/f0.txt") == "x" * 1000
+        assert fs.get_size("/", physical=True) == before + len("changed")
+        
+        # Removing every reference frees the blob
+        fs.remove("/home/admin/big", recursive=True)
+        fs.remove("/tmp/big", recursive=True)
+        assert fs.blobs.get(fs.blobs.hash("x" * 1000)) is None
+        
+        # Each unique blob is written once
+        fs.write_file("/tmp/a.txt", "shared")
+        fs.copy("/tmp/a.txt", "/tmp/b.txt")
+        with tempfile.TemporaryDirectory() as tmp:
+            image = os.path.join(tmp, "fs.json")
+            fs.save_to_disk(image)
+            with open(image) as f:
+                saved = json.load(f)
+            assert saved["blobs"][fs.blobs.hash("shared")][1] == 2
+            
+            loaded = VirtualFileSystem()
+            loaded.load_from_disk(image, lazy=True)
+            assert loaded.read_file("/tmp/b.txt") == "shared"
+            loaded.remove("/tmp/a.txt")
+            assert loaded.blobs.get(loaded.blobs.hash("shared")).refs == 1
+        
+        print("✓ Blob store works")
+        return True
+    except Exception as e:
+        print(f"✗ Blob store failed: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+
+def test_directory_totals():
+    """Test incrementally maintained directory sizes"""
+    print("\nTesting directory totals...")
+    try:
+        from filesystem import VirtualFileSystem
+        fs = VirtualFileSystem()
+        
+        def walk_totals(node):
+            if not node.is_directory:
+                return node.size, 1
+            size = count = 0
+            for child in node.children.values():
+                s, c = walk_totals(child)
+                size += s
+                count += c
+            return size, count
+            
+        fs.mkdir("/home/admin/logs/old", recursive=True)
+        fs.write_file("/home/admin/logs/a.log", "12345")
+        fs.write_file("/home/admin/logs/a.log", "678", append=True)
+        fs.write_file("/home/admin/logs/old/b.log", "x" * 100)
+        assert fs.get_size("/home/admin/logs") == 108
+        
+        fs.copy("/home/admin/logs", "/tmp/logs")
+        fs.move("/tmp/logs/old", "/var/old")
+        fs.copy("/etc/motd", "/var/old/b.log")
+        fs.remove("/home/admin/logs/a.log")
+        
+        for path in ("/", "/home", "/home/admin/logs", "/tmp/logs", "/var"):
+            node = fs._get_node(path)
+            assert (node.tree_size, node.file_count) == walk_totals(node), path
+        
+        from commands import DuCommand, CommandContext
+        context = CommandContext(None, fs, None, None)
+        output = DuCommand().execute(["-s", "/tmp/logs"], context)
+        assert output == "8\t/tmp/logs"
+        
+        print("✓ Directory totals work")
+        return True
+    except Exception as e:
+        print(f"✗ Directory totals failed: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+
+def test_chunked_content():
+    """Test chunked file content and append"""
+    print("\nTesting chunked content...")
+    try:
+        import os
+        import tempfile
+        from filesystem import VirtualFileSystem
+        
+        fs = VirtualFileSystem()
+        fs.CHUNK_SIZE = 16
+        expected = ""
+        for i in range(20):
+            line = f"entry {i} " + "w" * (i % 7) + "\n"
+            fs.write_file("/var/log/app.log", line, append=True)
+            expected += line
+        
+        node = fs._get_node("/var/log/app.log")
+        assert len(node._chunks) > 1
+        assert all(chunk.size <= 16 for chunk in node._chunks)
+        assert fs.read_file("/var/log/app.log") == expected
+        assert list(fs.read_lines("/var/log/app.log")) == expected.split("\n")
+        assert fs.get_size("/var/log/app.log") == len(expected)
+        
+        # Copies share chunks; saved images list them per file
+        fs.copy("/var/log/app.log", "/tmp/app.log")
+        with tempfile.TemporaryDirectory() as tmp:
+            image = os.path.join(tmp, "fs.json")
+            fs.save_to_disk(image)
+            loaded = VirtualFileSystem()
+            loaded.load_from_disk(image, lazy=True)
+            assert loaded.read_file("/tmp/app.log") == expected
+        
+        print("✓ Chunked content works")
+        return True
+    except Exception as e:
+        print(f"✗ Chunked content failed: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+
+def test_compact_nodes():
+    """Test slotted file nodes and their encoded attributes"""
+    print("\nTesting compact nodes...")
+    try:
+        import os
+        import tempfile
+        from datetime import datetime
+        from filesystem import FileNode, VirtualFileSystem
+        
+        node = FileNode("notes.txt", owner="admin", permissions="rw-r-----")
+        assert not hasattr(node, "__dict__")
+        assert node.mode == 0o640 and node.permissions == "rw-r-----"
+        node.mode = 0o755
+        assert node.permissions == "rwxr-xr-x"
+        try:
+            node.permissions = "rwz------"
+            assert False, "invalid permissions accepted"
+        except ValueError:
+            pass
+        
+        stamp = datetime(2024, 1, 2, 3, 4, 5)
+        node.modified_at = stamp
+        assert node.modified_at == stamp
+        
+        # Owners are interned so large trees share one string per user
+        other = FileNode("b", owner="".join(["ad", "min"]))
+        assert other.owner is node.owner
+        
+        fs = VirtualFileSystem()
+        fs.write_file("/tmp/a.txt", "data")
+        fs.chmod("/tmp/a.txt", "rw-------")
+        with tempfile.TemporaryDirectory() as tmp:
+            image = os.path.join(tmp, "fs.json")
+            fs.save_to_disk(image)
+            restored = VirtualFileSystem()
+            restored.load_from_disk(image)
+            restored_node = restored._get_node("/tmp/a.txt")
+            assert restored_node.mode == 0o600
+            assert restored_node.created_at == fs._get_node("/tmp/a.txt").created_at
+        
+        # Older images store ISO timestamps, parsed on first read
+        legacy = FileNode.from_dict({
+            "name": "old.txt", "is_directory": False, "owner": "root",
+            "permissions": "rw-r--r--", "created_at": stamp.isoformat(),
+            "modified_at": stamp.isoformat(), "size": 0,
+        }, lazy=True)
+        assert legacy.modified_at == stamp
+        
+        print("✓ Compact nodes work")
+        return True
+    except Exception as e:
+        print(f"✗ Compact nodes failed: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+
+def test_content_index():
+    """Test the full-text index behind grep -r"""
+    print("\nTesting content index...")
+    try:
+        from filesystem import VirtualFileSystem
+        from utilities import GrepCommand
+        from commands import CommandContext
+        
+        fs = VirtualFileSystem()
+        fs.write_file("/home/admin/a.txt", "alpha\nKernel panic at boot\n")
+        fs.write_file("/home/admin/b.txt", "nothing here\n")
+        fs.copy("/home/admin/a.txt", "/home/guest/a.txt")
+        
+        found = fs.search_content("kernel panic", "/home")
+        assert [path for path, _ in found] == ["/home/admin/a.txt", "/home/guest/a.txt"]
+        assert found[0][1] == ["Kernel panic at boot"]
+        assert fs.search_content("kernel", "/home/guest") == [("/home/guest/a.txt", ["Kernel panic at boot"])]
+        
+        # Identical files share one index entry until one of them changes
+        index = fs.content_index
+        assert index.group_of[fs.get_inode("/home/admin/a.txt")] is index.group_of[fs.get_inode("/home/guest/a.txt")]
+        fs.write_file("/home/guest/a.txt", "late oops\n", append=True)
+        assert [p for p, _ in fs.search_content("oops")] == ["/home/guest/a.txt"]
+        assert [p for p, _ in fs.search_content("kernel panic")] == ["/home/admin/a.txt", "/home/guest/a.txt"]
+        
+        # Appends that straddle the previous end still match
+        fs.write_file("/home/admin/b.txt", "seg", append=True)
+        fs.write_file("/home/admin/b.txt", "fault", append=True)
+        assert [p for p, _ in fs.search_content("segfault")] == ["/home/admin/b.txt"]
+        
+        fs.move("/home/admin", "/home/root")
+        assert [p for p, _ in fs.search_content("kernel")] == ["/home/guest/a.txt", "/home/root/a.txt"]
+        fs.remove("/home/root", recursive=True)
+        assert [p for p, _ in fs.search_content("kernel")] == ["/home/guest/a.txt"]
+        assert fs.search_content("xyz", "/missing") is None
+        
+        context = CommandContext(None, fs, None, None)
+        context.current_dir = "/home"
+        output = GrepCommand().execute(["-r", "oops", "/home"], context)
+        assert "/home/guest/a.txt" in output and "oops" in output
+        assert "Is a directory" in GrepCommand().execute(["oops", "/home"], context)
+        
+        print("✓ Content index works")
+        return True
+    except Exception as e:
+        print(f"✗ Content index failed: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+
+def test_name_index():
+    """Test the path index behind find"""
+    print("\nTesting name index...")
+    try:
+        from filesystem import VirtualFileSystem
+        from utilities import FindCommand
+        from commands import CommandContext
+        
+        fs = VirtualFileSystem()
+        fs.write_file("/var/log/app.log", "a")
+        fs.mkdir("/var/log/archive/2024", recursive=True)
+        fs.write_file("/var/log/archive/2024/old.log", "b")
+        fs.write_file("/var/log-notes.txt", "c")
+        
+        assert fs.find("/var", "*.log") == ["/var/log/app.log", "/var/log/archive/2024/old.log", "/var/log/system.log"]
+        assert fs.find("/var/log", "log*") == []
+        assert fs.find("/var", "log*") == ["/var/log", "/var/log-notes.txt"]
+        assert fs.find("/var", "[0-9]*", "d") == ["/var/log/archive/2024"]
+        assert fs.find("/var/log", file_type="d") == ["/var/log/archive", "/var/log/archive/2024"]
+        assert fs.find("/var", "?pp.log") == ["/var/log/app.log"]
+        
+        # The index follows later mutations
+        fs.write_file("/tmp/new.log", "d")
+        fs.mkdir("/tmp/a/b", recursive=True)
+        fs.move("/var/log/archive", "/tmp/a/b/archive")
+        fs.copy("/tmp/a", "/home/a")
+        fs.remove("/var/log/app.log")
+        assert fs.find("/", "*.log") == ["/home/a/b/archive/2024/old.log", "/tmp/a/b/archive/2024/old.log",
+                                         "/tmp/new.log", "/var/log/system.log"]
+        assert fs.find("/tmp", file_type="d") == ["/tmp/a", "/tmp/a/b", "/tmp/a/b/archive", "/tmp/a/b/archive/2024"]
+        fs.remove("/tmp/a", recursive=True)
+        assert fs.find("/tmp") == ["/tmp/new.log"]
+        assert fs.find("/missing") is None
+        
+        context = CommandContext(None, fs, None, None)
+        context.current_dir = "/tmp"
+        assert FindCommand().execute(["-name", "*.log", "-type", "f"], context) == "/tmp/new.log"
+        assert "unknown" in FindCommand().execute(["/", "-type", "x"], context)
+        
+        print("✓ Name index works")
+        return True
+    except Exception as e:
+        print(f"✗ Name index failed: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+
+def test_snapshots():
+    """Test copy-on-write snapshots"""
+    print("\nTesting snapshots...")
+    try:
+        from filesystem import VirtualFileSystem
+        
+        fs = VirtualFileSystem()
+        fs.write_file("/home/admin/notes.txt", "v1")
+        fs.mkdir("/home/admin/deep/er", recursive=True)
+        fs.write_file("/home/admin/deep/er/leaf.txt", "leaf")
+        usage = fs.get_usage("/")
+        name = fs.create_snapshot()
+        assert name == "snap1" and fs.create_snapshot("snap1") is None
+        snap_root = fs.snapshots["snap1"].root
+        
+        # Later changes copy only the touched path
+        etc = fs._get_node("/etc")
+        fs.write_file("/home/admin/notes.txt", "v2", append=True)
+        fs.chmod("/home/admin/deep/er/leaf.txt", "rw-------")
+        fs.move("/home/admin/deep", "/tmp/deep")
+        fs.remove("/var/log", recursive=True)
+        assert fs.root is not snap_root
+        assert fs._get_node("/etc") is etc
+        assert fs.read_file("/home/admin/notes.txt") == "v1v2"
+        assert fs._get_node("/tmp/deep/er/leaf.txt").permissions == "rw-------"
+        assert snap_root.children["home"].children["admin"].children["notes.txt"].content == "v1"
+        
+        # Automatic snapshot before formatting, then restore
+        assert fs.create_snapshot(note="before format") == "snap2"
+        fs.format()
+        assert fs.restore_snapshot("snap1")
+        assert fs.read_file("/home/admin/notes.txt") == "v1"
+        assert fs._get_node("/home/admin/deep/er/leaf.txt").permissions == "rwxr-xr-x"
+        assert fs.exists("/var/log/system.log") and not fs.exists("/tmp/deep")
+        # Physical usage also counts blobs still held by snap2
+        assert fs.get_usage("/")[0] == usage[0] and fs.get_usage("/")[1] > usage[1]
+        
+        # The restored snapshot stays intact under further changes
+        fs.write_file("/home/admin/notes.txt", "v3")
+        assert fs.restore_snapshot("snap1")
+        assert fs.read_file("/home/admin/notes.txt") == "v1"
+        assert fs.restore_snapshot("snap2")
+        assert fs.read_file("/home/admin/notes.txt") == "v1v2"
+        assert not fs.restore_snapshot("missing")
+        
+        # Deleting snapshots gives back the blobs only they held, and
+        # nodes shared with the live tree become its own again
+        fs.write_file("/tmp/big.txt", "only in snapshots")
+        fs.create_snapshot("before-rm")
+        fs.remove("/tmp/big.txt")
+        assert not fs.delete_snapshot("missing")
+        for name in ("snap1", "snap2", "before-rm"):
+            assert fs.delete_snapshot(name)
+        assert fs.snapshots == {}
+        _check_consistency(fs)
+        assert fs.blobs.get(fs.blobs.hash("only in snapshots")) is None
+        fs.remove("/home/admin/notes.txt")
+        _check_consistency(fs)
+        
+        print("✓ Snapshots work")
+        return True
+    except Exception as e:
+        print(f"✗ Snapshots failed: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+
+def _check_consistency(fs):
+    """Assert totals, blob refcounts and the name index all match the tree"""
+    from collections import Counter
+    from search_index import NameIndex, iter_nodes
+    
+    def totals(node):
+        if not node.is_directory:
+            return node.size, 1
+        size = count = 0
+        for child in node.children.values():
+            child_size, child_count = totals(child)
+            size += child_size
+            count += child_count
+        assert (node.tree_size, node.file_count) == (size, count), node.name
+        return size, count
+    totals(fs.root)
+    
+    refs = Counter(ref if isinstance(ref, str) else ref.digest for ref in fs.root.iter_blob_refs())
+    assert refs == Counter({digest: blob.refs for digest, blob in fs.blobs._blobs.items()})
+    
+    if fs.name_index is not None:
+        expected = NameIndex()
+        expected.add_tree("/", fs.root)
+        assert fs.name_index.paths == expected.paths
+        assert fs.name_index.is_directory == expected.is_directory
+
+
+def test_concurrency():
+    """Test thread-safe operations and transactions"""
+    print("\nTesting concurrency...")
+    try:
+        import random
+        import threading
+        import time
+        from filesystem import VirtualFileSystem
+        
+        fs = VirtualFileSystem()
+        fs.find("/", "*")
+        fs.search_content("x")
+        dirs = ["/tmp/a", "/tmp/b", "/tmp/a/c", "/home/admin/w"]
+        errors = []
+        deadline = time.time() + 1.0
+        
+        def worker(seed):
+            rng = random.Random(seed)
+            try:
+                while time.time() < deadline:
+                    d = rng.choice(dirs)
+                    path = f"{d}/f{rng.randrange(8)}"
+                    op = rng.randrange(9)
+                    if op == 0:
+                        fs.mkdir(d, recursive=True)
+                    elif op == 1:
+                        fs.write_file(path, "x" * rng.randrange(100))
+                    elif op == 2:
+                        fs.write_file(path, "y" * rng.randrange(50), append=True)
+                    elif op == 3:
+                        fs.remove(rng.choice([path, d]), recursive=True)
+                    elif op == 4:
+                        fs.move(path, f"{rng.choice(dirs)}/m{rng.randrange(4)}")
+                    elif op == 5:
+                        fs.copy(rng.choice(dirs), f"{rng.choice(dirs)}/c{rng.randrange(2)}")
+                    elif op == 6:
+                        fs.list_directory(d)
+                        fs.get_usage(d)
+                    elif op == 7:
+                        content = fs.read_file(path)
+                        assert content is None or set(content) <= {"x", "y"}
+                    else:
+                        fs.find(d, "f*")
+            except Exception as e:
+                errors.append(e)
+                
+        threads = [threading.Thread(target=worker, args=(n,)) for n in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert not errors, errors
+        _check_consistency(fs)
+        
+        # A transaction commits all of its changes...
+        with fs.transaction():
+            fs.write_file("/tmp/t1.txt", "one")
+            fs.move("/tmp/t1.txt", "/tmp/t2.txt")
+            fs.remove("/var/log", recursive=True)
+        assert fs.read_file("/tmp/t2.txt") == "one" and not fs.exists("/var/log")
+        _check_consistency(fs)
+        
+        # ...or none of them
+        before = fs.get_usage("/")
+        try:
+            with fs.transaction():
+                fs.write_file("/tmp/t2.txt", "two")
+                fs.remove("/etc", recursive=True)
+                fs.mkdir("/tmp/new/dir", recursive=True)
+                raise KeyError("abort")
+        except KeyError:
+            pass
+        assert fs.read_file("/tmp/t2.txt") == "one" and fs.exists("/etc/hosts")
+        assert not fs.exists("/tmp/new") and fs.get_usage("/") == before
+        _check_consistency(fs)
+        
+        print("✓ Concurrency works")
+        return True
+    except Exception as e:
+        print(f"✗ Concurrency failed: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+
+def test_binary_image():
+    """Test the binary image format and converter"""
+    print("\nTesting binary images...")
+    try:
+        import json
+        import os
+        import tempfile
+        import image_format
+        from filesystem import VirtualFileSystem
+        from users import UserManager
+        
+        fs = VirtualFileSystem()
+        fs.CHUNK_SIZE = 8
+        fs.write_file("/home/admin/big.txt", "chunked content ü " * 5)
+        fs.copy("/home/admin/big.txt", "/tmp/dup.txt")
+        fs.write_file("/etc/motd", "\ud800 lone surrogate")
+        fs.mkdir("/home/admin/empty")
+        fs.chmod("/tmp/dup.txt", "rw-------")
+        fs.chown("/tmp/dup.txt", "guest")
+        
+        with tempfile.TemporaryDirectory() as tmp:
+            image = os.path.join(tmp, "fs.dimg")
+            fs.save_to_disk(image)
+            assert image_format.is_binary_file(image)
+            loaded = VirtualFileSystem()
+            loaded.load_from_disk(image)
+            assert loaded._dump_tree() == fs._dump_tree()
+            assert loaded.read_file("/home/admin/big.txt") == "chunked content ü " * 5
+            assert loaded.get_usage("/") == fs.get_usage("/")
+            node = loaded._get_node("/tmp/dup.txt")
+            assert (node.permissions, node.owner) == ("rw-------", "guest")
+            
+            # Offline conversion both ways keeps everything
+            back = os.path.join(tmp, "fs.json")
+            assert image_format.convert(image, back) == "filesystem"
+            assert not image_format.is_binary_file(back)
+            with open(back) as f:
+                assert json.load(f)["blobs"] == fs._dump_tree()["blobs"]
+            
+            # A version 1 image (the root node itself) converts without
+            # its tree being copied into the metadata
+            legacy = os.path.join(tmp, "legacy.json")
+            with open(legacy, "w") as f:
+                json.dump({"name": "/", "is_directory": True, "owner": "root", "permissions": "rwxr-xr-x",
+                           "created_at": 0.0, "modified_at": 0.0, "size": 0, "content": "",
+                           "children": {"a.txt": {"name": "a.txt", "is_directory": False, "owner": "root",
+                                                  "permissions": "rw-r--r--", "created_at": 0.0,
+                                                  "modified_at": 0.0, "size": 3, "content": "old",
+                                                  "children": {}}}}, f)
+            for name in ("legacy.dimg", "legacy2.json"):
+                converted = os.path.join(tmp, name)
+                assert image_format.convert(legacy, converted) == "filesystem"
+                if name.endswith(".json"):
+                    with open(converted) as f:
+                        assert set(json.load(f)) == {"format", "blobs", "root"}
+                else:
+                    with open(converted, "rb") as f:
+                        assert image_format.decode_tree(f.read())[2] == {"format": VirtualFileSystem.IMAGE_FORMAT}
+                upgraded = VirtualFileSystem()
+                upgraded.load_from_disk(converted)
+                assert upgraded.read_file("/a.txt") == "old"
+            
+            users = UserManager()
+            users.authenticate("admin", "admin123")
+            users_json = os.path.join(tmp, "users.json")
+            users_image = os.path.join(tmp, "users.dimg")
+            users.save_to_disk(users_json)
+            assert image_format.convert(users_json, users_image) == "users"
+            restored = UserManager()
+            restored.load_from_disk(users_image)
+            assert {n: u.to_dict() for n, u in restored.users.items()} == \
+                   {n: u.to_dict() for n, u in users.users.items()}
+            
+            # Journal snapshots follow the snapshot path's suffix
+            journaled = VirtualFileSystem()
+            journaled.open_journal(os.path.join(tmp, "j.dimg"))
+            journaled.write_file("/tmp/j.txt", "journaled")
+            journaled.close_journal()
+            again = VirtualFileSystem()
+            assert again.open_journal(os.path.join(tmp, "j.dimg")) == 0
+            assert again.read_file("/tmp/j.txt") == "journaled"
+            again.close_journal()
+            
+            try:
+                image_format.decode_users(open(image, "rb").read())
+                assert False, "wrong image kind accepted"
+            except ValueError:
+                pass
+        
+        print("✓ Binary images work")
+        return True
+    except Exception as e:
+        print(f"✗ Binary images failed: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+
+def test_mount():
+    """Test host directory mounts"""
+    print("\nTesting host mounts...")
+    try:
+        import os
+        import tempfile
+        import time
+        from filesystem import VirtualFileSystem
+        from mount import HostNode
+        
+        with tempfile.TemporaryDirectory() as host:
+            os.makedirs(os.path.join(host, "src", "pkg"))
+            with open(os.path.join(host, "README.md"), "w") as f:
+                f.write("Project notes\nTODO: mount me\n")
+            with open(os.path.join(host, "src", "pkg", "main.py"), "w") as f:
+                f.write("print('hi')\n# todo later\n")
+            big = os.path.join(host, "big.log")
+            with open(big, "wb") as f:
+                f.write(("x" * 99 + "\n").encode() * 30000 + "NEEDLE ü\n".encode())
+            
+            fs = VirtualFileSystem()
+            fs.mkdir("/mnt")
+            fs.mkdir("/mnt/projects")
+            fs.find("/", "*.md")
+            fs.search_content("todo")
+            assert fs.mount(host, "/mnt/projects")
+            assert not fs.mount(host, "/mnt/projects/src")
+            assert not fs.mount(host, "/home")  # not empty
+            
+            # Listing, lookup and find cross the mount boundary
+            names = {node.name for node in fs.list_directory("/mnt")}
+            assert names == {"projects"}
+            assert fs.list_directory("/mnt")[0].is_host
+            assert {n.name for n in fs.list_directory("/mnt/projects")} == {"README.md", "src", "big.log"}
+            assert fs.is_directory("/mnt/projects/src/pkg")
+            assert fs.find("/mnt", "*.py") == ["/mnt/projects/src/pkg/main.py"]
+            assert "/mnt/projects/README.md" in fs.find("/", file_type="f")
+            assert "/etc/motd" in fs.find("/", file_type="f")
+            assert fs.find("/mnt/projects", file_type="d") == ["/mnt/projects/src", "/mnt/projects/src/pkg"]
+            
+            # Reads and searches go through the memory map
+            assert fs.read_file("/mnt/projects/README.md") == "Project notes\nTODO: mount me\n"
+            HostNode.CHUNK_SIZE = 4096
+            try:
+                chunks = list(fs.read_chunks("/mnt/projects/big.log"))
+                assert len(chunks) > 1 and "".join(chunks).endswith("NEEDLE ü\n")
+            finally:
+                HostNode.CHUNK_SIZE = 1024 * 1024
+            assert fs.search_file("/mnt/projects/big.log", "needle") == ["NEEDLE ü"]
+            assert fs.search_file("/mnt/projects/big.log", "ü") == ["NEEDLE ü"]
+            hits = dict(fs.search_content("todo", "/"))
+            assert hits["/mnt/projects/README.md"] == ["TODO: mount me"]
+            assert hits["/mnt/projects/src/pkg/main.py"] == ["# todo later"]
+            assert [p for p, _ in fs.search_content("todo", "/mnt/projects/src")] == \
+                   ["/mnt/projects/src/pkg/main.py"]
+            
+            # Host changes show up once the cached stat expires (mtime check)
+            HostNode.STAT_TTL = 0
+            try:
+                with open(os.path.join(host, "new.txt"), "w") as f:
+                    f.write("fresh")
+                stamp = time.time() + 5
+                os.utime(host, (stamp, stamp))
+                assert fs.read_file("/mnt/projects/new.txt") == "fresh"
+                with open(os.path.join(host, "new.txt"), "a") as f:
+                    f.write(" data")
+                assert fs._get_node("/mnt/projects/new.txt").size == 10
+            finally:
+                HostNode.STAT_TTL = 1.0
+            
+            # The mount is read-only and stays out of the tree and images
+            assert not fs.write_file("/mnt/projects/x.txt", "no")
+            assert not fs.mkdir("/mnt/projects/src/new", recursive=True)
+            assert not fs.remove("/mnt/projects/README.md")
+            assert not fs.remove("/mnt", recursive=True)
+            assert not fs.chmod("/mnt/projects/README.md", "rwxrwxrwx")
+            assert not os.path.exists(os.path.join(host, "x.txt"))
+            assert fs._dump_tree()["root"]["children"]["mnt"]["children"]["projects"]["children"] == {}
+            
+            # Copying out of the mount makes ordinary files
+            assert fs.copy("/mnt/projects/src", "/tmp/src")
+            assert fs.read_file("/tmp/src/pkg/main.py") == "print('hi')\n# todo later\n"
+            assert not fs._get_node("/tmp/src/pkg/main.py").is_host
+            assert fs.get_size("/tmp/src") == len("print('hi')\n# todo later\n")
+            
+            assert fs.umount("/mnt/projects")
+            assert fs.list_directory("/mnt/projects") == []
+            assert fs.find("/mnt") == ["/mnt/projects"]
+            assert not fs.umount("/mnt/projects")
+        
+        print("✓ Host mounts work")
+        return True
+    except Exception as e:
+        print(f"✗ Host mounts failed: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+
+def test_file_handles():
+    """Test streaming file handles, head and tail"""
+    print("\nTesting file handles...")
+    try:
+        import io
+        import os
+        import tempfile
+        from filesystem import VirtualFileSystem
+        from mount import HostNode
+        from utilities import HeadCommand, TailCommand, WcCommand
+        from commands import CommandContext
+        
+        fs = VirtualFileSystem()
+        fs.CHUNK_SIZE = 8
+        text = "".join(f"line {i} ü\n" for i in range(50))
+        fs.write_file("/tmp/log.txt", text)
+        
+        with fs.open("/tmp/log.txt") as f:
+            assert f.read(5) == "line "
+            assert f.readline() == "0 ü\n"
+            assert f.tell() == len("line 0 ü\n")
+            assert f.read(20) == text[9:29]
+            f.seek(3)
+            assert f.read(4) == text[3:7]
+            f.seek(-6, io.SEEK_END)
+            assert f.read() == text[-6:]
+            f.seek(-8, io.SEEK_CUR)
+            assert f.readline() == text[-8:]
+            f.seek(0)
+            assert list(f) == text.splitlines(keepends=True)
+            assert f.readline() == ""
+        try:
+            f.read()
+            assert False, "read after close"
+        except ValueError:
+            pass
+        assert fs.open("/tmp") is None and fs.open("/missing") is None
+        
+        # A handle keeps the version it opened
+        handle = fs.open("/tmp/log.txt")
+        assert handle.read(4) == "line"
+        fs.write_file("/tmp/log.txt", "rewritten")
+        handle.seek(0)
+        assert handle.read() == text
+        handle.close()
+        fs.write_file("/tmp/log.txt", text)
+        
+        # head and tail agree with splitting the whole content
+        context = CommandContext(None, fs, None, None)
+        for content in ("", "one", "a\nb\n", "a\nb", text):
+            fs.write_file("/tmp/t.txt", content)
+            for n in (0, 1, 2, 3, 10, 60):
+                lines = content.split("\n")
+                assert HeadCommand().execute(["-n", str(n), "/tmp/t.txt"], context) == "\n".join(lines[:n])
+                assert TailCommand().execute(["-n", str(n), "/tmp/t.txt"], context) == \
+                       "\n".join(lines[-n:] if n else [])
+        fs.write_file("/tmp/t.txt", "a b\nc d e\n")
+        assert WcCommand().execute(["/tmp/t.txt"], context).split()[:3] == ["3", "5", "10"]
+        
+        # Host files stream the same way, and tail reads them backwards
+        with tempfile.TemporaryDirectory() as host:
+            with open(os.path.join(host, "h.txt"), "w", encoding="utf-8") as f:
+                f.write(text)
+            fs.mkdir("/mnt/h", recursive=True)
+            assert fs.mount(host, "/mnt/h")
+            HostNode.CHUNK_SIZE = 7
+            try:
+                assert fs.tail_lines("/mnt/h/h.txt", 3) == text.split("\n")[-3:]
+                pieces = list(fs._get_node("/mnt/h/h.txt").iter_chunks_reversed())
+                assert len(pieces) > 1 and "".join(reversed(pieces)) == text
+                with fs.open("/mnt/h/h.txt") as f:
+                    assert f.readline() == "line 0 ü\n"
+                    f.seek(-6, io.SEEK_END)
+                    assert f.read() == text[-6:]
+                    f.seek(100)
+                    assert f.read(10) == text[100:110]
+            finally:
+                HostNode.CHUNK_SIZE = 1024 * 1024
+        
+        print("✓ File handles work")
+        return True
+    except Exception as e:
+        print(f"✗ File handles failed: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+
 def test_users():
     """Test user management"""
     print("\nTesting user management...")
@@ -95,8 +1012,10 @@ def test_users():
         assert user is None
         
         # Test login
-        assert um.login("admin", "admin123") == True
-        assert um.get_current_user().username == "admin"
+        session = um.login("admin", "admin123")
+        assert session.username == "admin" and session.is_admin
+        assert session.cwd == "/home/admin"
+        assert um.login("admin", "wrongpassword") is None
         
         print("✓ User management works")
         return True
@@ -119,8 +1038,7 @@ def test_commands():
         kernel = DoubOSKernel()
         fs = VirtualFileSystem()
         um = UserManager()
-        um.login("admin", "admin123")
-        shell = DoubOSShell(kernel)
+        shell = DoubOSShell(kernel, um.login("admin", "admin123"))
         
         context = CommandContext(kernel, fs, um, shell)
         processor = CommandProcessor(context)
@@ -128,7 +1046,7 @@ def test_commands():
         
         # Test basic commands
         output = processor.execute("pwd")
-        assert output == "/"
+        assert output == "/home/admin"
         
         output = processor.execute("whoami")
         assert "admin" in output
@@ -146,31 +1064,1039 @@ def test_commands():
         return False
 
 
-def test_dangerous_commands():
-    """Test dangerous commands"""
-    print("\nTesting dangerous commands...")
+def test_sessions():
+    """Test per-session state and concurrent sessions on threads"""
+    print("\nTesting sessions...")
     try:
+        import threading
         from kernel import DoubOSKernel, DoubOSShell
         from filesystem import VirtualFileSystem
         from users import UserManager
         from commands import CommandProcessor, CommandContext
-        from dangerous_commands import register_dangerous_commands
-        
+
         kernel = DoubOSKernel()
+        kernel.boot(verbose=False)
         fs = VirtualFileSystem()
         um = UserManager()
-        um.login("admin", "admin123")
-        shell = DoubOSShell(kernel)
-        
-        context = CommandContext(kernel, fs, um, shell)
+
+        def terminal(username, password):
+            session = um.login(username, password, kernel.environment_vars)
+            context = CommandContext(kernel, fs, um, DoubOSShell(kernel, session))
+            processor = CommandProcessor(context)
+            context.commands = processor.commands
+            return session, processor
+
+        admin, admin_shell = terminal("admin", "admin123")
+        guest, guest_shell = terminal("guest", "guest")
+        admin_shell.execute("cd /etc")
+        assert guest_shell.execute("pwd") == "/home/guest"
+        assert admin.get_env("USER") == "admin" and guest.get_env("HOME") == "/home/guest"
+        assert kernel.get_env("USER") is None
+
+        # su switches only this session's user; passwords are prompted for, never arguments
+        assert "no terminal" in guest_shell.execute("su admin")
+        assert guest_shell.execute("su admin admin123").startswith("Usage")
+        guest.ask_password = lambda prompt: "nope"
+        assert "Authentication failure" in guest_shell.execute("su")
+        guest.ask_password = lambda prompt: "admin123"
+        assert guest_shell.execute("su") is None
+        assert guest_shell.execute("whoami") == "admin" and guest.cwd == "/home/admin"
+        assert admin_shell.execute("su guest") is None and admin_shell.execute("whoami") == "guest"
+
+        # exit ends the session, not the kernel
+        admin_shell.execute("exit")
+        assert not admin.running and guest.running and kernel.running
+
+        # Sessions on threads never see each other's directory
+        errors = []
+
+        def worker(n):
+            session, shell = terminal("guest", "guest")
+            fs.mkdir(f"/tmp/t{n}", owner="guest")
+            for i in range(200):
+                shell.execute(f"cd /tmp/t{n}" if i % 2 else "cd /")
+                expected = f"/tmp/t{n}" if i % 2 else "/"
+                if shell.execute("pwd") != expected:
+                    errors.append((n, i))
+            if len(session.history) or shell.execute("whoami") != "guest":
+                errors.append(n)
+
+        threads = [threading.Thread(target=worker, args=(n,)) for n in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert not errors, errors
+
+        print("✓ Sessions work")
+        return True
+    except Exception as e:
+        print(f"✗ Sessions failed: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+
+def test_command_history():
+    """Test the bounded history, its index and history files"""
+    print("\nTesting command history...")
+    try:
+        import random
+        from kernel import DoubOSKernel, DoubOSShell
+        from filesystem import VirtualFileSystem
+        from users import UserManager
+        from commands import CommandProcessor, CommandContext
+        from utilities import register_utility_commands
+        from history import CommandHistory
+
+        history = CommandHistory(5)
+        for i in range(8):
+            history.add(f"echo {i}")
+        assert len(history) == 5 and history.first == 4 and history.last == 8
+        assert history.get(3) is None and history.get(8) == "echo 7"
+        assert history.tail(2) == [(7, "echo 6"), (8, "echo 7")]
+        assert history.search("ECHO") == (8, "echo 7")
+        assert history.search("echo", before=6) == (5, "echo 4")
+        assert history.search("echo 1") is None
+
+        # Index answers match a plain scan through evictions and rebuilds
+        rng = random.Random(7)
+        pool = [f"cd /home/user{n} && grep -r TODO src{n % 7}" for n in range(120)] + ["ls", "pwd", "LS -l"]
+        history = CommandHistory(50)
+        for _ in range(2000):
+            history.add(rng.choice(pool))
+        held = list(history.entries())
+        assert len(held) == 50
+        for needle in ("ls", "todo", "user1", "src3", "r1", "s", "zzz", "user11 &"):
+            expected = [(n, line) for n, line in held if needle in line.lower()]
+            assert history.matches(needle) == expected, needle
+            assert history.search(needle) == (expected[-1] if expected else None), needle
+            if len(expected) > 1:
+                assert history.search(needle, before=expected[-1][0]) == expected[-2]
+
+        # Sessions append to a per-user history file in the VFS
+        kernel = DoubOSKernel()
+        fs = VirtualFileSystem()
+        um = UserManager()
+        session = um.login("admin", "admin123", kernel.environment_vars)
+        session.open_history(fs)
+        context = CommandContext(kernel, fs, um, DoubOSShell(kernel, session))
         processor = CommandProcessor(context)
-        register_dangerous_commands(processor)
         context.commands = processor.commands
-        
-        # Test format command exists
-        assert "format" in processor.commands
-        assert "nuke" in processor.commands
-        assert "shred" in processor.commands
+        register_utility_commands(processor)
+        for command in ("pwd", "cd /etc", "ls", "whoami", "cd /tmp"):
+            session.add_to_history(command)
+            processor.execute(command)
+        assert processor.execute("history 2") == "    4  whoami\n    5  cd /tmp"
+        assert processor.execute("history -s CD") == "    5  cd /tmp"
+        assert processor.execute("history | grep cd") == "    2  cd /etc\n    5  cd /tmp"
+        assert processor.execute("history | cat | grep cd") == processor.execute("history | grep cd")
+        assert processor.execute("history | grep 4") == "    4  whoami"
+        assert processor.execute("history | grep cd | head -1") == "    2  cd /etc"
+        session.end()
+        lines = fs.read_file("/home/admin/.doubos_history").splitlines()
+        assert [line.split("\t")[1] for line in lines] == ["pwd", "cd /etc", "ls", "whoami", "cd /tmp"]
+
+        again = um.login("admin", "admin123")
+        again.open_history(fs)
+        assert [line for _, line in again.history.entries()][-2:] == ["whoami", "cd /tmp"]
+        processor.execute("history -c")
+        assert processor.execute("history") == "" and fs.exists("/home/admin/.doubos_history")
+
+        print("✓ Command history works")
+        return True
+    except Exception as e:
+        print(f"✗ Command history failed: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+
+def test_completion():
+    """Test tab completion of commands and paths, and its cache upkeep"""
+    print("\nTesting tab completion...")
+    try:
+        from kernel import DoubOSKernel, DoubOSShell
+        from filesystem import VirtualFileSystem
+        from users import UserManager
+        from commands import CommandProcessor, CommandContext
+        from utilities import register_utility_commands
+        from completion import CommandTrie, Completer
+
+        trie = CommandTrie(["ls", "less", "cat", "cd", "l"])
+        assert trie.words("l") == ["l", "less", "ls"] and trie.words("x") == []
+        assert trie.words() == ["cat", "cd", "l", "less", "ls"]
+
+        kernel = DoubOSKernel()
+        fs = VirtualFileSystem()
+        um = UserManager()
+        session = um.login("guest", "guest", kernel.environment_vars)
+        context = CommandContext(kernel, fs, um, DoubOSShell(kernel, session))
+        processor = CommandProcessor(context)
+        register_utility_commands(processor)
+        context.commands = processor.commands
+        completer = Completer(processor)
+
+        # Commands (and aliases) in command position only; no admin-only ones for guest
+        assert completer.complete("gre") == ["grep"]
+        assert completer.complete("cat x | gre") == ["grep"]
+        assert "ll" in completer.complete("l") and "ls" in completer.complete("l")
+        assert completer.complete("useradd") == [] and completer.complete("cat ca") == []
+        processor.aliases["gg"] = "grep"
+        assert completer.complete("g") == ["gg", "grep"]
+
+        # Paths: absolute, relative, hidden names, directories end in "/"
+        fs.mkdir("/data/sub", recursive=True)
+        for name in ("alpha.txt", "alps.txt", "beta.txt", ".hidden"):
+            fs.write_file(f"/data/{name}", "x")
+        assert completer.complete("cat /da") == ["/data/"]
+        assert completer.complete("cat /data/al") == ["/data/alpha.txt", "/data/alps.txt"]
+        assert completer.common_prefix(completer.complete("cat /data/al")) == "/data/alp"
+        processor.execute("cd /data")
+        assert completer.complete("cat ") == ["alpha.txt", "alps.txt", "beta.txt", "sub/"]
+        assert completer.complete("cat .h") == [".hidden"]
+        assert completer.complete("ls sub/../b") == ["sub/../beta.txt"]
+        assert completer.complete("cat x > al") == ["alpha.txt", "alps.txt"]
+        assert completer.complete("cat /nowhere/") == []
+
+        # Cached listings follow every change
+        fs.write_file("/data/alpine.txt", "x")
+        fs.remove("/data/alps.txt")
+        assert completer.complete("cat al") == ["alpha.txt", "alpine.txt"]
+        fs.move("/data/beta.txt", "/data/sub/beta.txt")
+        fs.move("/data/alpha.txt", "/data/gamma")
+        assert completer.complete("cat ") == ["alpine.txt", "gamma", "sub/"]
+        assert completer.complete("cat sub/") == ["sub/beta.txt"]
+        fs.copy("/data/sub", "/data/gamma")
+        assert completer.complete("cat g") == ["gamma/"]
+        assert completer.complete("cat gamma/") == ["gamma/beta.txt"]
+        fs.remove("/data/sub", recursive=True)
+        assert completer.complete("cat sub/") == [] and completer.complete("cat s") == []
+        with fs.transaction():
+            fs.write_file("/data/kept.txt", "x")
+        try:
+            with fs.transaction():
+                fs.write_file("/data/lost.txt", "x")
+                assert completer.complete("cat lo") == ["lost.txt"]
+                raise RuntimeError("roll back")
+        except RuntimeError:
+            pass
+        assert completer.complete("cat lo") == [] and completer.complete("cat k") == ["kept.txt"]
+
+        # Large directories are cut, keeping what a completion would insert
+        for i in range(1500):
+            fs.write_file(f"/data/many{i:04d}", "")
+        found = completer.complete("cat many")
+        assert len(found) == Completer.MAX_CANDIDATES and found[-1] == "many1499"
+        assert completer.common_prefix(found) == "many"
+        assert completer.common_prefix(completer.complete("cat many14")) == "many14"
+
+        print("✓ Tab completion works")
+        return True
+    except Exception as e:
+        print(f"✗ Tab completion failed: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+
+def test_watches():
+    """Test change notification, its coalescing and overflow, and tail -f"""
+    print("\nTesting file watches...")
+    try:
+        import threading
+        from kernel import DoubOSKernel, DoubOSShell
+        from filesystem import VirtualFileSystem
+        from users import UserManager
+        from commands import CommandProcessor, CommandContext
+        from utilities import register_utility_commands
+        from watch import OVERFLOW
+
+        fs = VirtualFileSystem()
+        fs.mkdir("/w/sub", recursive=True)
+        direct = fs.watch("/w")
+        tree = fs.watch("/w", recursive=True)
+        fs.write_file("/w/log", "a\n")
+        for _ in range(100):
+            fs.write_file("/w/log", "b\n", append=True)
+        fs.write_file("/w/sub/deep", "x")
+        fs.move("/w/log", "/w/sub/log")
+        fs.chmod("/w/sub", "rwx------")
+        fs.remove("/w/sub", recursive=True)
+        fs.write_file("/elsewhere", "x")
+        seen = [(c.event, c.path, c.dest) for c in tree.read(0)]
+        # 101 writes to the new file arrive as one create
+        assert seen == [("create", "/w/log", None), ("create", "/w/sub/deep", None),
+                        ("move", "/w/log", "/w/sub/log"), ("modify", "/w/sub", None),
+                        ("delete", "/w/sub", None)], seen
+        assert [c.event for c in direct.read(0)] == ["create", "move", "modify", "delete"]
+        assert tree.read(0.01) == []
+
+        # Modifies coalesce only until the reader has seen them
+        fs.write_file("/w/f", "1")
+        assert [c.event for c in direct.read(0)] == ["create"]
+        fs.write_file("/w/f", "2")
+        fs.write_file("/w/f", "3")
+        assert [c.event for c in direct.read(0)] == ["modify"]
+
+        # A full queue drops changes and signals it once
+        small = fs.watch("/w", max_events=4)
+        for i in range(10):
+            fs.write_file(f"/w/n{i}", "")
+        batch = small.read(0)
+        assert len(batch) == 4 and batch[-1].event == OVERFLOW and small.dropped == 7
+        fs.write_file("/w/after", "")
+        assert [c.path for c in small.read(0)] == ["/w/after"]
+
+        # Callbacks get batches from the dispatcher thread
+        batches = []
+        delivered = threading.Event()
+        fs.watch("/cb", recursive=True, callback=lambda batch: (batches.append(batch), delivered.set()))
+        fs.mkdir("/cb/x/y", recursive=True)
+        assert delivered.wait(2) and [c.path for c in batches[0]] == ["/cb", "/cb/x", "/cb/x/y"]
+
+        for watch in (direct, tree, small):
+            watch.close()
+        assert fs._watch_manager.watching() == 1
+
+        # tail -f follows appends until the session is interrupted
+        kernel = DoubOSKernel()
+        um = UserManager()
+        session = um.login("admin", "admin123", kernel.environment_vars)
+        context = CommandContext(kernel, fs, um, DoubOSShell(kernel, session))
+        processor = CommandProcessor(context)
+        register_utility_commands(processor)
+        context.commands = processor.commands
+        fs.write_file("/w/app.log", "one\ntwo\nthree\n")
+        lines = []
+        started = threading.Event()
+
+        def follow():
+            for line in processor.stream("tail -n 2 -f /w/app.log"):
+                lines.append(line)
+                started.set()
+
+        follower = threading.Thread(target=follow, daemon=True)
+        follower.start()
+        assert started.wait(2)
+        fs.write_file("/w/app.log", "four\nfi", append=True)
+        fs.write_file("/w/app.log", "ve\n", append=True)
+        for _ in range(200):
+            if len(lines) == 3:
+                break
+            threading.Event().wait(0.01)
+        session.interrupt()
+        follower.join(2)
+        assert not follower.is_alive() and lines == ["three", "four", "five"], lines
+        # Without a live output (execute, batch, server) -f just prints the tail
+        assert processor.execute("tail -n 1 -f /w/app.log") == ""
+        assert processor.execute("tail -n 2 -f /w/app.log") == "five\n"
+
+        print("✓ File watches work")
+        return True
+    except Exception as e:
+        print(f"✗ File watches failed: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+
+def test_job_control():
+    """Test background jobs, job control and the process table"""
+    print("\nTesting job control...")
+    try:
+        import time
+        from kernel import DoubOSKernel, DoubOSShell
+        from filesystem import VirtualFileSystem
+        from users import UserManager
+        from commands import CommandProcessor, CommandContext
+        from utilities import register_utility_commands
+        from dangerous_commands import register_dangerous_commands
+
+        kernel = DoubOSKernel()
+        fs = VirtualFileSystem()
+        um = UserManager()
+        session = um.login("admin", "admin123", kernel.environment_vars)
+        context = CommandContext(kernel, fs, um, DoubOSShell(kernel, session))
+        processor = CommandProcessor(context)
+        register_utility_commands(processor)
+        register_dangerous_commands(processor)
+        context.commands = processor.commands
+
+        # A job runs alongside the shell and is reported once when done
+        assert processor.execute("sleep 0.2 &") == "[1] 100"
+        assert processor.execute("pwd") == "/home/admin"
+        assert "running" in processor.execute("ps") and "sleep 0.2" in processor.execute("ps")
+        job = session.jobs[1]
+        assert job.wait(2) and job.state == "done" and 0.15 < job.wall_time < 1.0
+        assert job.cpu_time < 0.1  # sleeping costs no CPU
+        assert session.job_notices() == ["[1]  Done       sleep 0.2"] and session.job_notices() == []
+        assert "sleep" not in processor.execute("ps")
+
+        # CPU time is the job thread's own; output is kept for fg
+        fs.mkdir("/data")
+        for i in range(300):
+            fs.write_file(f"/data/f{i}.txt", "needle\n" * 50)
+        processor.execute("find /data -name f1 &")
+        busy = session.jobs[1]
+        assert busy.wait(5) and busy.cpu_time > 0 and busy.cpu_time <= busy.wall_time + 0.01
+        assert processor.execute("fg %1").split("\n")[0] == "find /data -name f1"
+        assert 1 not in session.jobs
+
+        # Jobs have their own copy of the session
+        processor.execute("cd /data &")
+        session.jobs[1].wait(2)
+        assert processor.execute("pwd") == "/home/admin"
+        session.job_notices()
+
+        # stop, bg, kill; tail -f in a job is woken by kill
+        processor.execute("tail -f /data/f1.txt &")
+        follower = session.jobs[1]
+        for _ in range(100):
+            if follower.state == "running":
+                break
+            time.sleep(0.01)
+        assert processor.execute(f"kill -STOP {follower.pid}") is None
+        assert follower.state == "stopped"
+        assert processor.execute("jobs") == "[1]  Stopped    tail -f /data/f1.txt"
+        assert processor.execute("bg") == "[1] tail -f /data/f1.txt &" and follower.state == "running"
+        fs.write_file("/data/f1.txt", "fresh\n", append=True)
+        for _ in range(100):
+            if "fresh" in follower.output:
+                break
+            time.sleep(0.01)
+        assert "fresh" in follower.output
+        processor.execute("kill %1")
+        assert follower.wait(2) and follower.state == "killed"
+        assert processor.execute("jobs") == "[1]  Killed     tail -f /data/f1.txt"
+        assert processor.execute("jobs") == ""
+
+        # fg shows output as it is produced and waits for the end
+        processor.execute("sleep 0.1 &")
+        assert processor.execute("fg") == "sleep 0.1"
+        assert processor.execute("kill 4242") == "kill: (4242) - No such process"
+        assert processor.execute("fg") == "fg: no current job"
+
+        # Other users' processes need an admin; killall ends them all
+        guest = um.login("guest", "guest", kernel.environment_vars)
+        guest_processor = processor.fork(guest)
+        assert guest_processor.context.session is guest
+        processor.execute("sleep 30 &")
+        pid = session.jobs[1].pid
+        assert guest_processor.execute(f"kill {pid}") == f"kill: ({pid}) - Operation not permitted"
+        guest_processor.execute("sleep 30 &")
+        assert "2 process" in processor.execute("killall --confirm")
+        assert session.jobs[1].wait(2) and guest.jobs[1].wait(2)
+
+        print("✓ Job control works")
+        return True
+    except Exception as e:
+        print(f"✗ Job control failed: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+
+def test_archives():
+    """Test tar archives of VFS subtrees"""
+    print("\nTesting archives...")
+    try:
+        import io
+        import os
+        import tarfile
+        import tempfile
+        from kernel import DoubOSKernel, DoubOSShell
+        from filesystem import VirtualFileSystem
+        from users import UserManager
+        from commands import CommandProcessor, CommandContext
+        from utilities import register_utility_commands
+
+        kernel = DoubOSKernel()
+        fs = VirtualFileSystem()
+        um = UserManager()
+        session = um.login("admin", "admin123", kernel.environment_vars)
+        context = CommandContext(kernel, fs, um, DoubOSShell(kernel, session))
+        processor = CommandProcessor(context)
+        register_utility_commands(processor)
+        context.commands = processor.commands
+
+        fs.mkdir("/src/sub", recursive=True)
+        fs.write_file("/src/notes.txt", "héllo ☃\n")
+        fs.write_file("/src/sub/big.log", "".join(f"line {i}\n" for i in range(50000)))
+        fs.chmod("/src/notes.txt", "rw-r-----")
+        processor.execute("cd /")
+
+        # The archive is a binary file in the VFS: one character per byte
+        assert processor.execute("tar -czf /backup.tar.gz src").startswith("📦 Created /backup.tar.gz: 2 file(s)")
+        data = fs.read_file("/backup.tar.gz").encode("latin-1")
+        with tarfile.open(fileobj=io.BytesIO(data), mode="r:gz") as tar:
+            assert tar.getnames() == ["src", "src/notes.txt", "src/sub", "src/sub/big.log"]
+            assert tar.getmember("src/notes.txt").size == len("héllo ☃\n".encode())
+            assert tar.getmember("src/notes.txt").mode == 0o640
+            assert tar.extractfile("src/sub/big.log").read() == fs.read_file("/src/sub/big.log").encode()
+        assert processor.execute("tar -tzf /backup.tar.gz") == "src/\nsrc/notes.txt\nsrc/sub/\nsrc/sub/big.log"
+        assert "-rw-r----- root" in processor.execute("tar -tvf /backup.tar.gz")
+
+        # Extraction round-trips contents and permissions
+        fs.mkdir("/restore")
+        assert processor.execute("tar -xzvf /backup.tar.gz -C /restore").split("\n")[-1] == \
+            "📦 Extracted 2 file(s) into /restore"
+        assert fs.read_file("/restore/src/notes.txt") == "héllo ☃\n"
+        assert fs.read_file("/restore/src/sub/big.log") == fs.read_file("/src/sub/big.log")
+        assert fs.list_directory("/restore/src")[0].permissions == "rw-r-----"
+
+        # Uncompressed archives, and an archive written into the tree it holds
+        assert "2 file(s)" in processor.execute("tar -cf /src/self.tar /src")
+        assert processor.execute("tar -tf /src/self.tar").split("\n")[0] == "src/"
+        assert "self.tar" not in processor.execute("tar -tf /src/self.tar")
+
+        # Unsafe names are skipped; bad input is reported
+        evil = io.BytesIO()
+        with tarfile.open(fileobj=evil, mode="w") as tar:
+            tar.addfile(tarfile.TarInfo("../escape.txt"), io.BytesIO())
+            tar.addfile(tarfile.TarInfo("/etc/passwd"), io.BytesIO())
+        fs.write_file("/evil.tar", evil.getvalue().decode("latin-1"))
+        assert processor.execute("tar -xf /evil.tar -C /tmp") == \
+            "tar: ../escape.txt: unsafe path; skipped\ntar: /etc/passwd: unsafe path; skipped\n" \
+            "📦 Extracted 0 file(s) into /tmp"
+        assert processor.execute("tar -xf /src/notes.txt").startswith("tar: /src/notes.txt:")
+        assert processor.execute("tar -czf /x.tgz missing") == "tar: missing: No such file or directory"
+        assert processor.execute("tar -f /x.tgz").startswith("tar: you must specify one of")
+
+        # Host archives are written and read as ordinary tar.gz files
+        with tempfile.TemporaryDirectory() as tmp:
+            host = os.path.join(tmp, "export.tar.gz")
+            processor.execute(f"tar -czf host:{host} src/sub")
+            with tarfile.open(host) as tar:
+                assert tar.getnames() == ["src/sub", "src/sub/big.log"]
+            assert processor.execute(f"tar -tzf host:{host}") == "src/sub/\nsrc/sub/big.log"
+            guest = um.login("guest", "guest", kernel.environment_vars)
+            assert "Permission denied" in processor.fork(guest).execute(f"tar -tzf host:{host}")
+
+        print("✓ Archives work")
+        return True
+    except Exception as e:
+        print(f"✗ Archives failed: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+
+def test_grep():
+    """Test grep: patterns, flags, several files and chunked scans"""
+    print("\nTesting grep...")
+    try:
+        from kernel import DoubOSKernel, DoubOSShell
+        from filesystem import VirtualFileSystem
+        from users import UserManager
+        from commands import CommandProcessor, CommandContext
+        from utilities import register_utility_commands
+        from grep import compile_pattern, scan
+
+        kernel = DoubOSKernel()
+        fs = VirtualFileSystem()
+        um = UserManager()
+        session = um.login("admin", "admin123", kernel.environment_vars)
+        context = CommandContext(kernel, fs, um, DoubOSShell(kernel, session))
+        processor = CommandProcessor(context)
+        register_utility_commands(processor)
+        context.commands = processor.commands
+
+        fs.mkdir("/p/src/sub", recursive=True)
+        fs.write_file("/p/src/a.py", "import os\nTODO: fix\nx = 1\n# todo later\n")
+        fs.write_file("/p/src/sub/b.py", "def f():\n    return 2  # TODO\n")
+        fs.write_file("/p/src/c.txt", "nothing\n")
+        processor.execute("cd /p")
+
+        # Case, numbering, inversion and counting; colours only outside pipelines
+        assert processor.execute("grep TODO src/a.py") == "\033[91mTODO\033[0m: fix"
+        assert processor.execute("grep -in todo src/a.py | cat") == "2:TODO: fix\n4:# todo later"
+        assert processor.execute("grep -v o src/a.py | cat") == "TODO: fix\nx = 1"
+        assert processor.execute("grep -c TODO src/a.py src/c.txt | cat") == "src/a.py:1\nsrc/c.txt:0"
+        assert processor.execute("grep -ci TODO src/a.py | cat") == "2"
+
+        # Basic, extended and fixed-string patterns
+        assert processor.execute("grep 'f(' src/sub/b.py | cat") == "def f():"
+        assert processor.execute("grep -E '^x|f\\(' src/a.py src/sub/b.py | cat") == "src/a.py:x = 1\nsrc/sub/b.py:def f():"
+        assert processor.execute("grep -F . src/a.py") == ""
+        assert processor.execute("grep 'x\\|im' src/a.py | cat") == "import os\nTODO: fix\nx = 1"
+        assert processor.execute("grep '[' src/a.py").startswith("grep: invalid regular expression")
+        assert compile_pattern("TODO") is compile_pattern("TODO")
+
+        # Recursive search and file names, in path order
+        assert processor.execute("grep -rl TODO .") == "./src/a.py\n./src/sub/b.py"
+        assert processor.execute("grep -rn TODO /p/src | cat") == \
+            "/p/src/a.py:2:TODO: fix\n/p/src/sub/b.py:2:    return 2  # TODO"
+        assert processor.execute("grep TODO src") == "grep: src: Is a directory"
+        assert processor.execute("grep x src/a.py nope | cat") == "src/a.py:TODO: fix\nsrc/a.py:x = 1\n" \
+            "grep: nope: No such file or directory"
+        fs.mkdir("/p/many")
+        for i in range(60):
+            fs.write_file(f"/p/many/f{i:02d}.txt", f"match {i}\n" * (i % 3))
+        expected = [f"/p/many/f{i:02d}.txt:match {i}" for i in range(60) for _ in range(i % 3)]
+        assert processor.execute("grep -r match /p/many | cat").split("\n") == expected
+        assert processor.execute("grep -rc match /p/many | head -3") == \
+            "/p/many/f00.txt:0\n/p/many/f01.txt:1\n/p/many/f02.txt:2"
+
+        # Large files are scanned in blocks; numbers and -m hold across them
+        log = "".join(f"{i} {'ERROR' if i % 1000 == 0 else 'ok'} event\n" for i in range(100000))
+        fs.write_file("/p/big.log", log)
+        assert processor.execute("grep -c ERROR big.log") == "100"
+        assert processor.execute("grep -n -m 2 ERROR big.log | cat") == "1:0 ERROR event\n1001:1000 ERROR event"
+        assert processor.execute("grep -n '^99999.ok' big.log | cat") == "100000:99999 ok event"
+        assert processor.execute("grep -vc ok big.log") == "100"
+        chunks = ["a b\nc", "d\ne", "f\n"]
+        assert list(scan(chunks, compile_pattern("cd"), numbers=True)) == [(2, "cd")]
+        assert list(scan(chunks, compile_pattern("b\\s*c"))) == []  # never across lines
+
+        # Pipelines filter line by line; history's index keeps grep's case rules
+        assert processor.execute("cat big.log | grep -n ERROR | head -2") == "1:0 ERROR event\n1001:1000 ERROR event"
+        for command in ("ls", "LS -l", "cd /etc"):
+            session.add_to_history(command)
+        assert processor.execute("history | grep ls") == "    1  ls"
+        assert processor.execute("history | grep -i ls") == "    1  ls\n    2  LS -l"
+
+        print("✓ grep works")
+        return True
+    except Exception as e:
+        print(f"✗ grep failed: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+
+def test_find():
+    """Test find: predicates, deep trees and wide directories"""
+    print("\nTesting find...")
+    try:
+        import time
+        from kernel import DoubOSKernel, DoubOSShell
+        from filesystem import VirtualFileSystem
+        from users import UserManager
+        from commands import CommandProcessor, CommandContext
+        from utilities import register_utility_commands
+        import find
+
+        kernel = DoubOSKernel()
+        fs = VirtualFileSystem()
+        um = UserManager()
+        context = CommandContext(kernel, fs, um, DoubOSShell(kernel, um.login("admin", "admin123")))
+        processor = CommandProcessor(context)
+        register_utility_commands(processor)
+        context.commands = processor.commands
+
+        fs.mkdir("/p/src/sub", recursive=True)
+        fs.write_file("/p/src/a.py", "x" * 100)
+        fs.write_file("/p/src/sub/b.py", "y" * 3000, "guest")
+        fs.write_file("/p/notes.txt", "")
+        fs.chmod("/p/notes.txt", "rw-r--r--")
+        processor.execute("cd /p")
+
+        # Name and type alone still come from the name index
+        assert processor.execute('find . -name "*.py"') == "/p/src/a.py\n/p/src/sub/b.py"
+        assert processor.execute("find -type d -maxdepth 1") == "/p/src"
+
+        # Every other predicate is tested during the walk, parents first
+        assert processor.execute("find /p -size +2k") == "/p/src/sub/b.py"
+        assert processor.execute("find /p -size 100c") == "/p/src/a.py"
+        assert processor.execute("find /p -type f -size -1") == "/p/notes.txt"
+        assert processor.execute("find /p -user guest") == "/p/src/sub/b.py"
+        assert processor.execute("find /p -perm 644") == "/p/notes.txt"
+        assert processor.execute("find /p -type f -perm /022") == ""
+        assert processor.execute("find /p -perm -755 -maxdepth 2") == "/p/src\n/p/src/a.py\n/p/src/sub"
+        node = fs._get_node("/p/src/a.py")
+        node._mtime = time.time() - 3 * 86400
+        assert processor.execute("find /p -mtime +2") == "/p/src/a.py"
+        assert processor.execute("find /p -type f -mtime -1") == "/p/notes.txt\n/p/src/sub/b.py"
+        assert processor.execute("find /p -type f -newer src/a.py") == "/p/notes.txt\n/p/src/sub/b.py"
+        assert processor.execute("find /p -size +1x") == "find: unknown argument to -size: +1x"
+        assert processor.execute("find /p -newer nope") == "find: 'nope': No such file or directory"
+        assert processor.execute("find /nope -user root") == "find: '/nope': No such file or directory"
+
+        # A subtree too small to hold a match is never entered
+        query = find.Query()
+        query.size("+1M")
+        assert query.prunes(fs._get_node("/p"))
+
+        # Trees deeper than the recursion limit, and wide directories walked in parallel
+        path = "/deep" + "/d" * 1500
+        fs.mkdir(path, recursive=True)
+        fs.write_file(path + "/leaf", "z" * 600)
+        assert processor.execute("find /deep -size +1") == path + "/leaf"
+        fs.mkdir("/wide")
+        for i in range(1000):
+            fs.write_file(f"/wide/f{i:04d}", "w" * (i % 7))
+        expected = [f"/wide/f{i:04d}" for i in range(1000) if i % 7 == 6]
+        assert processor.execute("find /wide -size 6c") == "\n".join(expected)
+        assert processor.execute("find /wide -user root | head -2") == "/wide/f0000\n/wide/f0001"
+
+        print("✓ find works")
+        return True
+    except Exception as e:
+        print(f"✗ find failed: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+
+def test_desktop_terminal():
+    """Test the terminal the desktop opens: Tab completion and Ctrl-R search"""
+    print("\nTesting desktop terminal...")
+    try:
+        import tkinter as tk
+        from kernel import DoubOSKernel
+        from filesystem import VirtualFileSystem
+        from users import UserManager
+        from gui_apps import TerminalApp
+        from gui_desktop import DoubOSDesktop
+
+        kernel = DoubOSKernel()
+        fs = VirtualFileSystem()
+        um = UserManager()
+        try:
+            desktop = DoubOSDesktop(kernel, fs, um, um.login("admin", "admin123"))
+        except tk.TclError:
+            print("✓ No display; desktop terminal skipped")
+            return True
+        try:
+            terminal = desktop.open_terminal()
+            assert isinstance(terminal, TerminalApp)
+            assert terminal.session is not desktop.session
+            assert terminal.input.bind("<Tab>") and terminal.input.bind("<Control-r>")
+
+            # Tab completes the word before the cursor
+            terminal.input.insert(0, "cat /etc/mo")
+            terminal.input.icursor(tk.END)
+            assert terminal.complete() == "break"
+            assert terminal.input.get() == "cat /etc/motd "
+
+            # Ctrl-R shows the newest matching command, then older ones
+            for command in ("ls /tmp", "cat /etc/motd", "ls /home"):
+                terminal.session.add_to_history(command)
+            terminal.input.delete(0, tk.END)
+            terminal.input.insert(0, "ls")
+            assert terminal.reverse_search() == "break"
+            assert terminal.input.get() == "ls /home"
+            terminal.reverse_search()
+            assert terminal.input.get() == "ls /tmp"
+        finally:
+            desktop.root.destroy()
+
+        print("✓ Desktop terminal works")
+        return True
+    except Exception as e:
+        print(f"✗ Desktop terminal failed: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+
+def test_desktop_explorer():
+    """Test the explorer the desktop opens: rows follow changes to its directory"""
+    print("\nTesting desktop file explorer...")
+    try:
+        import tkinter as tk
+        from kernel import DoubOSKernel
+        from filesystem import VirtualFileSystem
+        from users import UserManager
+        from gui_apps import FileExplorerApp
+        from gui_desktop import DoubOSDesktop
+
+        kernel = DoubOSKernel()
+        fs = VirtualFileSystem()
+        um = UserManager()
+        try:
+            desktop = DoubOSDesktop(kernel, fs, um, um.login("admin", "admin123"))
+        except tk.TclError:
+            print("✓ No display; desktop file explorer skipped")
+            return True
+        try:
+            explorer = desktop.open_file_explorer()
+            assert isinstance(explorer, FileExplorerApp)
+            explorer.navigate_to("/tmp")
+            assert explorer.watch.path == "/tmp"
+
+            # The dispatcher thread only queues; the Tk thread applies
+            fs.write_file("/tmp/new.txt", "x")
+            explorer.apply_changes(explorer.changes.get(timeout=2))
+            assert "📝 new.txt" in explorer.file_list.get(0, tk.END)
+            fs.remove("/tmp/new.txt")
+            explorer.apply_changes(explorer.changes.get(timeout=2))
+            assert "📝 new.txt" not in explorer.file_list.get(0, tk.END)
+        finally:
+            desktop.root.destroy()
+
+        print("✓ Desktop file explorer works")
+        return True
+    except Exception as e:
+        print(f"✗ Desktop file explorer failed: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+
+def test_pipelines():
+    """Test pipes and output redirection"""
+    print("\nTesting pipelines...")
+    try:
+        import itertools
+        from kernel import DoubOSKernel, DoubOSShell
+        from filesystem import VirtualFileSystem
+        from users import UserManager
+        from commands import Command, CommandProcessor, CommandContext
+        from utilities import register_utility_commands
+        
+        kernel = DoubOSKernel()
+        fs = VirtualFileSystem()
+        um = UserManager()
+        context = CommandContext(kernel, fs, um, DoubOSShell(kernel, um.login("admin", "admin123")))
+        processor = CommandProcessor(context)
+        context.commands = processor.commands
+        register_utility_commands(processor)
+        
+        # Redirection writes through the VFS
+        assert processor.execute("echo hello world > /tmp/out.txt") == ""
+        assert fs.read_file("/tmp/out.txt") == "hello world\n"
+        processor.execute("echo again >>/tmp/out.txt")
+        assert fs.read_file("/tmp/out.txt") == "hello world\nagain\n"
+        assert fs._get_node("/tmp/out.txt").owner == "admin"
+        anonymous = CommandProcessor(CommandContext(kernel, fs, um, DoubOSShell(kernel)))
+        register_utility_commands(anonymous)
+        anonymous.execute("echo hi > /tmp/anon.txt")
+        assert fs._get_node("/tmp/anon.txt").owner == "guest"
+        processor.execute("echo replaced > /tmp/out.txt")
+        assert fs.read_file("/tmp/out.txt") == "replaced\n"
+        assert "cannot create" in processor.execute("echo x > /nope/out.txt")
+        
+        # Filters stream line by line
+        log = "".join(f"{i} {'ERROR' if i % 3 == 0 else 'ok'} event\n" for i in range(30))
+        fs.write_file("/var/log/app.log", log)
+        assert processor.execute("cat /var/log/app.log | grep -i error | head -2") == "0 ERROR event\n3 ERROR event"
+        assert processor.execute("grep ERROR /var/log/app.log | tail -n 1") == "27 ERROR event"
+        assert processor.execute("cat /var/log/app.log | wc").split() == ["30", "90", str(len(log))]
+        assert processor.execute("cat /var/log/app.log | head -n 3 | tail -1") == "2 ok event"
+        
+        # String-returning commands join pipelines unchanged
+        assert processor.execute("ls /home | grep adm") == "\033[94madmin/\033[0m  \033[94mguest/\033[0m"
+        assert processor.execute("pwd | cat") == "/home/admin"
+        
+        # Stages only run as far as they are read
+        class YesCommand(Command):
+            def __init__(self):
+                super().__init__("yes", "Repeat a line forever", "yes")
+                
+            def stream(self, args, context, stdin=None):
+                return itertools.repeat("y")
+        processor.register_command(YesCommand())
+        assert processor.execute("yes | grep y | head -3") == "y\ny\ny"
+        
+        # Large output is written in blocks
+        processor.REDIRECT_BLOCK = 16
+        processor.execute("cat /var/log/app.log | grep ok >> /tmp/ok.txt")
+        assert fs.read_file("/tmp/ok.txt") == "".join(l + "\n" for l in log.splitlines() if "ok" in l)
+        
+        # Quoted operators are plain text; bad syntax is reported
+        assert processor.execute('echo "a | b > c"') == '"a | b > c"'
+        assert "syntax error" in processor.execute("ls |")
+        assert "syntax error" in processor.execute("echo a >")
+        assert "Command not found" in processor.execute("ls | nosuch")
+        
+        # Apostrophes inside words do not open a quote
+        assert processor.execute("echo don't panic") == "don't panic"
+        assert processor.execute("echo it's | cat") == "it's"
+        assert "unterminated quote" in processor.execute("echo 'a | b")
+        
+        print("✓ Pipelines work")
+        return True
+    except Exception as e:
+        print(f"✗ Pipelines failed: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+
+def test_batch_mode():
+    """Test non-interactive script runs and their report"""
+    print("\nTesting batch mode...")
+    try:
+        import os
+        import subprocess
+        import sys
+        from batch import parse_script, percentile, run_script
+        from doubos import DoubOS
+        
+        assert parse_script("# setup\n  mkdir /tmp/b \n\nls /tmp\n") == ["mkdir /tmp/b", "ls /tmp"]
+        assert percentile([1, 2, 3, 4], 0.5) == 2 and percentile([1, 2, 3, 4], 0.99) == 4
+        assert percentile([], 0.5) == 0.0
+        
+        doubos = DoubOS()
+        assert not doubos.login("admin", "wrong")
+        assert doubos.login("admin", "admin123")
+        assert doubos.context.current_dir == "/home/admin"
+        doubos.kernel.boot(verbose=False)
+        script = ["echo x%d > /tmp/f%d.txt" % (i, i) for i in range(200)] + ["cat /tmp/f7.txt", "exit", "pwd"]
+        report = doubos.run_batch(script, quiet=True)
+        assert report.count == 202  # stops at exit
+        assert doubos.filesystem.read_file("/tmp/f199.txt") == "x199\n"
+        assert len(report.by_command["echo"]) == 200
+        assert "commands/s" in report.format() and "p99" in report.format()
+        assert len(doubos.session.history) == 202
+        
+        # The entry point runs a script from stdin with no prompts
+        result = subprocess.run(
+            [sys.executable, "doubos.py", "--script", "-", "--user", "admin", "--password", "admin123"],
+            input="cd /etc\npwd\ncat motd | head -1\n", capture_output=True, text=True, timeout=60,
+            cwd=os.path.dirname(os.path.abspath(__file__)))
+        assert result.returncode == 0, result.stderr
+        assert result.stdout == "/etc\nWelcome to DoubOS!\n"
+        assert "Batch: 3 commands" in result.stderr
+        
+        result = subprocess.run(
+            [sys.executable, "doubos.py", "--script", "-", "--user", "admin", "--password", "nope"],
+            input="pwd\n", capture_output=True, text=True, timeout=60,
+            cwd=os.path.dirname(os.path.abspath(__file__)))
+        assert result.returncode == 2 and result.stdout == ""
+        
+        print("✓ Batch mode works")
+        return True
+    except Exception as e:
+        print(f"✗ Batch mode failed: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+
+def test_shell_server():
+    """Test concurrent sessions served over a socket"""
+    print("\nTesting shell server...")
+    try:
+        import asyncio
+        import time
+        from commands import Command
+        from server import ShellServer, encode_reply
+        from loadgen import _read_reply, run_load
+
+        assert encode_reply(".hidden\nx") == b"..hidden\nx\n.\n"
+        assert encode_reply(None) == b".\n"
+
+        class SlowCommand(Command):
+            def __init__(self):
+                super().__init__("slow", "Sleep for a while", "slow")
+
+            def execute(self, args, context):
+                time.sleep(0.5)
+                return "done"
+
+        async def scenario():
+            server = ShellServer()
+            await server.start("127.0.0.1", 0)
+            port = server.address[1]
+
+            async def connect(user, password):
+                reader, writer = await asyncio.open_connection("127.0.0.1", port)
+                await _read_reply(reader)
+
+                async def send(line):
+                    writer.write((line + "\n").encode())
+                    return await _read_reply(reader)
+                assert (await send(f"login {user} {password}")).startswith("✓")
+                return send, writer
+
+            try:
+                admin, admin_writer = await connect("admin", "admin123")
+                guest, guest_writer = await connect("guest", "guest")
+
+                # Each session has its own user, directory, environment and history
+                assert await admin("whoami") == "admin" and await guest("whoami") == "guest"
+                await admin("cd /etc")
+                assert await admin("pwd") == "/etc" and await guest("pwd") == "/home/guest"
+                assert "Permission denied" in await guest("format")
+                await guest("echo from guest > /tmp/shared.txt")
+                assert await admin("cat /tmp/shared.txt") == "from guest"
+                assert "cd /etc" in await admin("history") and "cd /etc" not in await guest("history")
+
+                # A slow command does not hold up other sessions
+                for session in server.sessions:
+                    session.processor.register_command(SlowCommand())
+                started = time.perf_counter()
+                slow = asyncio.ensure_future(admin("slow"))
+                await asyncio.sleep(0.05)
+                assert await guest("pwd") == "/home/guest"
+                assert time.perf_counter() - started < 0.4
+                assert await slow == "done"
+
+                # exit ends only that session
+                await guest("exit")
+                assert await guest_writer.drain() is None
+                assert await admin("pwd") == "/etc"
+                assert server.kernel.running
+                admin_writer.close()
+
+                # Unknown logins are refused
+                reader, writer = await asyncio.open_connection("127.0.0.1", port)
+                await _read_reply(reader)
+                writer.write(b"pwd\nlogin admin nope\n")
+                assert "Not logged in" in await _read_reply(reader)
+                assert "Login failed" in await _read_reply(reader)
+                writer.close()
+
+                report = await run_load(40, port=port)
+                assert not report.errors, report.errors
+                assert len(report.logins) == 40 and len(report.latencies) == 400
+                assert "p99" in report.format()
+            finally:
+                await server.close()
+
+        asyncio.run(scenario())
+        print("✓ Shell server works")
+        return True
+    except Exception as e:
+        print(f"✗ Shell server failed: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+
+def test_dangerous_commands():
+    """Test dangerous commands"""
+    print("\nTesting dangerous commands...")
+    try:
+        from kernel import DoubOSKernel, DoubOSShell
+        from filesystem import VirtualFileSystem
+        from users import UserManager
+        from commands import CommandProcessor, CommandContext
+        from dangerous_commands import register_dangerous_commands
+        
+        kernel = DoubOSKernel()
+        fs = VirtualFileSystem()
+        um = UserManager()
+        shell = DoubOSShell(kernel, um.login("admin", "admin123"))
+        
+        context = CommandContext(kernel, fs, um, shell)
+        processor = CommandProcessor(context)
+        register_dangerous_commands(processor)
+        context.commands = processor.commands
+        
+        # Test format command exists
+        assert "format" in processor.commands
+        assert "nuke" in processor.commands
+        assert "shred" in processor.commands
+        
+        # Each wipe takes an automatic snapshot; only the newest are kept
+        fs.create_snapshot("mine")
+        for i in range(fs.AUTO_SNAPSHOTS + 1):
+            fs.mkdir(f"/tmp/w{i}")
+            assert "Wiped" in processor.execute(f"wipe /tmp/w{i} --confirm")
+        autos = [snap for snap in fs.list_snapshots() if snap.auto]
+        assert [snap.note for snap in autos] == [f"before wipe /tmp/w{i}"
+                                                 for i in range(1, fs.AUTO_SNAPSHOTS + 1)]
+        assert "mine" in fs.snapshots
+        assert fs.restore_snapshot(autos[0].name) and fs.exists("/tmp/w1")
+        
+        # snapshot rm drops one by name
+        assert "Removed" in processor.execute(f"snapshot rm {autos[0].name}")
+        assert autos[0].name not in fs.snapshots
+        assert "no such snapshot" in processor.execute(f"snapshot rm {autos[0].name}")
         
         print("✓ Dangerous commands registered")
         return True
@@ -191,8 +2117,35 @@ def main():
         test_imports,
         test_kernel,
         test_filesystem,
+        test_path_cache,
+        test_journal,
+        test_deferred_hydration,
+        test_blob_store,
+        test_directory_totals,
+        test_chunked_content,
+        test_compact_nodes,
+        test_content_index,
+        test_name_index,
+        test_snapshots,
+        test_concurrency,
+        test_binary_image,
+        test_mount,
+        test_file_handles,
         test_users,
         test_commands,
+        test_sessions,
+        test_command_history,
+        test_completion,
+        test_watches,
+        test_job_control,
+        test_archives,
+        test_grep,
+        test_find,
+        test_desktop_terminal,
+        test_desktop_explorer,
+        test_pipelines,
+        test_batch_mode,
+        test_shell_server,
         test_dangerous_commands
     ]
     
@@ -8,6 +8,7 @@ import time
 from kernel import DoubOSKernel
 from filesystem import VirtualFileSystem
 from users import UserManager
+from session import Session
 from gui_login import LoginScreen
 from gui_desktop import DoubOSDesktop
 
@@ -53,7 +54,6 @@ def main():
     
     if user:
         print(f"  ✓ Logged in as: {user.username} (Admin: {user.is_admin})")
-        kernel.current_user = user.username
     else:
         print("  ✗ Login failed")
         return
@@ -61,7 +61,8 @@ def main():
     # Launch desktop
     print("\n🖥️  PHASE 4: Loading desktop environment...")
     try:
-        desktop = DoubOSDesktop(kernel, filesystem, user_manager)
+        desktop = DoubOSDesktop(kernel, filesystem, user_manager,
+                                Session(user, kernel.environment_vars))
         print("  ✓ Desktop created")
         print(f"  ✓ Window manager initialized")
         print(f"  ✓ Colors: {len(desktop.colors)} themes loaded")
@@ -6,9 +6,12 @@ Handles user authentication, permissions, and sessions
 import hashlib
 import json
 import os
+import threading
 from datetime import datetime
 from typing import Dict, List, Optional
 
+from session import Session
+
 
 class User:
     """Represents a system user"""
@@ -63,12 +66,17 @@ class User:
 
 
 class UserManager:
-    """Manages system users and authentication"""
+    """Manages system users and authentication
+    
+    Shared by every session: who is logged in where is kept by the
+    Session objects that login() hands out, not here.
+    """
     
     def __init__(self):
         self.users: Dict[str, User] = {}
         self.next_uid = 1000
-        self.current_session = None
+        # Serializes account changes made from concurrent sessions
+        self._lock = threading.RLock()
         self.initialize_default_users()
         
     def initialize_default_users(self):
@@ -85,50 +93,40 @@ class UserManager:
         
     def add_user(self, username: str, password: str, is_admin: bool = False) -> bool:
         """Add a new user"""
-        if username in self.users:
-            return False
-            
         password_hash = hashlib.sha256(password.encode()).hexdigest()
-        user = User(username, password_hash, self.next_uid, is_admin=is_admin)
-        self.users[username] = user
-        self.next_uid += 1
+        with self._lock:
+            if username in self.users:
+                return False
+            user = User(username, password_hash, self.next_uid, is_admin=is_admin)
+            self.users[username] = user
+            self.next_uid += 1
         return True
         
     def remove_user(self, username: str) -> bool:
         """Remove a user"""
-        if username == "root" or username not in self.users:
-            return False
-        del self.users[username]
+        with self._lock:
+            if username == "root" or username not in self.users:
+                return False
+            del self.users[username]
         return True
         
     def authenticate(self, username: str, password: str) -> Optional[User]:
         """Authenticate user with password"""
         user = self.users.get(username)
         if user and user.verify_password(password):
-            user.last_login = datetime.now()
-            user.login_count += 1
+            with self._lock:
+                user.last_login = datetime.now()
+                user.login_count += 1
             return user
         return None
         
-    def login(self, username: str, password: str) -> bool:
-        """Login user"""
+    def login(self, username: str, password: str,
+              environment: Optional[Dict[str, str]] = None) -> Optional[Session]:
+        """Authenticate and open a new session (None if the login fails)"""
         user = self.authenticate(username, password)
         if user:
-            self.current_session = user
-            return True
-        return False
-        
-    def logout(self):
-        """Logout current user"""
-        self.current_session = None
-        
-    def get_current_user(self) -> Optional[User]:
-        """Get currently logged in user"""
-        return self.current_session
-        
-    def is_admin(self) -> bool:
-        """Check if current user is admin"""
-        return self.current_session and self.current_session.is_admin
+            return Session(user, environment)
+        return None
         
     def change_password(self, username: str, old_password: str, new_password: str) -> bool:
         """Change user password"""
@@ -146,19 +144,33 @@ class UserManager:
         """Get user by username"""
         return self.users.get(username)
         
-    def save_to_disk(self, filepath: str):
-        """Save users to disk"""
+    def save_to_disk(self, filepath: str, binary: Optional[bool] = None):
+        """Save users to disk (as a binary image for .dimg paths or binary=True)"""
+        import image_format
+        
         data = {username: user.to_dict() for username, user in self.users.items()}
+        if binary is None:
+            binary = image_format.is_binary_path(filepath)
+        if binary:
+            with open(filepath, 'wb') as f:
+                f.write(image_format.encode_users(data))
+            return
         with open(filepath, 'w') as f:
             json.dump(data, f, indent=2)
             
     def load_from_disk(self, filepath: str):
-        """Load users from disk"""
+        """Load users from disk (JSON or binary, detected from the file)"""
+        import image_format
+        
         if os.path.exists(filepath):
-            with open(filepath, 'r') as f:
-                data = json.load(f)
-                self.users = {username: User.from_dict(user_data) 
-                             for username, user_data in data.items()}
-                # Update next_uid
-                if self.users:
-                    self.next_uid = max(user.uid for user in self.users.values()) + 1
+            if image_format.is_binary_file(filepath):
+                with open(filepath, 'rb') as f:
+                    data = image_format.decode_users(f.read())
+            else:
+                with open(filepath, 'r') as f:
+                    data = json.load(f)
+            self.users = {username: User.from_dict(user_data) 
+                         for username, user_data in data.items()}
+            # Update next_uid
+            if self.users:
+                self.next_uid = max(user.uid for user in self.users.values()) + 1
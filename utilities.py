@@ -3,9 +3,23 @@ DoubOS - Advanced Features and Utilities
 Network simulation, package manager, and more
 """
 
-from commands import Command, CommandContext
-from typing import List
+from commands import Command, CommandContext, file_lines
+from archive import HOST_PREFIX, open_archive
+from archive import create as create_archive, extract as extract_archive, members as archive_members
+from filesystem import _mode_to_permissions
+from find import Query, walk as find_walk
+from grep import BASIC, EXTENDED, FIXED, compile_pattern, folded, literal_text, ordered_map, scan, scan_lines
+from typing import Iterator, List, Optional, Tuple
+from collections import deque
+import io
+import itertools
+import os
+import posixpath
 import random
+import re
+import tarfile
+import threading
+import zlib
 from datetime import datetime
 
 
@@ -59,7 +73,7 @@ class WgetCommand(Command):
         
         # Actually create the file
         content = f"Downloaded from {url}\nSize: {size} bytes\n"
-        user = context.user_manager.get_current_user()
+        user = context.session.user
         owner = user.username if user else "guest"
         target = context.current_dir.rstrip("/") + "/" + filename
         context.filesystem.write_file(target, content, owner)
@@ -163,107 +177,393 @@ Removing {package} ...
 
 
 class GrepCommand(Command):
-    """Search for patterns in files"""
+    """Search files or input lines for a regular expression"""
+    
+    USAGE = "grep [-i] [-n] [-c] [-v] [-l] [-r] [-E|-F] [-m N] <pattern> [<file|dir>...]"
     
     def __init__(self):
-        super().__init__("grep", "Search for pattern in file", "grep <pattern> <file>")
+        super().__init__("grep", "Search for pattern in files", self.USAGE)
         
     def execute(self, args: List[str], context: CommandContext) -> str:
-        if len(args) < 2:
-            return "grep: missing pattern or file"
-            
-        pattern = args[0]
-        target = args[1]
+        return "\n".join(self.search(args, context, None, colour=True))
         
-        if not target.startswith("/"):
-            target = context.current_dir.rstrip("/") + "/" + target
-            
-        content = context.filesystem.read_file(target)
-        if content is None:
-            return f"grep: {args[1]}: No such file"
+    def stream(self, args: List[str], context: CommandContext,
+               stdin: Optional[Iterator[str]] = None) -> Iterator[str]:
+        # In a pipeline, lines are passed on as found (without colours) so
+        # that a later stage can stop reading early
+        return self.search(args, context, stdin, colour=False)
+        
+    @classmethod
+    def parse(cls, args: List[str]):
+        """(flags, max count, pattern, operands) from grep arguments, or an error string"""
+        flags = set()
+        limit = pattern = None
+        operands = []
+        i = 0
+        while i < len(args):
+            arg = args[i]
+            i += 1
+            if arg == "--":
+                operands.extend(args[i:])
+                break
+            if not arg.startswith("-") or arg == "-":
+                operands.append(arg)
+                continue
+            for j, flag in enumerate(arg[1:], 2):
+                if flag in "me":
+                    # The value is the rest of the argument or the next one
+                    value = arg[j:]
+                    if not value:
+                        if i >= len(args):
+                            return f"grep: option requires an argument -- '{flag}'"
+                        value = args[i]
+                        i += 1
+                    if flag == "e":
+                        pattern = value
+                    elif value.isdigit():
+                        limit = int(value)
+                    else:
+                        return f"grep: invalid max count: '{value}'"
+                    break
+                if flag not in "incvlrREF":
+                    return f"grep: invalid option -- '{flag}'\nUsage: {cls.USAGE}"
+                flags.add(flag)
+        if pattern is None:
+            if not operands:
+                return "grep: missing pattern or file"
+            pattern = operands.pop(0)
+            if len(pattern) > 1 and pattern[0] == pattern[-1] and pattern[0] in "\"'":
+                pattern = pattern[1:-1]
+        return flags, limit, pattern, operands
+        
+    def search(self, args: List[str], context: CommandContext,
+               stdin: Optional[Iterator[str]], colour: bool) -> Iterator[str]:
+        parsed = self.parse(args)
+        if isinstance(parsed, str):
+            yield parsed
+            return
+        flags, limit, pattern, operands = parsed
+        syntax = FIXED if "F" in flags else EXTENDED if "E" in flags else BASIC
+        try:
+            regex = compile_pattern(pattern, syntax, "i" in flags)
+        except re.error as e:
+            yield f"grep: invalid regular expression: {e}"
+            return
+        lowered = folded(pattern, syntax) if "i" in flags else None
+        recursive = bool(flags & {"r", "R"})
+        if "l" in flags:
+            # One match decides
+            limit = 1
+        
+        if not operands:
+            if stdin is not None and not recursive:
+                yield from self.report("(standard input)", False, scan_lines(stdin, regex, "v" in flags, limit),
+                                       regex, flags, colour)
+                return
+            if not recursive:
+                yield "grep: missing pattern or file"
+                return
+            operands = ["."]
             
-        # Simple pattern matching
-        lines = content.split("\n")
-        matches = [line for line in lines if pattern.lower() in line.lower()]
+        fs = context.filesystem
+        # Unless every file is reported (-v, -c), only the files the content
+        # index says may contain a plain-text pattern need to be read
+        needle = literal_text(pattern, syntax) if not flags & {"v", "c"} else None
         
-        if not matches:
-            return ""
+        def targets() -> Iterator[Tuple[str, Optional[str], bool]]:
+            """(name shown, path to scan or None for an error line, name prefixed) in output order"""
+            named = len(operands) > 1
+            for operand in operands:
+                path = operand if operand.startswith("/") else context.current_dir.rstrip("/") + "/" + operand
+                path = posixpath.normpath(path).replace("//", "/")
+                if not fs.is_directory(path):
+                    yield operand, path, named
+                elif not recursive:
+                    yield f"grep: {operand}: Is a directory", None, named
+                else:
+                    if needle:
+                        files = fs.content_candidates(needle, path) or []
+                    else:
+                        files = fs.find(path, None, "f") or []
+                    shown, base = operand.rstrip("/"), path.rstrip("/")
+                    for file_path in files:
+                        yield shown + file_path[len(base):], file_path, True
+                        
+        stop = threading.Event()
+        
+        def file_output(target) -> Iterator[str]:
+            shown, path, named = target
+            if path is None:
+                yield shown
+                return
+            chunks = fs.read_chunks(path)
+            if chunks is None:
+                yield f"grep: {shown}: No such file or directory"
+                return
+            first = next(chunks, "")
+            matches = scan(itertools.chain((first,), chunks), regex, "v" in flags, limit,
+                           "n" in flags, stop, lowered)
+            if "\0" in first[:8192] and not flags & {"c", "l"}:
+                if next(matches, None) is not None:
+                    yield f"Binary file {shown} matches"
+                return
+            yield from self.report(shown, named, matches, regex, flags, colour)
             
-        # Highlight matches
-        result = []
-        for line in matches:
-            highlighted = line.replace(pattern, f"\033[91m{pattern}\033[0m")
-            result.append(highlighted)
+        items = targets()
+        head = list(itertools.islice(items, 2))
+        if len(head) == 1:
+            # One file: its lines are passed on as they are found
+            yield from file_output(head[0])
+            return
+        # Several files: scanned side by side on the worker pool, reported in order
+        results = ordered_map(lambda target: list(file_output(target)), itertools.chain(head, items), stop)
+        try:
+            for lines in results:
+                yield from lines
+        finally:
+            results.close()
             
-        return "\n".join(result)
+    @staticmethod
+    def report(shown: str, named: bool, matches: Iterator[Tuple[int, str]], regex,
+               flags: set, colour: bool) -> Iterator[str]:
+        """Output lines for the matches in one file"""
+        if "l" in flags:
+            if next(matches, None) is not None:
+                yield shown
+            return
+        if colour:
+            prefix = f"\033[95m{shown}\033[0m:" if named else ""
+        else:
+            prefix = f"{shown}:" if named else ""
+        if "c" in flags:
+            yield f"{prefix}{sum(1 for _ in matches)}"
+            return
+        highlight = colour and "v" not in flags
+        for number, line in matches:
+            if highlight:
+                line = regex.sub(lambda found: f"\033[91m{found.group()}\033[0m" if found.group() else "", line)
+            if "n" in flags:
+                line = (f"\033[92m{number}\033[0m:" if colour else f"{number}:") + line
+            yield prefix + line
 
 
 class FindCommand(Command):
     """Find files in directory hierarchy"""
     
+    USAGE = ("find [path] [-name <glob>] [-type f|d] [-size [+-]N[ckMG]] [-mtime [+-]N] "
+             "[-newer <file>] [-user <name>] [-perm [-/]<mode>] [-maxdepth N]")
+    
+    # Query method behind each predicate
+    PREDICATES = {
+        "-name": "name", "-type": "type", "-size": "size", "-mtime": "mtime",
+        "-user": "user", "-perm": "perm", "-maxdepth": "depth",
+    }
+    
     def __init__(self):
-        super().__init__("find", "Search for files", "find <path> -name <pattern>")
+        super().__init__("find", "Search for files", self.USAGE)
         
     def execute(self, args: List[str], context: CommandContext) -> str:
-        if not args:
-            return "find: missing path"
-            
-        path = args[0]
+        return "\n".join(self.stream(args, context))
+        
+    def parse(self, args: List[str], context: CommandContext):
+        """(path, Query) from find arguments, or an error string"""
+        path = context.current_dir
+        if args and not args[0].startswith("-"):
+            path = args[0]
+            args = args[1:]
+        query = Query()
+        while args:
+            option = args[0]
+            if option != "-newer" and option not in self.PREDICATES:
+                return f"find: unknown predicate '{option}'"
+            if len(args) < 2:
+                return f"find: missing argument to '{option}'"
+            value = args[1]
+            args = args[2:]
+            if len(value) > 1 and value[0] == value[-1] and value[0] in "\"'":
+                value = value[1:-1]
+            if option == "-newer":
+                reference = context.filesystem._get_node(self.resolve(value, context))
+                if reference is None:
+                    return f"find: '{value}': No such file or directory"
+                query.newer(reference.mtime)
+                continue
+            try:
+                getattr(query, self.PREDICATES[option])(value)
+            except ValueError:
+                return f"find: unknown argument to {option}: {value}"
+        return self.resolve(path, context), query
+        
+    @staticmethod
+    def resolve(path: str, context: CommandContext) -> str:
         if not path.startswith("/"):
             path = context.current_dir.rstrip("/") + "/" + path
-            
-        # Simple implementation - just list all files recursively
-        def find_recursive(node_path, results):
-            node = context.filesystem._get_node(node_path)
-            if node and node.is_directory:
-                for child_name, child in node.children.items():
-                    child_path = node_path.rstrip("/") + "/" + child_name
-                    results.append(child_path)
-                    if child.is_directory:
-                        find_recursive(child_path, results)
-                        
-        results = []
-        find_recursive(path, results)
+        return posixpath.normpath(path).replace("//", "/")
         
-        # Filter by pattern if provided
-        if "-name" in args:
-            try:
-                idx = args.index("-name")
-                if idx + 1 < len(args):
-                    pattern = args[idx + 1]
-                    results = [r for r in results if pattern in r]
-            except:
-                pass
-                
-        return "\n".join(results) if results else ""
+    def stream(self, args: List[str], context: CommandContext,
+               stdin: Optional[Iterator[str]] = None) -> Iterator[str]:
+        parsed = self.parse(args, context)
+        if isinstance(parsed, str):
+            yield parsed
+            return
+        path, query = parsed
+        fs = context.filesystem
+        if query.indexed:
+            # Name and type filters are answered by the filesystem's name index
+            results = fs.find(path, query.pattern, query.file_type)
+            if results is None:
+                yield f"find: '{path}': No such file or directory"
+            elif query.maxdepth is None:
+                yield from results
+            else:
+                top = 0 if path == "/" else path.count("/")
+                yield from (result for result in results if result.count("/") - top <= query.maxdepth)
+            return
+        if not fs.exists(path):
+            yield f"find: '{path}': No such file or directory"
+            return
+        # Everything else is tested during a walk, which prints matches as it finds them
+        yield from find_walk(fs, path, query)
 
 
 class TarCommand(Command):
-    """Archive files"""
+    """Create, list and extract tar archives of VFS subtrees"""
+    
+    USAGE = "tar -c|-t|-x [-z] [-v] -f <archive> [-C <dir>] [<paths>]"
     
     def __init__(self):
-        super().__init__("tar", "Archive utility", "tar -czf <archive.tar.gz> <files>")
+        super().__init__("tar", "Archive utility", self.USAGE)
         
     def execute(self, args: List[str], context: CommandContext) -> str:
-        if len(args) < 3:
-            return "tar: missing arguments\nUsage: tar -czf archive.tar.gz file1 file2 ..."
-            
-        if args[0] not in ["-czf", "-xzf"]:
-            return "tar: invalid option (use -czf to create or -xzf to extract)"
+        return "\n".join(self.stream(args, context))
+        
+    @staticmethod
+    def parse(args: List[str]):
+        """(mode, flags, archive, directory, paths) from tar arguments, or an error string"""
+        flags = set()
+        archive = directory = None
+        paths = []
+        i = 0
+        while i < len(args):
+            arg = args[i]
+            i += 1
+            if arg == "-C" and i < len(args):
+                directory = args[i]
+                i += 1
+            elif arg.startswith("-") and len(arg) > 1 or i == 1 and set(arg) <= set("ctxzvf"):
+                for flag in arg.lstrip("-"):
+                    if flag not in "ctxzvf":
+                        return f"tar: invalid option -- '{flag}'"
+                    if flag == "f":
+                        if i >= len(args):
+                            return "tar: option requires an argument -- 'f'"
+                        archive = args[i]
+                        i += 1
+                    flags.add(flag)
+            else:
+                paths.append(arg)
+        modes = flags & set("ctx")
+        if len(modes) != 1:
+            return f"tar: you must specify one of -c, -t, -x\nUsage: {TarCommand.USAGE}"
+        if archive is None:
+            return "tar: an archive must be given with -f"
+        return modes.pop(), flags, archive, directory, paths
+        
+    def stream(self, args: List[str], context: CommandContext,
+               stdin: Optional[Iterator[str]] = None) -> Iterator[str]:
+        parsed = self.parse(args)
+        if isinstance(parsed, str):
+            yield parsed
+            return
+        mode, flags, archive, directory, paths = parsed
+        
+        def resolve(path: str) -> str:
+            if not path.startswith("/"):
+                path = (directory or context.current_dir).rstrip("/") + "/" + path
+            return posixpath.normpath(path).replace("//", "/")
             
-        archive_name = args[1]
-        
-        if args[0] == "-czf":
-            # Create archive
-            files = args[2:]
-            return f"""tar: Creating archive '{archive_name}'
-tar: Adding {len(files)} file(s)...
-tar: {archive_name} created successfully ({random.randint(1024, 102400)} bytes)"""
+        if directory is not None:
+            directory = resolve(directory)
+        if archive.startswith(HOST_PREFIX):
+            if not context.session.is_admin:
+                yield "❌ Permission denied: host archives require administrator privileges"
+                return
         else:
-            # Extract archive
-            return f"""tar: Extracting '{archive_name}'...
-tar: Extracted {random.randint(1, 10)} file(s)
-tar: Done"""
+            archive = posixpath.normpath(archive if archive.startswith("/") else
+                                         context.current_dir.rstrip("/") + "/" + archive).replace("//", "/")
+        fs = context.filesystem
+        owner = context.session.username or "root"
+        try:
+            if mode == "c":
+                yield from self.create(fs, archive, [resolve(path) for path in paths], paths,
+                                       "z" in flags, "v" in flags, owner)
+            elif mode == "t":
+                yield from self.list(fs, archive, "v" in flags)
+            else:
+                yield from self.extract(fs, archive, directory or context.current_dir,
+                                        "v" in flags, owner)
+        except (tarfile.TarError, OSError, EOFError, zlib.error) as e:
+            yield f"tar: {archive}: {e}"
+            
+    def create(self, fs, archive: str, sources: List[str], names: List[str],
+               compress: bool, verbose: bool, owner: str) -> Iterator[str]:
+        if not sources:
+            yield "tar: refusing to create an empty archive"
+            return
+        for source, name in zip(sources, names):
+            if not fs.exists(source):
+                yield f"tar: {name}: No such file or directory"
+                return
+        # Member names are relative, as given
+        pairs = [(source, posixpath.normpath(name).lstrip("/") or ".")
+                 for source, name in zip(sources, names)]
+        output = open_archive(fs, archive, write=True, owner=owner)
+        if output is None:
+            yield f"tar: {archive}: Cannot open"
+            return
+        files = size = 0
+        with output:
+            for info in create_archive(fs, output, pairs, compress, skip=archive):
+                if info.isfile():
+                    files += 1
+                    size += info.size
+                if verbose:
+                    yield info.name + ("/" if info.isdir() else "")
+        yield f"📦 Created {archive}: {files} file(s), {size:,} bytes archived"
+        
+    def list(self, fs, archive: str, verbose: bool) -> Iterator[str]:
+        handle = open_archive(fs, archive)
+        if handle is None:
+            yield f"tar: {archive}: Cannot open: No such file or directory"
+            return
+        with handle:
+            for info in archive_members(handle):
+                name = info.name + ("/" if info.isdir() else "")
+                if verbose:
+                    kind = "d" if info.isdir() else "-"
+                    date = datetime.fromtimestamp(info.mtime).strftime("%Y-%m-%d %H:%M")
+                    yield f"{kind}{_mode_to_permissions(info.mode)} {info.uname or info.uid:8} {info.size:10} {date} {name}"
+                else:
+                    yield name
+                    
+    def extract(self, fs, archive: str, target: str, verbose: bool, owner: str) -> Iterator[str]:
+        if not fs.is_directory(target):
+            yield f"tar: {target}: Cannot open: No such directory"
+            return
+        handle = open_archive(fs, archive)
+        if handle is None:
+            yield f"tar: {archive}: Cannot open: No such file or directory"
+            return
+        files = 0
+        with handle:
+            for info, problem in extract_archive(fs, handle, target, owner):
+                if problem:
+                    yield f"tar: {info.name}: {problem}"
+                    continue
+                files += info.isfile()
+                if verbose:
+                    yield info.name + ("/" if info.isdir() else "")
+        yield f"📦 Extracted {files} file(s) into {target}"
 
 
 class ChmodCommand(Command):
@@ -282,12 +582,27 @@ class ChmodCommand(Command):
         if not target.startswith("/"):
             target = context.current_dir.rstrip("/") + "/" + target
             
-        node = context.filesystem._get_node(target)
-        if node:
-            # Simulated - just acknowledge
+        permissions = self.parse_mode(mode)
+        if permissions is None:
+            return f"chmod: invalid mode: '{mode}'"
+            
+        if context.filesystem.chmod(target, permissions):
             return None
         else:
             return f"chmod: cannot access '{args[1]}': No such file or directory"
+            
+    @staticmethod
+    def parse_mode(mode: str):
+        """Convert an octal (755) or symbolic (rwxr-xr-x) mode to rwx form"""
+        if len(mode) == 9 and all(c in (flag, "-") for c, flag in zip(mode, "rwxrwxrwx")):
+            return mode
+        if mode.isdigit() and len(mode) in (3, 4) and all(c in "01234567" for c in mode):
+            bits = mode[-3:]
+            return "".join(
+                ("r" if int(d) & 4 else "-") + ("w" if int(d) & 2 else "-") + ("x" if int(d) & 1 else "-")
+                for d in bits
+            )
+        return None
 
 
 class ChownCommand(Command):
@@ -306,45 +621,130 @@ class ChownCommand(Command):
         if not target.startswith("/"):
             target = context.current_dir.rstrip("/") + "/" + target
             
-        node = context.filesystem._get_node(target)
-        if node:
-            node.owner = owner
+        if context.filesystem.chown(target, owner):
             return None
         else:
             return f"chown: cannot access '{args[1]}': No such file or directory"
 
 
+def _line_count_args(args: List[str], default: int = 10) -> Tuple[int, Optional[str]]:
+    """(line count, file or None) from head/tail arguments: [-n N | -N] [file]"""
+    count = default
+    rest = []
+    i = 0
+    while i < len(args):
+        arg = args[i]
+        if arg == "-n" and i + 1 < len(args):
+            try:
+                count = int(args[i + 1])
+            except ValueError:
+                pass
+            i += 2
+            continue
+        if arg.startswith("-") and arg[1:].isdigit():
+            count = int(arg[1:])
+        else:
+            rest.append(arg)
+        i += 1
+    return count, rest[-1] if rest else None
+
+
 class TailCommand(Command):
     """Display last lines of file"""
     
+    # Characters read backwards at a time when looking for the last lines
+    BLOCK = 64 * 1024
+    
     def __init__(self):
-        super().__init__("tail", "Output last part of file", "tail [-n N] <file>")
+        super().__init__("tail", "Output last part of file", "tail [-n N] [-f] <file>")
         
     def execute(self, args: List[str], context: CommandContext) -> str:
-        if not args:
+        num_lines, file_arg = _line_count_args([arg for arg in args if arg != "-f"])
+        if file_arg is None:
             return "tail: missing file operand"
-            
-        num_lines = 10
-        file_arg = args[-1]
-        
-        if "-n" in args:
-            try:
-                idx = args.index("-n")
-                num_lines = int(args[idx + 1])
-                file_arg = args[-1]
-            except:
-                pass
                 
         target = file_arg
         if not target.startswith("/"):
             target = context.current_dir.rstrip("/") + "/" + target
             
-        content = context.filesystem.read_file(target)
-        if content is None:
+        # Read backwards from the end of the file
+        lines = context.filesystem.tail_lines(target, num_lines)
+        if lines is None:
             return f"tail: {file_arg}: No such file"
             
-        lines = content.split("\n")
-        return "\n".join(lines[-num_lines:])
+        return "\n".join(lines)
+        
+    def stream(self, args: List[str], context: CommandContext,
+               stdin: Optional[Iterator[str]] = None) -> Iterator[str]:
+        follow = "-f" in args
+        num_lines, file_arg = _line_count_args([arg for arg in args if arg != "-f"])
+        if file_arg is None and stdin is not None:
+            # A stream can only be read forwards, keeping the last lines
+            yield from deque(stdin, maxlen=max(num_lines, 0))
+            return
+        if follow and file_arg is not None and context.streaming:
+            yield from self.follow(file_arg, num_lines, context)
+            return
+        output = self.execute(args, context)
+        if output:
+            yield from output.split("\n")
+            
+    def follow(self, file_arg: str, num_lines: int, context: CommandContext) -> Iterator[str]:
+        """tail -f: the last lines, then lines as they are appended, until interrupted
+        
+        Waits on a watch of the file, so a quiet file costs nothing; each
+        batch of changes reads only what was added since the last one.
+        """
+        target = file_arg
+        if not target.startswith("/"):
+            target = context.current_dir.rstrip("/") + "/" + target
+        filesystem = context.filesystem
+        # Watch before reading, so nothing written in between is missed
+        with filesystem.watch(target) as watch:
+            handle = filesystem.open(target)
+            if handle is None:
+                yield f"tail: {file_arg}: No such file"
+                return
+            with handle:
+                lines, position = self._last_lines(handle, num_lines)
+            # An unfinished last line is shown once it is finished
+            partial = lines.pop() if lines else ""
+            yield from lines
+            context.session.wait_on(watch)
+            try:
+                while watch.read():
+                    handle = filesystem.open(target)
+                    if handle is None:
+                        yield f"tail: {file_arg}: file removed"
+                        return
+                    with handle:
+                        length = handle.seek(0, io.SEEK_END)
+                        if length < position:
+                            yield f"tail: {file_arg}: file truncated"
+                            position, partial = 0, ""
+                        handle.seek(position)
+                        data = handle.read()
+                    position += len(data)
+                    lines = (partial + data).split("\n")
+                    partial = lines.pop()
+                    yield from lines
+            finally:
+                context.session.done_waiting(watch)
+                
+    def _last_lines(self, handle, count: int) -> Tuple[List[str], int]:
+        """The last count lines of an open file (as tail_lines) and its length"""
+        end = handle.seek(0, io.SEEK_END)
+        if count <= 0:
+            return [], end
+        start = end
+        text = ""
+        block = self.BLOCK
+        while start > 0 and text.count("\n") < count:
+            start = max(0, start - block)
+            block *= 2
+            handle.seek(start)
+            text = handle.read(end - start)
+        return text.split("\n")[-count:], end
 
 
 class HeadCommand(Command):
@@ -354,34 +754,48 @@ class HeadCommand(Command):
         super().__init__("head", "Output first part of file", "head [-n N] <file>")
         
     def execute(self, args: List[str], context: CommandContext) -> str:
-        if not args:
+        num_lines, file_arg = _line_count_args(args)
+        if file_arg is None:
             return "head: missing file operand"
-            
-        num_lines = 10
-        file_arg = args[-1]
-        
-        if "-n" in args:
-            try:
-                idx = args.index("-n")
-                num_lines = int(args[idx + 1])
-            except:
-                pass
                 
         target = file_arg
         if not target.startswith("/"):
             target = context.current_dir.rstrip("/") + "/" + target
             
-        content = context.filesystem.read_file(target)
-        if content is None:
+        handle = context.filesystem.open(target)
+        if handle is None:
             return f"head: {file_arg}: No such file"
             
-        lines = content.split("\n")
-        return "\n".join(lines[:num_lines])
+        # Only the chunks holding the first lines are read
+        with handle:
+            lines = list(itertools.islice(handle, max(num_lines, 0)))
+        text = "".join(lines)
+        if len(lines) == num_lines and text.endswith("\n"):
+            text = text[:-1]
+        return text
+        
+    def stream(self, args: List[str], context: CommandContext,
+               stdin: Optional[Iterator[str]] = None) -> Iterator[str]:
+        num_lines, file_arg = _line_count_args(args)
+        if file_arg is None:
+            lines = stdin
+        else:
+            if not file_arg.startswith("/"):
+                file_arg = context.current_dir.rstrip("/") + "/" + file_arg
+            lines = file_lines(context.filesystem, file_arg)
+        if lines is None:
+            yield self.execute(args, context)
+            return
+        # Stop pulling from the previous stage after the last line needed
+        yield from itertools.islice(lines, max(num_lines, 0))
 
 
 class WcCommand(Command):
     """Count lines, words, and characters"""
     
+    # Characters read from the file at a time
+    BLOCK_SIZE = 64 * 1024
+    
     def __init__(self):
         super().__init__("wc", "Word, line, and byte count", "wc <file>")
         
@@ -393,15 +807,82 @@ class WcCommand(Command):
         if not target.startswith("/"):
             target = context.current_dir.rstrip("/") + "/" + target
             
-        content = context.filesystem.read_file(target)
-        if content is None:
+        handle = context.filesystem.open(target)
+        if handle is None:
             return f"wc: {args[0]}: No such file"
             
-        lines = len(content.split("\n"))
-        words = len(content.split())
-        chars = len(content)
+        # Count block by block; a word split across two blocks counts once
+        lines, words, chars = 1, 0, 0
+        in_word = False
+        with handle:
+            for data in iter(lambda: handle.read(self.BLOCK_SIZE), ""):
+                lines += data.count("\n")
+                words += len(data.split())
+                if in_word and not data[0].isspace():
+                    words -= 1
+                chars += len(data)
+                in_word = not data[-1].isspace()
         
         return f"{lines:8} {words:8} {chars:8} {args[0]}"
+        
+    def stream(self, args: List[str], context: CommandContext,
+               stdin: Optional[Iterator[str]] = None) -> Iterator[str]:
+        if args or stdin is None:
+            yield from super().stream(args, context, stdin)
+            return
+        lines = words = chars = 0
+        for line in stdin:
+            lines += 1
+            words += len(line.split())
+            chars += len(line) + 1
+        yield f"{lines:8} {words:8} {chars:8}"
+
+
+class MountCommand(Command):
+    """Attach a host directory to the file system"""
+    
+    def __init__(self):
+        super().__init__("mount", "Mount a host directory (read-only)",
+                         "mount [<host_dir> <path>]", requires_admin=True)
+        
+    def execute(self, args: List[str], context: CommandContext) -> str:
+        fs = context.filesystem
+        if not args:
+            mounts = fs.list_mounts()
+            if not mounts:
+                return "No mounts"
+            return "\n".join(f"{mount.host_path} on {mount.path} (ro)" for mount in mounts)
+            
+        if len(args) < 2:
+            return f"Usage: {self.usage}"
+            
+        host_dir, target = args[0], args[1]
+        if not target.startswith("/"):
+            target = context.current_dir.rstrip("/") + "/" + target
+        if not os.path.isdir(host_dir):
+            return f"mount: {host_dir}: No such host directory"
+        if not fs.exists(target):
+            fs.mkdir(target, recursive=True)
+        if not fs.mount(host_dir, target):
+            return f"mount: {args[1]}: mount point must be an empty directory outside other mounts"
+        return f"📂 Mounted {host_dir} on {target}"
+
+
+class UmountCommand(Command):
+    """Detach a mounted host directory"""
+    
+    def __init__(self):
+        super().__init__("umount", "Unmount a host directory", "umount <path>", requires_admin=True)
+        
+    def execute(self, args: List[str], context: CommandContext) -> str:
+        if not args:
+            return f"Usage: {self.usage}"
+        target = args[0]
+        if not target.startswith("/"):
+            target = context.current_dir.rstrip("/") + "/" + target
+        if not context.filesystem.umount(target):
+            return f"umount: {args[0]}: not mounted"
+        return None
 
 
 # Function to register all utility commands
@@ -420,3 +901,5 @@ def register_utility_commands(processor):
     processor.register_command(TailCommand())
     processor.register_command(HeadCommand())
     processor.register_command(WcCommand())
+    processor.register_command(MountCommand())
+    processor.register_command(UmountCommand())
@@ -0,0 +1,229 @@
+"""
+DoubOS - File Watches
+Change notification for VFS paths and subtrees, in the manner of inotify
+"""
+
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+from filesystem import CREATE, MODIFY, MOVE, RESET, Change
+
+
+# Kind of the Change queued in place of those dropped when a watch is full
+OVERFLOW = "overflow"
+
+
+class Watch:
+    """Changes at a path (and, if recursive, everywhere below it)
+
+    Made by VirtualFileSystem.watch. A watch sees the changes of its path
+    itself and of the entries directly in it, or of the whole subtree if
+    recursive; the path need not exist yet. Changes queue until they are
+    read, as batches, with read() or by the callback given when watching,
+    which the dispatcher thread calls.
+
+    Changes are coalesced as they queue: a MODIFY of a path that is
+    already waiting to be reported as created or modified is dropped, so a
+    log appended to ten thousand times between reads shows up once. At
+    most max_events changes wait; once that many are queued, later ones
+    are dropped and a single OVERFLOW change for the watched path is queued
+    instead, telling the reader to look at the tree again.
+    """
+
+    # Changes queued before the watch overflows
+    MAX_EVENTS = 1024
+
+    def __init__(self, manager: 'WatchManager', path: str, recursive: bool = False,
+                 callback: Optional[Callable[[List[Change]], None]] = None,
+                 max_events: Optional[int] = None):
+        self.manager = manager
+        self.path = path
+        self.recursive = recursive
+        self.callback = callback
+        self.max_events = max_events or self.MAX_EVENTS
+        self._ready = threading.Condition(threading.Lock())
+        self._events: deque = deque()
+        # Paths with a CREATE or MODIFY waiting, which absorb new MODIFYs
+        self._fresh: Set[str] = set()
+        self.overflowed = False
+        # Changes dropped because the queue was full
+        self.dropped = 0
+        self.closed = False
+
+    def __enter__(self) -> 'Watch':
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @property
+    def pending(self) -> int:
+        """Number of changes waiting to be read"""
+        return len(self._events)
+
+    def _put(self, change: Change) -> bool:
+        """Queue a change (called by the manager); True if the queue was empty"""
+        with self._ready:
+            if self.closed:
+                return False
+            was_empty = not self._events
+            if change.event == MODIFY and change.path in self._fresh:
+                return False
+            if self.overflowed:
+                self.dropped += 1
+                return False
+            if len(self._events) >= self.max_events - 1:
+                self.overflowed = True
+                self.dropped += 1
+                change = Change(OVERFLOW, self.path, True)
+            elif change.event in (CREATE, MODIFY):
+                self._fresh.add(change.path)
+            else:
+                self._fresh.discard(change.path)
+                self._fresh.discard(change.dest)
+            self._events.append(change)
+            self._ready.notify_all()
+            return was_empty
+
+    def take(self) -> List[Change]:
+        """Every queued change, without waiting"""
+        with self._ready:
+            return self._take()
+
+    def _take(self) -> List[Change]:
+        batch = list(self._events)
+        self._events.clear()
+        self._fresh.clear()
+        self.overflowed = False
+        return batch
+
+    def read(self, timeout: Optional[float] = None) -> List[Change]:
+        """Wait until changes are queued and return them all
+
+        Returns an empty list if timeout seconds pass first, or once the
+        watch is closed.
+        """
+        with self._ready:
+            if not self._events and not self.closed:
+                self._ready.wait_for(lambda: self._events or self.closed, timeout)
+            return self._take()
+
+    def close(self):
+        """Stop watching; a blocked read() returns"""
+        with self._ready:
+            if self.closed:
+                return
+            self.closed = True
+            self._events.clear()
+            self._ready.notify_all()
+        self.manager.remove(self)
+
+
+class WatchManager:
+    """The watches of one file system
+
+    Listens to every change the file system makes and queues it on the
+    watches it concerns. Watches are found by looking up the changed path
+    and its ancestors, so a change costs a few dictionary lookups whatever
+    the number of watches, and nothing at all while there are none.
+
+    Watches with a callback are served by one dispatcher thread, started by
+    the first of them. It sleeps until a watch's queue goes from empty to
+    non-empty, lets DISPATCH_DELAY pass so that a burst of changes arrives
+    as one batch, then hands each such watch everything it has queued.
+    An idle watch therefore costs nothing; slow callbacks hold up the
+    others and should hand work to another thread.
+    """
+
+    # Seconds the dispatcher gathers changes before delivering them
+    DISPATCH_DELAY = 0.02
+
+    def __init__(self, filesystem):
+        self._lock = threading.Lock()
+        # Watched path -> its watches; replaced, never edited in place, so
+        # changes can be matched without the lock
+        self._watches: Dict[str, Tuple[Watch, ...]] = {}
+        # Callback watches with changes to deliver, in the order they arrived
+        self._pending: Dict[Watch, None] = {}
+        self._wakeup = threading.Condition(self._lock)
+        self._thread: Optional[threading.Thread] = None
+        filesystem.add_listener(self.changed)
+
+    def add(self, watch: Watch) -> Watch:
+        with self._lock:
+            watches = dict(self._watches)
+            watches[watch.path] = watches.get(watch.path, ()) + (watch,)
+            self._watches = watches
+            if watch.callback is not None and self._thread is None:
+                self._thread = threading.Thread(target=self._dispatch, name="doubos-watch", daemon=True)
+                self._thread.start()
+        return watch
+
+    def remove(self, watch: Watch):
+        with self._lock:
+            remaining = tuple(item for item in self._watches.get(watch.path, ()) if item is not watch)
+            watches = dict(self._watches)
+            if remaining:
+                watches[watch.path] = remaining
+            else:
+                watches.pop(watch.path, None)
+            self._watches = watches
+            self._pending.pop(watch, None)
+
+    def watching(self) -> int:
+        """Number of open watches"""
+        return sum(len(watches) for watches in self._watches.values())
+
+    def _concerned(self, watches: Dict[str, Tuple[Watch, ...]], path: str, found: Dict[Watch, None]):
+        """Add the watches that see a change at path to found"""
+        for watch in watches.get(path, ()):
+            found[watch] = None
+        if path == "/":
+            return
+        parent = path.rpartition("/")[0] or "/"
+        for watch in watches.get(parent, ()):
+            found[watch] = None
+        while parent != "/":
+            parent = parent.rpartition("/")[0] or "/"
+            for watch in watches.get(parent, ()):
+                if watch.recursive:
+                    found[watch] = None
+
+    def changed(self, change: Change):
+        """File system listener: queue a change on the watches it concerns"""
+        watches = self._watches
+        if not watches:
+            return
+        found: Dict[Watch, None] = {}
+        self._concerned(watches, change.path, found)
+        if change.event == MOVE:
+            self._concerned(watches, change.dest, found)
+        elif change.event == RESET:
+            # Everything below was replaced too
+            prefix = "/" if change.path == "/" else change.path + "/"
+            for path, below in watches.items():
+                if path.startswith(prefix):
+                    for watch in below:
+                        found[watch] = None
+        for watch in found:
+            if watch._put(change) and watch.callback is not None:
+                with self._wakeup:
+                    self._pending[watch] = None
+                    self._wakeup.notify()
+
+    def _dispatch(self):
+        while True:
+            with self._wakeup:
+                self._wakeup.wait_for(lambda: self._pending)
+            time.sleep(self.DISPATCH_DELAY)
+            with self._wakeup:
+                ready, self._pending = list(self._pending), {}
+            for watch in ready:
+                batch = watch.take()
+                if batch and not watch.closed:
+                    try:
+                        watch.callback(batch)
+                    except Exception:
+                        pass  # a failing callback must not stop delivery to the others